@@ -162,6 +162,63 @@ REST_FRAMEWORK = {
     'MAX_PAGINATE_BY': 100,
 }
 
+# Parser writes: rows per bulk INSERT and activities per transaction
+PARSER_BULK_BATCH_SIZE = 500
+PARSER_ACTIVITIES_PER_TRANSACTION = 100
+# Read the file in a separate thread while writing (see iati.pipeline),
+# with a queue of at most PARSER_PIPELINE_QUEUE_SIZE activities
+PARSER_PIPELINE = False
+PARSER_PIPELINE_QUEUE_SIZE = 200
+PARSER_PIPELINE_WRITERS = 1
+# Store stage timings and query counts of every parse as a ParseRun
+PARSER_PROFILE = False
+# Parse errors kept in memory before they are stored as ParseError rows
+PARSE_ERROR_BUFFER_SIZE = 500
+
+# Cached API responses: cache.backends.DatabaseBackend (CachedCall rows),
+# DjangoCacheBackend (the API_CACHE_ALIAS cache, local memory per process
+# by default) or RedisBackend (shared, at API_CACHE_REDIS_URL)
+API_CACHE_BACKEND = 'cache.backends.DatabaseBackend'
+API_CACHE_ALIAS = 'api'
+API_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+API_CACHE_REDIS_URL = 'redis://localhost:6379/1'
+# seconds between writes of the request counts to RequestedCall
+API_CACHE_COUNT_FLUSH_INTERVAL = 60
+# seconds a process keeps the data versions (cache.data_version) in memory
+API_CACHE_VERSION_TTL = 10
+# API calls rendered at the same time when the cache is warmed (cache.warmer)
+API_CACHE_WARM_WORKERS = 4
+# answer activity-aggregate-any from the ActivityAggregate fact table
+API_AGGREGATE_CUBE = True
+# rows fetched from the database at a time for ?stream= responses
+API_STREAM_CHUNK_SIZE = 500
+# where the bulk_export command writes the activity dumps, served as media
+API_EXPORT_ROOT = os.path.join(MEDIA_ROOT, 'exports')
+API_EXPORT_URL = MEDIA_URL + 'exports/'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'TIMEOUT': API_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+# Downloaded IATI XML files, kept to send conditional requests on re-parse
+IATI_FILE_CACHE_DIR = rel('../iati_file_cache')
+
+# parse_sources: parser processes, and files of one publisher parsed at once
+PARSE_POOL_PROCESSES = 4
+PARSE_POOL_MAX_PER_PUBLISHER = 2
+# seconds after which a source without result counts as lost (killed worker)
+PARSE_POOL_TASK_TIMEOUT = 60 * 60 * 6
+
 try:
     from local_settings import *
 except ImportError:
@@ -18,6 +18,7 @@ from django.http import HttpResponse
 from cache.validator import Validator
 
 from api.v3.resources.csv_serializer import CsvSerializer
+from api.v3.resources.streaming import StreamingListMixin
 from api.api_tools import comma_separated_parameter_to_list
 
 from api.paginator import NoCountPaginator
@@ -169,7 +170,7 @@ class RelatedActivityResource(ModelResource):
         excludes = ['id']
 
 
-class ActivityResource(ModelResource):
+class ActivityResource(StreamingListMixin, ModelResource):
     countries = fields.ToManyField(OnlyCountryResource, 'recipient_country', full=True, null=True, use_in='all')
     regions = fields.ToManyField(OnlyRegionResource, 'recipient_region', full=True, null=True, use_in='all')
     sectors = fields.ToManyField(ActivityViewSectorResource, 'sector', full=True, null=True, use_in='all')
@@ -286,7 +287,7 @@ class ActivityResource(ModelResource):
         cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
 
         if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), mimetype='application/json')
+            return validator.cached_response(request, cururl)
         else:
             return super(ActivityResource, self).get_list(request, **kwargs)
 
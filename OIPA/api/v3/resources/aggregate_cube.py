@@ -0,0 +1,129 @@
+from builtins import object
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Sum, Value
+
+from iati.models import ActivityAggregate
+
+
+class AggregateCube(object):
+    """
+    Answers activity-aggregate-any calls from the ActivityAggregate fact
+    table, without joining the activity tables.
+
+    A fact row repeats its activity for every value of every dimension. The
+    values are divided by the number of values of the dimensions the call
+    does not use, so the result equals the joins of the SQL resource: an
+    activity counts once per country when grouped by country, once in total
+    when no dimension is used.
+    """
+
+    # aggregation_key: (transaction type, summed field), no field is a count
+    aggregations = {
+        'iati-identifier': (None, None),
+        'reporting-org': (None, None),
+        'commitment': ('C', 'value'),
+        'disbursement': ('D', 'value'),
+        'expenditure': ('E', 'value'),
+        'incoming-fund': ('IF', 'value'),
+        'total-budget': (None, 'total_budget'),
+    }
+
+    group_bys = {
+        'recipient-country': 'country',
+        'recipient-region': 'region',
+        'sector': 'sector',
+        'reporting-org': 'reporting_organisation',
+    }
+
+    year_fields = ('start_planned', 'start_actual', 'end_planned', 'end_actual')
+
+    filters = (
+        ('reporting_organisation__in', 'reporting_organisation'),
+        ('countries__in', 'country'),
+        ('regions__in', 'region'),
+        ('total_budget__in', 'total_budget'),
+        ('sectors__in', 'sector'),
+    )
+
+    # dimension: field with the number of values of the dimension
+    counted_dimensions = (
+        ('country', 'country_count'),
+        ('region', 'region_count'),
+        ('sector', 'sector_count'),
+        ('transaction_type', 'transaction_type_count'),
+    )
+
+    def aggregation(self, field, divisor):
+        if field is None:
+            if divisor is None:
+                return Count('id')
+            value = Value(1.0)
+        else:
+            if divisor is None:
+                return Sum(field, output_field=FloatField())
+            value = F(field)
+        return Sum(ExpressionWrapper(value / divisor, output_field=FloatField()), output_field=FloatField())
+
+    def aggregate(self, request):
+        """
+        The activity-aggregate-any result for request, None when the call
+        needs data that is not in the fact table.
+        """
+        group_by_key = request.GET.get('group_by', None)
+        aggregation_key = request.GET.get('aggregation_key', 'iati-identifier')
+        group_field = request.GET.get('group_field', 'start_actual')
+
+        if aggregation_key not in self.aggregations or request.GET.get('query'):
+            return None
+
+        if group_by_key == 'year':
+            if group_field not in self.year_fields:
+                return None
+            group_column = group_field + '_year'
+        elif group_by_key in self.group_bys:
+            group_column = self.group_bys[group_by_key]
+        else:
+            return None
+
+        transaction_type, field = self.aggregations[aggregation_key]
+        facts = ActivityAggregate.objects.all()
+        used = set([group_column])
+
+        if transaction_type:
+            facts = facts.filter(transaction_type_id=transaction_type)
+            used.add('transaction_type')
+        if aggregation_key == 'reporting-org':
+            facts = facts.exclude(reporting_organisation=None)
+        if group_column in dict(self.counted_dimensions):
+            # the SQL resource joins these dimensions
+            facts = facts.exclude(**{group_column: None})
+
+        for parameter, dimension in self.filters:
+            values = request.GET.get(parameter, '').strip(',')
+            if values:
+                facts = facts.filter(**{dimension + '__in': values.split(',')})
+                used.add(dimension)
+
+        divisor = None
+        for dimension, count_field in self.counted_dimensions:
+            if dimension not in used:
+                divisor = F(count_field) if divisor is None else divisor * F(count_field)
+
+        columns = [group_column]
+        if group_column == 'region':
+            columns.append('region__name')
+
+        rows = facts.values(*columns).annotate(
+            aggregation_field=self.aggregation(field, divisor)).order_by()
+
+        results = []
+        for row in rows:
+            result = {
+                'group_field': row[group_column],
+                'aggregation_field': row['aggregation_field'],
+            }
+            if field is None:
+                result['aggregation_field'] = int(round(result['aggregation_field']))
+            if group_column == 'region':
+                result['name'] = row['region__name']
+            results.append(result)
+        return results
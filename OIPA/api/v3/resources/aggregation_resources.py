@@ -2,9 +2,6 @@ from builtins import object
 # Tastypie specific
 from tastypie.resources import ModelResource
 
-# Data specific
-from geodata.data_backup.country_data import countryData
-
 # cache specific
 from api.cache import NoTransformCache
 from iati.models import AidType
@@ -13,11 +10,42 @@ from cache.validator import Validator
 
 # Direct sql specific
 import ujson
+from django.conf import settings
 from django.db import connection
 from django.http import HttpResponse
 
 # Helpers
+from api.v3.resources.aggregate_cube import AggregateCube
 from api.v3.resources.custom_call_helper import CustomCallHelper
+from api.v3.resources.sql_query import SqlQuery
+
+
+COUNTRY_JOIN = 'JOIN iati_activityrecipientcountry as rc on a.id = rc.activity_id'
+REGION_JOIN = 'JOIN iati_activityrecipientregion as rr on a.id = rr.activity_id'
+SECTOR_JOIN = 'JOIN iati_activitysector as acts on a.id = acts.activity_id'
+TRANSACTION_JOIN = 'JOIN iati_transaction as t on a.id = t.activity_id'
+
+YEAR_FIELDS = ('start_planned', 'start_actual', 'end_planned', 'end_actual')
+
+# group by: (table, column) to count from without joining the activities
+UNFILTERED_COUNTS = {
+    'country': ('iati_activityrecipientcountry', 'country_id'),
+    'region': ('iati_activityrecipientregion', 'region_id'),
+    'sector': ('iati_activitysector', 'sector_id'),
+}
+
+
+def activity_filters(query, request):
+    """
+    Add the filters the aggregation calls share, returns if any was used
+    """
+    return any([
+        query.filter(request, 'reporting_organisation__in', 'a.reporting_organisation_id'),
+        query.filter(request, 'countries__in', 'rc.country_id', COUNTRY_JOIN),
+        query.filter(request, 'regions__in', 'rr.region_id', REGION_JOIN),
+        query.filter(request, 'total_budget__in', 'a.total_budget'),
+        query.filter(request, 'sectors__in', 'acts.sector_id', SECTOR_JOIN),
+    ])
 
 
 class ActivityCountResource(ModelResource):
@@ -39,105 +67,44 @@ class ActivityCountResource(ModelResource):
         cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
 
         if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), content_type='application/json')
+            return validator.cached_response(request, cururl)
 
         helper = CustomCallHelper()
         cursor = connection.cursor()
 
-        # get filters
-        reporting_organisations = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        recipient_countries = helper.get_and_query(request, 'countries__in', 'rc.country_id')
-        recipient_regions = helper.get_and_query(request, 'regions__in', 'rr.region_id')
-        total_budgets = helper.get_and_query(request, 'total_budget__in', 'a.total_budget')
-        sectors = helper.get_and_query(request, 'sectors__in', 'acts.sector_id')
-
-        from_countries = False
-        from_regions = False
-        from_sectors = False
-
-        if recipient_countries:
-            from_countries = True
-        if recipient_regions:
-            from_regions = True
-        if sectors:
-            from_sectors = True
-
         # get group by pars
         group_by = request.GET.get("group_by", None) # valid : country, region, year, sector, reporting org
         field = request.GET.get("group_field", "start_actual") # used for year filtering, valid : start_planned, start_actual, end_planned, end_actual, defaults to start_actual
+        if field not in YEAR_FIELDS:
+            field = "start_actual"
 
-        if not group_by:
+        group_by_element_dict = {
+            'country': ('rc.country_id', COUNTRY_JOIN),
+            'region': ('rr.region_id', REGION_JOIN),
+            'year': ('YEAR(a.' + field + ')', None),
+            'sector': ('acts.sector_id', SECTOR_JOIN),
+            'reporting_organisation': ('a.reporting_organisation_id', None),
+        }
+
+        if group_by not in group_by_element_dict:
             return HttpResponse(ujson.dumps("No field to group by. add parameter group_by (country/region/etc.. see docs)"), content_type='application/json')
 
         #create the query
-        query_select = 'SELECT count(a.id) as activity_count, '
-        query_from = 'FROM iati_activity as a '
-        query_where = 'WHERE 1 '
-        query_group_by = 'GROUP BY '
-
-        # fill select and group by
-        if(group_by == "country"):
-            query_select += 'rc.country_id as group_field '
-            query_group_by += 'rc.country_id '
-            from_countries = True
-
-        elif(group_by == "region"):
-            query_select += 'r.region_id as group_field '
-            query_group_by += 'r.region_id '
-            from_regions = True
-
-        elif(group_by == "year"):
-            query_select += 'YEAR(a.'+field+') as group_field '
-            query_group_by += 'YEAR(a.'+field+') '
-
-        elif(group_by == "sector"):
-            query_select += 'acts.sector_id as group_field '
-            query_group_by += 'acts.sector_id '
-            from_sectors = True
-
-        elif(group_by == "reporting_organisation"):
-            query_select += 'a.reporting_organisation_id as group_field '
-            query_group_by += 'a.reporting_organisation_id '
-
-        # fill from part
-        if from_countries:
-            query_from += "JOIN iati_activityrecipientcountry as rc on a.id = rc.activity_id "
-        if from_regions:
-            query_from += "JOIN iati_activityrecipientregion as rr on a.id = rr.activity_id "
-        if from_sectors:
-            query_from += "JOIN iati_activitysector as acts on a.id = acts.activity_id "
-
-        # fill where part
-        filter_string = 'AND (' + reporting_organisations + recipient_countries + recipient_regions + total_budgets + sectors + ')'
-        if filter_string == 'AND ()':
-            filter_string = ""
-        else:
-            if 'AND ()' in filter_string:
-                filter_string = filter_string[:-6]
-
-        query_where += filter_string
+        group_select, group_join = group_by_element_dict[group_by]
+        query = SqlQuery('iati_activity as a', 'count(a.id) as activity_count', group_select + ' as group_field')
+        if group_join:
+            query.join(group_join)
+        query.group(group_select)
 
         # optimalisation for simple (all) queries
-        if not filter_string:
-            # fill select and group by
-            if(group_by == "country"):
-                query_select = 'SELECT count(activity_id) as activity_count, country_id as group_field '
-                query_from = "FROM iati_activityrecipientcountry "
-                query_group_by = "GROUP BY country_id"
-
-            elif(group_by == "region"):
-                query_select = 'SELECT count(activity_id) as activity_count, region_id as group_field '
-                query_from = "FROM iati_activityrecipientregion "
-                query_group_by = "GROUP BY region_id"
-
-            elif(group_by == "sector"):
-                query_select = 'SELECT count(activity_id) as activity_count, sector_id as group_field '
-                query_from = "FROM iati_activitysector "
-                query_group_by = "GROUP BY sector_id"
+        if not activity_filters(query, request) and group_by in UNFILTERED_COUNTS:
+            table, column = UNFILTERED_COUNTS[group_by]
+            query = SqlQuery(table, 'count(activity_id) as activity_count', column + ' as group_field')
+            query.group(column)
 
         # execute query
 
-        cursor.execute(query_select + query_from + query_where + query_group_by)
+        query.execute(cursor)
         results1 = helper.get_fields(cursor=cursor)
 
         # query result -> json output
@@ -172,108 +139,93 @@ class ActivityAggregatedAnyResource(ModelResource):
 
         if group_by_key in {'commitment', 'disbursement', 'incoming-fund'}:
             group_field = 't.value_date'
+        elif group_field not in YEAR_FIELDS:
+            group_field = 'start_actual'
 
         aggregation_element_dict = {
             'iati-identifier': {
                 'select': 'a.id',
                 'type': 'count',
-                'from_addition': ''},
+                'joins': ()},
             'reporting-org': {
                 'select': 'a.reporting_organisation_id',
                 'type': 'count',
-                'from_addition': ''},
+                'joins': ()},
             'title': {
                 'select': 't.title',
                 'type': 'count',
-                'from_addition': 'JOIN iati_title as t on a.id = t.activity_id '},
+                'joins': ('JOIN iati_title as t on a.id = t.activity_id',)},
             'description': {
                 'select': 'd.description',
                 'type': 'count',
-                'from_addition': 'JOIN iati_description as d on a.id = d.activity_id '},
+                'joins': ('JOIN iati_description as d on a.id = d.activity_id',)},
             'commitment': {
                 'select': 't.value',
                 'type': 'sum',
-                'from_addition': 'JOIN iati_transaction as t on a.id = t.activity_id ',
-                'where_addition': 'AND t.transaction_type_id = "C" '},
+                'joins': (TRANSACTION_JOIN,),
+                'where': ('t.transaction_type_id = %s', 'C')},
             'disbursement': {
                 'select': 't.value',
                 'type': 'sum',
-                'from_addition': 'JOIN iati_transaction as t on a.id = t.activity_id ',
-                'where_addition': 'AND t.transaction_type_id = "D" '},
+                'joins': (TRANSACTION_JOIN,),
+                'where': ('t.transaction_type_id = %s', 'D')},
             'expenditure': {
                 'select': 't.value',
                 'type': 'sum',
-                'from_addition': 'JOIN iati_transaction as t on a.id = t.activity_id ',
-                'where_addition': 'AND t.transaction_type_id = "E" '},
+                'joins': (TRANSACTION_JOIN,),
+                'where': ('t.transaction_type_id = %s', 'E')},
             'incoming-fund': {
                 'select': 't.value',
                 'type': 'sum',
-                'from_addition': 'JOIN iati_transaction as t on a.id = t.activity_id ',
-                'where_addition': 'AND t.transaction_type_id = "IF" '},
+                'joins': (TRANSACTION_JOIN,),
+                'where': ('t.transaction_type_id = %s', 'IF')},
             'location': {
                 'select': 'l.activity_id',
                 'type': 'count',
-                'from_addition': 'JOIN iati_location as l on a.id = l.activity_id '},
+                'joins': ('JOIN iati_location as l on a.id = l.activity_id',)},
             'policy-marker': {
                 'select': 'pm.policy_marker_id',
                 'type': 'count',
-                'from_addition': 'JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id '},
+                'joins': ('JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id',)},
             'total-budget': {
                 'select': 'a.total_budget',
                 'type': 'sum',
-                'from_addition': ''},
+                'joins': ()},
         }
 
         group_by_element_dict = {
             'recipient-country': {
                 'select': 'rc.country_id',
-                'from_addition': 'JOIN iati_activityrecipientcountry as rc on a.id = rc.activity_id '},
+                'joins': (COUNTRY_JOIN,)},
             'recipient-region': {
                 'select': 'r.name, rr.region_id',
-                'from_addition': 'JOIN iati_activityrecipientregion as rr on a.id = rr.activity_id '
-                                 'join geodata_region as r on rr.region_id = r.code '},
+                'joins': (REGION_JOIN, 'join geodata_region as r on rr.region_id = r.code')},
             'year': {
                 'select': 'YEAR('+group_field+')',
-                'from_addition': ''},
+                'joins': ()},
             'sector': {
                 'select': 'acts.sector_id',
-                'from_addition': 'JOIN iati_activitysector as acts on a.id = acts.activity_id '},
+                'joins': (SECTOR_JOIN,)},
             'reporting-org': {
                 'select': 'a.reporting_organisation_id',
-                'from_addition': ''},
+                'joins': ()},
             'participating-org': {
                 'select': 'po.name',
-                'from_addition': 'JOIN iati_activityparticipatingorganisation as po on a.id = po.activity_id '},
+                'joins': ('JOIN iati_activityparticipatingorganisation as po on a.id = po.activity_id',)},
             'policy-marker': {
                 'select': 'pm.policy_marker_id',
-                'from_addition': 'JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id '},
+                'joins': ('JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id',)},
             'r.title': {
                 'select': 'r.title',
-                'from_addition': 'JOIN iati_result as r on a.id = r.activity_id ',
-                'where_addition': ' AND r.title = %(query)s '},
+                'joins': ('JOIN iati_result as r on a.id = r.activity_id',),
+                'where': 'r.title = %s'},
         }
 
         helper = CustomCallHelper()
         cursor = connection.cursor()
 
-        # get filters
-        reporting_organisations = helper.get_and_query(
-            request,
-            'reporting_organisation__in',
-            'a.reporting_organisation_id')
-        recipient_countries = helper.get_and_query(request, 'countries__in', 'rc.country_id')
-        recipient_regions = helper.get_and_query(request, 'regions__in', 'rr.region_id')
-        total_budgets = helper.get_and_query(request, 'total_budget__in', 'a.total_budget')
-        sectors = helper.get_and_query(request, 'sectors__in', 'acts.sector_id')
-
         if aggregation_key in aggregation_element_dict:
             aggregation_info = aggregation_element_dict[aggregation_key]
-            aggregation_key = aggregation_info["select"]
-            aggregation_type = aggregation_info["type"]
-            aggregation_from_addition = aggregation_info["from_addition"]
-            aggregation_where_addition = ""
-            if "where_addition" in aggregation_info:
-                aggregation_where_addition = aggregation_info["where_addition"]
         else:
             return HttpResponse(ujson.dumps({
                 "error": "Invalid aggregation key, see included list for viable keys.",
@@ -282,10 +234,6 @@ class ActivityAggregatedAnyResource(ModelResource):
 
         if group_by_key in group_by_element_dict:
             group_by_info = group_by_element_dict[group_by_key]
-            group_select = group_by_info["select"]
-            group_from_addition = group_by_info["from_addition"]
-            if "where_addition" in group_by_info and query:
-                aggregation_where_addition = aggregation_where_addition.join(group_by_info["where_addition"])
         else:
             return HttpResponse(ujson.dumps({
                 "error": "Invalid group by key, see included list for viable keys.",
@@ -303,62 +251,27 @@ class ActivityAggregatedAnyResource(ModelResource):
                 "No field to aggregate on. add parameter aggregation_key "),
                 content_type='application/json')
 
-        query_select = ''.join([
-            'SELECT ',
-            aggregation_type,
-            '(',
-            aggregation_key,
-            ') as aggregation_field, ',
-            group_select,
-            ' as group_field '])
-
-        query_from = ''.join([
-            'FROM iati_activity as a ',
-            aggregation_from_addition,
-            group_from_addition])
-
-        query_where = ''.join([
-            'WHERE 1 ',
-            aggregation_where_addition])
-
-        query_group_by = ''.join([
-            'GROUP BY ',
-            group_select])
-
-        # fill where part
-        filter_string = ''.join([
-            'AND (',
-            reporting_organisations,
-            recipient_countries,
-            recipient_regions,
-            total_budgets,
-            sectors,
-            ')'])
-
-        if filter_string == 'AND ()':
-            filter_string = ""
-        elif 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
-
-        query_where += filter_string
-
-        if not filter_string and query_from == 'FROM iati_activity as a ':
-            if group_by_key == "country":
-                query_select = 'SELECT count(activity_id) as aggregation_field, country_id as group_field '
-                query_from = "FROM iati_activityrecipientcountry "
-                query_group_by = "GROUP BY country_id"
-
-            elif group_by_key == "region":
-                query_select = 'SELECT count(activity_id) as aggregation_field, region_id as group_field '
-                query_from = "FROM iati_activityrecipientregion "
-                query_group_by = "GROUP BY region_id"
-
-            elif group_by_key == "sector":
-                query_select = 'SELECT count(activity_id) as aggregation_field, sector_id as group_field '
-                query_from = "FROM iati_activitysector "
-                query_group_by = "GROUP BY sector_id"
-
-        cursor.execute(query_select + query_from + query_where + query_group_by, {"query": query, })
+        # most group by / aggregation combinations are in the fact table
+        if settings.API_AGGREGATE_CUBE:
+            options = AggregateCube().aggregate(request)
+            if options is not None:
+                return HttpResponse(ujson.dumps(options), content_type='application/json')
+
+        group_select = group_by_info["select"]
+        aggregation = SqlQuery(
+            'iati_activity as a',
+            aggregation_info["type"] + '(' + aggregation_info["select"] + ') as aggregation_field',
+            group_select + ' as group_field')
+        aggregation.join(*aggregation_info["joins"])
+        aggregation.join(*group_by_info["joins"])
+        if "where" in aggregation_info:
+            aggregation.where(*aggregation_info["where"])
+        if "where" in group_by_info and query:
+            aggregation.where(group_by_info["where"], query)
+        activity_filters(aggregation, request)
+        aggregation.group(group_select)
+
+        aggregation.execute(cursor)
         results1 = helper.get_fields(cursor=cursor)
 
         options = []
@@ -399,32 +312,34 @@ class ActivityAggregatedAnyNamesResource(ModelResource):
         group_field = request.GET.get("group_field", "start_actual") # used for year filtering, valid : start_planned, start_actual, end_planned, end_actual, defaults to start_actual
         if group_by_key in {'commitment', 'disbursement', 'incoming-fund'}:
             group_field = "t.value_date"
+        elif group_field not in YEAR_FIELDS:
+            group_field = "start_actual"
 
         aggregation_element_dict = {
-            'iati-identifier': {'select': 'a.id', 'type': 'count', 'from_addition': ''},
-            'reporting-org': {'select': 'a.reporting_organisation_id', 'type': 'count', 'from_addition': ''},
-            'title': {'select': 't.title', 'type': 'count', 'from_addition': 'JOIN iati_title as t on a.id = t.activity_id '},
-            'description': {'select': 'd.description', 'type': 'count', 'from_addition':'JOIN iati_description as d on a.id = d.activity_id '},
-            'commitment': {'select': 't.value', 'type': 'sum', 'from_addition': 'JOIN iati_transaction as t on a.id = t.activity_id ', 'where_addition': 'AND t.transaction_type_id = "C" '},
-            'disbursement': {'select': 't.value', 'type': 'sum', 'from_addition': 'JOIN iati_transaction as t on a.id = t.activity_id ', 'where_addition': 'AND t.transaction_type_id = "D" '},
-            'incoming-fund': {'select': 't.value', 'type': 'sum', 'from_addition': 'JOIN iati_transaction as t on a.id = t.activity_id ', 'where_addition': 'AND t.transaction_type_id = "IF" '},
-            'location': {'select': 'l.activity_id', 'type': 'count', 'from_addition': 'JOIN iati_location as l on a.id = l.activity_id '},
-            'policy-marker': {'select': 'pm.policy_marker_id', 'type': 'count', 'from_addition': 'JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id '},
-            'total-budget': {'select': 'a.total_budget', 'type': 'sum', 'from_addition': ''},
-            # 'recipient-country': {'select': 'a.id', 'type': 'count', 'from_addition': ''},
-            # 'recipient-region': {'select': 'a.id', 'type': 'count', 'from_addition': ''},
-            # 'year': {'select': 'a.id', 'type': 'count', 'from_addition': ''},
-            # 'sector': {'select': 'a.id', 'type': 'count', 'from_addition': ''},
+            'iati-identifier': {'select': 'a.id', 'type': 'count', 'joins': ()},
+            'reporting-org': {'select': 'a.reporting_organisation_id', 'type': 'count', 'joins': ()},
+            'title': {'select': 't.title', 'type': 'count', 'joins': ('JOIN iati_title as t on a.id = t.activity_id',)},
+            'description': {'select': 'd.description', 'type': 'count', 'joins': ('JOIN iati_description as d on a.id = d.activity_id',)},
+            'commitment': {'select': 't.value', 'type': 'sum', 'joins': (TRANSACTION_JOIN,), 'where': ('t.transaction_type_id = %s', 'C')},
+            'disbursement': {'select': 't.value', 'type': 'sum', 'joins': (TRANSACTION_JOIN,), 'where': ('t.transaction_type_id = %s', 'D')},
+            'incoming-fund': {'select': 't.value', 'type': 'sum', 'joins': (TRANSACTION_JOIN,), 'where': ('t.transaction_type_id = %s', 'IF')},
+            'location': {'select': 'l.activity_id', 'type': 'count', 'joins': ('JOIN iati_location as l on a.id = l.activity_id',)},
+            'policy-marker': {'select': 'pm.policy_marker_id', 'type': 'count', 'joins': ('JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id',)},
+            'total-budget': {'select': 'a.total_budget', 'type': 'sum', 'joins': ()},
+            # 'recipient-country': {'select': 'a.id', 'type': 'count', 'joins': ()},
+            # 'recipient-region': {'select': 'a.id', 'type': 'count', 'joins': ()},
+            # 'year': {'select': 'a.id', 'type': 'count', 'joins': ()},
+            # 'sector': {'select': 'a.id', 'type': 'count', 'joins': ()},
         }
 
         group_by_element_dict = {
-            'recipient-country': {'select': 'rc.country_id', 'from_addition': 'JOIN iati_activityrecipientcountry as rc on a.id = rc.activity_id '},
-            'recipient-region': {'select': 'rr.region_id', 'from_addition': 'JOIN iati_activityrecipientregion as rr on a.id = rr.activity_id '},
-            'year': {'select': 'YEAR('+group_field+')', 'from_addition': ''},
-            'sector': {'select': 'acts.sector_id', 'from_addition': 'JOIN iati_activitysector as acts on a.id = acts.activity_id '},
-            'reporting-org': {'select': 'a.reporting_organisation_id', 'from_addition': 'JOIN iati_organisation as o on a.reporting_organisation_id = o.code '},
-            'participating-org': {'select': 'po.name', 'from_addition': 'JOIN iati_activityparticipatingorganisation as po on a.id = po.activity_id '},
-            'policy-marker': {'select': 'pm.policy_marker_id', 'from_addition': 'JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id '},
+            'recipient-country': {'select': 'rc.country_id', 'joins': (COUNTRY_JOIN,)},
+            'recipient-region': {'select': 'rr.region_id', 'joins': (REGION_JOIN,)},
+            'year': {'select': 'YEAR('+group_field+')', 'joins': ()},
+            'sector': {'select': 'acts.sector_id', 'joins': (SECTOR_JOIN,)},
+            'reporting-org': {'select': 'a.reporting_organisation_id', 'joins': ('JOIN iati_organisation as o on a.reporting_organisation_id = o.code',)},
+            'participating-org': {'select': 'po.name', 'joins': ('JOIN iati_activityparticipatingorganisation as po on a.id = po.activity_id',)},
+            'policy-marker': {'select': 'pm.policy_marker_id', 'joins': ('JOIN iati_activitypolicymarker as pm on a.id = pm.activity_id',)},
         }
 
         # check if call is cached using validator.is_cached
@@ -433,39 +348,20 @@ class ActivityAggregatedAnyNamesResource(ModelResource):
         cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
 
         if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), content_type='application/json')
+            return validator.cached_response(request, cururl)
 
         helper = CustomCallHelper()
         cursor = connection.cursor()
 
 
-        # get filters
-        reporting_organisations = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        recipient_countries = helper.get_and_query(request, 'countries__in', 'rc.country_id')
-        recipient_regions = helper.get_and_query(request, 'regions__in', 'rr.region_id')
-        total_budgets = helper.get_and_query(request, 'total_budget__in', 'a.total_budget')
-        sectors = helper.get_and_query(request, 'sectors__in', 'acts.sector_id')
-
-
-
-
-
         if aggregation_key in aggregation_element_dict:
             aggregation_info = aggregation_element_dict[aggregation_key]
-            aggregation_key = aggregation_info["select"]
-            aggregation_type = aggregation_info["type"]
-            aggregation_from_addition = aggregation_info["from_addition"]
-            aggregation_where_addition = ""
-            if "where_addition" in aggregation_info:
-                aggregation_where_addition = aggregation_info["where_addition"]
         else:
 
             return HttpResponse(ujson.dumps({"error": "Invalid aggregation key, see included list for viable keys.","valid_aggregation_keys": list(aggregation_element_dict.keys())}), content_type='application/json')
 
         if group_by_key in group_by_element_dict:
             group_by_info = group_by_element_dict[group_by_key]
-            group_select = group_by_info["select"]
-            group_from_addition = group_by_info["from_addition"]
         else:
             return HttpResponse(ujson.dumps({"error": "Invalid group by key, see included list for viable keys.","valid_group_by_keys": list(group_by_element_dict.keys())}), content_type='application/json')
 
@@ -476,42 +372,21 @@ class ActivityAggregatedAnyNamesResource(ModelResource):
             return HttpResponse(ujson.dumps("No field to aggregate on. add parameter aggregation_key (iati-identifier/reporting-org/etc.. see docs)"), content_type='application/json')
 
         #create the query
-        query_select = 'SELECT '+aggregation_type+'(' + aggregation_key + ') as aggregation_field, ' + group_select + ' as group_field, o.name   as org_name '
-        query_from = 'FROM iati_activity as a ' + aggregation_from_addition + group_from_addition
-        query_where = 'WHERE 1 ' + aggregation_where_addition
-        query_group_by = 'GROUP BY ' + group_select
-
-        # fill where part
-        filter_string = 'AND (' + reporting_organisations + recipient_countries + recipient_regions + total_budgets + sectors + ')'
-        if filter_string == 'AND ()':
-            filter_string = ""
-        else:
-            if 'AND ()' in filter_string:
-                filter_string = filter_string[:-6]
-
-        query_where += filter_string
-
-        # optimalisation for simple (all) queries
-        if not filter_string and query_from == 'FROM iati_activity as a ':
-            if(group_by_key == "country"):
-                query_select = 'SELECT count(activity_id) as aggregation_field, country_id as group_field '
-                query_from = "FROM iati_activityrecipientcountry "
-                query_group_by = "GROUP BY country_id"
-
-            elif(group_by_key == "region"):
-                query_select = 'SELECT count(activity_id) as aggregation_field, region_id as group_field '
-                query_from = "FROM iati_activityrecipientregion "
-                query_group_by = "GROUP BY region_id"
-
-            elif(group_by_key == "sector"):
-                query_select = 'SELECT count(activity_id) as aggregation_field, sector_id as group_field '
-                query_from = "FROM iati_activitysector "
-                query_group_by = "GROUP BY sector_id"
+        group_select = group_by_info["select"]
+        query = SqlQuery(
+            'iati_activity as a',
+            aggregation_info["type"] + '(' + aggregation_info["select"] + ') as aggregation_field',
+            group_select + ' as group_field',
+            'o.name   as org_name')
+        query.join(*aggregation_info["joins"])
+        query.join(*group_by_info["joins"])
+        if "where" in aggregation_info:
+            query.where(*aggregation_info["where"])
+        activity_filters(query, request)
+        query.group(group_select)
 
         # execute query
-
-
-        cursor.execute(query_select + query_from + query_where + query_group_by)
+        query.execute(cursor)
         results1 = helper.get_fields(cursor=cursor)
 
         # query result -> json output
@@ -15,6 +15,7 @@ class CsvHelper(Serializer):
         'csv': 'text/csv',
     }
 
+    csv_params = {'quotechar': "'", 'quoting': csv.QUOTE_NONNUMERIC}
 
     def to_csv(self, data, options=None):
         try:
@@ -32,7 +33,7 @@ class CsvHelper(Serializer):
                     test = {}
                     self.flatten("", value, test)
                     if first:
-                        writer = csv.DictWriter(raw_data, list(test.keys()), quotechar="'", quoting=csv.QUOTE_NONNUMERIC)
+                        writer = csv.DictWriter(raw_data, list(test.keys()), **self.csv_params)
                         writer.writeheader()
                         writer.writerow(test)
                         first=False
@@ -42,7 +43,7 @@ class CsvHelper(Serializer):
                 test = {}
                 self.flatten("", data, test)
                 if first:
-                    writer = csv.DictWriter(raw_data, list(test.keys()), quotechar="'", quoting=csv.QUOTE_NONNUMERIC)
+                    writer = csv.DictWriter(raw_data, list(test.keys()), **self.csv_params)
                     writer.writeheader()
                     writer.writerow(test)
                     first=False
@@ -2,9 +2,9 @@ from __future__ import print_function
 from future import standard_library
 standard_library.install_aliases()
 import csv
-import io
 from tastypie.serializers import Serializer
-import string
+
+from api.v3.resources.streaming import csv_rows
 
 class CsvSerializer(Serializer):
     formats = ['json', 'xml', 'csv']
@@ -15,41 +15,22 @@ class CsvSerializer(Serializer):
     }
 
 
+    csv_params = {'delimiter': ";", 'quotechar': "'", 'quoting': csv.QUOTE_NONNUMERIC}
+
     def to_csv(self, data, options=None):
         options = options or {}
 
         data = self.to_simple(data, options)
 
-        raw_data = io.StringIO()
-        first = True
-
         try:
 
             if "meta" in list(data.keys()): #if multiple objects are returned
-                objects = data.get("objects")
-
-                for value in objects:
-
-                    test = self.set_data(value)
-
-                    if first:
-                        writer = csv.DictWriter(raw_data, list(test.keys()), delimiter=";", quotechar="'", quoting=csv.QUOTE_NONNUMERIC)
-                        writer.writeheader()
-                        writer.writerow(test)
-                        first=False
-                    else:
-                        writer.writerow(test)
+                rows = (self.set_data(value) for value in data.get("objects"))
             else:
                 test = {}
                 self.flatten("", data, test)
-                if first:
-                    writer = csv.DictWriter(raw_data, list(test.keys()), delimiter=";", quotechar="'", quoting=csv.QUOTE_NONNUMERIC)
-                    writer.writeheader()
-                    writer.writerow(test)
-                    first=False
-                else:
-                    writer.writerow(test)
-            CSVContent=raw_data.getvalue()
+                rows = [test]
+            CSVContent = ''.join(csv_rows(rows, **self.csv_params))
             return CSVContent
 
         except Exception as e:
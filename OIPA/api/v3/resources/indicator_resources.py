@@ -16,6 +16,7 @@ from django.http import HttpResponse
 
 # Helpers
 from api.v3.resources.custom_call_helper import CustomCallHelper
+from api.v3.resources.sql_query import SqlQuery, parameter_values
 
 class IndicatorAggregationResource(ModelResource):
 
@@ -47,15 +48,16 @@ class IndicatorAggregationResource(ModelResource):
             return HttpResponse(ujson.dumps(["Indicator type not recognized"]), content_type='application/json')
 
         #create the query
-        query = 'SELECT year, r.code as region_id, ' + aggregation_type + '(id.value) as aggregation ' \
-                'FROM indicator_indicatordata as id ' \
-                'JOIN geodata_country as c on id.country_id = c.code ' \
-                'JOIN geodata_region as r on c.region_id = r.code ' \
-                'WHERE id.indicator_id = "'+indicator_id+'" ' \
-                'GROUP BY year, r.code'
+        query = SqlQuery('indicator_indicatordata as id', 'year', 'r.code as region_id',
+                         aggregation_type + '(id.value) as aggregation')
+        query.join(
+            'JOIN geodata_country as c on id.country_id = c.code',
+            'JOIN geodata_region as r on c.region_id = r.code')
+        query.where('id.indicator_id = %s', indicator_id)
+        query.group('year', 'r.code')
 
         # execute query
-        cursor.execute(query)
+        query.execute(cursor)
         results1 = helper.get_fields(cursor=cursor)
 
         # query result -> json output
@@ -85,34 +87,30 @@ class IndicatorCountryDataResource(ModelResource):
     def get_list(self, request, **kwargs):
 
         helper = CustomCallHelper()
+        indicators = parameter_values(request, 'indicators__in')
 
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        region_q = helper.get_and_query(request, 'regions__in', 'dac_region_code')
-        year_q = helper.get_and_query(request, 'years__in', 'id.year')
-        indicator_q = helper.get_and_query(request, 'indicators__in', 'indicator_id')
-
-        if not indicator_q:
+        if not indicators:
             return HttpResponse(ujson.dumps("No indicator given"), content_type='application/json')
 
-        filter_string = '  (' + country_q + region_q + year_q + indicator_q + ')'
-
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
+        query = SqlQuery('indicator_indicatordata id', 'da.id as indicator_id', 'da.friendly_label', 'da.type_data',
+                         'c.name as country_name', 'id.value', 'id.year', 'AsText(c.center_longlat) as loc',
+                         'c.code as country_id')
+        query.join(
+            'LEFT OUTER JOIN geodata_country c ON id.country_id = c.code',
+            'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id')
+        query.where('id.city_id is NULL')
+        query.filter(request, 'countries__in', 'c.code')
+        query.filter(request, 'regions__in', 'dac_region_code')
+        query.filter(request, 'years__in', 'id.year')
+        query.where_in('id.indicator_id', indicators)
 
         cursor = connection.cursor()
+        query.execute(cursor)
 
-        cursor.execute('SELECT da.id as indicator_id, da.friendly_label, da.type_data, c.name as country_name, '
-                       'id.value, id.year, AsText(c.center_longlat) as loc, c.code as country_id '
-                       'FROM indicator_indicatordata id '
-                       'LEFT OUTER JOIN geodata_country c ON id.country_id = c.code '
-                       'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id '
-                       'WHERE '
-                       'id.city_id is NULL '
-                       'AND %s' % (filter_string))
         cursor_max = connection.cursor()
-
-        indicator_q = indicator_q.replace(" ) AND (", "")
-        cursor_max.execute('SELECT max(value) as max_value FROM indicator_indicatordata WHERE %s' % indicator_q)
+        max_query = SqlQuery('indicator_indicatordata', 'max(value) as max_value')
+        max_query.where_in('indicator_id', indicators)
+        max_query.execute(cursor_max)
         result_max = cursor_max.fetchone()
         desc = cursor.description
         results = [
@@ -161,36 +159,33 @@ class IndicatorCityDataResource(ModelResource):
 
     def get_list(self, request, **kwargs):
         helper = CustomCallHelper()
-        city_q = helper.get_and_query(request, 'cities__in', 'city_id')
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        year_q = helper.get_and_query(request, 'years__in', 'id.year')
-        indicator_q = helper.get_and_query(request, 'indicators__in', 'indicator_id')
+        indicators = parameter_values(request, 'indicators__in')
 
-        if not indicator_q:
+        if not indicators:
             return HttpResponse(ujson.dumps("No indicator given"), content_type='application/json')
 
-        filter_string = '  (' + city_q + country_q + region_q + year_q + indicator_q + ')'
-
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
+        query = SqlQuery('indicator_indicatordata id', 'da.id as indicator_id', 'da.friendly_label', 'da.type_data',
+                         'ci.name as city_name', 'c.name as country_name', 'id.value', 'id.year',
+                         'AsText(ci.location) as loc', 'ci.id as city_id')
+        query.join(
+            'LEFT OUTER JOIN geodata_city ci ON id.city_id = ci.id',
+            'LEFT OUTER JOIN geodata_country c ON ci.country_id = c.code',
+            'LEFT OUTER JOIN geodata_region r ON c.region_id = r.code',
+            'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id')
+        query.where('id.city_id is not NULL')
+        query.filter(request, 'cities__in', 'id.city_id')
+        query.filter(request, 'countries__in', 'c.code')
+        query.filter(request, 'regions__in', 'r.code')
+        query.filter(request, 'years__in', 'id.year')
+        query.where_in('id.indicator_id', indicators)
 
         cursor = connection.cursor()
-
-        cursor.execute('SELECT da.id as indicator_id, da.friendly_label, da.type_data, ci.name as city_name, '
-                       'c.name as country_name, id.value, id.year, AsText(ci.location) as loc, ci.id as city_id '
-                       'FROM indicator_indicatordata id '
-                       'LEFT OUTER JOIN geodata_city ci ON id.city_id = ci.id '
-                       'LEFT OUTER JOIN geodata_country c ON ci.country_id = c.code '
-                       'LEFT OUTER JOIN geodata_region r ON c.region_id = r.code '
-                       'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id '
-                       'WHERE '
-                       'id.city_id is not NULL '
-                       'AND %s' % (filter_string))
+        query.execute(cursor)
 
         cursor_max = connection.cursor()
-        indicator_q = indicator_q.replace(" ) AND (", "")
-        cursor_max.execute('SELECT max(value) as max_value FROM indicator_indicatordata WHERE %s' % indicator_q)
+        max_query = SqlQuery('indicator_indicatordata', 'max(value) as max_value')
+        max_query.where_in('indicator_id', indicators)
+        max_query.execute(cursor_max)
         result_max = cursor_max.fetchone()
         desc = cursor.description
         results = [
@@ -243,30 +238,26 @@ class IndicatorRegionDataResource(ModelResource):
 
     def get_list(self, request, **kwargs):
         helper = CustomCallHelper()
-        country_q = helper.get_and_query(request, 'cities__in', 'c.code')
-        region_q = helper.get_and_query(request, 'regions__in', 'dac_region_code')
-        year_q = helper.get_and_query(request, 'years__in', 'id.year')
-        indicator_q = helper.get_and_query(request, 'indicators__in', 'indicator_id')
-
-        if not indicator_q:
-            indicator_q = ' indicator_id = "population"'
-
-        filter_string = '  (' + country_q + region_q + year_q + indicator_q + ')'
-
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
+        indicators = parameter_values(request, 'indicators__in') or ['population']
+
+        query = SqlQuery('indicator_indicatordata id', 'da.id as indicator_id', 'da.friendly_label', 'da.type_data',
+                         'c.name as country_name', 'c.dac_region_code', 'c.dac_region_name', 'id.value', 'id.year',
+                         'AsText(c.center_longlat) as loc', 'c.code as country_id')
+        query.join(
+            'LEFT OUTER JOIN geodata_city c ON id.country_id = c.code',
+            'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id')
+        query.filter(request, 'cities__in', 'c.code')
+        query.filter(request, 'regions__in', 'dac_region_code')
+        query.filter(request, 'years__in', 'id.year')
+        query.where_in('id.indicator_id', indicators)
 
         cursor = connection.cursor()
+        query.execute(cursor)
 
-        cursor.execute('SELECT da.id as indicator_id, da.friendly_label, da.type_data, c.name as country_name, c.dac_region_code, '
-                       'c.dac_region_name, id.value, id.year, AsText(c.center_longlat) as loc, c.code as country_id '
-                       'FROM indicator_indicatordata id '
-                       'LEFT OUTER JOIN geodata_city c ON id.country_id = c.code '
-                       'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id WHERE %s' % (filter_string))
         cursor_max = connection.cursor()
-
-        indicator_q = indicator_q.replace(" ) AND (", "")
-        cursor_max.execute('SELECT max(value) as max_value FROM indicator_indicatordata WHERE %s' % indicator_q)
+        max_query = SqlQuery('indicator_indicatordata', 'max(value) as max_value')
+        max_query.where_in('indicator_id', indicators)
+        max_query.execute(cursor_max)
         result_max = cursor_max.fetchone()
         results = helper.get_fields(cursor)
         country = {}
@@ -313,42 +304,44 @@ class IndicatorDataResource(ModelResource):
         cache = NoTransformCache()
         allowed_methods = ['get']
 
+    def data_filters(self, query, request):
+        query.filter(request, 'cities__in', 'id.city_id')
+        query.filter(request, 'countries__in', 'c.code')
+        query.filter(request, 'regions__in', 'r.code')
+        query.filter(request, 'years__in', 'id.year')
+        query.filter(request, 'indicators__in', 'id.indicator_id')
+        query.filter(request, 'selection_type__in', 'id.selection_type')
 
     def get_list(self, request, **kwargs):
         helper = CustomCallHelper()
-        city_q = helper.get_and_query(request, 'cities__in', 'city_id')
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        year_q = helper.get_and_query(request, 'years__in', 'id.year')
-        indicator_q = helper.get_and_query(request, 'indicators__in', 'indicator_id')
-        selection_type_q = helper.get_and_query(request, 'selection_type__in', 'id.selection_type')
+        indicators = parameter_values(request, 'indicators__in')
         limit_q = request.GET.get("limit", None)
 
         if limit_q:
             limit_q = int(limit_q)
 
-        if not indicator_q and not country_q and not city_q:
+        if not indicators and not parameter_values(request, 'countries__in') \
+                and not parameter_values(request, 'cities__in'):
             return HttpResponse(ujson.dumps("No indicator given"), content_type='application/json')
 
 
 
         # CITY DATA
-        filter_string = 'AND (' + city_q + country_q + region_q + year_q + indicator_q + selection_type_q + ')'
-
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
+        query = SqlQuery('indicator_indicatordata id', 'da.id as indicator_id', 'da.friendly_label', 'da.type_data',
+                         'id.selection_type', 'da.category', 'ci.name as city_name', 'r.code as region_id',
+                         'r.name as region_name', 'c.code as country_id', 'c.name as country_name', 'id.value',
+                         'id.year', 'AsText(ci.location) as loc', 'ci.id as city_id')
+        query.join(
+            'LEFT OUTER JOIN geodata_city ci ON id.city_id = ci.id',
+            'LEFT OUTER JOIN geodata_country c ON ci.country_id = c.code',
+            'LEFT OUTER JOIN geodata_region r ON c.region_id = r.code',
+            'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id')
+        query.where('id.country_id is null')
+        self.data_filters(query, request)
+        query.order('id.value', 'DESC', ['id.value'])
 
         cursor = connection.cursor()
-        cursor.execute('SELECT da.id as indicator_id, da.friendly_label, da.type_data, id.selection_type, da.category, ci.name as city_name, '
-                       'r.code as region_id, r.name as region_name, c.code as country_id, c.name as country_name, '
-                       'id.value, id.year, AsText(ci.location) as loc, ci.id as city_id '
-                       'FROM indicator_indicatordata id '
-                       'LEFT OUTER JOIN geodata_city ci ON id.city_id = ci.id '
-                       'LEFT OUTER JOIN geodata_country c ON ci.country_id = c.code '
-                       'LEFT OUTER JOIN geodata_region r ON c.region_id = r.code '
-                       'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id '
-                       'WHERE id.country_id is null %s '
-                       'ORDER BY id.value DESC' % (filter_string))
+        query.execute(cursor)
         desc = cursor.description
         city_results = [
         dict(list(zip([col[0] for col in desc], row)))
@@ -359,33 +352,33 @@ class IndicatorDataResource(ModelResource):
 
 
         # COUNTRY DATA
-        filter_string = 'AND (' + city_q + country_q + region_q + year_q + indicator_q + selection_type_q + ')'
-
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
+        query = SqlQuery('indicator_indicatordata id', 'da.id as indicator_id', 'da.friendly_label',
+                         'id.selection_type', 'da.category', 'da.type_data', 'r.code as region_id',
+                         'r.name as region_name', 'c.code as country_id', 'c.name as country_name', 'id.value',
+                         'id.year', 'AsText(c.center_longlat) as loc')
+        query.join(
+            'LEFT OUTER JOIN geodata_country c ON id.country_id = c.code',
+            'LEFT OUTER JOIN geodata_region r ON c.region_id = r.code',
+            'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id')
+        query.where('id.city_id is null')
+        self.data_filters(query, request)
+        query.order('id.value', 'DESC', ['id.value'])
 
         cursor = connection.cursor()
-        cursor.execute('SELECT da.id as indicator_id, da.friendly_label, id.selection_type, da.category, da.type_data, '
-                       'r.code as region_id, r.name as region_name, c.code as country_id, c.name as country_name, '
-                       'id.value, id.year, AsText(c.center_longlat) as loc '
-                       'FROM indicator_indicatordata id '
-                       'LEFT OUTER JOIN geodata_country c ON id.country_id = c.code '
-                       'LEFT OUTER JOIN geodata_region r ON c.region_id = r.code '
-                       'LEFT OUTER JOIN indicator_indicator da ON da.id = id.indicator_id '
-                       'WHERE id.city_id is null %s '
-                       'ORDER BY id.value DESC' % (filter_string))
+        query.execute(cursor)
         desc = cursor.description
         country_results = [
         dict(list(zip([col[0] for col in desc], row)))
         for row in cursor.fetchall()
         ]
 
-        indicator_q = indicator_q.replace(" ) AND (", "")
-        if indicator_q:
-            indicator_q = "AND " + indicator_q
+        max_query = SqlQuery('indicator_indicatordata', 'indicator_id', 'max(value) as max_value')
+        max_query.where_in('indicator_id', indicators)
+        max_query.group('indicator_indicatordata.indicator_id')
+        max_query.order('max_value', 'DESC', ['max_value'])
 
         cursor_max = connection.cursor()
-        cursor_max.execute('SELECT indicator_id, max(value) as max_value FROM indicator_indicatordata WHERE 1 %s GROUP BY indicator_indicatordata.indicator_id order by max_value DESC' % indicator_q)
+        max_query.execute(cursor_max)
         desc = cursor_max.description
         max_results = [
         dict(list(zip([col[0] for col in desc], row)))
@@ -486,20 +479,15 @@ class IndicatorFilterOptionsResource(ModelResource):
         cache = NoTransformCache()
         allowed_methods = ['get']
 
+    def indicator_filters(self, query, request):
+        query.filter(request, 'regions__in', 'region.code')
+        query.filter(request, 'indicators__in', 'i.indicator_id')
+        query.filter(request, 'categories__in', 'ind.category')
+
     def get_list(self, request, **kwargs):
-        helper = CustomCallHelper()
-        city_q = helper.get_and_query(request, 'cities__in', 'city.id') or ""
-        country_q = helper.get_and_query(request, 'countries__in', 'country.code') or ""
-        region_q = helper.get_and_query(request, 'regions__in', 'region.code') or ""
-        indicator_q = helper.get_and_query(request, 'indicators__in', 'i.indicator_id') or ""
-        category_q = helper.get_and_query(request, 'categories__in', 'ind.category') or ""
         adm_division_q = request.GET.get("adm_division__in", "city,country,region") or ""
         adm_divisions = adm_division_q.split(",")
 
-        filter_string = ' AND (' + city_q + country_q + region_q + indicator_q + category_q + ')'
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
-
         regions = {}
         countries = {}
         cities = {}
@@ -509,13 +497,20 @@ class IndicatorFilterOptionsResource(ModelResource):
         if "city" in adm_divisions:
             cursor = connection.cursor()
             # city filters
-            cursor.execute('SELECT DISTINCT i.indicator_id, i.selection_type ,ind.friendly_label, ind.category as indicator_category, city.id as city_id, city.name as city_name, country.code as country_id, country.name as country_name, region.code as region_id, region.name as region_name '
-                           'FROM indicator_indicatordata i '
-                           'JOIN indicator_indicator ind ON i.indicator_id = ind.id '
-                           'JOIN geodata_city city ON i.city_id=city.id '
-                           'LEFT OUTER JOIN geodata_country country on city.country_id = country.code '
-                           'LEFT OUTER JOIN geodata_region region on country.region_id = region.code '
-                           'WHERE 1 %s ' % (filter_string))
+            query = SqlQuery(
+                'indicator_indicatordata i', 'DISTINCT i.indicator_id', 'i.selection_type', 'ind.friendly_label',
+                'ind.category as indicator_category', 'city.id as city_id', 'city.name as city_name',
+                'country.code as country_id', 'country.name as country_name', 'region.code as region_id',
+                'region.name as region_name')
+            query.join(
+                'JOIN indicator_indicator ind ON i.indicator_id = ind.id',
+                'JOIN geodata_city city ON i.city_id=city.id',
+                'LEFT OUTER JOIN geodata_country country on city.country_id = country.code',
+                'LEFT OUTER JOIN geodata_region region on country.region_id = region.code')
+            query.filter(request, 'cities__in', 'city.id')
+            query.filter(request, 'countries__in', 'country.code')
+            self.indicator_filters(query, request)
+            query.execute(cursor)
 
             desc = cursor.description
             city_results = [
@@ -550,16 +545,18 @@ class IndicatorFilterOptionsResource(ModelResource):
 
         if "country" in adm_divisions:
             # country filters
-            filter_string = ' AND (' + country_q + region_q + indicator_q + category_q + ')'
-            if 'AND ()' in filter_string:
-                filter_string = filter_string[:-6]
             cursor = connection.cursor()
-            cursor.execute('SELECT DISTINCT i.indicator_id, i.selection_type, ind.friendly_label, ind.category as indicator_category, country.code as country_id, country.name as country_name, region.code as region_id, region.name as region_name '
-                           'FROM indicator_indicatordata i '
-                           'JOIN indicator_indicator ind ON i.indicator_id = ind.id '
-                           'JOIN geodata_country country on i.country_id = country.code '
-                           'LEFT OUTER JOIN geodata_region region on country.region_id = region.code '
-                           'WHERE 1 %s ' % (filter_string))
+            query = SqlQuery(
+                'indicator_indicatordata i', 'DISTINCT i.indicator_id', 'i.selection_type', 'ind.friendly_label',
+                'ind.category as indicator_category', 'country.code as country_id', 'country.name as country_name',
+                'region.code as region_id', 'region.name as region_name')
+            query.join(
+                'JOIN indicator_indicator ind ON i.indicator_id = ind.id',
+                'JOIN geodata_country country on i.country_id = country.code',
+                'LEFT OUTER JOIN geodata_region region on country.region_id = region.code')
+            query.filter(request, 'countries__in', 'country.code')
+            self.indicator_filters(query, request)
+            query.execute(cursor)
 
             desc = cursor.description
             country_results = [
@@ -588,15 +585,15 @@ class IndicatorFilterOptionsResource(ModelResource):
 
         if "region" in adm_divisions:
             # region filters
-            filter_string = ' AND (' + region_q + indicator_q + category_q + ')'
-            if 'AND ()' in filter_string:
-                filter_string = filter_string[:-6]
             cursor = connection.cursor()
-            cursor.execute('SELECT DISTINCT i.indicator_id, i.selection_type ,ind.friendly_label, ind.category as indicator_category, region.code as region_id, region.name as region_name '
-                           'FROM indicator_indicatordata i '
-                           'JOIN indicator_indicator ind ON i.indicator_id = ind.id '
-                           'JOIN geodata_region region on i.region_id = region.code '
-                           'WHERE 1 %s ' % (filter_string))
+            query = SqlQuery(
+                'indicator_indicatordata i', 'DISTINCT i.indicator_id', 'i.selection_type', 'ind.friendly_label',
+                'ind.category as indicator_category', 'region.code as region_id', 'region.name as region_name')
+            query.join(
+                'JOIN indicator_indicator ind ON i.indicator_id = ind.id',
+                'JOIN geodata_region region on i.region_id = region.code')
+            self.indicator_filters(query, request)
+            query.execute(cursor)
 
             desc = cursor.description
             region_results = [
@@ -0,0 +1,174 @@
+from builtins import str
+from builtins import object
+
+
+def parameter_values(request, parameter):
+    """
+    The comma separated values of a GET parameter, without empty values
+    """
+    return [value for value in request.GET.get(parameter, '').split(',') if value]
+
+
+class SqlQuery(object):
+    """
+    A SELECT statement built from parts for the custom SQL resources.
+
+    Filter values are never pasted into the SQL: where() and the filters
+    add placeholders and keep the values as parameters for
+    cursor.execute(), a list of values becomes one IN (%s, ...). Joins are
+    added once, in the order they are first needed, so a filter only joins
+    the tables it uses.
+    """
+
+    def __init__(self, from_table, *columns):
+        self.from_table = from_table
+        self.columns = list(columns)
+        self.joins = []
+        self.join_params = []
+        self.conditions = []
+        self.params = []
+        self.group_by = []
+        self.order_by = None
+        self.limit = None
+        self.offset = 0
+
+    def select(self, *columns):
+        self.columns.extend(columns)
+        return self
+
+    def join(self, *joins):
+        for join in joins:
+            if join not in self.joins:
+                self.joins.append(join)
+        return self
+
+    def join_on(self, join, *params):
+        """
+        Add a join with %s in its condition for each of params
+        """
+        if join not in self.joins:
+            self.joins.append(join)
+            self.join_params.extend(params)
+        return self
+
+    def where(self, condition, *params):
+        """
+        Add a condition, with %s for each of params
+        """
+        self.conditions.append(condition)
+        self.params.extend(params)
+        return self
+
+    def where_in(self, column, values, *joins):
+        """
+        Filter column on values, returns if there were values
+        """
+        values = [value for value in values if value != '']
+        if not values:
+            return False
+
+        self.join(*joins)
+        self.where('%s IN (%s)' % (column, ', '.join(['%s'] * len(values))), *values)
+        return True
+
+    def where_year_in(self, column, values, *joins):
+        years = []
+        for value in values:
+            try:
+                years.append(int(value))
+            except ValueError:
+                pass
+        return self.where_in('YEAR(%s)' % column, years, *joins)
+
+    def where_like(self, columns, text, *joins):
+        """
+        One of columns contains text
+        """
+        if not text:
+            return False
+
+        self.join(*joins)
+        self.where(
+            '(' + ' OR '.join('%s LIKE %%s' % column for column in columns) + ')',
+            *(['%' + text + '%'] * len(columns)))
+        return True
+
+    def filter(self, request, parameter, column, *joins):
+        """
+        Filter column on the comma separated values of a GET parameter
+        """
+        return self.where_in(column, parameter_values(request, parameter), *joins)
+
+    def filter_years(self, request, parameter, column, *joins):
+        return self.where_year_in(column, parameter_values(request, parameter), *joins)
+
+    def filter_range(self, request, parameter, column, operator):
+        """
+        column <operator> the numeric value of a GET parameter
+        """
+        value = request.GET.get(parameter, None)
+        if not value:
+            return False
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+
+        self.where('%s %s %%s' % (column, operator), value)
+        return True
+
+    def group(self, *columns):
+        self.group_by.extend(columns)
+        return self
+
+    def order(self, column, direction, allowed):
+        """
+        Order by column when it is one of allowed, by the first of allowed
+        otherwise
+        """
+        if column not in allowed:
+            column = allowed[0]
+        if str(direction).upper() != 'DESC':
+            direction = 'ASC'
+        self.order_by = '%s %s' % (column, direction.upper())
+        return self
+
+    def paginate(self, limit, offset=0):
+        try:
+            self.limit = int(limit)
+        except (TypeError, ValueError):
+            self.limit = None
+        try:
+            self.offset = int(offset)
+        except (TypeError, ValueError):
+            self.offset = 0
+        return self
+
+    def sql(self, paginate=True):
+        """
+        The statement and its parameters
+        """
+        sql = 'SELECT ' + ', '.join(self.columns) + ' FROM ' + self.from_table
+        if self.joins:
+            sql += ' ' + ' '.join(self.joins)
+        if self.conditions:
+            sql += ' WHERE ' + ' AND '.join('(%s)' % condition for condition in self.conditions)
+        if self.group_by:
+            sql += ' GROUP BY ' + ', '.join(self.group_by)
+        if paginate and self.order_by:
+            sql += ' ORDER BY ' + self.order_by
+        if paginate and self.limit is not None:
+            sql += ' LIMIT %d OFFSET %d' % (self.limit, self.offset)
+        return sql, self.join_params + self.params
+
+    def execute(self, cursor, paginate=True):
+        cursor.execute(*self.sql(paginate))
+        return cursor
+
+    def count(self, cursor):
+        """
+        The number of rows without pagination
+        """
+        sql, params = self.sql(paginate=False)
+        cursor.execute('SELECT COUNT(*) FROM (' + sql + ') as counted', params)
+        return cursor.fetchone()[0]
@@ -16,6 +16,46 @@ from django.http import HttpResponse
 # Helpers
 from api.v3.resources.csv_helper import CsvHelper
 from api.v3.resources.custom_call_helper import CustomCallHelper
+from api.v3.resources.sql_query import SqlQuery, parameter_values
+from api.v3.resources.streaming import StreamingListMixin, cursor_rows, server_side_cursor, streaming_response
+from iati.management.commands.filter_facet_updater import get_filter_options
+
+# joins of the filters on activities (a)
+COUNTRY_JOINS = (
+    'LEFT JOIN iati_activityrecipientcountry rc ON rc.activity_id = a.id',
+    'LEFT JOIN geodata_country c ON rc.country_id = c.code',
+)
+REGION_JOINS = (
+    'LEFT JOIN iati_activityrecipientregion rr ON rr.activity_id = a.id',
+    'LEFT JOIN geodata_region r ON rr.region_id = r.code',
+)
+SECTOR_JOIN = 'LEFT JOIN iati_activitysector s ON a.id = s.activity_id'
+DONOR_JOIN = 'LEFT JOIN iati_activityparticipatingorganisation as apo on a.id = apo.activity_id'
+RESULT_JOIN = 'LEFT JOIN iati_result res ON a.id = res.activity_id'
+TITLE_JOIN = 'LEFT JOIN iati_title as t on a.id = t.activity_id'
+VOCABULARY_JOIN = 'LEFT JOIN iati_regionvocabulary rv ON r.region_vocabulary_id = rv.code'
+COMMITMENT_JOIN = 'LEFT JOIN iati_transaction tr ON tr.activity_id = a.id'
+
+
+def facet_filter_options(request):
+    """
+    The activity filter options from the precomputed ActivityFilterFacet
+    counts
+    """
+    organisations = request.GET.get("reporting_organisation__in", None)
+
+    facets = ['countries', 'sectors', 'regions']
+    if request.GET.get("include_donor", None):
+        facets.append('donors')
+    if request.GET.get("include_start_year_actual", None):
+        facets.append('start_actual')
+    if request.GET.get("include_start_year_planned", None):
+        facets.append('start_planned_years')
+
+    if organisations:
+        return get_filter_options(facets, organisations.split(','))
+    return get_filter_options(facets + ['reporting_organisations'])
+
 
 class ActivityFilterOptionsResource(ModelResource):
 
@@ -36,137 +76,9 @@ class ActivityFilterOptionsResource(ModelResource):
         cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
 
         if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), content_type='application/json')
+            return validator.cached_response(request, cururl)
 
-
-        helper = CustomCallHelper()
-        cursor = connection.cursor()
-        organisations = request.GET.get("reporting_organisation__in", None)
-        include_donors = request.GET.get("include_donor", None)
-        include_start_year_actual = request.GET.get("include_start_year_actual", None)
-        include_start_year_planned = request.GET.get("include_start_year_planned", None)
-        if organisations:
-            q_organisations = 'WHERE a.reporting_organisation_id = "' + organisations + '"'
-        else:
-            q_organisations = ""
-
-        cursor.execute('SELECT c.code, c.name, count(c.code) as total_amount '
-                       'FROM geodata_country c '
-                       'LEFT JOIN iati_activityrecipientcountry rc on c.code = rc.country_id '
-                       'LEFT JOIN iati_activity a on rc.activity_id = a.id %s '
-                       'GROUP BY c.code' % (q_organisations))
-        results1 = helper.get_fields(cursor=cursor)
-        cursor.execute('SELECT s.code, s.name, count(s.code) as total_amount '
-                       'FROM iati_sector s '
-                       'LEFT JOIN iati_activitysector as ias on s.code = ias.sector_id '
-                       'LEFT JOIN iati_activity a on ias.activity_id = a.id '
-                       '%s '
-                       'GROUP BY s.code' % (q_organisations))
-        results2 = helper.get_fields(cursor=cursor)
-        if q_organisations:
-            q_organisations = q_organisations.replace("WHERE", "AND")
-        cursor.execute('SELECT r.code, r.name, count(r.code) as total_amount '
-                       'FROM geodata_region r '
-                       'LEFT JOIN iati_activityrecipientregion rr on r.code = rr.region_id '
-                       'LEFT JOIN iati_activity a on rr.activity_id = a.id '
-                       'WHERE r.region_vocabulary_id = 1 '
-                       '%s '
-                       'GROUP BY r.code' % (q_organisations))
-        results3 = helper.get_fields(cursor=cursor)
-
-        options = {}
-        options['countries'] = {}
-        options['regions'] = {}
-        options['sectors'] = {}
-
-
-
-        for r in results1:
-
-            country_item = {}
-            country_item['name'] = r['name']
-            country_item['total'] = r['total_amount']
-            options['countries'][r['code']] = country_item
-
-        for r in results2:
-            sector_item = {}
-            sector_item['name'] = r['name']
-            sector_item['total'] = r['total_amount']
-            options['sectors'][r['code']] = sector_item
-
-        for r in results3:
-
-            region_item = {}
-            region_item['name'] = r['name']
-            region_item['total'] = r['total_amount']
-            options['regions'][r['code']] = region_item
-
-        if include_donors:
-            options['donors'] = {}
-
-            cursor.execute('SELECT o.code, o.name, count(o.code) as total_amount '
-                       'FROM iati_activity a '
-                       'JOIN iati_activityparticipatingorganisation as po on a.id = po.activity_id '
-                       'JOIN iati_organisation as o on po.organisation_id = o.code '
-                       'WHERE 1 %s '
-                       'GROUP BY o.code' % (q_organisations))
-            results4 = helper.get_fields(cursor=cursor)
-
-            for r in results4:
-
-                donor_item = {}
-                donor_item['name'] = r['name']
-                donor_item['total'] = r['total_amount']
-                options['donors'][r['code']] = donor_item
-
-        if include_start_year_actual:
-
-            options['start_actual'] = {}
-            cursor.execute('SELECT YEAR(a.start_actual) as start_year, count(YEAR(a.start_actual)) as total_amount '
-                       'FROM iati_activity a '
-                       'WHERE 1 %s '
-                       'GROUP BY YEAR(a.start_actual)' % (q_organisations))
-            results5 = helper.get_fields(cursor=cursor)
-
-            for r in results5:
-                start_actual_item = {}
-                start_actual_item['name'] = r['start_year']
-                start_actual_item['total'] = r['total_amount']
-                options['start_actual'][r['start_year']] = start_actual_item
-
-        if include_start_year_planned:
-
-            options['start_planned_years'] = {}
-            cursor.execute('SELECT YEAR(a.start_planned) as start_year, count(YEAR(a.start_planned)) as total_amount '
-                       'FROM iati_activity a '
-                       'WHERE 1 %s '
-                       'GROUP BY YEAR(a.start_planned)' % (q_organisations))
-            results5 = helper.get_fields(cursor=cursor)
-
-            for r in results5:
-                start_planned_item = {}
-                start_planned_item['name'] = r['start_year']
-                start_planned_item['total'] = r['total_amount']
-                options['start_planned_years'][r['start_year']] = start_planned_item
-
-
-        if not q_organisations:
-            cursor.execute('SELECT a.reporting_organisation_id, o.name, count(a.reporting_organisation_id) as total_amount '
-                       'FROM iati_activity a '
-                       'INNER JOIN iati_organisation o on a.reporting_organisation_id = o.code '
-                       'GROUP BY a.reporting_organisation_id')
-            results4 = helper.get_fields(cursor=cursor)
-
-            options['reporting_organisations'] = {}
-
-            for r in results4:
-
-                org_item = {}
-                org_item['name'] = r['name']
-                org_item['total'] = r['total_amount']
-                options['reporting_organisations'][r['reporting_organisation_id']] = org_item
-
-        return HttpResponse(ujson.dumps(options), content_type='application/json')
+        return HttpResponse(ujson.dumps(facet_filter_options(request)), content_type='application/json')
 
 
 class ActivityFilterOptionsUnescoResource(ModelResource):
@@ -179,6 +91,27 @@ class ActivityFilterOptionsUnescoResource(ModelResource):
         cache = NoTransformCache()
         allowed_methods = ['get']
 
+    # donors, start years and reporting organisations are counted per
+    # country or region of the perspective
+    perspective_joins = {
+        'country': 'JOIN iati_activityrecipientcountry as pc on a.id = pc.activity_id',
+        'region': 'JOIN iati_activityrecipientregion as pr on a.id = pr.activity_id',
+    }
+
+    def activity_filters(self, query, organisations, perspective, join_perspective=False):
+        if join_perspective and perspective in self.perspective_joins:
+            query.join(self.perspective_joins[perspective])
+        query.where_in('a.reporting_organisation_id', organisations)
+        if perspective == 'global':
+            query.where('a.scope_id = 1')
+        return query
+
+    def get_options(self, cursor, query, code_field='code', name_field='name'):
+        options = {}
+        for r in CustomCallHelper().get_fields(cursor=query.execute(cursor)):
+            options[r[code_field]] = {'name': r[name_field], 'total': r['total_amount']}
+        return options
+
 
     def get_list(self, request, **kwargs):
 
@@ -188,182 +121,83 @@ class ActivityFilterOptionsUnescoResource(ModelResource):
         cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
 
         if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), content_type='application/json')
-
-
-        helper = CustomCallHelper()
-        cursor = connection.cursor()
-        organisations = request.GET.get("reporting_organisation__in", None)
+            return validator.cached_response(request, cururl)
 
-        countries = request.GET.get("countries__in", None)
+        countries = parameter_values(request, "countries__in")
 
         perspective = request.GET.get("perspective", None)
-        w_perspective = ''
-
-        if perspective:
-            if perspective == 'country':
-                q_perspective = ' JOIN iati_activityrecipientcountry as c on a.id = c.activity_id '
-            elif perspective == 'region':
-                q_perspective = ' JOIN iati_activityrecipientregion as r on a.id = r.activity_id '
-            elif perspective == 'global':
-                q_perspective = ''
-                w_perspective = 'AND a.scope_id = 1 '
-            else:
-                q_perspective = ''
-        else:
-            q_perspective = ''
 
+        # the facet counts are per reporting organisation only
+        if not perspective and not countries:
+            return HttpResponse(ujson.dumps(facet_filter_options(request)), content_type='application/json')
+
+        cursor = connection.cursor()
+        organisations = parameter_values(request, "reporting_organisation__in")
 
         include_donors = request.GET.get("include_donor", None)
         include_start_year_actual = request.GET.get("include_start_year_actual", None)
         include_start_year_planned = request.GET.get("include_start_year_planned", None)
-        if organisations:
-            q_organisations = 'AND a.reporting_organisation_id = "' + organisations + '" '
-        else:
-            q_organisations = ""
-
-        query = ('SELECT c.code, c.name, count(c.code) as total_amount '
-                       'FROM geodata_country c '
-                       'LEFT JOIN iati_activityrecipientcountry rc on c.code = rc.country_id '
-                       'LEFT JOIN iati_activity a on rc.activity_id = a.id '
-                       'WHERE 1 %s %s '
-                       'GROUP BY c.code' % (q_organisations, w_perspective))
-
-        #making query for country results
-        cursor.execute('SELECT c.code, c.name, count(c.code) as total_amount '
-                       'FROM geodata_country c '
-                       'LEFT JOIN iati_activityrecipientcountry rc on c.code = rc.country_id '
-                       'LEFT JOIN iati_activity a on rc.activity_id = a.id '
-                       'WHERE 1 %s %s '
-                       'GROUP BY c.code' % (q_organisations, w_perspective))
-        results1 = helper.get_fields(cursor=cursor)
-
-        #making query for sector results
-        cursor.execute('SELECT s.code, s.name, count(s.code) as total_amount '
-                       'FROM iati_sector s '
-                       'LEFT JOIN iati_activitysector as ias on s.code = ias.sector_id '
-                       'LEFT JOIN iati_activity a on ias.activity_id = a.id '
-                       'WHERE 1 %s %s '
-                       'GROUP BY s.code' % (q_organisations, w_perspective))
-        results2 = helper.get_fields(cursor=cursor)
-
-        #making query for regions
-        if q_organisations:
-            q_organisations = q_organisations.replace("WHERE", "AND")
-        cursor.execute('SELECT r.code, r.name, count(r.code) as total_amount '
-                       'FROM geodata_region r '
-                       'LEFT JOIN iati_activityrecipientregion rr on r.code = rr.region_id '
-                       'LEFT JOIN iati_activity a on rr.activity_id = a.id '
-                       'WHERE r.region_vocabulary_id = 1 '
-                       '%s %s '
-                       'GROUP BY r.code' % (q_organisations, w_perspective))
-        results3 = helper.get_fields(cursor=cursor)
 
         options = {}
-        options['countries'] = {}
-        options['regions'] = {}
-        options['sectors'] = {}
-
-
-        #country results
-        for r in results1:
-
-            country_item = {}
-            country_item['name'] = r['name']
-            country_item['total'] = r['total_amount']
-            options['countries'][r['code']] = country_item
-        #sector results
-        for r in results2:
-            sector_item = {}
-            sector_item['name'] = r['name']
-            sector_item['total'] = r['total_amount']
-            options['sectors'][r['code']] = sector_item
-        #region results
-        for r in results3:
-
-            region_item = {}
-            region_item['name'] = r['name']
-            region_item['total'] = r['total_amount']
-            options['regions'][r['code']] = region_item
-        #donor results
+
+        countries_query = SqlQuery('geodata_country c', 'c.code', 'c.name', 'count(c.code) as total_amount')
+        countries_query.join(
+            'LEFT JOIN iati_activityrecipientcountry rc on c.code = rc.country_id',
+            'LEFT JOIN iati_activity a on rc.activity_id = a.id')
+        self.activity_filters(countries_query, organisations, perspective).group('c.code')
+        options['countries'] = self.get_options(cursor, countries_query)
+
+        sectors_query = SqlQuery('iati_sector s', 's.code', 's.name', 'count(s.code) as total_amount')
+        sectors_query.join(
+            'LEFT JOIN iati_activitysector as ias on s.code = ias.sector_id',
+            'LEFT JOIN iati_activity a on ias.activity_id = a.id')
+        self.activity_filters(sectors_query, organisations, perspective).group('s.code')
+        options['sectors'] = self.get_options(cursor, sectors_query)
+
+        regions_query = SqlQuery('geodata_region r', 'r.code', 'r.name', 'count(r.code) as total_amount')
+        regions_query.join(
+            'LEFT JOIN iati_activityrecipientregion rr on r.code = rr.region_id',
+            'LEFT JOIN iati_activity a on rr.activity_id = a.id')
+        regions_query.where('r.region_vocabulary_id = 1')
+        self.activity_filters(regions_query, organisations, perspective).group('r.code')
+        options['regions'] = self.get_options(cursor, regions_query)
+
         if include_donors:
-            options['donors'] = {}
-            if countries:
-                q_countries = ' and c.country_id = "' + countries + '"'
-            else:
-                q_countries = ""
-
-            cursor.execute('SELECT o.code, o.name, count(o.code) as total_amount '
-                       'FROM iati_activity a '
-                       'JOIN iati_activityparticipatingorganisation as po on a.id = po.activity_id '
-                       'JOIN iati_organisation as o on po.organisation_id = o.code '
-                       ' %s '
-                       'WHERE 1 %s %s %s '
-                       'GROUP BY o.code' % (q_perspective, q_organisations, q_countries, w_perspective))
-            results4 = helper.get_fields(cursor=cursor)
-
-            for r in results4:
-
-                donor_item = {}
-                donor_item['name'] = r['name']
-                donor_item['total'] = r['total_amount']
-                options['donors'][r['code']] = donor_item
-
-        if include_start_year_actual:
-
-            options['start_actual'] = {}
-            cursor.execute('SELECT YEAR(a.start_actual) as start_year, count(YEAR(a.start_actual)) as total_amount '
-                       'FROM iati_activity a '
-                        ' %s '
-                       'WHERE 1 %s %s '
-                       'GROUP BY YEAR(a.start_actual)' % (q_perspective, q_organisations, w_perspective))
-            results5 = helper.get_fields(cursor=cursor)
-
-            for r in results5:
-                start_actual_item = {}
-                start_actual_item['name'] = r['start_year']
-                start_actual_item['total'] = r['total_amount']
-                options['start_actual'][r['start_year']] = start_actual_item
-
-        if include_start_year_planned:
-
-            options['start_planned_years'] = {}
-            cursor.execute('SELECT YEAR(a.start_planned) as start_year, count(YEAR(a.start_planned)) as total_amount '
-                       'FROM iati_activity a '
-                        ' %s '
-                       'WHERE 1 %s %s '
-                       'GROUP BY YEAR(a.start_planned)' % (q_perspective, q_organisations, w_perspective))
-            results5 = helper.get_fields(cursor=cursor)
-
-            for r in results5:
-                start_planned_item = {}
-                start_planned_item['name'] = r['start_year']
-                start_planned_item['total'] = r['total_amount']
-                options['start_planned_years'][r['start_year']] = start_planned_item
-
-
-        if not q_organisations:
-            cursor.execute('SELECT a.reporting_organisation_id, o.name, count(a.reporting_organisation_id) as total_amount '
-                       'FROM iati_activity a '
-                        ' %s '
-                       'INNER JOIN iati_organisation o on a.reporting_organisation_id = o.code '
-                       'WHERE 1 %s '
-                       'GROUP BY a.reporting_organisation_id' % q_perspective, w_perspective)
-            results4 = helper.get_fields(cursor=cursor)
-
-            options['reporting_organisations'] = {}
-
-            for r in results4:
-
-                org_item = {}
-                org_item['name'] = r['name']
-                org_item['total'] = r['total_amount']
-                options['reporting_organisations'][r['reporting_organisation_id']] = org_item
+            donors_query = SqlQuery('iati_activity a', 'o.code', 'o.name', 'count(o.code) as total_amount')
+            self.activity_filters(donors_query, organisations, perspective, join_perspective=True)
+            donors_query.join(
+                'JOIN iati_activityparticipatingorganisation as po on a.id = po.activity_id',
+                'JOIN iati_organisation as o on po.organisation_id = o.code')
+            donors_query.where_in('pc.country_id', countries, self.perspective_joins['country'])
+            options['donors'] = self.get_options(cursor, donors_query.group('o.code'))
+
+        for include, key, date_field in (
+                (include_start_year_actual, 'start_actual', 'a.start_actual'),
+                (include_start_year_planned, 'start_planned_years', 'a.start_planned')):
+            if include:
+                years_query = SqlQuery(
+                    'iati_activity a',
+                    'YEAR(%s) as start_year' % date_field,
+                    'count(YEAR(%s)) as total_amount' % date_field)
+                self.activity_filters(years_query, organisations, perspective, join_perspective=True)
+                years_query.group('YEAR(%s)' % date_field)
+                options[key] = self.get_options(cursor, years_query, 'start_year', 'start_year')
+
+        if not organisations:
+            organisations_query = SqlQuery(
+                'iati_activity a',
+                'a.reporting_organisation_id',
+                'o.name',
+                'count(a.reporting_organisation_id) as total_amount')
+            self.activity_filters(organisations_query, organisations, perspective, join_perspective=True)
+            organisations_query.join('INNER JOIN iati_organisation o on a.reporting_organisation_id = o.code')
+            organisations_query.group('a.reporting_organisation_id')
+            options['reporting_organisations'] = self.get_options(
+                cursor, organisations_query, 'reporting_organisation_id')
 
         return HttpResponse(ujson.dumps(options), content_type='application/json')
 
 
-
 class CountryGeojsonResource(ModelResource):
 
     class Meta:
@@ -383,70 +217,34 @@ class CountryGeojsonResource(ModelResource):
         cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
 
         if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), content_type='application/json')
+            return validator.cached_response(request, cururl)
 
         helper = CustomCallHelper()
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        budget_q_gte = request.GET.get('total_budget__gt', None)
-        budget_q_lte = request.GET.get('total_budget__lt', None)
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        sector_q = helper.get_and_query(request, 'sectors__in', 's.sector_id')
-        donor_q = helper.get_and_query(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id')
-        organisation_q = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        budget_q = ''
-        country_query = request.GET.get("country", None)
-        project_query = request.GET.get("query", None)
-        result_title_q = helper.get_and_query(request, 'result_title', 'r.title')
-
-        if budget_q_gte:
-            budget_q += ' a.total_budget > "' + budget_q_gte + '" ) AND ('
-        if budget_q_lte:
-            budget_q += ' a.total_budget < "' + budget_q_lte + '" ) AND ('
-
-        filter_string = ' AND (' + country_q + organisation_q + region_q + sector_q + budget_q + result_title_q + ')'
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
-
-        if region_q:
-            filter_region = 'LEFT JOIN iati_activityrecipientregion rr ON rr.activity_id = a.id LEFT JOIN geodata_region r ON rr.region_id = r.code '
-        else:
-            filter_region = ''
-
-        if sector_q:
-            filter_sector = 'LEFT JOIN iati_activitysector s ON a.id = s.activity_id '
-        else:
-            filter_sector = ''
-
-        filter_result = ''
-        if result_title_q:
-            filter_result = 'LEFT JOIN iati_result r ON a.id = r.activity_id '
-
-        filter_donor = ''
-        if donor_q:
-            filter_donor = 'LEFT JOIN iati_activityparticipatingorganisation as apo on a.id = apo.activity_id '
-            filter_string += ' AND apo.role_id = "Funding" '
-
-        if country_query:
-            filter_string += 'AND c.name LIKE "%%' + country_query + '%%" '
-
-        filter_project_query = ''
-        if project_query:
-            filter_project_query = 'LEFT JOIN iati_title as t on a.id = t.activity_id '
-            filter_string += 'AND ( t.title LIKE "%%' + project_query + '%%" OR c.name LIKE "%%' + project_query + '%%" ) '
+        query = SqlQuery('iati_activity a', 'c.code as country_id', 'c.name as country_name',
+                         'count(a.id) as total_projects')
+        query.join(*COUNTRY_JOINS)
+        query.filter(request, 'countries__in', 'c.code')
+        query.filter(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
+        query.filter(request, 'regions__in', 'r.code', *REGION_JOINS)
+        query.filter(request, 'sectors__in', 's.sector_id', SECTOR_JOIN)
+        query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        query.filter_range(request, 'total_budget__lt', 'a.total_budget', '<')
+        query.filter(request, 'result_title', 'res.title', RESULT_JOIN)
+        if query.filter(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id',
+                        DONOR_JOIN):
+            query.where('apo.role_id = %s', 'Funding')
+        query.where_like(['c.name'], request.GET.get("country", None))
+        query.where_like(['t.title', 'c.name'], request.GET.get("query", None), TITLE_JOIN)
+        query.group('c.code')
 
         cursor = connection.cursor()
-        query = 'SELECT c.code as country_id, c.name as country_name, count(a.id) as total_projects '\
-                'FROM iati_activity a '\
-                'LEFT JOIN iati_activityrecipientcountry rc ON rc.activity_id = a.id '\
-                'LEFT JOIN geodata_country c ON rc.country_id = c.code '\
-                '%s %s %s %s %s '\
-                'WHERE 1 %s'\
-                'GROUP BY c.code' % (filter_region, filter_sector, filter_result, filter_donor, filter_project_query, filter_string)
-
-        cursor.execute(query)
+        query.execute(cursor)
 
         activity_result = {'type': 'FeatureCollection', 'features': []}
 
+        # simplified polygons for lower zoom levels, see geodata.country_polygons.TOLERANCES
+        tolerance = request.GET.get("tolerance", None)
+
         activities = []
 
         results = helper.get_fields(cursor=cursor)
@@ -456,7 +254,7 @@ class CountryGeojsonResource(ModelResource):
             country['id'] = r['country_id']
 
             country['properties'] = {'name': r['country_name'], 'project_amount': r['total_projects']}
-            country['geometry'] = helper.find_polygon(r['country_id'])
+            country['geometry'] = helper.find_polygon(r['country_id'], tolerance)
 
             activities.append(country)
 
@@ -482,9 +280,9 @@ class Adm1RegionGeojsonResource(ModelResource):
 
         cursor = connection.cursor()
 
-        cursor.execute('SELECT r.adm1_code, r.name, r.polygon, r.geometry_type  '\
-                'FROM geodata_adm1region r '\
-                'WHERE r.country_id = "%s"' % (country_id))
+        query = SqlQuery('geodata_adm1region r', 'r.adm1_code', 'r.name', 'r.polygon', 'r.geometry_type')
+        query.where('r.country_id = %s', country_id)
+        query.execute(cursor)
 
         activity_result = {'type' : 'FeatureCollection', 'features' : []}
 
@@ -552,7 +350,7 @@ def dict2xml(d, root_node, first, listname):
 
 
 
-class CountryActivitiesResource(ModelResource):
+class CountryActivitiesResource(StreamingListMixin, ModelResource):
 
     class Meta:
         queryset = AidType.objects.none()
@@ -562,177 +360,117 @@ class CountryActivitiesResource(ModelResource):
         serializer = CsvHelper()
         allowed_methods = ['get']
 
-    def get_list(self, request, **kwargs):
-
-        validator = Validator()
-        cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
-        if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), content_type='application/json')
-
-        helper = CustomCallHelper()
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        budget_q_gte = request.GET.get('total_budget__gt', None)
-        budget_q_lte = request.GET.get('total_budget__lt', None)
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        sector_q = helper.get_and_query(request, 'sectors__in', 's.sector_id')
-        donor_q = helper.get_and_query(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id')
-        organisation_q = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        start_actual_q = helper.get_year_and_query(request, 'start_actual__in', 'a.start_actual')
-        start_planned_q = helper.get_year_and_query(request, 'start_planned__in', 'a.start_planned')
-        budget_q = ''
-        limit = request.GET.get("limit", 999)
-        offset = request.GET.get("offset", 0)
+    def get_query(self, request):
         order_by = request.GET.get("order_by", "country_name")
         order_asc_desc = request.GET.get("order_asc_desc", "ASC")
         country_query = request.GET.get("country", None)
         project_query = request.GET.get("query", None)
         total_commitments_q = request.GET.get("total_commitments", None)
-        output_format = request.GET.get("format", "json")
         include_unesco_empty = request.GET.get("include_unesco_empty", False)
-        result_title_q = helper.get_and_query(request, 'results_title__in', 'r.title')
-
-        if budget_q_gte:
-            budget_q += ' a.total_budget > "' + budget_q_gte + '" ) AND ('
-        if budget_q_lte:
-            budget_q += ' a.total_budget < "' + budget_q_lte + '" ) AND ('
-
-        filter_string = ''.join([
-            country_q,
-            organisation_q,
-            region_q,
-            sector_q,
-            budget_q,
-            start_planned_q,
-            start_actual_q,
-            donor_q,
-            result_title_q
-        ])
-
-        if filter_string:
-            filter_string = ' AND (' + filter_string[:-7] + ') '
-
-        query_select = [
-            'SELECT c.code as country_id',
-            'c.name as country_name',
-            'AsText(c.center_longlat) as location'
-        ]
-
-        query_join = [
-            'FROM geodata_country c ',
-            'LEFT JOIN iati_activityrecipientcountry rc ON rc.country_id = c.code ',
-            'LEFT JOIN iati_activity a ON rc.activity_id = a.id '
-        ]
+        organisations = parameter_values(request, 'reporting_organisation__in')
+
+        query = SqlQuery('geodata_country c', 'c.code as country_id', 'c.name as country_name',
+                         'AsText(c.center_longlat) as location')
+        query.join('LEFT JOIN iati_activityrecipientcountry rc ON rc.country_id = c.code')
+        query.where('c.code is not null')
+
+        if include_unesco_empty and organisations:
+            # countries without activities of the organisations are listed too
+            query.join_on(
+                'LEFT JOIN iati_activity a ON rc.activity_id = a.id AND a.reporting_organisation_id IN (%s)'
+                % ', '.join(['%s'] * len(organisations)), *organisations)
+            query.where('unesco_region_id is not null')
+        else:
+            query.join('LEFT JOIN iati_activity a ON rc.activity_id = a.id')
+            query.where_in('a.reporting_organisation_id', organisations)
 
         if total_commitments_q:
-            query_join.append('LEFT JOIN iati_transaction tr ON tr.activity_id = a.id ')
-            query_select.append('sum(tr.value) as total_commitment')
-            query_select.append('count(distinct(a.id)) as total_projects')
-            filter_string += ' AND tr.transaction_type_id = "C" '
+            query.join(COMMITMENT_JOIN)
+            query.select('sum(tr.value) as total_commitment', 'count(distinct(a.id)) as total_projects')
+            query.where('tr.transaction_type_id = %s', 'C')
         else:
-            query_select.append('sum(a.total_budget) as total_budget')
-            query_select.append('count(a.id) as total_projects',)
-
-        if region_q:
-            query_join.append(
-                'LEFT JOIN iati_activityrecipientregion rr '
-                'ON rr.activity_id = a.id '
-                'LEFT JOIN geodata_region r '
-                'ON rr.region_id = r.code ')
-
-        if sector_q:
-            query_join.append(
-                'LEFT JOIN iati_activitysector s '
-                'ON a.id = s.activity_id ')
-
-        if donor_q:
-            query_join.append(
-                'LEFT JOIN iati_activityparticipatingorganisation as apo '
-                'ON a.id = apo.activity_id ')
-            filter_string += ' AND apo.role_id = "Funding" '
-
-        if country_query:
-            filter_string += 'AND c.name LIKE "%%' + country_query + '%%" '
-
-        if project_query:
-            query_join.append(
-                'LEFT JOIN iati_title as t ON a.id = t.activity_id '
-                'LEFT JOIN iati_description as dis ON a.id = dis.activity_id '
-                'LEFT JOIN iati_otheridentifier as oa ON a.id = oa.activity_id ')
-            filter_string += 'AND ( t.title LIKE "%%' + project_query + '%%" '
-            filter_string += 'OR dis.description LIKE "%%' + project_query + '%%" '
-            filter_string += 'OR oa.identifier LIKE "%%' + project_query + '%%" '
-            filter_string += 'OR c.name LIKE "%%' + project_query + '%%" ) '
-
-        if result_title_q:
-            query_join.append(
-                'LEFT JOIN iati_result r '
-                'ON a.id = r.activity_id ')
-
-        query_end = 'WHERE c.code is not null ' \
-                '%s '\
-                'GROUP BY c.code ' \
-                'ORDER BY %s %s ' \
-                'LIMIT %s OFFSET %s' % (filter_string, order_by, order_asc_desc, limit, offset)
-        query = ','.join(query_select) + ' ' + ''.join(query_join) + query_end
-
-        if include_unesco_empty and organisation_q:
-            query = query.replace(organisation_q, "")
-            query = query.replace(' AND (' + organisation_q[:-6], "")
-            query = query.replace(organisation_q[:-6], "")
-            query = query.replace(
-                "LEFT JOIN iati_activity a ON rc.activity_id = a.id",
-                "LEFT JOIN iati_activity a ON rc.activity_id = a.id AND " + organisation_q[:-8])
-            query = query.replace("WHERE ", "WHERE unesco_region_id is not null AND ")
-        cursor = connection.cursor()
-        cursor.execute(query)
+            query.select('sum(a.total_budget) as total_budget', 'count(a.id) as total_projects')
+
+        query.filter(request, 'countries__in', 'c.code')
+        query.filter(request, 'regions__in', 'r.code', *REGION_JOINS)
+        query.filter(request, 'sectors__in', 's.sector_id', SECTOR_JOIN)
+        query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        query.filter_range(request, 'total_budget__lt', 'a.total_budget', '<')
+        query.filter_years(request, 'start_planned__in', 'a.start_planned')
+        query.filter_years(request, 'start_actual__in', 'a.start_actual')
+        if query.filter(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id',
+                        DONOR_JOIN):
+            query.where('apo.role_id = %s', 'Funding')
+        query.filter(request, 'results_title__in', 'res.title', RESULT_JOIN)
+        query.where_like(['c.name'], country_query)
+        query.where_like(
+            ['t.title', 'dis.description', 'oa.identifier', 'c.name'], project_query,
+            TITLE_JOIN,
+            'LEFT JOIN iati_description as dis ON a.id = dis.activity_id',
+            'LEFT JOIN iati_otheridentifier as oa ON a.id = oa.activity_id')
+
+        query.group('c.code')
+        query.order(order_by, order_asc_desc, [
+            'country_name', 'country_id', 'total_projects', 'total_commitment' if total_commitments_q else 'total_budget'])
+        return query
+
+    def country(self, r):
+        loc = r['location']
+        if loc:
+            loc = loc.replace("POINT(", "")
+            loc = loc.replace(")", "")
+            loc_array = loc.split(" ")
+            longitude = loc_array[0]
+            latitude = loc_array[1]
+        else:
+            longitude = None
+            latitude = None
+
+        country = {
+            'id': r['country_id'],
+            'name': r['country_name'],
+            'total_projects': r['total_projects'],
+            'latitude': latitude,
+            'longitude': longitude
+        }
 
-        activities = []
-        results = helper.get_fields(cursor=cursor)
+        if 'total_commitment' in r:
+            country['total_commitment'] = r['total_commitment']
+        else:
+            country['total_budget'] = r['total_budget']
+        return country
 
-        for r in results:
+    def stream_list(self, request, stream, **kwargs):
+        query = self.get_query(request)
+        if request.GET.get("limit", None):
+            query.paginate(request.GET.get("limit"), request.GET.get("offset", 0))
 
-            loc = r['location']
-            if loc:
-                loc = loc.replace("POINT(", "")
-                loc = loc.replace(")", "")
-                loc_array = loc.split(" ")
-                longitude = loc_array[0]
-                latitude = loc_array[1]
-            else:
-                longitude = None
-                latitude = None
+        cursor = query.execute(server_side_cursor())
+        rows = (self.country(r) for r in cursor_rows(cursor))
+        return streaming_response(rows, stream, **self.csv_params())
 
-            country = {
-                'id': r['country_id'],
-                'name': r['country_name'],
-                'total_projects': r['total_projects'],
-                'latitude': latitude,
-                'longitude': longitude
-            }
+    def get_list(self, request, **kwargs):
 
-            if total_commitments_q:
-                country['total_commitment'] = r['total_commitment']
-            else:
-                country['total_budget'] = r['total_budget']
-            activities.append(country)
+        validator = Validator()
+        cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
+        if not 'flush' in cururl and validator.is_cached(cururl):
+            return validator.cached_response(request, cururl)
+
+        helper = CustomCallHelper()
+        output_format = request.GET.get("format", "json")
+
+        query = self.get_query(request)
+        query.paginate(request.GET.get("limit", 999), request.GET.get("offset", 0))
 
-        return_json = {
-            'objects': activities
-        }
         cursor = connection.cursor()
-        query = 'SELECT c.code ' + ''.join(query_join)
-        query += 'WHERE c.code is not null %s GROUP BY c.code' % filter_string
+        query.execute(cursor)
 
-        if include_unesco_empty and organisation_q:
-            query = query.replace(organisation_q, "")
-            query = query.replace(' AND (' + organisation_q[:-6], "")
-            query = query.replace(organisation_q[:-6], "")
-            query = query.replace("LEFT JOIN iati_activity a ON rc.activity_id = a.id", "LEFT JOIN iati_activity a ON rc.activity_id = a.id AND " + organisation_q[:-8])
-            query = query.replace("WHERE ", "WHERE unesco_region_id is not null AND ")
+        activities = [self.country(r) for r in helper.get_fields(cursor=cursor)]
 
-        cursor.execute(query)
-        results2 = helper.get_fields(cursor=cursor)
-        return_json["meta"] = {"total_count": len(results2)}
+        return_json = {
+            'objects': activities
+        }
+        return_json["meta"] = {"total_count": query.count(cursor)}
 
         if output_format == "json":
             return HttpResponse(ujson.dumps(return_json), content_type='application/json')
@@ -768,91 +506,49 @@ class RegionActivitiesResource(ModelResource):
         validator = Validator()
         cururl = request.META['PATH_INFO'] + "?" + request.META['QUERY_STRING']
         if not 'flush' in cururl and validator.is_cached(cururl):
-            return HttpResponse(validator.get_cached_call(cururl), content_type='application/json')
+            return validator.cached_response(request, cururl)
 
         helper = CustomCallHelper()
-        budget_q_gte = request.GET.get('total_budget__gt', None)
-        budget_q_lte = request.GET.get('total_budget__lt', None)
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        sector_q = helper.get_and_query(request, 'sectors__in', 's.sector_id')
-        organisation_q = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        budget_q = ''
-        limit = request.GET.get("limit", 999)
-        offset = request.GET.get("offset", 0)
         order_by = request.GET.get("order_by", "region_name")
         order_asc_desc = request.GET.get("order_asc_desc", "ASC")
-        start_actual_q = helper.get_year_and_query(request, 'start_actual__in', 'a.start_actual')
-        start_planned_q = helper.get_year_and_query(request, 'start_planned__in', 'a.start_planned')
-        vocabulary_q = helper.get_and_query(request, "vocabulary__in", "rv.code")
         region_query = request.GET.get("region", None)
         project_query = request.GET.get("query", None)
-        donor_q = helper.get_and_query(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id')
         output_format = request.GET.get("format", "json")
         total_commitments_q = request.GET.get("total_commitments", None)
 
-        if budget_q_gte:
-            budget_q += ' a.total_budget > "' + budget_q_gte + '" ) AND ('
-        if budget_q_lte:
-            budget_q += ' a.total_budget < "' + budget_q_lte + '" ) AND ('
-
-        filter_string = ''.join([
-            organisation_q,
-            region_q,
-            sector_q,
-            budget_q,
-            start_planned_q,
-            start_actual_q,
-            vocabulary_q,
-            donor_q])
-
-        if filter_string:
-            filter_string = ' AND (' + filter_string[:-7] + ') '
-
-        query_select = [
-            'SELECT r.code as region_id',
-            'r.name as region_name',
-            'AsText(r.center_longlat) as location',
-        ]
-
-        query_join = [
-            'FROM iati_activity a ',
-            'LEFT JOIN iati_activityrecipientregion rr ON rr.activity_id = a.id ',
-            'LEFT JOIN geodata_region r ON rr.region_id = r.code '
-        ]
+        query = SqlQuery('iati_activity a', 'r.code as region_id', 'r.name as region_name',
+                         'AsText(r.center_longlat) as location')
+        query.join(*REGION_JOINS)
+        query.where('r.code is not null')
 
         if total_commitments_q:
-            query_join.append('LEFT JOIN iati_transaction tr ON tr.activity_id = a.id ')
-            query_select.append('sum(tr.value) as total_commitment')
-            query_select.append('count(distinct(a.id)) as total_projects')
-            filter_string += ' AND tr.transaction_type_id = "C" '
+            query.join(COMMITMENT_JOIN)
+            query.select('sum(tr.value) as total_commitment', 'count(distinct(a.id)) as total_projects')
+            query.where('tr.transaction_type_id = %s', 'C')
         else:
-            query_select.append('sum(a.total_budget) as total_budget')
-            query_select.append('count(a.id) as total_projects',)
-
-        if sector_q:
-            query_join.append('LEFT JOIN iati_activitysector s ON a.id = s.activity_id ')
-
-        if vocabulary_q:
-            query_join.append("LEFT JOIN iati_regionvocabulary rv ON r.region_vocabulary_id = rv.code ")
-
-        if region_query:
-            filter_string += 'AND r.name LIKE "%%' + region_query + '%%" '
-
-        if project_query:
-            query_join.append('LEFT JOIN iati_title as t on a.id = t.activity_id ')
-            filter_string += 'AND t.title LIKE "%%' + project_query + '%%" '
-
-        if donor_q:
-            query_join.append('LEFT JOIN iati_activityparticipatingorganisation as apo on a.id = apo.activity_id ')
-            filter_string += ' AND apo.role_id = "Funding" '
+            query.select('sum(a.total_budget) as total_budget', 'count(a.id) as total_projects')
+
+        query.filter(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
+        query.filter(request, 'regions__in', 'r.code')
+        query.filter(request, 'sectors__in', 's.sector_id', SECTOR_JOIN)
+        query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        query.filter_range(request, 'total_budget__lt', 'a.total_budget', '<')
+        query.filter_years(request, 'start_planned__in', 'a.start_planned')
+        query.filter_years(request, 'start_actual__in', 'a.start_actual')
+        query.filter(request, 'vocabulary__in', 'rv.code', VOCABULARY_JOIN)
+        if query.filter(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id',
+                        DONOR_JOIN):
+            query.where('apo.role_id = %s', 'Funding')
+        query.where_like(['r.name'], region_query)
+        query.where_like(['t.title'], project_query, TITLE_JOIN)
+
+        query.group('r.code')
+        query.order(order_by, order_asc_desc, [
+            'region_name', 'region_id', 'total_projects', 'total_commitment' if total_commitments_q else 'total_budget'])
+        query.paginate(request.GET.get("limit", 999), request.GET.get("offset", 0))
 
         cursor = connection.cursor()
-        cursor.execute(
-            ','.join(query_select) + ' ' + ''.join(query_join) +
-            'WHERE r.code is not null %s '\
-            'GROUP BY r.code ' \
-            'ORDER BY %s %s ' \
-            'LIMIT %s OFFSET %s' % (filter_string, order_by, order_asc_desc, limit, offset))
+        query.execute(cursor)
 
         activities = []
 
@@ -885,15 +581,9 @@ class RegionActivitiesResource(ModelResource):
 
             activities.append(region)
 
-        cursor.execute(','.join(query_select) +
-                       ' ' +
-                       ''.join(query_join) +
-                       'WHERE r.code is not null %s GROUP BY r.code ' % filter_string)
-        results2 = helper.get_fields(cursor=cursor)
-
         return_json = {
             'objects': activities,
-            'meta': {"total_count": len(results2)}
+            'meta': {"total_count": query.count(cursor)}
         }
 
         if output_format == "json":
@@ -927,79 +617,35 @@ class GlobalActivitiesResource(ModelResource):
     def get_list(self, request, **kwargs):
 
         helper = CustomCallHelper()
-        budget_q_gte = request.GET.get('total_budget__gt', None)
-        budget_q_lte = request.GET.get('total_budget__lt', None)
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        sector_q = helper.get_and_query(request, 'sectors__in', 's.sector_id')
-        organisation_q = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        budget_q = ''
-        start_actual_q = helper.get_year_and_query(request, 'start_actual__in', 'a.start_actual')
-        start_planned_q = helper.get_year_and_query(request, 'start_planned__in', 'a.start_planned')
-        vocabulary_q = helper.get_and_query(request, "vocabulary__in", "rv.code")
-        project_query = request.GET.get("query", None)
-        donor_q = helper.get_and_query(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id')
         total_commitments_q = request.GET.get("total_commitments", None)
 
-        if budget_q_gte:
-            budget_q += ' a.total_budget > "' + budget_q_gte + '" ) AND ('
-        if budget_q_lte:
-            budget_q += ' a.total_budget < "' + budget_q_lte + '" ) AND ('
-
-        filter_string = ''.join([
-            organisation_q,
-            region_q,
-            sector_q,
-            budget_q,
-            start_planned_q,
-            start_actual_q,
-            vocabulary_q,
-            donor_q])
-
-        if filter_string:
-            filter_string = ' AND (' + filter_string[:-7] + ') '
-
-        query_select = [
-            'SELECT count(a.id) as total_projects',
-        ]
-
-        query_join = [
-            'FROM iati_activity a '
-        ]
+        query = SqlQuery('iati_activity a')
+        query.where('a.scope_id = 1')
 
         if total_commitments_q:
-            query_join.append('LEFT JOIN iati_transaction tr ON tr.activity_id = a.id ')
-            query_select.append('sum(tr.value) as total_commitment')
-            query_select.append('count(distinct(a.id)) as total_projects')
-            filter_string += ' AND tr.transaction_type_id = "C" '
+            query.join(COMMITMENT_JOIN)
+            query.select('sum(tr.value) as total_commitment', 'count(distinct(a.id)) as total_projects')
+            query.where('tr.transaction_type_id = %s', 'C')
         else:
-            query_select.append('sum(a.total_budget) as total_budget')
-            query_select.append('count(a.id) as total_projects',)
-
-        if sector_q:
-            query_join.append('LEFT JOIN iati_activitysector s ON a.id = s.activity_id ')
-
-        if vocabulary_q:
-            query_join.append('LEFT JOIN iati_regionvocabulary rv ON r.region_vocabulary_id = rv.code ')
-
-        if region_q:
-            query_join.append(
-                'LEFT JOIN iati_activityrecipientregion rr ON rr.activity_id = a.id '
-                'LEFT JOIN geodata_region r ON rr.region_id = r.code ')
-
-        if project_query:
-            query_join.append('LEFT JOIN iati_title as t on a.id = t.activity_id ')
-            filter_string += 'AND t.title LIKE "%%' + project_query + '%%" '
-
-        if donor_q:
-            query_join.append('LEFT JOIN iati_activityparticipatingorganisation as apo on a.id = apo.activity_id ')
-            filter_string += ' AND apo.role_id = "Funding" '
+            query.select('sum(a.total_budget) as total_budget', 'count(a.id) as total_projects')
+
+        query.filter(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
+        query.filter(request, 'regions__in', 'r.code', *REGION_JOINS)
+        query.filter(request, 'sectors__in', 's.sector_id', SECTOR_JOIN)
+        query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        query.filter_range(request, 'total_budget__lt', 'a.total_budget', '<')
+        query.filter_years(request, 'start_planned__in', 'a.start_planned')
+        query.filter_years(request, 'start_actual__in', 'a.start_actual')
+        query.filter(request, 'vocabulary__in', 'rv.code', *(REGION_JOINS + (VOCABULARY_JOIN,)))
+        if query.filter(request, 'participating_organisations__organisation__code__in', 'apo.organisation_id',
+                        DONOR_JOIN):
+            query.where('apo.role_id = %s', 'Funding')
+        query.where_like(['t.title'], request.GET.get("query", None), TITLE_JOIN)
+        query.group('a.scope_id')
 
         cursor = connection.cursor()
-        cursor.execute(
-            ','.join(query_select) +
-            ' ' +
-            ''.join(query_join) +
-            'WHERE a.scope_id = 1 %s GROUP BY a.scope_id ' % filter_string)
+        query.execute(cursor)
+
         activities = []
 
         results = helper.get_fields(cursor=cursor)
@@ -1034,77 +680,39 @@ class SectorActivitiesResource(ModelResource):
     def get_list(self, request, **kwargs):
 
         helper = CustomCallHelper()
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        budget_q_gte = request.GET.get('total_budget__gt', None)
-        budget_q_lte = request.GET.get('total_budget__lt', None)
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        sector_q = helper.get_and_query(request, 'sectors__in', 's.code')
-        organisation_q = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        budget_q = ''
-        limit = request.GET.get("limit", 999)
-        offset = request.GET.get("offset", 0)
         order_by = request.GET.get("order_by", "sector_name")
         order_asc_desc = request.GET.get("order_asc_desc", "ASC")
-        search_query = request.GET.get("query", None)
         output_format = request.GET.get("format", "json")
         total_commitments_q = request.GET.get("total_commitments", None)
 
-        if budget_q_gte:
-            budget_q += ' a.total_budget > "' + budget_q_gte + '" ) AND ('
-        if budget_q_lte:
-            budget_q += ' a.total_budget < "' + budget_q_lte + '" ) AND ('
-
-        filter_string = ''.join([
-            country_q,
-            organisation_q,
-            region_q,
-            sector_q,
-            budget_q
-        ])
-        if filter_string:
-            filter_string = ' AND (' + filter_string[:-7] + ') '
-
-        query_select = [
-            'SELECT s.code as sector_id',
-            's.name as sector_name',
-        ]
-
-        query_join = [
-            'FROM iati_activity a ',
-            'LEFT JOIN iati_activitysector acts ON acts.activity_id = a.id '
-            'LEFT JOIN iati_sector s ON s.code = acts.sector_id '
-        ]
+        query = SqlQuery('iati_activity a', 's.code as sector_id', 's.name as sector_name')
+        query.join(
+            'LEFT JOIN iati_activitysector acts ON acts.activity_id = a.id',
+            'LEFT JOIN iati_sector s ON s.code = acts.sector_id')
+        query.where('s.code is not null')
 
         if total_commitments_q:
-            query_join.append('LEFT JOIN iati_transaction tr ON tr.activity_id = a.id ')
-            query_select.append('sum(tr.value) as total_commitment')
-            query_select.append('count(distinct(a.id)) as total_projects')
-            filter_string += ' AND tr.transaction_type_id = "C" '
+            query.join(COMMITMENT_JOIN)
+            query.select('sum(tr.value) as total_commitment', 'count(distinct(a.id)) as total_projects')
+            query.where('tr.transaction_type_id = %s', 'C')
         else:
-            query_select.append('sum(a.total_budget) as total_budget')
-            query_select.append('count(a.id) as total_projects',)
+            query.select('sum(a.total_budget) as total_budget', 'count(a.id) as total_projects')
 
+        query.filter(request, 'countries__in', 'c.code', *COUNTRY_JOINS)
+        query.filter(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
+        query.filter(request, 'regions__in', 'r.code', *REGION_JOINS)
+        query.filter(request, 'sectors__in', 's.code')
+        query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        query.filter_range(request, 'total_budget__lt', 'a.total_budget', '<')
+        query.where_like(['s.name'], request.GET.get("query", None))
 
-        if country_q:
-            query_join.append(
-                'LEFT JOIN iati_activityrecipientcountry rc ON rc.activity_id = a.id '
-                'LEFT JOIN geodata_country c ON rc.region_id = c.code ')
-
-        if region_q:
-            query_join.append(
-                'LEFT JOIN iati_activityrecipientregion rr ON rr.activity_id = a.id '
-                'LEFT JOIN geodata_region r ON rr.region_id = r.code ')
-
-        if search_query:
-            filter_string += 'AND s.name LIKE "%%' + search_query + '%%" '
+        query.group('s.code')
+        query.order(order_by, order_asc_desc, [
+            'sector_name', 'sector_id', 'total_projects', 'total_commitment' if total_commitments_q else 'total_budget'])
+        query.paginate(request.GET.get("limit", 999), request.GET.get("offset", 0))
 
         cursor = connection.cursor()
-        cursor.execute(
-            ','.join(query_select) + ' ' + ''.join(query_join) +
-            'WHERE s.code is not null %s'\
-            'GROUP BY s.code ' \
-            'ORDER BY %s %s ' \
-            'LIMIT %s OFFSET %s' % (filter_string, order_by, order_asc_desc, limit, offset))
+        query.execute(cursor)
 
         activities = []
 
@@ -1122,14 +730,9 @@ class SectorActivitiesResource(ModelResource):
 
             activities.append(sector)
 
-        cursor.execute(','.join(query_select) + ' ' + ''.join(query_join) +
-                       'WHERE s.code is not null %s GROUP BY s.code ' % filter_string)
-
-        results2 = helper.get_fields(cursor=cursor)
-
         return_json = {
             'objects': activities,
-            'meta': {'total_count': len(results2)}
+            'meta': {'total_count': query.count(cursor)}
         }
 
         if output_format == "json":
@@ -1163,101 +766,44 @@ class DonorActivitiesResource(ModelResource):
     def get_list(self, request, **kwargs):
 
         helper = CustomCallHelper()
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        budget_q_gte = request.GET.get('total_budget__gt', None)
-        budget_q_lte = request.GET.get('total_budget__lt', None)
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        sector_q = helper.get_and_query(request, 'sectors__in', 's.sector_id')
-        donor_q = helper.get_and_query(request, 'donors__in', 'apo.organisation_id')
-        organisation_q = helper.get_and_query(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
-        start_actual_q = helper.get_year_and_query(request, 'start_actual__in', 'a.start_actual')
-        start_planned_q = helper.get_year_and_query(request, 'start_planned__in', 'a.start_planned')
-        budget_q = ''
-        limit = request.GET.get("limit", 999)
-        offset = request.GET.get("offset", 0)
         order_by = request.GET.get("order_by", "apo.name")
         order_asc_desc = request.GET.get("order_asc_desc", "ASC")
-        donor_query = request.GET.get("donor", None)
-        project_query = request.GET.get("query", None)
         output_format = request.GET.get("format", "json")
         total_commitments_q = request.GET.get("total_commitments", None)
 
-        if budget_q_gte:
-            budget_q += ' a.total_budget > "' + budget_q_gte + '" ) AND ('
-        if budget_q_lte:
-            budget_q += ' a.total_budget < "' + budget_q_lte + '" ) AND ('
-
-        filter_string = ''.join([
-            country_q,
-            organisation_q,
-            region_q,
-            sector_q,
-            budget_q,
-            start_planned_q,
-            start_actual_q,
-            donor_q
-        ])
-
-        if filter_string:
-            filter_string = ' AND (' + filter_string[:-7] + ') '
-
-        query_select = [
-            'SELECT apo.organisation_id as organisation_id',
-            'apo.name as organisation_name',
-            'count(a.id) as total_projects',
-            'sum(a.total_budget) as total_budget'
-        ]
-
-        query_join = [
-            'FROM iati_activity a ',
-            'LEFT JOIN iati_activityparticipatingorganisation as apo on a.id = apo.activity_id ',
-        ]
+        query = SqlQuery('iati_activity a', 'apo.organisation_id as organisation_id',
+                         'apo.name as organisation_name')
+        query.join(DONOR_JOIN)
+        query.where('apo.name is not null')
+        query.where('apo.role_id = %s', 'Funding')
 
         if total_commitments_q:
-            query_join.append('LEFT JOIN iati_transaction tr ON tr.activity_id = a.id ')
-            query_select.append('sum(tr.value) as total_commitment')
-            query_select.append('count(distinct(a.id)) as total_projects')
-            filter_string += ' AND tr.transaction_type_id = "C" '
+            query.join(COMMITMENT_JOIN)
+            query.select('sum(tr.value) as total_commitment', 'count(distinct(a.id)) as total_projects')
+            query.where('tr.transaction_type_id = %s', 'C')
         else:
-            query_select.append('sum(a.total_budget) as total_budget')
-            query_select.append('count(a.id) as total_projects',)
-
-        if region_q:
-            query_join.append(
-                'LEFT JOIN iati_activityrecipientregion rr ON rr.activity_id = a.id '
-                'LEFT JOIN geodata_region r ON rr.region_id = r.code ')
-
-        if sector_q:
-            query_join.append('LEFT JOIN iati_activitysector s ON a.id = s.activity_id ')
-
-        if country_q:
-            query_join.append(
-                'LEFT JOIN iati_activityrecipientcountry as rc on rc.activity_id = a.id '
-                'LEFT JOIN geodata_country c on rc.country_id = c.code ')
-            filter_string += ' AND apo.role_id = "Funding" '
-
-        filter_string += ' AND apo.role_id = "Funding" '
-
-        if donor_query:
-            filter_string += 'AND apo.name LIKE "%%' + donor_query + '%%" '
-
-        if project_query:
-            query_join.append('LEFT JOIN iati_title as t on a.id = t.activity_id ')
-            filter_string += 'AND t.title LIKE "%%' + project_query + '%%" '
+            query.select('sum(a.total_budget) as total_budget', 'count(a.id) as total_projects')
+
+        query.filter(request, 'countries__in', 'c.code', *COUNTRY_JOINS)
+        query.filter(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
+        query.filter(request, 'regions__in', 'r.code', *REGION_JOINS)
+        query.filter(request, 'sectors__in', 's.sector_id', SECTOR_JOIN)
+        query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        query.filter_range(request, 'total_budget__lt', 'a.total_budget', '<')
+        query.filter_years(request, 'start_planned__in', 'a.start_planned')
+        query.filter_years(request, 'start_actual__in', 'a.start_actual')
+        query.filter(request, 'donors__in', 'apo.organisation_id')
+        query.where_like(['apo.name'], request.GET.get("donor", None))
+        query.where_like(['t.title'], request.GET.get("query", None), TITLE_JOIN)
+
+        query.group('apo.name')
+        query.order(order_by, order_asc_desc, [
+            'apo.name', 'organisation_name', 'organisation_id', 'total_projects',
+            'total_commitment' if total_commitments_q else 'total_budget'])
+        query.paginate(request.GET.get("limit", 999), request.GET.get("offset", 0))
 
         cursor = connection.cursor()
-        cursor.execute(
-            ','.join(query_select) + ' ' + ''.join(query_join) +
-            'WHERE apo.name is not null %s'
-            'GROUP BY apo.name '
-            'ORDER BY %s %s '
-            'LIMIT %s OFFSET %s'
-            % (
-                filter_string,
-                order_by,
-                order_asc_desc,
-                limit,
-                offset))
+        query.execute(cursor)
 
         activities = []
 
@@ -1276,17 +822,9 @@ class DonorActivitiesResource(ModelResource):
 
             activities.append(donor)
 
-        cursor.execute(
-            ','.join(query_select) + ' ' + ''.join(query_join) +
-            'WHERE apo.name is not null %s'
-            'GROUP BY apo.name '
-            % filter_string
-        )
-        results2 = helper.get_fields(cursor=cursor)
-
         return_json = {
             'objects': activities,
-            'meta': {"total_count": len(results2)}
+            'meta': {"total_count": query.count(cursor)}
         }
 
         if output_format == "json":
@@ -1307,65 +845,43 @@ class DonorActivitiesResource(ModelResource):
             return HttpResponse(csv_content, content_type='text/csv')
 
 
-class ActivityListVisResource(ModelResource):
+class ActivityListVisResource(StreamingListMixin, ModelResource):
 
     class Meta:
         resource_name = 'activity-list-vis'
         allowed_methods = ['get']
 
+    def get_query(self, request):
+        query = SqlQuery('iati_activity as a', 'a.id', 'r.code', 'r.name', 't.title', 'a.total_budget')
+        query.join(
+            'JOIN iati_activityrecipientregion as rr on a.id = rr.activity_id',
+            'JOIN geodata_region as r on r.code = rr.region_id',
+            'JOIN iati_title as t on a.id = t.activity_id')
+        query.filter(request, 'reporting_organisation__in', 'a.reporting_organisation_id')
+        query.filter(request, 'countries__in', 'c.code', *COUNTRY_JOINS)
+        query.filter(request, 'regions__in', 'r.code')
+        query.filter(request, 'sectors__in', 's.sector_id', SECTOR_JOIN)
+        query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        query.filter_range(request, 'total_budget__lt', 'a.total_budget', '<')
+        query.where_like(['t.title'], request.GET.get("query", None))
+        query.order('a.id', 'ASC', ['a.id'])
+        return query
+
+    def stream_list(self, request, stream, **kwargs):
+        # all activities, the list call stops at 5000
+        query = self.get_query(request)
+        cursor = query.execute(server_side_cursor())
+        return streaming_response(cursor_rows(cursor), stream, **self.csv_params())
 
     def get_list(self, request, **kwargs):
 
         helper = CustomCallHelper()
         cursor = connection.cursor()
-        organisations = request.GET.get("reporting_organisation__in", None)
-        country_q = helper.get_and_query(request, 'countries__in', 'c.code')
-        region_q = helper.get_and_query(request, 'regions__in', 'r.code')
-        sector_q = helper.get_and_query(request, 'sectors__in', 's.sector_id')
-        budget_q_gte = request.GET.get('total_budget__gt', None)
-        budget_q_lte = request.GET.get('total_budget__lt', None)
-        query = request.GET.get("query", None)
-
-        budget_q = ''
-        if budget_q_gte:
-            budget_q += ' a.total_budget > "' + budget_q_gte + '" ) AND ('
-        if budget_q_lte:
-            budget_q += ' a.total_budget < "' + budget_q_lte + '" ) AND ('
-
-        if organisations:
-            q_organisations = 'AND a.reporting_organisation_id = "' + organisations + '"'
-        else:
-            q_organisations = ""
-
-        filter_string = ' AND (' + country_q + region_q + sector_q + budget_q + ')'
-        if 'AND ()' in filter_string:
-            filter_string = filter_string[:-6]
-
-        filter_country = ''
-        if country_q:
-            filter_country = 'LEFT JOIN iati_activityrecipientcountry as rc on rc.activity_id = a.id LEFT JOIN geodata_country c on rc.country_id = c.code '
-
-        filter_sector = ''
-        if sector_q:
-            filter_sector = 'LEFT JOIN iati_activitysector s ON a.id = s.activity_id '
-
-        if query:
-            filter_string += 'AND t.title LIKE "%%' + query + '%%" '
-
-        cursor.execute('SELECT a.id, r.code, r.name, t.title, a.total_budget '
-        'FROM iati_activity as a '
-        'JOIN iati_activityrecipientregion as rr on a.id = rr.activity_id '
-        'JOIN geodata_region as r on r.code = rr.region_id '
-        'JOIN iati_title as t on a.id = t.activity_id '
-        '%s %s '
-        'WHERE 1 %s %s '
-        'order by a.id LIMIT 5000' % (filter_country, filter_sector, q_organisations, filter_string))
-        results1 = helper.get_fields(cursor=cursor)
-
-        activities = []
 
-        for r in results1:
-            activities.append(r)
+        query = self.get_query(request)
+        query.paginate(5000)
+        query.execute(cursor)
+        activities = helper.get_fields(cursor=cursor)
 
         return HttpResponse(ujson.dumps(activities), content_type='application/json')
 
@@ -0,0 +1,191 @@
+from builtins import object
+import csv
+
+import ujson
+from django.conf import settings
+from django.db import connection
+from django.http import StreamingHttpResponse
+from future.utils import PY2, text_type
+
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def stream_format(request):
+    """
+    The format of a streamed response (?stream=json|ndjson|csv, or
+    ?stream=true for the ?format of the call), None for a normal response
+    """
+    stream = request.GET.get('stream', None)
+    if stream in STREAM_CONTENT_TYPES:
+        return stream
+    if stream in ('true', '1'):
+        output_format = request.GET.get('format', 'json')
+        if output_format in STREAM_CONTENT_TYPES:
+            return output_format
+        return 'json'
+    return None
+
+
+def json_array(rows):
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + ujson.dumps(row)
+        separator = ','
+    yield ']'
+
+
+def ndjson(rows):
+    for row in rows:
+        yield ujson.dumps(row) + '\n'
+
+
+class Echo(object):
+    """
+    A file for csv.writer that returns the lines instead of storing them
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    # the csv module of Python 2 writes bytes
+    if PY2 and isinstance(value, text_type):
+        return value.encode('utf-8', 'ignore')
+    if not PY2 and isinstance(value, bytes):
+        return value.decode('utf-8', 'ignore')
+    return value
+
+
+def csv_rows(rows, fieldnames=None, **fmtparams):
+    """
+    The lines of a CSV file of rows (dicts), starting with the header. The
+    columns are fieldnames, by default the keys of the first row.
+    """
+    writer = None
+    for row in rows:
+        if writer is None:
+            if fieldnames is None:
+                fieldnames = list(row.keys())
+            writer = csv.DictWriter(Echo(), fieldnames, extrasaction='ignore', **fmtparams)
+            yield writer.writer.writerow([csv_value(name) for name in fieldnames])
+        yield writer.writerow(dict((key, csv_value(value)) for key, value in row.items()))
+
+
+def streaming_response(rows, stream, **csv_params):
+    """
+    A StreamingHttpResponse encoding rows while it is sent
+    """
+    if stream == 'csv':
+        content = csv_rows(rows, **csv_params)
+    elif stream == 'ndjson':
+        content = ndjson(rows)
+    else:
+        content = json_array(rows)
+    return StreamingHttpResponse(content, content_type=STREAM_CONTENT_TYPES[stream])
+
+
+def server_side_cursor():
+    """
+    A cursor that reads the rows of its query from the database while they
+    are fetched. The usual MySQL cursor loads the whole result on execute.
+    The connection can not run other queries until all rows are read.
+    """
+    connection.ensure_connection()
+    if connection.vendor == 'mysql':
+        from MySQLdb.cursors import SSCursor
+        return connection.connection.cursor(SSCursor)
+    return connection.cursor()
+
+
+def cursor_rows(cursor, chunk_size=None):
+    """
+    The rows of an executed cursor as dicts, fetched chunk_size at a time
+    """
+    chunk_size = chunk_size or settings.API_STREAM_CHUNK_SIZE
+    try:
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        cursor.close()
+
+
+class StreamingListMixin(object):
+    """
+    Answers list calls with ?stream= with a StreamingHttpResponse, see
+    stream_format. Tastypie replaces responses that are not an HttpResponse
+    with a 204, so these calls are handled before its dispatch. The
+    response is not cached.
+    """
+
+    def dispatch(self, request_type, request, **kwargs):
+        stream = stream_format(request)
+        if request_type != 'list' or stream is None:
+            return super(StreamingListMixin, self).dispatch(request_type, request, **kwargs)
+
+        self.method_check(request, allowed=self._meta.list_allowed_methods)
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        self.log_throttled_access(request)
+        return self.stream_list(request, stream, **kwargs)
+
+    def stream_list(self, request, stream, **kwargs):
+        """
+        All objects of the call (limit and offset are ignored), dehydrated
+        as for get_list
+        """
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        objects = self.apply_sorting(objects, options=request.GET)
+
+        serializer = self._meta.serializer
+        rows = (serializer.to_simple(bundle, {}) for bundle in self.stream_bundles(request, objects))
+        if stream == 'csv' and hasattr(serializer, 'set_data'):
+            rows = (serializer.set_data(row) for row in rows)
+        return streaming_response(rows, stream, **self.csv_params())
+
+    def csv_params(self):
+        """
+        The CSV dialect of the serializer, so ?stream=csv writes the same
+        CSV as ?format=csv
+        """
+        return getattr(self._meta.serializer, 'csv_params', {})
+
+    def stream_bundles(self, request, objects):
+        """
+        The dehydrated objects, settings.API_STREAM_CHUNK_SIZE at a time. An
+        unsorted list is read in primary key order, so a chunk does not
+        have to skip the rows of the chunks before it.
+        """
+        chunk_size = settings.API_STREAM_CHUNK_SIZE
+        sorted_by_call = bool(objects.query.order_by)
+        if not sorted_by_call:
+            objects = objects.order_by('pk')
+
+        offset = 0
+        last_pk = None
+        while True:
+            if sorted_by_call:
+                chunk = objects[offset:offset + chunk_size]
+            elif last_pk is None:
+                chunk = objects[:chunk_size]
+            else:
+                chunk = objects.filter(pk__gt=last_pk)[:chunk_size]
+
+            chunk = list(chunk)
+            if not chunk:
+                return
+            for obj in chunk:
+                yield self.full_dehydrate(self.build_bundle(obj=obj, request=request), for_list=True)
+            offset += len(chunk)
+            last_pk = chunk[-1].pk
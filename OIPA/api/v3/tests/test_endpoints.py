@@ -1,5 +1,6 @@
 from builtins import object
 import pytest
+import ujson
 from django.test.client import Client
 from iati.factory import iati_factory
 
@@ -39,6 +40,14 @@ class TestEndpoints(object):
         response = client.get('/api/v3/activities/')
         assert response.status_code == 200
 
+    def test_activities_stream_ndjson(self, client, activity):
+        response = client.get('/api/v3/activities/?stream=ndjson')
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Type'] == 'application/x-ndjson'
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        assert [ujson.loads(line)['id'] for line in lines] == ['IATI-0001']
+
     def test_activity_detail_endpoint(self, client, activity):
         response = client.get('/api/v3/activities/IATI-0001/')
         assert response.status_code == 200
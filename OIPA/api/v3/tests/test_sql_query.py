@@ -0,0 +1,67 @@
+from builtins import object
+import pytest
+from django.test import RequestFactory
+
+from api.v3.resources.sql_query import SqlQuery
+
+
+class TestSqlQuery(object):
+
+    @pytest.fixture
+    def factory(self):
+        return RequestFactory()
+
+    def test_no_filters(self):
+        query = SqlQuery('iati_activity a', 'a.id')
+        assert query.sql() == ('SELECT a.id FROM iati_activity a', [])
+
+    def test_filter_values_are_parameters(self, factory):
+        request = factory.get('/', {'countries__in': 'NL,"; DROP TABLE iati_activity; --'})
+        query = SqlQuery('iati_activity a', 'a.id')
+        assert query.filter(request, 'countries__in', 'c.code', 'LEFT JOIN geodata_country c ON c.code = a.id')
+
+        sql, params = query.sql()
+        assert sql == ('SELECT a.id FROM iati_activity a LEFT JOIN geodata_country c ON c.code = a.id '
+                       'WHERE (c.code IN (%s, %s))')
+        assert params == ['NL', '"; DROP TABLE iati_activity; --']
+
+    def test_missing_filter_adds_no_join(self, factory):
+        query = SqlQuery('iati_activity a', 'a.id')
+        assert not query.filter(factory.get('/', {'sectors__in': ','}), 'sectors__in', 's.sector_id', 'JOIN s')
+        assert query.sql() == ('SELECT a.id FROM iati_activity a', [])
+
+    def test_join_once(self):
+        query = SqlQuery('iati_activity a', 'a.id')
+        query.where_in('r.code', ['1'], 'JOIN rr', 'JOIN r')
+        query.where_in('r.name', ['x'], 'JOIN rr', 'JOIN r')
+        assert query.sql()[0] == 'SELECT a.id FROM iati_activity a JOIN rr JOIN r WHERE (r.code IN (%s)) AND (r.name IN (%s))'
+
+    def test_join_parameters_come_first(self):
+        query = SqlQuery('geodata_country c', 'c.code')
+        query.where('c.code is not null')
+        query.where('c.name = %s', 'Kenya')
+        query.join_on('LEFT JOIN iati_activity a ON a.reporting_organisation_id = %s', 'NL-1')
+        assert query.sql()[1] == ['NL-1', 'Kenya']
+
+    def test_years_and_ranges(self, factory):
+        request = factory.get('/', {'start_actual__in': '2012,x', 'total_budget__gt': '10; --'})
+        query = SqlQuery('iati_activity a', 'a.id')
+        query.filter_years(request, 'start_actual__in', 'a.start_actual')
+        assert not query.filter_range(request, 'total_budget__gt', 'a.total_budget', '>')
+        assert query.sql() == ('SELECT a.id FROM iati_activity a WHERE (YEAR(a.start_actual) IN (%s))', [2012])
+
+    def test_like(self):
+        query = SqlQuery('iati_activity a', 'a.id')
+        query.where_like(['t.title', 'c.name'], 'water', 'JOIN t')
+        assert query.sql() == (
+            'SELECT a.id FROM iati_activity a JOIN t WHERE ((t.title LIKE %s OR c.name LIKE %s))',
+            ['%water%', '%water%'])
+
+    def test_order_and_pagination(self):
+        query = SqlQuery('iati_activity a', 'a.id', 'count(a.id) as total')
+        query.group('a.id')
+        query.order('total; DROP TABLE iati_activity', 'desc', ['a.id', 'total'])
+        query.paginate('10', 'x')
+        assert query.sql()[0] == ('SELECT a.id, count(a.id) as total FROM iati_activity a '
+                                  'GROUP BY a.id ORDER BY a.id DESC LIMIT 10 OFFSET 0')
+        assert query.sql(paginate=False)[0] == 'SELECT a.id, count(a.id) as total FROM iati_activity a GROUP BY a.id'
@@ -0,0 +1,41 @@
+from builtins import object
+import csv
+
+import pytest
+import ujson
+from django.test import RequestFactory
+
+from api.v3.resources.streaming import csv_rows, json_array, ndjson, stream_format
+
+
+class TestStreaming(object):
+
+    @pytest.fixture
+    def factory(self):
+        return RequestFactory()
+
+    def test_stream_format(self, factory):
+        assert stream_format(factory.get('/')) is None
+        assert stream_format(factory.get('/', {'stream': 'ndjson'})) == 'ndjson'
+        assert stream_format(factory.get('/', {'stream': 'true', 'format': 'csv'})) == 'csv'
+        assert stream_format(factory.get('/', {'stream': 'true', 'format': 'xml'})) == 'json'
+        assert stream_format(factory.get('/', {'stream': 'xml'})) is None
+
+    def test_json_array(self):
+        rows = [{'id': 1}, {'id': 2}]
+        assert ujson.loads(''.join(json_array(iter(rows)))) == rows
+        assert ''.join(json_array(iter([]))) == '[]'
+
+    def test_ndjson(self):
+        lines = list(ndjson(iter([{'id': 1}, {'id': 2}])))
+        assert [ujson.loads(line) for line in lines] == [{'id': 1}, {'id': 2}]
+        assert all(line.endswith('\n') for line in lines)
+
+    def test_csv_rows(self):
+        rows = [{'id': 'a', 'total': 1}, {'id': 'b', 'total': 2, 'extra': 'x'}]
+        lines = list(csv_rows(iter(rows), fieldnames=['id', 'total'], delimiter=';'))
+        assert lines == ['id;total\r\n', 'a;1\r\n', 'b;2\r\n']
+
+    def test_csv_rows_quoting(self):
+        lines = list(csv_rows(iter([{'id': 'a'}]), delimiter=';', quotechar="'", quoting=csv.QUOTE_NONNUMERIC))
+        assert lines == ["'id'\r\n", "'a'\r\n"]
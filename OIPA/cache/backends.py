@@ -0,0 +1,133 @@
+from builtins import object
+import base64
+import datetime
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from django.utils.text import compress_string
+
+from cache.models import CachedCall
+
+
+def call_key(call):
+    # calls can be longer than memcached and redis keys are comfortable with
+    return 'api:' + hashlib.sha1(call.encode('utf-8')).hexdigest()
+
+
+class CachedResponse(object):
+    """
+    A cached API response, gzip compressed. The ETag and the compressed
+    length are computed once, when the response is cached.
+    """
+
+    def __init__(self, gzipped, etag):
+        self.gzipped = gzipped
+        self.etag = etag
+
+    @classmethod
+    def from_data(cls, data):
+        data = data.encode('utf-8')
+        return cls(compress_string(data), '"%s"' % hashlib.sha1(data).hexdigest())
+
+    @property
+    def length(self):
+        return len(self.gzipped)
+
+    @property
+    def data(self):
+        # 16 + MAX_WBITS: data with a gzip header
+        return zlib.decompress(self.gzipped, 16 + zlib.MAX_WBITS).decode('utf-8')
+
+    def dumps(self):
+        """
+        The response as text, for the backends that store text
+        """
+        return self.etag + '\n' + base64.b64encode(self.gzipped).decode('ascii')
+
+    @classmethod
+    def loads(cls, text):
+        etag, gzipped = text.split('\n', 1)
+        return cls(base64.b64decode(gzipped), etag)
+
+
+class DatabaseBackend(object):
+    """
+    Responses stored as CachedCall rows, the result column holds
+    CachedResponse.dumps(). Setting a new version of a call removes the rows
+    of its older versions.
+    """
+
+    def get(self, call):
+        try:
+            return CachedResponse.loads(CachedCall.objects.values_list('result', flat=True).get(call=call))
+        except CachedCall.DoesNotExist:
+            return None
+
+    def set(self, call, data):
+        result = CachedResponse.from_data(data).dumps()
+        CachedCall(call=call, result=result, last_fetched=datetime.datetime.now()).save()
+        if '#' in call:
+            prefix = call.rsplit('#', 1)[0] + '#'
+            CachedCall.objects.filter(call__startswith=prefix).exclude(call=call).delete()
+
+    def delete(self, call):
+        CachedCall.objects.filter(call=call).delete()
+
+
+class DjangoCacheBackend(object):
+    """
+    Responses in the Django cache settings.API_CACHE_ALIAS. With the
+    local-memory cache every process has its own, size bounded copy (see
+    MAX_ENTRIES in CACHES).
+    """
+
+    def __init__(self):
+        self.cache = caches[settings.API_CACHE_ALIAS]
+
+    def get(self, call):
+        return self.cache.get(call_key(call))
+
+    def set(self, call, data):
+        self.cache.set(call_key(call), CachedResponse.from_data(data), settings.API_CACHE_TIMEOUT)
+
+    def delete(self, call):
+        self.cache.delete(call_key(call))
+
+
+class RedisBackend(object):
+    """
+    Responses in Redis, shared by all processes. Eviction when Redis is full
+    follows its maxmemory-policy (allkeys-lru is a good fit).
+    """
+
+    def __init__(self):
+        import redis
+        self.redis = redis.StrictRedis.from_url(settings.API_CACHE_REDIS_URL)
+
+    def get(self, call):
+        data = self.redis.get(call_key(call))
+        if data is None:
+            return None
+        return CachedResponse.loads(data.decode('ascii'))
+
+    def set(self, call, data):
+        self.redis.setex(call_key(call), settings.API_CACHE_TIMEOUT, CachedResponse.from_data(data).dumps())
+
+    def delete(self, call):
+        self.redis.delete(call_key(call))
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    The backend configured in settings.API_CACHE_BACKEND, one per process.
+    """
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.API_CACHE_BACKEND)()
+    return _backend
@@ -0,0 +1,93 @@
+from future import standard_library
+standard_library.install_aliases()
+from builtins import str
+from builtins import object
+import hashlib
+import threading
+import time
+import urllib.parse
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from cache.models import DataVersion
+
+GLOBAL = 'global'
+# query parameters that limit a call to the activities of reporting organisations
+ORGANISATION_PARAMETERS = ('reporting_organisation__in', 'reporting_organisation')
+
+
+def organisation_key(code):
+    return 'org:' + code
+
+
+class DataVersions(object):
+    """
+    Version counters of the parsed data, globally and per reporting
+    organisation. A parse bumps the global version and the versions of the
+    organisations in the parsed source.
+
+    Cached API responses are stored under a key with the versions of the
+    data they depend on (tag), so a parse only invalidates the responses of
+    the changed organisations, and the responses that are not limited to
+    organisations. The versions are read from the database at most every
+    settings.API_CACHE_VERSION_TTL seconds per process.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.versions = {}
+        self.read_at = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl is None:
+            self.ttl = settings.API_CACHE_VERSION_TTL
+
+        with self.lock:
+            if time.time() - self.read_at >= self.ttl:
+                self.versions = dict(DataVersion.objects.values_list('key', 'version'))
+                self.read_at = time.time()
+            return self.versions.get(key, 0)
+
+    def keys(self, call):
+        """
+        The version keys a call depends on
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(call).query)
+        codes = []
+        for parameter in ORGANISATION_PARAMETERS:
+            for value in query.get(parameter, []):
+                codes.extend(code.strip() for code in value.split(',') if code.strip())
+
+        if codes:
+            return [organisation_key(code) for code in sorted(set(codes))]
+        return [GLOBAL]
+
+    def tag(self, call):
+        versions = [str(self.get(key)) for key in self.keys(call)]
+        if len(versions) == 1:
+            return 'v' + versions[0]
+        return 'v' + hashlib.sha1(','.join(versions).encode('utf-8')).hexdigest()[:8]
+
+    def bump(self, organisation_codes):
+        keys = [GLOBAL] + [organisation_key(code) for code in set(organisation_codes) if code]
+
+        with transaction.atomic():
+            existing = set(DataVersion.objects.filter(key__in=keys).values_list('key', flat=True))
+            DataVersion.objects.filter(key__in=existing).update(version=F('version') + 1)
+            for key in keys:
+                if key not in existing:
+                    try:
+                        with transaction.atomic():
+                            DataVersion.objects.create(key=key, version=1)
+                    except IntegrityError:
+                        # created by another process in the meantime
+                        DataVersion.objects.filter(key=key).update(version=F('version') + 1)
+
+        # this process sees its own changes right away
+        self.read_at = 0
+
+
+data_versions = DataVersions()
@@ -23,6 +23,14 @@ class CachedCall(models.Model):
     def __unicode__(self,):
         return "%s" % (self.call)
 
+class DataVersion(models.Model):
+    # 'global', or 'org:' + the code of a reporting organisation
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.IntegerField(default=0)
+
+    def __unicode__(self,):
+        return "%s: %d" % (self.key, self.version)
+
 
 
 
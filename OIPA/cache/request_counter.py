@@ -0,0 +1,77 @@
+from builtins import object
+from collections import defaultdict
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from cache.models import RequestedCall
+
+
+class RequestCounter(object):
+    """
+    Counts the API requests per call in memory. The counts are added to
+    RequestedCall when settings.API_CACHE_COUNT_FLUSH_INTERVAL seconds have
+    passed since the last flush, so serving a request does not write to the
+    database.
+    """
+
+    max_calls = 1000
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval
+        self.counts = defaultdict(int)
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, call):
+        if self.flush_interval is None:
+            self.flush_interval = settings.API_CACHE_COUNT_FLUSH_INTERVAL
+
+        with self.lock:
+            self.counts[call] += 1
+            due = time.time() - self.last_flush >= self.flush_interval or len(self.counts) >= self.max_calls
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            counts = self.counts
+            self.counts = defaultdict(int)
+            self.last_flush = time.time()
+
+        if not counts:
+            return
+
+        now = datetime.datetime.now()
+        calls = list(counts)
+        existing = set(RequestedCall.objects.filter(call__in=calls).values_list('call', flat=True))
+
+        # one UPDATE per distinct count
+        by_count = defaultdict(list)
+        for call in existing:
+            by_count[counts[call]].append(call)
+        for count, count_calls in by_count.items():
+            RequestedCall.objects.filter(call__in=count_calls).update(
+                count=F('count') + count, last_requested=now)
+
+        new_calls = [
+            RequestedCall(call=call, cached=False, response_time=None, count=counts[call])
+            for call in calls if call not in existing]
+        try:
+            with transaction.atomic():
+                RequestedCall.objects.bulk_create(new_calls)
+        except IntegrityError:
+            # another process added some of the calls in the meantime
+            for requested_call in new_calls:
+                updated = RequestedCall.objects.filter(call=requested_call.call).update(
+                    count=F('count') + requested_call.count, last_requested=now)
+                if not updated:
+                    requested_call.save()
+
+
+request_counter = RequestCounter()
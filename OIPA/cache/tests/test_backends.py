@@ -0,0 +1,96 @@
+import gzip
+import io
+from django.test import RequestFactory, TestCase
+from cache import backends
+from cache.backends import CachedResponse, DatabaseBackend, DjangoCacheBackend
+from cache.models import RequestedCall
+from cache.request_counter import RequestCounter, request_counter
+from cache.validator import Validator
+
+
+CALL = '/api/v3/activity-filter-options/?format=json'
+
+
+class BackendTestCase(TestCase):
+    """
+    Test storing responses in the cache backends
+    """
+    def check_backend(self, backend):
+        self.assertIsNone(backend.get(CALL))
+        backend.set(CALL, '{"countries": []}')
+        self.assertEqual('{"countries": []}', backend.get(CALL).data)
+        backend.delete(CALL)
+        self.assertIsNone(backend.get(CALL))
+
+    def test_database_backend(self):
+        self.check_backend(DatabaseBackend())
+
+    def test_django_cache_backend(self):
+        self.check_backend(DjangoCacheBackend())
+
+    def test_validator(self):
+        """
+        Test if the validator serves the response from the configured
+        backend without writing to the database
+        """
+        backends._backend = DjangoCacheBackend()
+        flush_interval = request_counter.flush_interval
+        request_counter.flush_interval = 3600
+        request_counter.flush()
+        try:
+            validator = Validator()
+            backends._backend.set(validator.cache_key(CALL), '{}')
+            with self.assertNumQueries(0):
+                self.assertTrue(validator.is_cached(CALL))
+                self.assertEqual('{}', validator.get_cached_call(CALL))
+                self.assertFalse(validator.is_cached(CALL + '&page=2'))
+        finally:
+            backends._backend = None
+            request_counter.flush_interval = flush_interval
+
+    def test_cached_response(self):
+        """
+        Test serving the compressed response and answering a matching ETag
+        with 304
+        """
+        validator = Validator()
+        validator.backend = DatabaseBackend()
+        validator.backend.set(validator.cache_key(CALL), '{"countries": []}')
+        factory = RequestFactory()
+
+        response = validator.cached_response(factory.get(CALL, HTTP_ACCEPT_ENCODING='gzip, deflate'), CALL)
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(str(len(response.content)), response['Content-Length'])
+        self.assertEqual(b'{"countries": []}', gzip.GzipFile(fileobj=io.BytesIO(response.content)).read())
+
+        response = validator.cached_response(factory.get(CALL), CALL)
+        self.assertEqual(b'{"countries": []}', response.content)
+
+        etag = response['ETag']
+        response = validator.cached_response(factory.get(CALL, HTTP_IF_NONE_MATCH=etag), CALL)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+
+    def test_cached_response_dumps(self):
+        cached = CachedResponse.from_data(u'{"name": "C\u00f4te d\u2019Ivoire"}')
+        loaded = CachedResponse.loads(cached.dumps())
+        self.assertEqual(cached.etag, loaded.etag)
+        self.assertEqual(u'{"name": "C\u00f4te d\u2019Ivoire"}', loaded.data)
+
+
+class RequestCounterTestCase(TestCase):
+    """
+    Test counting requests in memory
+    """
+    def test_counts_added_on_flush(self):
+        RequestedCall.objects.create(call=CALL, count=5)
+        counter = RequestCounter(flush_interval=3600)
+
+        for i in range(3):
+            counter.add(CALL)
+        counter.add('/api/v3/countries/')
+        self.assertEqual(5, RequestedCall.objects.get(call=CALL).count)
+
+        counter.flush()
+        self.assertEqual(8, RequestedCall.objects.get(call=CALL).count)
+        self.assertEqual(1, RequestedCall.objects.get(call='/api/v3/countries/').count)
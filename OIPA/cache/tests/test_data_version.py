@@ -0,0 +1,38 @@
+from django.test import TestCase
+from cache.backends import DatabaseBackend
+from cache.data_version import DataVersions
+from cache.models import CachedCall, DataVersion
+
+
+CALL = '/api/v3/activity-aggregate-any/?format=json&reporting_organisation__in=NL-1,GB-1'
+
+
+class DataVersionTestCase(TestCase):
+    """
+    Test versioning the cached responses by the data they depend on
+    """
+    def test_keys(self):
+        data_versions = DataVersions(ttl=0)
+        self.assertEqual(['org:GB-1', 'org:NL-1'], data_versions.keys(CALL))
+        self.assertEqual(['global'], data_versions.keys('/api/v3/countries/?format=json'))
+
+    def test_bump_changes_tags_of_the_organisations(self):
+        data_versions = DataVersions(ttl=0)
+        other_call = '/api/v3/activities/?format=json&reporting_organisation__in=US-1'
+        global_call = '/api/v3/countries/?format=json'
+        tag, other_tag, global_tag = [data_versions.tag(c) for c in (CALL, other_call, global_call)]
+
+        data_versions.bump(['NL-1'])
+        self.assertNotEqual(tag, data_versions.tag(CALL))
+        self.assertEqual(other_tag, data_versions.tag(other_call))
+        self.assertNotEqual(global_tag, data_versions.tag(global_call))
+
+        data_versions.bump(['NL-1'])
+        self.assertEqual(2, DataVersion.objects.get(key='org:NL-1').version)
+        self.assertEqual(2, DataVersion.objects.get(key='global').version)
+
+    def test_database_backend_removes_older_versions(self):
+        backend = DatabaseBackend()
+        backend.set(CALL + '#v1', '{}')
+        backend.set(CALL + '#v2', '{"count": 1}')
+        self.assertEqual([CALL + '#v2'], list(CachedCall.objects.values_list('call', flat=True)))
@@ -0,0 +1,34 @@
+import json
+from django.test import TestCase
+from cache.models import RequestedCall
+from cache.warmer import CacheWarmer, prioritise
+
+
+class CacheWarmerTestCase(TestCase):
+    """
+    Test rendering API calls for the cache inside the process
+    """
+    def setUp(self):
+        self.warmer = CacheWarmer(workers=1)
+
+    def test_render(self):
+        data = self.warmer.render('/api/v3/regions/?format=json')
+        self.assertEqual(0, json.loads(data)['meta']['total_count'])
+
+    def test_render_unknown_call(self):
+        self.assertIsNone(self.warmer.render('/api/v3/no-such-resource/?format=json'))
+        self.assertIsNone(self.warmer.render('/api/v3/regions/?format=xml'))
+
+    def test_warm(self):
+        results = list(self.warmer.warm(['/api/v3/regions/?format=json', '/api/v3/cities/?format=json']))
+        self.assertEqual(['/api/v3/regions/?format=json', '/api/v3/cities/?format=json'],
+                         [call for call, data, seconds in results])
+        self.assertTrue(all(data for call, data, seconds in results))
+
+    def test_prioritise(self):
+        calls = [
+            RequestedCall(call='/a', count=100, response_time=0.1),
+            RequestedCall(call='/b', count=10, response_time=5),
+            RequestedCall(call='/c', count=20, response_time=None),
+        ]
+        self.assertEqual(['/b', '/c', '/a'], [c.call for c in prioritise(calls)])
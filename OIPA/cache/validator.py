@@ -3,131 +3,130 @@ from future import standard_library
 standard_library.install_aliases()
 from builtins import str
 from builtins import object
+import re
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
 from cache.models import *
-import urllib.request, urllib.error, urllib.parse
-import http.client
-from django.conf import settings
-import json
-from contexttimer import Timer
-import datetime
+from cache.backends import get_backend
+from cache.data_version import data_versions
+from cache.request_counter import request_counter
+from cache.warmer import CacheWarmer, prioritise
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
 
 
 class Validator(object):
 
     start_caching_from = 0.6 # seconds in query time
 
+    def __init__(self):
+        self.backend = get_backend()
+        self.cached_call = None
+        self.cached_result = None
+
+    def cache_key(self, call):
+        """
+        The call with the version of the data it depends on, a parse of that
+        data makes the cached response unreachable.
+        """
+        return call + '#' + data_versions.tag(call)
+
     def is_cached(self, call):
 
-        if call.__len__() < 255:
-
-            # check if call is in requested_calls table
-            if RequestedCall.objects.filter(call=call).exists():
-                the_call = RequestedCall.objects.get(call=call)
-                the_call.count = the_call.count + 1
-                the_call.save()
-                if the_call.cached:
-                    if CachedCall.objects.filter(call=call).exists():
-                        return True
-            else:
-                if not "flush" in call:
-                    the_call = RequestedCall(call=call, cached=False, response_time=None, count=1)
-                    the_call.save()
-            return False
+        # room for the version tag in CachedCall.call
+        if call.__len__() < 245:
+
+            # requests are counted in memory and added to RequestedCall in batches
+            if not "flush" in call:
+                request_counter.add(call)
+
+            self.cached_call = call
+            self.cached_result = self.backend.get(self.cache_key(call))
+            return self.cached_result is not None
         else:
             return False
 
     def update_response_times_and_add_to_cache(self):
 
-        for entry in RequestedCall.objects.filter(response_time=None):
+        entries = RequestedCall.objects.filter(response_time=None).order_by('-count')
+        self.warm(entries, timed=True)
 
-            data = None
-            #perform the code with a timer
-            try:
-                with Timer() as t:
-                    data = self.perform_api_call(entry.call)
-                time_elapsed = t.elapsed
-            finally:
-                if data:
-                    #if t in seconds > min query time to cache, store the call
-                    if time_elapsed > self.start_caching_from:
+    def cache_all_requests(self):
 
-                        the_api_cache = CachedCall(call=entry.call, result=data, last_fetched=datetime.datetime.now())
-                        the_api_cache.save()
-                        entry.cached = True
-                    entry.response_time = time_elapsed
-                    entry.save()
+        self.warm(prioritise(RequestedCall.objects.all()))
 
+    def warm(self, entries, timed=False):
+        """
+        Render the calls of the RequestedCall entries in this process and
+        cache them. With timed the response times are stored and only calls
+        slower than start_caching_from are cached.
+        """
+        by_call = dict((entry.call, entry) for entry in entries)
 
-    def cache_all_requests(self):
+        for call, data, time_elapsed in CacheWarmer().warm([entry.call for entry in entries]):
+            entry = by_call[call]
+            if not data:
+                continue
 
-        for entry in RequestedCall.objects.all():
-            data = self.perform_api_call(entry.call)
-            if data:
-                the_api_cache = CachedCall(call=entry.call, result=data, last_fetched=datetime.datetime.now())
-                the_api_cache.save()
+            if not timed or time_elapsed > self.start_caching_from:
+                self.backend.set(self.cache_key(call), data)
                 entry.cached = True
-                entry.save()
-
+            if timed:
+                entry.response_time = time_elapsed
+            entry.save()
 
     def perform_api_call(self, call):
 
-
-        site = settings.SITE_URL
-        fullurl = site + call
-
-        if ("?" in fullurl):
-            fullurl += "&flush=true"
-        else:
-            fullurl += "?flush=true"
-
-        try:
-            req = urllib.request.Request(fullurl)
-            opener = urllib.request.build_opener()
-            data = opener.open(req)
-            if "json" in fullurl:
-                json_objects = json.load(data)
-                json_string = json.dumps(json_objects)
-                return json_string
-            else:
-                #xml call, TO DO
-                return None
-
-        except urllib.error.HTTPError as e:
-            print('HTTP error: ' + str(e.code))
-
-        except urllib.error.URLError as e:
-            print('URL error: ' + str(e.reason))
-
-        except http.client.HTTPException as e:
-            print('HTTP exception' + str(e.code))
-
-        return None
+        return CacheWarmer(workers=1).render(call)
 
     def update_cache_calls(self):
-        for entry in CachedCall.objects.all():
-
-            try:
-
-                data = self.perform_api_call(entry.call)
-                if data:
-                    entry.result = data
-                    entry.last_fetched=datetime.datetime.now()
-                    entry.save()
-
-            except Exception as e:
-                print(e.message)
+        """
+        Warm the cached calls whose data changed since they were cached, the
+        most requested and slowest first.
+        """
+        entries = [
+            entry for entry in RequestedCall.objects.filter(cached=True)
+            if self.backend.get(self.cache_key(entry.call)) is None]
+        self.warm(prioritise(entries))
+
+    def get_cached_response(self, call):
+        if call == self.cached_call and self.cached_result is not None:
+            return self.cached_result
+        return self.backend.get(self.cache_key(call))
 
     def get_cached_call(self, call):
-        data = CachedCall.objects.get(call=call).result
-        return data
+        cached = self.get_cached_response(call)
+        if cached is None:
+            return None
+        return cached.data
+
+    def cached_response(self, request, call):
+        """
+        The cached response to call for request: 304 when the client has it
+        (If-None-Match), the compressed bytes when the client accepts gzip.
+        """
+        cached = self.get_cached_response(call)
+
+        etags = [etag.strip() for etag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]
+        if cached.etag in etags:
+            response = HttpResponseNotModified()
+        elif re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            response = HttpResponse(cached.gzipped, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+            response['Content-Length'] = str(cached.length)
+        else:
+            response = HttpResponse(cached.data, content_type='application/json')
+
+        response['ETag'] = cached.etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
 
 
     def delete_all_under_x(self, number):
         try:
 
             for entry in RequestedCall.objects.filter(count__lt=number):
-                if CachedCall.objects.filter(call=entry.call).exists():
-                    CachedCall.objects.get(call=entry.call).delete()
+                self.backend.delete(self.cache_key(entry.call))
                 entry.delete()
             return True
 
@@ -0,0 +1,113 @@
+from future import standard_library
+standard_library.install_aliases()
+from builtins import object
+from multiprocessing.pool import ThreadPool
+import logging
+import urllib.parse
+
+from contexttimer import Timer
+from django.conf import settings
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def priority(requested_call):
+    """
+    The request time a cached response saves: how often the call is
+    requested times how long it takes. Calls without a response time yet
+    go by their count.
+    """
+    return (requested_call.count or 0) * (requested_call.response_time or 1)
+
+
+def prioritise(requested_calls):
+    return sorted(requested_calls, key=priority, reverse=True)
+
+
+class CacheWarmer(object):
+    """
+    Renders API calls for the cache inside this process: the call is
+    resolved to its resource and the view is called with a request built
+    by RequestFactory, instead of requesting settings.SITE_URL over HTTP.
+
+    At most settings.API_CACHE_WARM_WORKERS calls are rendered at a time,
+    each pool thread uses its own database connection.
+    """
+
+    def __init__(self, workers=None):
+        # django.test is only needed to warm, not to answer requests
+        from django.test import RequestFactory
+
+        if workers is None:
+            workers = settings.API_CACHE_WARM_WORKERS
+        self.workers = workers
+        self.factory = RequestFactory()
+
+    def render(self, call):
+        """
+        The JSON response to call as returned by the resource, None when the
+        call can not be cached.
+        """
+        if "json" not in call:
+            # xml call, TO DO
+            return None
+
+        url = urllib.parse.urlparse(call)
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            logger.warning("No resource for cached call %s", call)
+            return None
+
+        # the resources do not answer calls with flush from the cache
+        query = url.query + "&flush=true" if url.query else "flush=true"
+        request = self.factory.get(url.path + "?" + query)
+
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            logger.warning("Cached call %s returned status %d", call, response.status_code)
+            return None
+        if 'json' not in response.get('Content-Type', ''):
+            # the documentation page answers unknown urls
+            return None
+        return response.content.decode('utf-8')
+
+    def timed_render(self, call):
+        data = None
+        time_elapsed = None
+        try:
+            with Timer() as t:
+                data = self.render(call)
+            time_elapsed = t.elapsed
+        except Exception as e:
+            logger.error("Could not render cached call %s: %r", call, e)
+        return call, data, time_elapsed
+
+    def pool_render(self, call):
+        """
+        timed_render in a pool thread
+        """
+        try:
+            return self.timed_render(call)
+        finally:
+            connection.close()
+
+    def warm(self, calls):
+        """
+        Yields (call, data, seconds) per call, the calls are started in the
+        given order.
+        """
+        if self.workers <= 1:
+            for call in calls:
+                yield self.timed_render(call)
+            return
+
+        pool = ThreadPool(self.workers)
+        try:
+            for result in pool.imap_unordered(self.pool_render, calls):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,163 @@
+from builtins import object
+import os
+import threading
+
+import ujson
+
+# degrees, the simplified versions stored next to the full polygons
+TOLERANCES = (0.1, 0.25, 0.5)
+
+EMPTY_POLYGON = {
+    "type": "Polygon",
+    "coordinates": []
+}
+
+
+def _distance(point, start, end):
+    """
+    Distance of point to the line through start and end
+    """
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return ((point[0] - start[0]) ** 2 + (point[1] - start[1]) ** 2) ** 0.5
+    return abs(dy * point[0] - dx * point[1] + end[0] * start[1] - end[1] * start[0]) / (dx ** 2 + dy ** 2) ** 0.5
+
+
+def simplify_line(points, tolerance):
+    """
+    Douglas-Peucker simplification of a list of [lng, lat] points
+    """
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        index = None
+        max_distance = tolerance
+        for i in range(first + 1, last):
+            distance = _distance(points[i], points[first], points[last])
+            if distance > max_distance:
+                index = i
+                max_distance = distance
+        if index is not None:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_ring(ring, tolerance, decimals):
+    # the first point of a closed ring is also its last, the farthest
+    # point from it is kept first
+    return [[round(lng, decimals), round(lat, decimals)] for lng, lat in simplify_line(ring, tolerance)]
+
+
+def simplify_polygon(rings, tolerance, decimals):
+    """
+    The simplified rings of a polygon, None when the exterior ring
+    collapses. Holes that collapse are left out.
+    """
+    simplified = []
+    for i, ring in enumerate(rings):
+        ring = simplify_ring(ring, tolerance, decimals)
+        if len(ring) >= 4:
+            simplified.append(ring)
+        elif i == 0:
+            return None
+    return simplified
+
+
+def simplify_geometry(geometry, tolerance, decimals=4):
+    """
+    A simplified copy of a GeoJSON Polygon or MultiPolygon. The polygons
+    that collapse are left out, a MultiPolygon keeps its largest polygon
+    when all of them collapse.
+    """
+    if geometry['type'] == 'Polygon':
+        rings = simplify_polygon(geometry['coordinates'], tolerance, decimals)
+        if rings is None:
+            return geometry
+        return {'type': 'Polygon', 'coordinates': rings}
+
+    if geometry['type'] == 'MultiPolygon':
+        polygons = [simplify_polygon(polygon, tolerance, decimals) for polygon in geometry['coordinates']]
+        polygons = [polygon for polygon in polygons if polygon is not None]
+        if not polygons:
+            largest = max(geometry['coordinates'], key=lambda polygon: len(polygon[0]))
+            return {'type': 'Polygon', 'coordinates': largest}
+        return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+    return geometry
+
+
+def build_index(features, tolerances=TOLERANCES):
+    """
+    The iso2 -> geometry index of a GeoJSON FeatureCollection's features,
+    per tolerance. Tolerance '0' holds the full geometries.
+    """
+    full = {}
+    for feature in features:
+        iso2 = feature.get('properties', {}).get('iso2')
+        if iso2 and feature.get('geometry'):
+            full[iso2] = feature['geometry']
+
+    index = {'0': full}
+    for tolerance in tolerances:
+        index[str(tolerance)] = dict(
+            (iso2, simplify_geometry(geometry, tolerance)) for iso2, geometry in full.items())
+    return index
+
+
+class CountryPolygons(object):
+    """
+    Country geometries by iso2 code, read from
+    data_backup/country_polygons.json (see the country_polygons_build
+    command) on first use.
+    """
+
+    def __init__(self, location=None):
+        if location is None:
+            base = os.path.dirname(os.path.abspath(__file__))
+            location = base + "/data_backup/country_polygons.json"
+        self.location = location
+        self.index = None
+        self.tolerances = []
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    with open(self.location) as json_data:
+                        index = ujson.load(json_data)
+                    self.tolerances = sorted(float(tolerance) for tolerance in index)
+                    self.index = index
+        return self.index
+
+    def tolerance_key(self, tolerance):
+        """
+        The key of the largest stored tolerance that is not above
+        tolerance, the full geometries when tolerance is not a number.
+        """
+        try:
+            tolerance = float(tolerance)
+        except (TypeError, ValueError):
+            return '0'
+
+        key = '0'
+        for stored in self.tolerances:
+            if stored <= tolerance:
+                key = '0' if stored == 0 else str(stored)
+        return key
+
+    def get(self, iso2, tolerance=None):
+        index = self.load()
+        return index[self.tolerance_key(tolerance)].get(iso2) or EMPTY_POLYGON
+
+
+country_polygons = CountryPolygons()
@@ -0,0 +1,20 @@
+import os
+
+import ujson
+from django.core.management.base import BaseCommand
+
+from geodata.country_polygons import build_index
+
+
+class Command(BaseCommand):
+    help = 'Writes the country polygons of data_backup/country_data.py, with their simplified versions, ' \
+           'to data_backup/country_polygons.json'
+
+    def handle(self, *args, **options):
+        from geodata.data_backup.country_data import countryData
+
+        base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        location = base + "/data_backup/country_polygons.json"
+
+        with open(location, 'w') as json_data:
+            ujson.dump(build_index(countryData['features']), json_data)
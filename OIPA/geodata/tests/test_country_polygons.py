@@ -0,0 +1,69 @@
+from builtins import object
+import os
+import shutil
+import tempfile
+
+import ujson
+
+from geodata.country_polygons import CountryPolygons, build_index, simplify_geometry, simplify_line
+
+
+SQUARE = [[0, 0], [0.5, 0.001], [1, 0], [1, 1], [0, 1], [0, 0]]
+
+
+class TestSimplify(object):
+
+    def test_simplify_line(self):
+        assert simplify_line([[0, 0], [1, 0.01], [2, 0]], 0.1) == [[0, 0], [2, 0]]
+        assert simplify_line([[0, 0], [1, 1], [2, 0]], 0.1) == [[0, 0], [1, 1], [2, 0]]
+
+    def test_polygon(self):
+        geometry = simplify_geometry({'type': 'Polygon', 'coordinates': [SQUARE]}, 0.1)
+        assert geometry == {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+
+    def test_collapsed_polygons(self):
+        island = [[5, 5], [5.01, 5], [5.01, 5.01], [5, 5]]
+        geometry = simplify_geometry({'type': 'MultiPolygon', 'coordinates': [[SQUARE], [island]]}, 0.1)
+        assert geometry['type'] == 'MultiPolygon'
+        assert len(geometry['coordinates']) == 1
+
+        geometry = simplify_geometry({'type': 'MultiPolygon', 'coordinates': [[island]]}, 0.1)
+        assert geometry == {'type': 'Polygon', 'coordinates': [island]}
+
+
+class TestCountryPolygons(object):
+
+    def setup_method(self, method):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'country_polygons.json')
+        features = [{
+            'type': 'Feature',
+            'properties': {'name': 'Square', 'iso2': 'SQ'},
+            'geometry': {'type': 'Polygon', 'coordinates': [SQUARE]},
+        }]
+        with open(self.location, 'w') as json_data:
+            ujson.dump(build_index(features, (0.1, 0.5)), json_data)
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.directory)
+
+    def test_loaded_on_first_use(self):
+        polygons = CountryPolygons(self.location)
+        assert polygons.index is None
+        assert polygons.get('SQ')['coordinates'] == [SQUARE]
+        assert polygons.tolerances == [0, 0.1, 0.5]
+
+    def test_tolerance(self):
+        polygons = CountryPolygons(self.location)
+        assert len(polygons.get('SQ', '0.2')['coordinates'][0]) == 5
+        assert polygons.get('SQ', '0.05')['coordinates'] == [SQUARE]
+        assert polygons.get('SQ', 'detailed')['coordinates'] == [SQUARE]
+        assert polygons.tolerance_key('2') == '0.5'
+
+    def test_unknown_country(self):
+        assert CountryPolygons(self.location).get('XX') == {'type': 'Polygon', 'coordinates': []}
+
+    def test_data_backup_index(self):
+        polygons = CountryPolygons()
+        assert polygons.get('NL')['type'] in ('Polygon', 'MultiPolygon')
+        assert polygons.get('NL', '0.5') != polygons.get('NL')
@@ -0,0 +1,148 @@
+from builtins import object
+from collections import OrderedDict
+from django.conf import settings
+from django.db import transaction
+
+from iati import models
+from iati_synchroniser.exception_handler import exception_handler
+
+
+# Rows that reference a parent row created in the same flush, by foreign key
+# field name. MySQL does not return the ids of bulk inserted rows, so the
+# parent models below are saved one at a time to obtain their ids.
+PARENT_FIELDS = {
+    models.ResultIndicator: 'result',
+    models.ResultIndicatorPeriod: 'result_indicator',
+    models.FfsForecast: 'ffs',
+    models.CrsAddLoanTerms: 'crs_add',
+    models.CrsAddLoanStatus: 'crs_add',
+}
+
+PARENT_MODELS = (
+    models.Result,
+    models.ResultIndicator,
+    models.Ffs,
+    models.CrsAdd,
+)
+
+# Activities go first (their ids are set by the parser), then the parents in
+# dependency order; all other models follow in the order they were added.
+INSERT_ORDER = (models.Activity,) + PARENT_MODELS
+
+
+class BulkWriter(object):
+    """
+    Unit of work for the parser: collects new model instances per activity
+    and inserts them per table with bulk_create.
+
+    flush() writes everything collected so far inside one transaction. If a
+    batch fails, the rows are saved again one at a time so a single bad row
+    only loses itself, like the per row saves did before.
+    """
+
+    def __init__(self, batch_size=None, activities_per_transaction=None):
+        self.batch_size = batch_size or settings.PARSER_BULK_BATCH_SIZE
+        self.activities_per_transaction = activities_per_transaction or settings.PARSER_ACTIVITIES_PER_TRANSACTION
+        self.pending = OrderedDict()
+        self.current_activity_id = None
+
+    def start_activity(self, activity):
+        """
+        Start collecting the rows of a new activity; an activity that is
+        already pending (a duplicate in the same file) is replaced.
+        """
+        self.discard_activity(activity.id)
+        self.current_activity_id = activity.id
+        self.pending[activity.id] = [activity]
+
+    def discard_activity(self, activity_id):
+        self.pending.pop(activity_id, None)
+        if self.current_activity_id == activity_id:
+            self.current_activity_id = None
+
+    def add(self, instance):
+        self.pending[self.current_activity_id].append(instance)
+
+    def is_full(self):
+        return len(self.pending) >= self.activities_per_transaction
+
+    def flush(self):
+        """
+        Insert all pending rows, returns the activities that were written.
+        """
+        if not self.pending:
+            return []
+
+        pending = self.pending
+        self.pending = OrderedDict()
+        self.current_activity_id = None
+
+        try:
+            with transaction.atomic():
+                self._bulk_insert(pending)
+            return [rows[0] for rows in pending.values()]
+        except Exception as e:
+            exception_handler(e, "bulk insert", "BulkWriter.flush")
+
+        return self._insert_per_row(pending)
+
+    def _group_by_model(self, pending):
+        grouped = OrderedDict((model, []) for model in INSERT_ORDER)
+        for rows in pending.values():
+            for instance in rows:
+                grouped.setdefault(type(instance), []).append(instance)
+        return grouped
+
+    def _set_parent_id(self, instance):
+        field_name = PARENT_FIELDS.get(type(instance))
+        if field_name:
+            # the parent was unsaved when it was assigned, so the cached
+            # foreign key value is still empty
+            parent = getattr(instance, field_name)
+            field = instance._meta.get_field(field_name)
+            setattr(instance, field.attname, parent.pk)
+
+    def _bulk_insert(self, pending):
+        for model, instances in self._group_by_model(pending).items():
+            if not instances:
+                continue
+
+            for instance in instances:
+                self._set_parent_id(instance)
+
+            if model in PARENT_MODELS:
+                for instance in instances:
+                    instance.save(force_insert=True)
+            else:
+                model.objects.bulk_create(instances, batch_size=self.batch_size)
+
+    def _insert_per_row(self, pending):
+        activities = []
+
+        for activity_id, rows in pending.items():
+            activity = rows[0]
+
+            # the rows of the failed batch might have gotten ids
+            for instance in rows:
+                if instance._meta.auto_field:
+                    instance.pk = None
+
+            try:
+                with transaction.atomic():
+                    activity.save(force_insert=True)
+            except Exception as e:
+                exception_handler(e, activity_id, "BulkWriter.flush")
+                continue
+
+            activities.append(activity)
+
+            grouped = self._group_by_model({activity_id: rows[1:]})
+            for instance in [i for instances in grouped.values() for i in instances]:
+                try:
+                    self._set_parent_id(instance)
+                    with transaction.atomic():
+                        instance.save(force_insert=True)
+                except Exception as e:
+                    exception_handler(e, activity_id, "BulkWriter.flush " + type(instance).__name__)
+
+        return activities
@@ -0,0 +1,138 @@
+from builtins import object
+from django.db import models as django_models
+
+from geodata.models import Country
+from iati.models import TiedStatus
+
+
+INTEGER_FIELDS = (
+    django_models.IntegerField,
+    django_models.SmallIntegerField,
+    django_models.PositiveIntegerField,
+    django_models.PositiveSmallIntegerField,
+    django_models.BigIntegerField,
+)
+
+TIED_STATUS_NAMES = {
+    'partially tied': '3',
+    'tied': '4',
+    'untied': '5',
+}
+
+KOSOVO_CODES = ('KOS', 'KS')
+
+
+def to_text(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'ignore')
+    return value
+
+
+class CodelistResolver(object):
+    """
+    Resolves codelist references (codes or names) to model instances.
+
+    Every codelist table is read into memory the first time it is used, so a
+    parse run does one query per codelist instead of two per reference. The
+    string comparisons mimic MySQL's default collation (case insensitive,
+    trailing spaces ignored), which is what the filter() based lookups
+    used to get for free.
+
+    CodelistResolver.invalidate() marks all loaded tables as stale; it is
+    called after the codelists have been re-imported.
+    """
+
+    generation = 0
+
+    def __init__(self):
+        self._by_code = {}
+        self._by_name = {}
+        self._generation = CodelistResolver.generation
+
+    @classmethod
+    def invalidate(cls):
+        cls.generation += 1
+
+    def _check_generation(self):
+        if self._generation != CodelistResolver.generation:
+            self._by_code = {}
+            self._by_name = {}
+            self._generation = CodelistResolver.generation
+
+    def _is_integer_model(self, model):
+        return isinstance(model._meta.pk, INTEGER_FIELDS)
+
+    def _code_key(self, model, code):
+        if code is None:
+            return None
+        if self._is_integer_model(model):
+            try:
+                return int(code)
+            except (TypeError, ValueError):
+                return None
+        return to_text(code).rstrip().lower()
+
+    def _name_key(self, name):
+        if name is None:
+            return None
+        return to_text(name).rstrip().lower()
+
+    def _load(self, model):
+        self._check_generation()
+
+        if model not in self._by_code:
+            by_code = {}
+            by_name = {}
+            field_names = [f.name for f in model._meta.concrete_fields]
+            queryset = model.objects.order_by('pk')
+            if 'name' in field_names:
+                queryset = queryset.only(model._meta.pk.name, 'name')
+            for item in queryset:
+                by_code[self._code_key(model, item.pk)] = item
+                by_name.setdefault(self._name_key(getattr(item, 'name', None)), item)
+            self._by_code[model] = by_code
+            self._by_name[model] = by_name
+
+    def get(self, model, code):
+        """
+        Return the codelist item with the given code, or None.
+        """
+        key = self._code_key(model, code)
+        if key is None:
+            return None
+        self._load(model)
+        return self._by_code[model].get(key)
+
+    def get_by_name(self, model, name):
+        """
+        Return the first (lowest code) codelist item with the given name, or None.
+        """
+        key = self._name_key(name)
+        if not key:
+            return None
+        self._load(model)
+        return self._by_name[model].get(key)
+
+    def country(self, ref):
+        """
+        Country by code, with the Kosovo codes publishers use and a fallback
+        on the country name.
+        """
+        country = self.get(Country, ref)
+        if country:
+            return country
+        if to_text(ref) in KOSOVO_CODES:
+            return self.get(Country, 'XK')
+        return self.get_by_name(Country, ref)
+
+    def tied_status(self, ref):
+        """
+        Tied status by code, or by its textual representation ('untied' etc.)
+        """
+        if ref is None:
+            return None
+        try:
+            int(ref)
+        except (TypeError, ValueError):
+            ref = TIED_STATUS_NAMES.get(to_text(ref).lower())
+        return self.get(TiedStatus, ref)
@@ -1,20 +1,116 @@
 from builtins import str
+from builtins import range
 from builtins import object
 __author__ = 'vincentvantwestende'
 
+from django.db import connection, transaction
+
 import iati.models as models
 from iati_synchroniser.exception_handler import exception_handler
 
+
+# Everything stored for an activity, in delete order (children before their
+# parents), with the foreign key path from the table to the activity.
+ACTIVITY_TABLES = (
+    (models.ResultIndicatorPeriod, ('result_indicator', 'result', 'activity')),
+    (models.ResultIndicator, ('result', 'activity')),
+    (models.Result, ('activity',)),
+    (models.FfsForecast, ('ffs', 'activity')),
+    (models.Ffs, ('activity',)),
+    (models.CrsAddLoanStatus, ('crs_add', 'activity')),
+    (models.CrsAddLoanTerms, ('crs_add', 'activity')),
+    (models.CrsAdd, ('activity',)),
+    (models.ActivityParticipatingOrganisation, ('activity',)),
+    (models.ActivityPolicyMarker, ('activity',)),
+    (models.ActivitySector, ('activity',)),
+    (models.ActivityRecipientCountry, ('activity',)),
+    (models.CountryBudgetItem, ('activity',)),
+    (models.ActivityRecipientRegion, ('activity',)),
+    (models.OtherIdentifier, ('activity',)),
+    (models.ActivityWebsite, ('activity',)),
+    (models.ContactInfo, ('activity',)),
+    (models.Transaction, ('activity',)),
+    (models.PlannedDisbursement, ('activity',)),
+    (models.DocumentLink, ('activity',)),
+    (models.RelatedActivity, ('current_activity',)),
+    (models.Title, ('activity',)),
+    (models.Description, ('activity',)),
+    (models.Location, ('activity',)),
+    (models.Budget, ('activity',)),
+    (models.Condition, ('activity',)),
+    (models.ActivitySearchData, ('activity',)),
+    (models.ActivityAggregate, ('activity',)),
+)
+
+ACTIVITY_ID_CHUNK_SIZE = 500
+
+
 class Deleter(object):
 
     def delete_by_source(self, xml_source_ref):
+        """
+        Remove all activities of a source, a few DELETE statements per table.
+        """
+        try:
+            activity_ids = models.Activity.objects.filter(
+                xml_source_ref=xml_source_ref).values_list('id', flat=True)
+            self.delete_activities(activity_ids)
+        except Exception as e:
+            exception_handler(e, xml_source_ref, "delete_by_source")
+
+    def delete_activities(self, activity_ids):
+        """
+        Remove the given activities (by id) and everything stored for them,
+        in chunks of ACTIVITY_ID_CHUNK_SIZE activities per transaction.
+        """
+        activity_ids = list(activity_ids)
+        for i in range(0, len(activity_ids), ACTIVITY_ID_CHUNK_SIZE):
+            chunk = activity_ids[i:i + ACTIVITY_ID_CHUNK_SIZE]
+            try:
+                self.delete_activity_chunk(chunk)
+            except Exception as e:
+                exception_handler(e, chunk[0], "delete_activities")
+
+    def delete_activity_chunk(self, activity_ids):
+        placeholders = ", ".join(["%s"] * len(activity_ids))
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            for model, path in ACTIVITY_TABLES:
+                cursor.execute("DELETE FROM %s WHERE %s" % (
+                    model._meta.db_table,
+                    self.activity_condition(model, path, placeholders)), activity_ids)
+
+            cursor.execute("DELETE FROM %s WHERE id IN (%s)" % (
+                models.Activity._meta.db_table, placeholders), activity_ids)
+
+    def activity_condition(self, model, path, activity_select):
+        """
+        WHERE clause matching the rows of model that belong to the activities
+        in activity_select, with a nested subquery per step in path.
+        """
+        field = model._meta.get_field(path[0])
+        if len(path) == 1:
+            return "%s IN (%s)" % (field.column, activity_select)
+
+        parent = field.related_model
+        return "%s IN (SELECT %s FROM %s WHERE %s)" % (
+            field.column,
+            parent._meta.pk.column,
+            parent._meta.db_table,
+            self.activity_condition(parent, path[1:], activity_select))
+
+    def delete_by_source_per_activity(self, xml_source_ref):
+        """
+        The old per activity delete, kept to compare with delete_by_source.
+        """
         try:
             activities = models.Activity.objects.filter(xml_source_ref=xml_source_ref)
             for activity in activities:
                 self.remove_values_for_activity(activity)
 
         except Exception as e:
-            exception_handler(e, xml_source_ref, "delete_by_source")
+            exception_handler(e, xml_source_ref, "delete_by_source_per_activity")
 
     def return_first_exist(self, xpath_find):
 
@@ -69,6 +165,7 @@ class Deleter(object):
             models.Condition.objects.filter(activity=cur_activity).delete()
 
             models.ActivitySearchData.objects.filter(activity=cur_activity).delete()
+            models.ActivityAggregate.objects.filter(activity=cur_activity).delete()
 
             for r in models.Result.objects.filter(activity=cur_activity):
                 for ri in models.ResultIndicator.objects.filter(result=r):
@@ -81,8 +178,8 @@ class Deleter(object):
                 f.delete()
 
             for c in models.CrsAdd.objects.filter(activity=cur_activity):
-                models.CrsAddLoanStatus.objects.filter(crs_add=c)
-                models.CrsAddLoanTerms.objects.filter(crs_add=c)
+                models.CrsAddLoanStatus.objects.filter(crs_add=c).delete()
+                models.CrsAddLoanTerms.objects.filter(crs_add=c).delete()
                 c.delete()
 
             cur_activity.delete()
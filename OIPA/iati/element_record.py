@@ -0,0 +1,99 @@
+from builtins import object
+from past.builtins import basestring
+
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+ELEMENTS = 0
+TEXT = 1
+ATTRIBUTE = 2
+
+# path (and namespaces) -> (element steps, result kind, attribute name)
+compiled_paths = {}
+
+
+def qualified_name(name, namespaces):
+    if ':' not in name:
+        return name
+    prefix, local_name = name.split(':', 1)
+    if prefix == 'xml':
+        return '{%s}%s' % (XML_NAMESPACE, local_name)
+    if namespaces and prefix in namespaces:
+        return '{%s}%s' % (namespaces[prefix], local_name)
+    raise ValueError("Undefined namespace prefix in path: " + name)
+
+
+def compile_path(path, namespaces=None):
+    """
+    Compile a path of the form 'a/b', 'a/b/@attr' or 'a/text()', these are
+    the only XPath expressions the parser uses. Compiled paths are cached.
+    """
+    key = (path, tuple(sorted(namespaces.items())) if namespaces else None)
+    compiled = compiled_paths.get(key)
+    if compiled is not None:
+        return compiled
+
+    steps = path.strip().split('/')
+    last = steps[-1]
+    name = None
+    if last == 'text()':
+        kind = TEXT
+        steps = steps[:-1]
+    elif last.startswith('@'):
+        kind = ATTRIBUTE
+        name = qualified_name(last[1:], namespaces)
+        steps = steps[:-1]
+    else:
+        kind = ELEMENTS
+
+    for step in steps:
+        if not step or any(c in step for c in '@()[]*:.'):
+            raise ValueError("Unsupported path: '%s'" % path)
+
+    compiled = (tuple(steps), kind, name)
+    compiled_paths[key] = compiled
+    return compiled
+
+
+class ElementRecord(object):
+    """
+    Plain data copy of an XML element, made in one pass over the element and
+    its descendants: the attributes, the text nodes and the child elements
+    grouped by tag.
+
+    xpath() answers the simple child paths the parser uses with dictionary
+    lookups, and returns the same lists lxml would, so the parser's add_*
+    methods work on either. A record does not refer to the lxml tree, so it
+    stays valid after the element is cleared and can be passed to another
+    thread.
+    """
+
+    __slots__ = ('tag', 'attrib', 'texts', 'children')
+
+    def __init__(self, elem):
+        self.tag = elem.tag
+        self.attrib = dict(elem.attrib)
+        self.texts = []
+        self.children = {}
+
+        if elem.text is not None:
+            self.texts.append(elem.text)
+
+        for child in elem:
+            # comments and processing instructions have no string tag
+            if isinstance(child.tag, basestring):
+                self.children.setdefault(child.tag, []).append(ElementRecord(child))
+            if child.tail is not None:
+                self.texts.append(child.tail)
+
+    def xpath(self, path, namespaces=None):
+        steps, kind, name = compile_path(path, namespaces)
+
+        nodes = [self]
+        for step in steps:
+            nodes = [child for node in nodes for child in node.children.get(step, ())]
+
+        if kind == ELEMENTS:
+            return nodes
+        if kind == TEXT:
+            return [text for node in nodes for text in node.texts]
+        return [node.attrib[name] for node in nodes if name in node.attrib]
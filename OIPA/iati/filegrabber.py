@@ -4,54 +4,215 @@ from builtins import str
 from builtins import object
 import urllib.request, urllib.error, urllib.parse
 import http.client
+import hashlib
+import json
 import logging
-import http.cookiejar
+import os
+import socket
+import time
+import zlib
+
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.0.1) Gecko/2008071615 Fedora/3.0.1-1.fc9 Firefox/3.0.1'
+CHUNK_SIZE = 64 * 1024
+MAX_TRIES = 6
+
+
+class FetchResult(object):
+    """
+    A source file in the download cache. unchanged is True when the file is
+    the same as the last one that was parsed.
+    """
+
+    def __init__(self, url, path, size, checksum, unchanged):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.checksum = checksum
+        self.unchanged = unchanged
+
+
+class Decoder(object):
+    """
+    Decodes a gzip or deflate encoded response body chunk by chunk.
+    """
+
+    def __init__(self, content_encoding):
+        content_encoding = (content_encoding or '').lower()
+        self.raw_deflate_fallback = False
+        if content_encoding in ('gzip', 'x-gzip'):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif content_encoding == 'deflate':
+            # some servers send raw deflate data without the zlib header
+            self.decompressor = zlib.decompressobj(zlib.MAX_WBITS)
+            self.raw_deflate_fallback = True
+        else:
+            self.decompressor = None
+
+    def decode(self, chunk):
+        if self.decompressor is None:
+            return chunk
+        try:
+            data = self.decompressor.decompress(chunk)
+        except zlib.error:
+            if not self.raw_deflate_fallback:
+                raise
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self.decompressor.decompress(chunk)
+        self.raw_deflate_fallback = False
+        return data
+
+    def flush(self):
+        if self.decompressor is None:
+            return b''
+        return self.decompressor.flush()
+
+
 class FileGrabber(object):
+    """
+    Downloads IATI XML files into a local cache, keyed by url.
+
+    Requests are conditional (If-None-Match / If-Modified-Since) when the
+    file is in the cache, responses are streamed to disk and gzip / deflate
+    encoded responses are decoded on the fly. Next to each file a json file
+    keeps the response headers, the checksum and the checksum of the last
+    parsed version.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or settings.IATI_FILE_CACHE_DIR
 
-    def get_the_file(self, url, try_number = 0):
-        import mechanize
+    def cache_paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        path = os.path.join(self.cache_dir, key + '.xml')
+        return path, path + '.json'
+
+    def read_meta(self, meta_path):
         try:
+            with open(meta_path) as meta_file:
+                return json.load(meta_file)
+        except (IOError, ValueError):
+            return {}
+
+    def write_meta(self, meta_path, meta):
+        with open(meta_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
 
-            br = mechanize.Browser()
+    def fetch(self, url):
+        """
+        Returns a FetchResult, or None when the file could not be downloaded.
+        """
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
 
-            # Cookie Jar
-            cj = http.cookiejar.LWPCookieJar()
-            br.set_cookiejar(cj)
+        for try_number in range(MAX_TRIES):
+            try:
+                return self.download(url)
+            except urllib.error.HTTPError as e:
+                logger.info('HTTPError (url=' + url + ') = ' + str(e.code))
+                if e.code < 500:
+                    return None
+            except urllib.error.URLError as e:
+                logger.info('URLError (url=' + url + ') = ' + str(e.reason))
+            except (http.client.HTTPException, socket.error, zlib.error) as e:
+                logger.info('%s (%s)' % (e, type(e)) + " in fetch: " + url)
 
-            # Browser options
-            br.set_handle_equiv(True)
-            br.set_handle_redirect(True)
-            br.set_handle_referer(True)
-            br.set_handle_robots(False)
-            br.set_handle_refresh(mechanize._http.HTTPRefreshProcessor(), max_time=1)
-            br.set_debug_http(True)
-            br.set_debug_redirects(True)
-            br.set_debug_responses(True)
+            if try_number + 1 < MAX_TRIES:
+                time.sleep(2 ** try_number)
 
-            # User-Agent
-            br.addheaders = [('User-agent', 'Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.0.1) Gecko/2008071615 Fedora/3.0.1-1.fc9 Firefox/3.0.1')]
+        return None
 
-            response = br.open(url, timeout=80)
-            return response
+    def download(self, url):
+        path, meta_path = self.cache_paths(url)
+        meta = self.read_meta(meta_path)
+        cached = os.path.exists(path) and meta.get('checksum')
 
+        request = urllib.request.Request(url)
+        request.add_header('User-agent', USER_AGENT)
+        request.add_header('Accept-Encoding', 'gzip, deflate')
+        if cached and meta.get('etag'):
+            request.add_header('If-None-Match', meta['etag'])
+        if cached and meta.get('last_modified'):
+            request.add_header('If-Modified-Since', meta['last_modified'])
+
+        try:
+            response = urllib.request.urlopen(request, timeout=80)
         except urllib.error.HTTPError as e:
-            logger.info('HTTPError (url=' + url + ') = ' + str(e.code))
-            if try_number < 6:
-                self.get_the_file(url, try_number + 1)
-            else:
-                return None
-        except urllib.error.URLError as e:
-            logger.info('URLError (url=' + url + ') = ' + str(e.reason))
-            if try_number < 6:
-                self.get_the_file(url, try_number + 1)
-        except http.client.HTTPException as e:
-            logger.info('HTTPException reading url ' + url)
-            if try_number < 6:
-                self.get_the_file(url, try_number + 1)
-        except Exception as e:
-            logger.info('%s (%s)' % (e.message, type(e)) + " in get_the_file: " + url)
-            if try_number < 6:
-                self.get_the_file(url, try_number + 1)
+            if e.code == 304 and cached:
+                return self.result(url, path, meta)
+            raise
+
+        part_path = path + '.part'
+        checksum = hashlib.sha1()
+        size = 0
+        decoder = Decoder(response.info().get('Content-Encoding'))
+
+        try:
+            with open(part_path, 'wb') as part_file:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    data = decoder.decode(chunk)
+                    checksum.update(data)
+                    size += len(data)
+                    part_file.write(data)
+                data = decoder.flush()
+                checksum.update(data)
+                size += len(data)
+                part_file.write(data)
+        except Exception:
+            os.remove(part_path)
+            raise
+        finally:
+            response.close()
+
+        os.rename(part_path, path)
+
+        meta.update({
+            'url': url,
+            'etag': response.info().get('ETag'),
+            'last_modified': response.info().get('Last-Modified'),
+            'checksum': checksum.hexdigest(),
+            'size': size,
+        })
+        self.write_meta(meta_path, meta)
+
+        return self.result(url, path, meta)
+
+    def result(self, url, path, meta):
+        return FetchResult(
+            url,
+            path,
+            meta['size'],
+            meta['checksum'],
+            unchanged=meta['checksum'] == meta.get('parsed_checksum'))
+
+    def mark_parsed(self, fetch_result):
+        """
+        Remember the checksum of a file that has been parsed, later fetches
+        of the same content report it as unchanged.
+        """
+        path, meta_path = self.cache_paths(fetch_result.url)
+        meta = self.read_meta(meta_path)
+        meta['parsed_checksum'] = fetch_result.checksum
+        self.write_meta(meta_path, meta)
+
+    def cached_size(self, url):
+        """
+        Size of the last downloaded version of the file, or None.
+        """
+        path, meta_path = self.cache_paths(url)
+        return self.read_meta(meta_path).get('size')
+
+    def get_the_file(self, url):
+        """
+        The downloaded file opened for reading, or None.
+        """
+        fetch_result = self.fetch(url)
+        if fetch_result:
+            return open(fetch_result.path, 'rb')
+        return None
@@ -0,0 +1,134 @@
+from builtins import range
+from builtins import object
+from collections import defaultdict
+import itertools
+
+# Django specific
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from iati import models
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the activity aggregate fact table, for all activities or for the sources with the given refs'
+    args = '[xml_source_ref ...]'
+
+    def handle(self, *args, **options):
+        updater = ActivityAggregateUpdater()
+        if args:
+            for xml_source_ref in args:
+                updater.update_source(xml_source_ref)
+        else:
+            updater.update()
+
+
+class ActivityAggregateUpdater(object):
+    """
+    Builds the ActivityAggregate fact rows for a batch of activities.
+
+    Every dimension is read for the whole batch with one values_list query,
+    the transaction values are summed per activity and transaction type in
+    the database. An activity gets a row per combination of its countries,
+    regions, sectors and transaction types; a dimension without values
+    gives one row with None.
+    """
+
+    chunk_size = 500
+
+    # (dimension, model, value field)
+    dimensions = (
+        ('country', models.ActivityRecipientCountry, 'country_id'),
+        ('region', models.ActivityRecipientRegion, 'region_id'),
+        ('sector', models.ActivitySector, 'sector_id'),
+    )
+
+    def get_values(self, model, value_field, activity_ids):
+        values = defaultdict(set)
+        rows = model.objects.filter(activity_id__in=activity_ids) \
+            .exclude(**{value_field: None}) \
+            .values_list('activity_id', value_field)
+        for activity_id, value in rows:
+            values[activity_id].add(value)
+        return values
+
+    def get_transaction_values(self, activity_ids):
+        values = defaultdict(dict)
+        rows = models.Transaction.objects.filter(activity_id__in=activity_ids) \
+            .exclude(transaction_type=None) \
+            .values_list('activity_id', 'transaction_type_id') \
+            .annotate(value=Sum('value')) \
+            .order_by()
+        for activity_id, transaction_type, value in rows:
+            values[activity_id][transaction_type] = value or 0
+        return values
+
+    def year(self, date):
+        if date is None:
+            return None
+        return date.year
+
+    def build(self, activity_ids):
+        activities = models.Activity.objects.filter(id__in=activity_ids).values_list(
+            'id', 'reporting_organisation_id', 'total_budget',
+            'start_planned', 'start_actual', 'end_planned', 'end_actual')
+
+        dimension_values = [
+            self.get_values(model, value_field, activity_ids)
+            for dimension, model, value_field in self.dimensions]
+        transaction_values = self.get_transaction_values(activity_ids)
+
+        aggregates = []
+        for activity_id, reporting_organisation_id, total_budget, start_planned, start_actual, \
+                end_planned, end_actual in activities:
+            countries, regions, sectors = [
+                sorted(values.get(activity_id, ())) or [None] for values in dimension_values]
+            transaction_types = sorted(transaction_values[activity_id]) or [None]
+
+            for country, region, sector, transaction_type in itertools.product(
+                    countries, regions, sectors, transaction_types):
+                aggregates.append(models.ActivityAggregate(
+                    activity_id=activity_id,
+                    reporting_organisation_id=reporting_organisation_id,
+                    country_id=country,
+                    region_id=region,
+                    sector_id=sector,
+                    transaction_type_id=transaction_type,
+                    start_planned_year=self.year(start_planned),
+                    start_actual_year=self.year(start_actual),
+                    end_planned_year=self.year(end_planned),
+                    end_actual_year=self.year(end_actual),
+                    value=transaction_values[activity_id].get(transaction_type, 0),
+                    total_budget=total_budget,
+                    country_count=len(countries),
+                    region_count=len(regions),
+                    sector_count=len(sectors),
+                    transaction_type_count=len(transaction_types)))
+        return aggregates
+
+    def update_activities(self, activity_ids):
+        activity_ids = list(activity_ids)
+        for i in range(0, len(activity_ids), self.chunk_size):
+            chunk = activity_ids[i:i + self.chunk_size]
+            try:
+                with transaction.atomic():
+                    aggregates = self.build(chunk)
+                    models.ActivityAggregate.objects.filter(activity_id__in=chunk).delete()
+                    models.ActivityAggregate.objects.bulk_create(
+                        aggregates, batch_size=settings.PARSER_BULK_BATCH_SIZE)
+            except Exception as e:
+                logger.info("error in activity aggregate chunk starting at " + str(chunk[0]) + ", def: update_activities")
+                if e.args:
+                    logger.info(e.args[0])
+
+    def update(self):
+        self.update_activities(models.Activity.objects.values_list('id', flat=True))
+        return True
+
+    def update_source(self, xml_source_ref):
+        self.update_activities(models.Activity.objects.filter(
+            xml_source_ref=xml_source_ref).values_list('id', flat=True))
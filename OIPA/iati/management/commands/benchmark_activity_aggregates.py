@@ -0,0 +1,178 @@
+from builtins import str
+from builtins import range
+from builtins import object
+from optparse import make_option
+import random
+import time
+
+import ujson
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from api.v3.resources.aggregation_resources import ActivityAggregatedAnyResource
+from geodata.models import Country, Region
+from iati import models
+from iati.management.commands.activity_aggregate_updater import ActivityAggregateUpdater
+
+
+class Command(BaseCommand):
+    help = 'Compare activity-aggregate-any on the activity tables with the ActivityAggregate fact table ' \
+           'on generated activities. Nothing is kept.'
+    option_list = BaseCommand.option_list + (
+        make_option('--activities', dest='activities', type='int', default=1000000,
+                    help='Number of activities to generate'),
+        make_option('--seed', dest='seed', type='int', default=1,
+                    help='Seed of the generated data'),
+    )
+
+    def handle(self, *args, **options):
+        benchmark = ActivityAggregateBenchmark(options['activities'], options['seed'])
+        for name, seconds in benchmark.run():
+            self.stdout.write("%s: %.2f seconds" % (name, seconds))
+
+        for call, sql_seconds, cube_seconds, same in benchmark.results:
+            self.stdout.write("%s\n    sql %.3f seconds, fact table %.3f seconds%s" % (
+                call, sql_seconds, cube_seconds, '' if same else ', RESULTS DIFFER'))
+
+
+class ActivityAggregateBenchmark(object):
+    """
+    Generates activities with countries, regions, sectors and transactions
+    from the loaded codelists, builds their fact rows and times a set of
+    activity-aggregate-any calls on both paths. Everything runs in a
+    transaction that is rolled back.
+
+    The calls cover all activities, so the results only compare when the
+    fact rows of the activities already in the database are built too.
+    """
+
+    prefix = 'aggregate-benchmark'
+    chunk_size = 5000
+    organisation_count = 100
+    transaction_types = ('C', 'D', 'E', 'IF')
+
+    calls = (
+        'group_by=recipient-country&aggregation_key=iati-identifier',
+        'group_by=recipient-region&aggregation_key=iati-identifier',
+        'group_by=sector&aggregation_key=disbursement',
+        'group_by=year&aggregation_key=commitment',
+        'group_by=year&aggregation_key=iati-identifier&group_field=end_planned',
+        'group_by=reporting-org&aggregation_key=total-budget',
+        'group_by=recipient-country&aggregation_key=expenditure&reporting_organisation__in={organisation}',
+        'group_by=sector&aggregation_key=iati-identifier&countries__in={countries}',
+    )
+
+    def __init__(self, activity_count, seed):
+        self.activity_count = activity_count
+        self.random = random.Random(seed)
+        self.results = []
+
+    def load_dimensions(self):
+        self.countries = list(Country.objects.values_list('code', flat=True))
+        self.regions = list(Region.objects.values_list('code', flat=True))
+        self.sectors = list(models.Sector.objects.values_list('code', flat=True))
+        if not self.countries or not self.regions or not self.sectors or \
+                models.TransactionType.objects.filter(code__in=self.transaction_types).count() < 4:
+            raise CommandError("Load the codelists and geodata first")
+
+        self.organisations = []
+        for i in range(self.organisation_count):
+            code = '%s-%d' % (self.prefix, i)
+            self.organisations.append(code)
+            models.Organisation.objects.create(code=code, name=code)
+
+    def date(self):
+        return '%d-%02d-01' % (self.random.randint(2000, 2020), self.random.randint(1, 12))
+
+    def pick(self, values, low, high):
+        return self.random.sample(values, min(len(values), self.random.randint(low, high)))
+
+    def create_chunk(self, first, last):
+        activities = []
+        countries = []
+        regions = []
+        sectors = []
+        transactions = []
+
+        for i in range(first, last):
+            activity_id = '%s-%d' % (self.prefix, i)
+            activities.append(models.Activity(
+                id=activity_id,
+                iati_identifier=activity_id,
+                xml_source_ref=self.prefix,
+                reporting_organisation_id=self.random.choice(self.organisations),
+                total_budget=self.random.randint(0, 10000000),
+                start_planned=self.date(),
+                start_actual=self.date(),
+                end_planned=self.date()))
+
+            for country in self.pick(self.countries, 1, 3):
+                countries.append(models.ActivityRecipientCountry(activity_id=activity_id, country_id=country))
+            for region in self.pick(self.regions, 0, 2):
+                regions.append(models.ActivityRecipientRegion(activity_id=activity_id, region_id=region))
+            for sector in self.pick(self.sectors, 1, 3):
+                sectors.append(models.ActivitySector(activity_id=activity_id, sector_id=sector))
+            for j in range(self.random.randint(2, 6)):
+                transactions.append(models.Transaction(
+                    activity_id=activity_id,
+                    transaction_type_id=self.random.choice(self.transaction_types),
+                    value_date=self.date(),
+                    value=self.random.randint(0, 1000000)))
+
+        models.Activity.objects.bulk_create(activities)
+        models.ActivityRecipientCountry.objects.bulk_create(countries)
+        models.ActivityRecipientRegion.objects.bulk_create(regions)
+        models.ActivitySector.objects.bulk_create(sectors)
+        models.Transaction.objects.bulk_create(transactions)
+        return [activity.id for activity in activities]
+
+    def call(self, query, cube):
+        request = RequestFactory().get('/api/v3/activity-aggregate-any/?format=json&' + query)
+        with override_settings(API_AGGREGATE_CUBE=cube):
+            start = time.time()
+            response = ActivityAggregatedAnyResource().get_list(request)
+            seconds = time.time() - start
+
+        values = {}
+        for row in ujson.loads(response.content):
+            values[str(row['group_field'])] = round(float(row['aggregation_field'] or 0), 0)
+        return values, seconds
+
+    def time_calls(self):
+        parameters = {
+            'organisation': self.organisations[0],
+            'countries': ','.join(self.countries[:2]),
+        }
+        for query in self.calls:
+            query = query.format(**parameters)
+            sql_values, sql_seconds = self.call(query, cube=False)
+            cube_values, cube_seconds = self.call(query, cube=True)
+            self.results.append((query, sql_seconds, cube_seconds, sql_values == cube_values))
+
+    def run(self):
+        timings = []
+        updater = ActivityAggregateUpdater()
+
+        with transaction.atomic():
+            self.load_dimensions()
+
+            generate_seconds = 0
+            build_seconds = 0
+            for first in range(0, self.activity_count, self.chunk_size):
+                start = time.time()
+                activity_ids = self.create_chunk(first, min(first + self.chunk_size, self.activity_count))
+                generate_seconds += time.time() - start
+
+                start = time.time()
+                updater.update_activities(activity_ids)
+                build_seconds += time.time() - start
+
+            timings.append(('generate %d activities' % self.activity_count, generate_seconds))
+            timings.append(('build fact rows', build_seconds))
+
+            self.time_calls()
+            transaction.set_rollback(True)
+
+        return timings
@@ -0,0 +1,96 @@
+from builtins import str
+from builtins import range
+from builtins import object
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from iati import models
+from iati.deleter import Deleter
+
+
+class Command(BaseCommand):
+    help = 'Compare the per activity delete with the set based delete on generated activities. Nothing is kept.'
+    option_list = BaseCommand.option_list + (
+        make_option('--activities', dest='activities', type='int', default=200,
+                    help='Number of activities to generate'),
+        make_option('--rows', dest='rows', type='int', default=5,
+                    help='Number of rows per child table per activity'),
+    )
+
+    def handle(self, *args, **options):
+        benchmark = DeleterBenchmark(options['activities'], options['rows'])
+        for name, seconds, queries in benchmark.run():
+            self.stdout.write("%s: %.2f seconds, %d queries" % (name, seconds, queries))
+
+
+class DeleterBenchmark(object):
+    """
+    Generates activities for a fake source and times both delete paths on
+    them. Everything runs in a transaction that is rolled back.
+    """
+
+    xml_source_ref = 'deleter-benchmark'
+
+    def __init__(self, activity_count, row_count):
+        self.activity_count = activity_count
+        self.row_count = row_count
+
+    def create_activities(self):
+        activities = []
+        for i in range(self.activity_count):
+            activity_id = '%s-%d' % (self.xml_source_ref, i)
+            activities.append(models.Activity(
+                id=activity_id,
+                iati_identifier=activity_id,
+                xml_source_ref=self.xml_source_ref))
+        models.Activity.objects.bulk_create(activities)
+
+        titles = []
+        budgets = []
+        transactions = []
+        for activity in activities:
+            for i in range(self.row_count):
+                titles.append(models.Title(activity=activity, title='title %d' % i))
+                budgets.append(models.Budget(activity=activity, value=i))
+                transactions.append(models.Transaction(activity=activity, value=i))
+
+            result = models.Result.objects.create(activity=activity, title='result')
+            for i in range(self.row_count):
+                indicator = models.ResultIndicator.objects.create(
+                    result=result, baseline_year=2014, baseline_value=str(i))
+                models.ResultIndicatorPeriod.objects.create(result_indicator=indicator, target=str(i))
+
+        models.Title.objects.bulk_create(titles)
+        models.Budget.objects.bulk_create(budgets)
+        models.Transaction.objects.bulk_create(transactions)
+
+    def time_delete(self, delete):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            delete(self.xml_source_ref)
+            seconds = time.time() - start
+
+        if models.Activity.objects.filter(xml_source_ref=self.xml_source_ref).exists():
+            raise Exception("activities left after delete")
+
+        return seconds, len(queries)
+
+    def run(self):
+        deleter = Deleter()
+        results = []
+
+        with transaction.atomic():
+            for name, delete in (
+                    ('per activity', deleter.delete_by_source_per_activity),
+                    ('set based', deleter.delete_by_source)):
+                self.create_activities()
+                seconds, queries = self.time_delete(delete)
+                results.append((name, seconds, queries))
+
+            transaction.set_rollback(True)
+
+        return results
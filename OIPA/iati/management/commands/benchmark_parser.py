@@ -0,0 +1,61 @@
+from builtins import range
+from builtins import object
+from optparse import make_option
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lxml import etree
+
+from iati.parser import Parser
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'fixtures', 'sample_activities.xml')
+
+
+class Command(BaseCommand):
+    help = 'Time the parser per activity on an IATI file, reading the activities with lxml XPath ' \
+           'and with element records. Nothing is kept.'
+    args = '[file]'
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', dest='repeat', type='int', default=100,
+                    help='Number of times the file is parsed'),
+    )
+
+    def handle(self, *args, **options):
+        path = args[0] if args else SAMPLE_FILE
+        benchmark = ParserBenchmark(path, options['repeat'])
+
+        for name, use_element_records in (('lxml xpath', False), ('element records', True)):
+            seconds, activity_count = benchmark.run(use_element_records)
+            self.stdout.write("%s: %d activities in %.2f seconds, %.2f ms per activity" % (
+                name, activity_count, seconds, 1000 * seconds / max(activity_count, 1)))
+
+
+class ParserBenchmark(object):
+    """
+    Parses a file a number of times in a transaction that is rolled back.
+    """
+
+    xml_source_ref = 'parser-benchmark'
+
+    def __init__(self, path, repeat):
+        self.path = path
+        self.repeat = repeat
+
+    def run(self, use_element_records):
+        parser = Parser()
+        parser.use_element_records = use_element_records
+        parser.xml_source_ref = self.xml_source_ref
+
+        with transaction.atomic():
+            start = time.time()
+            for i in range(self.repeat):
+                context = etree.iterparse(self.path, tag='iati-activity')
+                parser.fast_iter(context, parser.process_element)
+                parser.flush()
+            seconds = time.time() - start
+
+            transaction.set_rollback(True)
+
+        return seconds, parser.activity_count
@@ -0,0 +1,327 @@
+from builtins import object
+import csv
+import datetime
+import decimal
+import gzip
+import hashlib
+import os
+import re
+
+import ujson
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.v3.resources.csv_serializer import CsvSerializer
+from api.v3.resources.sql_query import SqlQuery
+from api.v3.resources.streaming import Echo, csv_value, server_side_cursor
+from iati import models
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# (name, sql, type) of the exported activity columns
+EXPORT_COLUMNS = (
+    ('id', 'a.id', 'string'),
+    ('iati_identifier', 'a.iati_identifier', 'string'),
+    ('reporting_organisation', 'a.reporting_organisation_id', 'string'),
+    ('title', '(SELECT t.title FROM iati_title t WHERE t.activity_id = a.id LIMIT 1)', 'string'),
+    ('activity_status', 'a.activity_status_id', 'string'),
+    ('start_planned', 'a.start_planned', 'date'),
+    ('end_planned', 'a.end_planned', 'date'),
+    ('start_actual', 'a.start_actual', 'date'),
+    ('end_actual', 'a.end_actual', 'date'),
+    ('total_budget', 'a.total_budget', 'decimal'),
+    ('total_budget_currency', 'a.total_budget_currency_id', 'string'),
+    ('countries', "(SELECT GROUP_CONCAT(rc.country_id SEPARATOR ',') FROM iati_activityrecipientcountry rc "
+                  "WHERE rc.activity_id = a.id)", 'string'),
+    ('regions', "(SELECT GROUP_CONCAT(rr.region_id SEPARATOR ',') FROM iati_activityrecipientregion rr "
+                "WHERE rr.activity_id = a.id)", 'string'),
+    ('sectors', "(SELECT GROUP_CONCAT(s.sector_id SEPARATOR ',') FROM iati_activitysector s "
+                "WHERE s.activity_id = a.id)", 'string'),
+    ('last_updated_datetime', 'a.last_updated_datetime', 'string'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Write the CSV, NDJSON and (with pyarrow) Parquet dumps of the activities per reporting organisation, ' \
+           'for all organisations or for the given refs'
+    args = '[reporting_organisation_ref ...]'
+
+    def handle(self, *args, **options):
+        BulkExporter().export(args or None)
+
+
+def json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def file_name(reporting_organisation):
+    """
+    The base name of the dumps of an organisation: the ref without the
+    characters that do not belong in a file name, and a short hash of the
+    ref so refs that only differ in those characters get their own file
+    """
+    ref_hash = hashlib.sha1(reporting_organisation.encode('utf-8')).hexdigest()[:8]
+    return 'activities-' + re.sub(r'[^\w.-]', '_', reporting_organisation) + '-' + ref_hash
+
+
+def sha256(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+class CsvDump(object):
+    """
+    Gzipped CSV, in the dialect of ?format=csv
+    """
+    format = 'csv'
+    extension = '.csv.gz'
+
+    def __init__(self, path, columns):
+        self.file = gzip.open(path, 'wb')
+        self.writer = csv.writer(Echo(), **CsvSerializer.csv_params)
+        self.write_line(self.writer.writerow([csv_value(name) for name, sql, column_type in columns]))
+
+    def write_line(self, line):
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        self.file.write(line)
+
+    def write(self, rows):
+        for row in rows:
+            self.write_line(self.writer.writerow([csv_value(json_value(value)) for value in row]))
+
+    def close(self):
+        self.file.close()
+
+
+class NdjsonDump(object):
+    """
+    Gzipped newline delimited JSON, an object per activity
+    """
+    format = 'ndjson'
+    extension = '.ndjson.gz'
+
+    def __init__(self, path, columns):
+        self.file = gzip.open(path, 'wb')
+        self.names = [name for name, sql, column_type in columns]
+
+    def write(self, rows):
+        for row in rows:
+            line = ujson.dumps(dict(zip(self.names, [json_value(value) for value in row]))) + '\n'
+            self.file.write(line.encode('utf-8'))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetDump(object):
+    """
+    Snappy compressed Parquet, a row group per chunk
+    """
+    format = 'parquet'
+    extension = '.parquet'
+
+    def __init__(self, path, columns):
+        types = {
+            'string': pyarrow.string(),
+            'date': pyarrow.date32(),
+            'decimal': pyarrow.float64(),
+        }
+        self.schema = pyarrow.schema([
+            pyarrow.field(name, types[column_type]) for name, sql, column_type in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='snappy')
+
+    def value(self, value):
+        if isinstance(value, decimal.Decimal):
+            return float(value)
+        return value
+
+    def write(self, rows):
+        arrays = [
+            pyarrow.array([self.value(value) for value in values], type=field.type)
+            for values, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class BulkExporter(object):
+    """
+    Writes the dumps of the activities of each reporting organisation to
+    settings.API_EXPORT_ROOT, served under settings.API_EXPORT_URL.
+
+    An organisation's activities are read once, chunk_size rows at a time
+    from a server side cursor, and written to every dump format. Dumps are
+    written to a temporary file and renamed, so a download never gets a
+    half written file. index.json lists the dumps with their row count,
+    size and sha256, SHA256SUMS has the checksums for sha256sum -c.
+    Activities without a reporting organisation are not exported.
+    """
+
+    chunk_size = 5000
+    columns = EXPORT_COLUMNS
+    # bytes, MySQL cuts the GROUP_CONCAT columns at 1024 by default
+    group_concat_max_len = 1024 * 1024
+
+    def __init__(self, export_root=None, export_url=None):
+        self.export_root = export_root or settings.API_EXPORT_ROOT
+        self.export_url = export_url if export_url is not None else settings.API_EXPORT_URL
+
+    def dump_classes(self):
+        dumps = [CsvDump, NdjsonDump]
+        if pyarrow is not None:
+            dumps.append(ParquetDump)
+        return dumps
+
+    def reporting_organisations(self):
+        return list(models.Activity.objects.exclude(reporting_organisation=None)
+                    .values_list('reporting_organisation_id', flat=True)
+                    .distinct().order_by('reporting_organisation_id'))
+
+    def get_query(self, reporting_organisation):
+        query = SqlQuery('iati_activity a', *['%s as %s' % (sql, name) for name, sql, column_type in self.columns])
+        query.where('a.reporting_organisation_id = %s', reporting_organisation)
+        query.order('a.id', 'ASC', ['a.id'])
+        return query
+
+    def write_dumps(self, reporting_organisation, row_chunks):
+        """
+        Write the chunks of rows to a dump per format, returns the index
+        entries of the dumps
+        """
+        base = file_name(reporting_organisation)
+        dumps = []
+        for dump_class in self.dump_classes():
+            path = os.path.join(self.export_root, base + dump_class.extension)
+            dumps.append((dump_class(path + '.tmp', self.columns), path))
+
+        rows = 0
+        try:
+            for chunk in row_chunks:
+                rows += len(chunk)
+                for dump, path in dumps:
+                    dump.write(chunk)
+        except Exception:
+            # the previous dumps stay when the export fails
+            for dump, path in dumps:
+                dump.close()
+                os.remove(path + '.tmp')
+            raise
+
+        for dump, path in dumps:
+            dump.close()
+
+        entries = []
+        for dump, path in dumps:
+            os.rename(path + '.tmp', path)
+            name = os.path.basename(path)
+            entries.append({
+                'reporting_organisation': reporting_organisation,
+                'format': dump.format,
+                'file': name,
+                'url': self.export_url + name,
+                'rows': rows,
+                'size': os.path.getsize(path),
+                'sha256': sha256(path),
+            })
+        return entries
+
+    def row_chunks(self, reporting_organisation):
+        cursor = server_side_cursor()
+        if connection.vendor == 'mysql':
+            cursor.execute('SET SESSION group_concat_max_len = %s', [self.group_concat_max_len])
+        self.get_query(reporting_organisation).execute(cursor)
+        try:
+            while True:
+                chunk = cursor.fetchmany(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            cursor.close()
+
+    def read_index(self):
+        try:
+            with open(os.path.join(self.export_root, 'index.json')) as f:
+                return ujson.load(f)['files']
+        except (IOError, ValueError, KeyError):
+            return []
+
+    def write_index(self, entries):
+        entries = sorted(entries, key=lambda entry: (entry['reporting_organisation'], entry['format']))
+        index = {
+            'generated': datetime.datetime.now().isoformat(),
+            'columns': [name for name, sql, column_type in self.columns],
+            'files': entries,
+        }
+
+        path = os.path.join(self.export_root, 'index.json')
+        with open(path + '.tmp', 'w') as f:
+            f.write(ujson.dumps(index, indent=2))
+        os.rename(path + '.tmp', path)
+
+        path = os.path.join(self.export_root, 'SHA256SUMS')
+        with open(path + '.tmp', 'w') as f:
+            for entry in entries:
+                f.write(entry['sha256'] + '  ' + entry['file'] + '\n')
+        os.rename(path + '.tmp', path)
+
+    def remove_dumps(self, entries):
+        for entry in entries:
+            path = os.path.join(self.export_root, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+
+    def export(self, reporting_organisations=None):
+        """
+        Export the given organisations, all of them by default. The dumps
+        of organisations that no longer have activities are removed after
+        a full export.
+        """
+        if not os.path.isdir(self.export_root):
+            os.makedirs(self.export_root)
+
+        full_export = reporting_organisations is None
+        if full_export:
+            reporting_organisations = self.reporting_organisations()
+
+        exported = {}
+        for reporting_organisation in reporting_organisations:
+            try:
+                exported[reporting_organisation] = self.write_dumps(
+                    reporting_organisation, self.row_chunks(reporting_organisation))
+            except Exception as e:
+                logger.info("error in export of " + reporting_organisation + ", def: export")
+                if e.args:
+                    logger.info(e.args[0])
+
+        entries = []
+        for entry in self.read_index():
+            organisation = entry['reporting_organisation']
+            if organisation in exported:
+                continue
+            if full_export and organisation not in reporting_organisations:
+                self.remove_dumps([entry])
+                continue
+            entries.append(entry)
+        for organisation_entries in exported.values():
+            entries.extend(organisation_entries)
+
+        self.write_index(entries)
+        return True
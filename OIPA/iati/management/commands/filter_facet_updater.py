@@ -0,0 +1,137 @@
+from builtins import range
+from builtins import str
+from builtins import object
+from collections import defaultdict
+
+# Django specific
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from iati import models
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the activity filter option counts, for all or for the given reporting organisations'
+    args = '[reporting_organisation ...]'
+
+    def handle(self, *args, **options):
+        updater = FilterFacetUpdater()
+        if args:
+            updater.update_organisations(args)
+        else:
+            updater.update()
+
+
+class FilterFacetUpdater(object):
+    """
+    Builds the ActivityFilterFacet rows: the number of activities per filter
+    option (country, sector, region, donor, start year, reporting
+    organisation) and reporting organisation.
+
+    The rows of a reporting organisation are replaced as a whole, after a
+    parse only the organisations of the parsed source are rebuilt.
+    """
+
+    # (facet, model, activity field, code field, name field, filters)
+    related_facets = (
+        ('countries', models.ActivityRecipientCountry, 'activity', 'country_id', 'country__name', {}),
+        ('sectors', models.ActivitySector, 'activity', 'sector_id', 'sector__name', {}),
+        ('regions', models.ActivityRecipientRegion, 'activity', 'region_id', 'region__name',
+         {'region__region_vocabulary_id': 1}),
+        ('donors', models.ActivityParticipatingOrganisation, 'activity', 'organisation_id',
+         'organisation__name', {}),
+    )
+
+    chunk_size = 100
+
+    # (facet, date field)
+    year_facets = (
+        ('start_actual', 'start_actual'),
+        ('start_planned_years', 'start_planned'),
+    )
+
+    def related_counts(self, codes):
+        for facet, model, activity_field, code_field, name_field, filters in self.related_facets:
+            organisation_field = activity_field + '__reporting_organisation_id'
+            rows = model.objects.filter(**{organisation_field + '__in': codes}) \
+                .exclude(**{code_field: None}) \
+                .filter(**filters) \
+                .values_list(organisation_field, code_field, name_field) \
+                .annotate(count=Count(activity_field, distinct=True)) \
+                .order_by()
+
+            for reporting_organisation, code, name, count in rows:
+                yield facet, reporting_organisation, str(code), name, count
+
+    def activity_counts(self, codes):
+        activities = models.Activity.objects.filter(reporting_organisation_id__in=codes)
+
+        rows = activities.values_list('reporting_organisation_id', 'reporting_organisation__name') \
+            .annotate(count=Count('id')).order_by()
+        for code, name, count in rows:
+            yield 'reporting_organisations', code, code, name, count
+
+        # years are counted here, the ORM has no portable year extraction
+        for facet, date_field in self.year_facets:
+            years = defaultdict(int)
+            for reporting_organisation, date in activities.exclude(**{date_field: None}) \
+                    .values_list('reporting_organisation_id', date_field):
+                years[(reporting_organisation, date.year)] += 1
+
+            for (reporting_organisation, year), count in years.items():
+                yield facet, reporting_organisation, str(year), str(year), count
+
+    def build(self, codes):
+        facets = []
+        for counts in (self.related_counts(codes), self.activity_counts(codes)):
+            for facet, reporting_organisation, code, name, count in counts:
+                facets.append(models.ActivityFilterFacet(
+                    facet=facet,
+                    reporting_organisation=reporting_organisation,
+                    code=code,
+                    name=name or '',
+                    count=count))
+        return facets
+
+    def update_organisations(self, codes):
+        codes = list(codes)
+        try:
+            with transaction.atomic():
+                facets = self.build(codes)
+                models.ActivityFilterFacet.objects.filter(reporting_organisation__in=codes).delete()
+                models.ActivityFilterFacet.objects.bulk_create(facets)
+        except Exception as e:
+            logger.info("error in filter facets of " + ", ".join(codes) + ", def: update_organisations")
+            if e.args:
+                logger.info(e.args[0])
+
+    def update(self):
+        models.ActivityFilterFacet.objects.all().delete()
+        codes = list(models.Activity.objects.exclude(reporting_organisation=None)
+                     .values_list('reporting_organisation_id', flat=True).distinct())
+        for i in range(0, len(codes), self.chunk_size):
+            self.update_organisations(codes[i:i + self.chunk_size])
+        return True
+
+
+def get_filter_options(facets, reporting_organisations=None):
+    """
+    The filter options in the format of activity-filter-options, with one
+    query on ActivityFilterFacet.
+    """
+    rows = models.ActivityFilterFacet.objects.filter(facet__in=facets)
+    if reporting_organisations:
+        rows = rows.filter(reporting_organisation__in=reporting_organisations)
+
+    options = dict((facet, {}) for facet in facets)
+    for facet, code, name, count in rows.values_list('facet', 'code', 'name').annotate(
+            total=Sum('count')).order_by():
+        options[facet][code] = {'name': name, 'total': count}
+
+    for facet, date_field in FilterFacetUpdater.year_facets:
+        for code, item in options.get(facet, {}).items():
+            item['name'] = int(code)
+    return options
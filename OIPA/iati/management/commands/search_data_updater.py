@@ -0,0 +1,100 @@
+from builtins import range
+from builtins import object
+from collections import defaultdict
+
+# Django specific
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from iati import models
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full text search data, for all activities or for the sources with the given refs'
+    args = '[xml_source_ref ...]'
+
+    def handle(self, *args, **options):
+        updater = SearchDataUpdater()
+        if args:
+            for xml_source_ref in args:
+                updater.update_source(xml_source_ref)
+        else:
+            updater.update()
+
+
+class SearchDataUpdater(object):
+    """
+    Builds the ActivitySearchData rows for a batch of activities at once.
+
+    Every search field is read for the whole batch with a single values_list
+    query, the texts are joined per activity and the rows of the batch are
+    replaced with one delete and one bulk_create.
+    """
+
+    chunk_size = 500
+
+    # (search field, model, activity field, text field)
+    search_fields = (
+        ('search_title', models.Title, 'activity_id', 'title'),
+        ('search_description', models.Description, 'activity_id', 'description'),
+        ('search_country_name', models.ActivityRecipientCountry, 'activity_id', 'country__name'),
+        ('search_region_name', models.ActivityRecipientRegion, 'activity_id', 'region__name'),
+        ('search_sector_name', models.ActivitySector, 'activity_id', 'sector__name'),
+        ('search_participating_organisation_name', models.ActivityParticipatingOrganisation,
+         'activity_id', 'name'),
+        ('search_documentlink_title', models.DocumentLink, 'activity_id', 'title'),
+    )
+
+    def get_texts(self, model, activity_field, text_field, activity_ids):
+        texts = defaultdict(str)
+        rows = model.objects.filter(**{activity_field + '__in': activity_ids}) \
+            .exclude(**{text_field + '__isnull': True}) \
+            .order_by(activity_field, 'pk') \
+            .values_list(activity_field, text_field)
+
+        for activity_id, text in rows:
+            texts[activity_id] += text + ' '
+        return texts
+
+    def build(self, activity_ids):
+        activities = models.Activity.objects.filter(id__in=activity_ids) \
+            .values_list('id', 'iati_identifier', 'reporting_organisation__name')
+
+        texts = dict(
+            (field, self.get_texts(model, activity_field, text_field, activity_ids))
+            for field, model, activity_field, text_field in self.search_fields)
+
+        search_data = []
+        for activity_id, iati_identifier, reporting_organisation_name in activities:
+            row = models.ActivitySearchData(
+                activity_id=activity_id,
+                search_identifier=iati_identifier,
+                search_reporting_organisation_name=reporting_organisation_name or '')
+            for field in texts:
+                setattr(row, field, texts[field].get(activity_id, ''))
+            search_data.append(row)
+        return search_data
+
+    def update_activities(self, activity_ids):
+        activity_ids = list(activity_ids)
+        for i in range(0, len(activity_ids), self.chunk_size):
+            chunk = activity_ids[i:i + self.chunk_size]
+            try:
+                with transaction.atomic():
+                    search_data = self.build(chunk)
+                    models.ActivitySearchData.objects.filter(activity_id__in=chunk).delete()
+                    models.ActivitySearchData.objects.bulk_create(search_data)
+            except Exception as e:
+                logger.info("error in search data chunk starting at " + str(chunk[0]) + ", def: update_activities")
+                if e.args:
+                    logger.info(e.args[0])
+
+    def update(self):
+        self.update_activities(models.Activity.objects.values_list('id', flat=True))
+        return True
+
+    def update_source(self, xml_source_ref):
+        self.update_activities(models.Activity.objects.filter(
+            xml_source_ref=xml_source_ref).values_list('id', flat=True))
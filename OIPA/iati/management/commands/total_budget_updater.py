@@ -1,24 +1,43 @@
+from builtins import str
 from builtins import zip
+from builtins import range
 from builtins import object
 import datetime
 
 # Django specific
 from django.core.management.base import BaseCommand
-from django.db import connection
-from iati.models import Activity, Budget, Currency
+from django.db import connection, transaction
+from django.db.models import Case, CharField, DecimalField, Value, When
+from iati.models import Activity
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
+    help = 'Recompute total_budget and total_budget_currency, for all activities or for the sources with the given refs'
+    args = '[xml_source_ref ...]'
     counter = 0
 
     def handle(self, *args, **options):
-        parser = TotalBudgetUpdater()
-        parser.updateTotal()
+        updater = TotalBudgetUpdater()
+        if args:
+            for xml_source_ref in args:
+                updater.update_source(xml_source_ref)
+        else:
+            updater.update()
 
 
 class TotalBudgetUpdater(object):
+    """
+    Sets Activity.total_budget to the sum of the activity's budgets, and
+    total_budget_currency to the budget currency if all budgets (with a
+    currency) are in the same currency.
+
+    The totals for a source, or the whole database, come from one aggregate
+    query and are written with an UPDATE per chunk of activities.
+    """
+
+    chunk_size = 500
 
     def get_fields(self, cursor):
         desc = cursor.description
@@ -28,70 +47,63 @@ class TotalBudgetUpdater(object):
         ]
         return results
 
-    def update(self):
-
-        cursor = connection.cursor()
-        cursor.execute('SELECT activity_id, sum(value) as total_value FROM IATI_budget b GROUP BY activity_id')
-
-        results = self.get_fields(cursor=cursor)
-        for r in results:
-            cur_act = Activity.objects.get(id=r['activity_id'])
-            cur_act.total_budget = r['total_value']
-            cur_act.total_budget_currency = self.get_budget_currency(cur_act);
-            cur_act.save()
+    def get_totals(self, xml_source_ref=None, activity_ids=None):
+        query = "SELECT b.activity_id, SUM(b.value) AS total_value, " \
+                "COUNT(DISTINCT b.currency_id) AS currency_count, MAX(b.currency_id) AS currency_id " \
+                "FROM iati_budget b"
+        params = []
 
-        return True
+        if xml_source_ref is not None:
+            query += " JOIN iati_activity a ON a.id = b.activity_id WHERE a.xml_source_ref = %s"
+            params.append(xml_source_ref)
+        elif activity_ids is not None:
+            query += " WHERE b.activity_id IN (" + ", ".join(["%s"] * len(activity_ids)) + ")"
+            params.extend(activity_ids)
 
-    def get_budget_currency(self, activity):
+        query += " GROUP BY b.activity_id"
 
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        return self.get_fields(cursor=cursor)
+
+    def apply_totals(self, totals):
+        for i in range(0, len(totals), self.chunk_size):
+            chunk = totals[i:i + self.chunk_size]
+
+            total_budget = Case(
+                *[When(id=r['activity_id'], then=Value(r['total_value'])) for r in chunk],
+                output_field=DecimalField(max_digits=15, decimal_places=2))
+            total_budget_currency = Case(
+                *[When(id=r['activity_id'], then=Value(r['currency_id'] if r['currency_count'] == 1 else None))
+                  for r in chunk],
+                output_field=CharField())
+
+            Activity.objects.filter(id__in=[r['activity_id'] for r in chunk]).update(
+                total_budget=total_budget,
+                total_budget_currency=total_budget_currency)
+
+    def update_totals(self, xml_source_ref=None, activity_ids=None):
         try:
-            current_currency = None
-            for b in Budget.objects.filter(activity_id=activity.id):
-
-                if not current_currency:
-                    # first row
-                    current_currency = b.currency_id
-                elif current_currency == b.currency_id:
-                    # currency matches previously found currency
-                    continue
-                else:
-                    # multiple currencies detected, return None
-                    return None
-
-            if current_currency:
-                return Currency.objects.get(code=current_currency)
-            else:
-                return None
+            with transaction.atomic():
+                self.apply_totals(self.get_totals(xml_source_ref, activity_ids))
         except Exception as e:
-            logger.info("error in " + activity.id + ", def: get_budget_currency")
+            logger.info("error in " + str(xml_source_ref) + ", def: update_totals")
             if e.args:
                 logger.info(e.args[0])
             if e.args.__len__() > 1:
                 logger.info(e.args[1])
-            if e.message:
-                logger.info(e.message)
-            return None
-
-
 
-    def update_single_activity(self, id):
+    def update(self):
+        self.update_totals()
+        return True
 
-        try:
-            cursor = connection.cursor()
+    def update_source(self, xml_source_ref):
+        self.update_totals(xml_source_ref=xml_source_ref)
 
-            cursor.execute("SELECT activity_id, sum(value) as total_value FROM iati_budget b WHERE activity_id ='" + id + "' GROUP BY activity_id")
+    def update_activities(self, activity_ids):
+        activity_ids = list(activity_ids)
+        for i in range(0, len(activity_ids), self.chunk_size):
+            self.update_totals(activity_ids=activity_ids[i:i + self.chunk_size])
 
-            results = self.get_fields(cursor=cursor)
-            for r in results:
-                cur_act = Activity.objects.get(id=r['activity_id'])
-                cur_act.total_budget = r['total_value']
-                cur_act.total_budget_currency = self.get_budget_currency(cur_act)
-                cur_act.save()
-        except Exception as e:
-            logger.info("error in " + id + ", def: update_single_activity")
-            if e.args:
-                logger.info(e.args[0])
-            if e.args.__len__() > 1:
-                logger.info(e.args[1])
-            if e.message:
-                logger.info(e.message)
+    def update_single_activity(self, id):
+        self.update_totals(activity_ids=[id])
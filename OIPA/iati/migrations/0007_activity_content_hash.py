@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati', '0006_auto_20160923_1348'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='content_hash',
+            field=models.CharField(default='', max_length=40),
+        ),
+    ]
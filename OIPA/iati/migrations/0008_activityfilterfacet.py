@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati', '0007_activity_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityFilterFacet',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('facet', models.CharField(max_length=30, db_index=True)),
+                ('code', models.CharField(max_length=80)),
+                ('name', models.CharField(default='', max_length=250)),
+                ('reporting_organisation', models.CharField(max_length=80)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='activityfilterfacet',
+            index_together=set([('reporting_organisation', 'facet')]),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geodata', '0001_initial'),
+        ('iati', '0008_activityfilterfacet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityAggregate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start_planned_year', models.SmallIntegerField(null=True)),
+                ('start_actual_year', models.SmallIntegerField(null=True)),
+                ('end_planned_year', models.SmallIntegerField(null=True)),
+                ('end_actual_year', models.SmallIntegerField(null=True)),
+                ('value', models.DecimalField(default=0, max_digits=15, decimal_places=2)),
+                ('total_budget', models.DecimalField(default=None, null=True, max_digits=15, decimal_places=2)),
+                ('country_count', models.SmallIntegerField(default=1)),
+                ('region_count', models.SmallIntegerField(default=1)),
+                ('sector_count', models.SmallIntegerField(default=1)),
+                ('transaction_type_count', models.SmallIntegerField(default=1)),
+                ('activity', models.ForeignKey(to='iati.Activity')),
+                ('country', models.ForeignKey(to='geodata.Country', null=True)),
+                ('region', models.ForeignKey(to='geodata.Region', null=True)),
+                ('reporting_organisation', models.ForeignKey(to='iati.Organisation', null=True)),
+                ('sector', models.ForeignKey(to='iati.Sector', null=True)),
+                ('transaction_type', models.ForeignKey(to='iati.TransactionType', null=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='activityaggregate',
+            index_together=set([('transaction_type', 'reporting_organisation'), ('transaction_type', 'country'), ('transaction_type', 'sector')]),
+        ),
+    ]
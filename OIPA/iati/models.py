@@ -496,6 +496,8 @@ class Activity(models.Model):
     capital_spend = models.DecimalField(max_digits=5, decimal_places=2, null=True, default=None)
     scope = models.ForeignKey(ActivityScope, null=True, blank=True)
     iati_standard_version = models.CharField(max_length=30, default="")
+    # sha1 of the iati-activity element, used to skip unchanged activities
+    content_hash = models.CharField(max_length=40, default="")
 
     objects = ActivityQuerySet.as_manager()
 
@@ -517,6 +519,48 @@ class ActivitySearchData(models.Model):
     search_reporting_organisation_name = models.TextField(max_length=80000)
     search_documentlink_title = models.TextField(max_length=80000)
 
+class ActivityFilterFacet(models.Model):
+    # number of activities per filter option and reporting organisation, see
+    # iati/management/commands/filter_facet_updater.py
+    facet = models.CharField(max_length=30, db_index=True)
+    code = models.CharField(max_length=80)
+    name = models.CharField(max_length=250, default="")
+    reporting_organisation = models.CharField(max_length=80)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        index_together = (('reporting_organisation', 'facet'),)
+
+class ActivityAggregate(models.Model):
+    # fact table for activity-aggregate-any, one row per activity x country x
+    # region x sector x transaction type with the transaction values of that
+    # type summed. The *_count fields hold the number of values of a
+    # dimension on the activity (at least 1), see
+    # iati/management/commands/activity_aggregate_updater.py
+    activity = models.ForeignKey(Activity)
+    reporting_organisation = models.ForeignKey(Organisation, null=True)
+    country = models.ForeignKey(Country, null=True)
+    region = models.ForeignKey(Region, null=True)
+    sector = models.ForeignKey(Sector, null=True)
+    transaction_type = models.ForeignKey(TransactionType, null=True)
+    start_planned_year = models.SmallIntegerField(null=True)
+    start_actual_year = models.SmallIntegerField(null=True)
+    end_planned_year = models.SmallIntegerField(null=True)
+    end_actual_year = models.SmallIntegerField(null=True)
+    value = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_budget = models.DecimalField(max_digits=15, decimal_places=2, null=True, default=None)
+    country_count = models.SmallIntegerField(default=1)
+    region_count = models.SmallIntegerField(default=1)
+    sector_count = models.SmallIntegerField(default=1)
+    transaction_type_count = models.SmallIntegerField(default=1)
+
+    class Meta:
+        index_together = (
+            ('transaction_type', 'reporting_organisation'),
+            ('transaction_type', 'country'),
+            ('transaction_type', 'sector'),
+        )
+
 @python_2_unicode_compatible
 class ActivityParticipatingOrganisation(models.Model):
     activity = models.ForeignKey(Activity, related_name="participating_organisations")
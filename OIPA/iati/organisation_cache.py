@@ -0,0 +1,150 @@
+from builtins import range
+from builtins import object
+import random
+import string
+import threading
+
+from django.db import transaction
+
+from iati import models
+from iati_synchroniser.exception_handler import exception_handler
+from .codelist_resolver import to_text
+
+
+def org_key(value):
+    # MySQL compares case insensitive and ignores trailing spaces
+    if value is None:
+        return None
+    return to_text(value).rstrip().lower()
+
+
+class OrganisationCache(object):
+    """
+    Identity map of the organisations used in a parse run, by code and by
+    (original ref, name).
+
+    preload() reads the organisations the source referenced in its last
+    parse, so a re-parse normally finds every organisation in memory. Other
+    organisations are looked up once and remembered. New organisations are
+    collected and inserted with one bulk_create in flush(), which the parser
+    calls before the activities that use them are written.
+
+    Writer threads of the same run share the cache, so the lookups are
+    guarded by a lock. A flush can insert organisations that the activities
+    of another writer use, so flushes run one at a time: a writer's flush
+    returns only after the organisations taken by another writer's flush
+    are committed.
+    """
+
+    def __init__(self):
+        self.by_code = {}
+        self.by_ref_and_name = {}
+        # codes with a random suffix that are in use, per original ref
+        self.suffixed_codes = {}
+        self.new = []
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+
+    def remember(self, organisation):
+        self.by_code[org_key(organisation.code)] = organisation
+        self.by_ref_and_name.setdefault(
+            (org_key(organisation.original_ref), org_key(organisation.name)), organisation)
+
+    def preload(self, xml_source_ref):
+        activities = models.Activity.objects.filter(xml_source_ref=xml_source_ref)
+
+        codes = set(activities.values_list('reporting_organisation_id', flat=True))
+        codes.update(models.Transaction.objects.filter(activity__in=activities)
+                     .values_list('provider_organisation_id', flat=True))
+        codes.update(models.Transaction.objects.filter(activity__in=activities)
+                     .values_list('receiver_organisation_id', flat=True))
+        codes.update(models.ActivityParticipatingOrganisation.objects.filter(activity__in=activities)
+                     .values_list('organisation_id', flat=True))
+        codes.discard(None)
+
+        codes = list(codes)
+        with self.lock:
+            for i in range(0, len(codes), 500):
+                for organisation in models.Organisation.objects.filter(code__in=codes[i:i + 500]):
+                    self.remember(organisation)
+
+    def reporting_organisation(self, ref, name, org_type):
+        """
+        The organisation with code ref, created when it does not exist.
+        """
+        if not ref:
+            return None
+
+        with self.lock:
+            organisation = self.by_code.get(org_key(ref))
+            if organisation is None:
+                organisation = models.Organisation.objects.filter(code=ref).first()
+                if organisation is None:
+                    organisation = models.Organisation(code=ref, name=name, type=org_type, original_ref=ref)
+                    self.new.append(organisation)
+                self.remember(organisation)
+            return organisation
+
+    def find_or_create(self, ref, name):
+        """
+        The first organisation with the given original ref and name. A new
+        one gets the ref plus a random suffix as code.
+        """
+        with self.lock:
+            key = (org_key(ref), org_key(name))
+            organisation = self.by_ref_and_name.get(key)
+            if organisation is None:
+                organisation = models.Organisation.objects.filter(original_ref=ref, name=name).first()
+                if organisation is None:
+                    organisation = models.Organisation(
+                        code=self.new_code(ref),
+                        name=name,
+                        type=None,
+                        original_ref=ref)
+                    self.new.append(organisation)
+                self.remember(organisation)
+                self.by_ref_and_name[key] = organisation
+            return organisation
+
+    def new_code(self, ref):
+        if ref not in self.suffixed_codes:
+            self.suffixed_codes[ref] = set(org_key(code) for code in models.Organisation.objects.filter(
+                code__startswith=ref + '-').values_list('code', flat=True))
+        taken = self.suffixed_codes[ref]
+
+        for x in range(0, 10):
+            code = ref + '-' + self.random_key()
+            if org_key(code) not in taken and org_key(code) not in self.by_code:
+                taken.add(org_key(code))
+                return code
+        raise ValueError("No free organisation code for " + ref)
+
+    def random_key(self, size=6, chars=string.ascii_uppercase + string.digits):
+        return ''.join(random.choice(chars) for _ in range(size))
+
+    def flush(self):
+        """
+        Insert the organisations created since the last flush.
+        """
+        with self.flush_lock:
+            with self.lock:
+                new = self.new
+                self.new = []
+
+            if new:
+                self.insert(new)
+
+    def insert(self, new):
+        try:
+            with transaction.atomic():
+                models.Organisation.objects.bulk_create(new)
+            return
+        except Exception as e:
+            exception_handler(e, "bulk insert", "OrganisationCache.flush")
+
+        for organisation in new:
+            try:
+                with transaction.atomic():
+                    organisation.save()
+            except Exception as e:
+                exception_handler(e, organisation.code, "OrganisationCache.flush")
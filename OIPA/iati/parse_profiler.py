@@ -0,0 +1,160 @@
+from builtins import object
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import datetime
+import functools
+import resource
+import threading
+import time
+
+from django.db import connection
+
+# Parser methods timed besides the add_* methods; add_all_activity_data is
+# left out, it only calls the other add_* methods
+INSTRUMENTED_METHODS = (
+    'flush',
+    'delete_removed_activities',
+    'update_total_budgets',
+    'update_search_data',
+    'update_activity_aggregates',
+)
+
+
+class CountingQueriesLog(deque):
+    """
+    connection.queries_log that keeps a running count and time of the
+    queries appended to it, also of those dropped past maxlen
+    """
+
+    def __init__(self, maxlen):
+        deque.__init__(self, maxlen=maxlen)
+        self.count = 0
+        self.seconds = 0.0
+
+    def append(self, query):
+        deque.append(self, query)
+        self.count += 1
+        self.seconds += float(query['time'])
+
+
+class ParseProfiler(object):
+    """
+    Collects per stage timings of one parse run: calls, wall time, number of
+    SQL queries and their time.
+
+    A stage is a block of parse_url (download, delete) or a parser method:
+    instrument() wraps the add_* methods and the per file updates of a
+    parser instance, so the Parser class itself pays nothing when profiling
+    is off. Queries are counted through Django's debug cursor, in a
+    CountingQueriesLog so a stage with more queries than the log keeps
+    (settings.DEBUG's 9000) is still counted in full. Stages nest
+    (add_activity calls add_activity_date): the time and queries of an inner
+    stage are left out of the stage around it, so the stages add up.
+
+    peak_rss is the peak memory of the process so far, not of the run; a
+    pool worker that parsed a larger file before reports that file's peak.
+
+    A disabled profiler does nothing, the parser always has one.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = OrderedDict()
+        self.lock = threading.Lock()
+        self.started = None
+        self.start_time = None
+        self.duration = 0
+        self.activity_count = 0
+        self.peak_rss = None
+        # the open stages of each thread
+        self.local = threading.local()
+
+    def start(self):
+        self.started = datetime.datetime.now()
+        self.start_time = time.time()
+
+    def stop(self, activity_count):
+        if not self.enabled:
+            return
+        self.duration = time.time() - self.start_time
+        self.activity_count = activity_count
+        # kilobytes on linux, for the whole lifetime of the process
+        self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        connection.force_debug_cursor = False
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        connection.force_debug_cursor = True
+        queries_log = connection.queries_log
+        if not isinstance(queries_log, CountingQueriesLog):
+            queries_log = connection.queries_log = CountingQueriesLog(queries_log.maxlen)
+        open_stages = getattr(self.local, 'open_stages', None)
+        if open_stages is None:
+            open_stages = self.local.open_stages = []
+
+        # seconds, queries and query seconds of the stages inside this one
+        inner = [0.0, 0, 0.0]
+        open_stages.append(inner)
+        first_count = queries_log.count
+        first_seconds = queries_log.seconds
+        start = time.time()
+        try:
+            yield
+        finally:
+            open_stages.pop()
+            seconds = time.time() - start
+            queries = queries_log.count - first_count
+            query_seconds = queries_log.seconds - first_seconds
+            if open_stages:
+                outer = open_stages[-1]
+                outer[0] += seconds
+                outer[1] += queries
+                outer[2] += query_seconds
+            self.add(name, seconds - inner[0], queries - inner[1], query_seconds - inner[2])
+
+    def add(self, name, seconds, queries, query_seconds):
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = OrderedDict(
+                    (('calls', 0), ('seconds', 0.0), ('queries', 0), ('query_seconds', 0.0)))
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['queries'] += queries
+            stage['query_seconds'] += query_seconds
+
+    def timed(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def instrument(self, parser):
+        if not self.enabled or getattr(parser, 'instrumented', False):
+            return
+
+        names = [name for name in dir(type(parser))
+                 if name.startswith('add_') and name != 'add_all_activity_data']
+        for name in names + list(INSTRUMENTED_METHODS):
+            setattr(parser, name, self.timed(name, getattr(parser, name)))
+        parser.instrumented = True
+
+    def activities_per_second(self):
+        if not self.duration:
+            return 0
+        return self.activity_count / float(self.duration)
+
+    def result(self):
+        return {
+            'started': self.started,
+            'duration': self.duration,
+            'activity_count': self.activity_count,
+            'activities_per_second': self.activities_per_second(),
+            'peak_rss': self.peak_rss,
+            'stages': self.stages,
+        }
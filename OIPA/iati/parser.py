@@ -8,41 +8,134 @@ from django.conf import settings
 import time
 from datetime import datetime
 import gc
-from iati_synchroniser.exception_handler import exception_handler
+from iati_synchroniser.exception_handler import exception_handler, error_sink, handled_error_count
 from iati.data_backup.unesco_sectors import unesco_sectors
-import string
-import random
+import hashlib
+import logging
 
+from .bulk_writer import BulkWriter
+from .codelist_resolver import CodelistResolver, to_text
 from .deleter import Deleter
+from .element_record import ElementRecord
 from .filegrabber import FileGrabber
+from .organisation_cache import OrganisationCache
+from .parse_profiler import ParseProfiler
+from .pipeline import ParsePipeline
+from .management.commands.search_data_updater import SearchDataUpdater
+from .management.commands.activity_aggregate_updater import ActivityAggregateUpdater
 from .management.commands.total_budget_updater import TotalBudgetUpdater
 
+logger = logging.getLogger(__name__)
+
 
 class Parser(object):
 
     xml_source_ref = None
-
-    def parse_url(self, url, xml_source_ref):
+    # iati-activity elements handled in the last parse_url call
+    activity_count = 0
+    # the downloaded file and the version attribute of its root element,
+    # set when parse_url parsed a file
+    fetch_result = None
+    iati_standard_version = None
+    # set when parse_url started to change the activities of the source,
+    # also when the parse did not finish
+    data_changed = False
+    # read activities through an ElementRecord instead of lxml XPath
+    use_element_records = True
+
+    # incremental mode: content hash per activity id of the source as stored
+    # before this parse, the ids found in the file, and the ids of the
+    # activities written or removed
+    known_hashes = None
+    seen_activity_ids = None
+    changed_activity_ids = None
+
+    def __init__(self):
+        self.codelists = CodelistResolver()
+        self.writer = BulkWriter()
+        self.organisations = OrganisationCache()
+        self.profiler = ParseProfiler(enabled=False)
+
+    def parse_url(self, url, xml_source_ref, incremental=False, force=False, pipelined=None):
+        """
+        Parse the file at url. Normally all activities of the source are
+        deleted and parsed again; in incremental mode activities that did not
+        change since the last parse are skipped and only the activities that
+        are no longer in the file are deleted.
+
+        Nothing is done when the file did not change since the last parse,
+        unless force is set.
+
+        pipelined (default settings.PARSER_PIPELINE) reads the file in a
+        separate thread while the activities are written, see ParsePipeline.
+
+        Set self.profiler to an enabled ParseProfiler to time the stages.
+        """
+        if pipelined is None:
+            pipelined = settings.PARSER_PIPELINE
 
         try:
+            # codelists are read once per parse run
+            self.codelists = CodelistResolver()
+            self.writer = BulkWriter()
+            self.organisations = OrganisationCache()
+            self.activity_count = 0
+            self.fetch_result = None
+            self.iati_standard_version = None
+            self.data_changed = False
+            self.profiler.start()
+            self.profiler.instrument(self)
+
             #iterate through iati-activity tree
             file_grabber = FileGrabber()
-            iati_file = file_grabber.get_the_file(url)
-            if iati_file:
+            with self.profiler.stage('download'):
+                fetch_result = file_grabber.fetch(url)
+            if fetch_result and fetch_result.unchanged and not force:
+                logger.info("Skipping unchanged file " + url)
+            elif fetch_result:
+                # replaces the errors of the previous parse, a skipped file
+                # keeps them
+                error_sink.start(xml_source_ref)
+                self.data_changed = True
+
+                self.organisations.preload(xml_source_ref)
+
+                if incremental:
+                    self.known_hashes = dict(models.Activity.objects.filter(
+                        xml_source_ref=xml_source_ref).values_list('id', 'content_hash'))
+                    self.seen_activity_ids = set()
+                    self.changed_activity_ids = set()
+                else:
+                    self.known_hashes = None
+                    self.changed_activity_ids = None
 
-                # delete old activities
-                try:
-                    deleter = Deleter()
-                    deleter.delete_by_source(xml_source_ref)
-                except Exception as e:
-                    exception_handler(e, "parse url", "delete by source")
+                    # delete old activities
+                    try:
+                        with self.profiler.stage('delete'):
+                            deleter = Deleter()
+                            deleter.delete_by_source(xml_source_ref)
+                    except Exception as e:
+                        exception_handler(e, "parse url", "delete by source")
 
                 # parse the new file
                 self.xml_source_ref = xml_source_ref
-                context = etree.iterparse(iati_file, tag='iati-activity')
-                self.fast_iter(context, self.process_element)
+                if pipelined:
+                    ParsePipeline(self).run(fetch_result.path)
+                else:
+                    context = etree.iterparse(fetch_result.path, tag='iati-activity')
+                    self.fast_iter(context, self.process_element)
+                self.flush()
+
+                if incremental:
+                    self.delete_removed_activities()
 
-                del iati_file
+                # an incremental parse only rebuilds what it changed
+                self.update_total_budgets(self.changed_activity_ids)
+                self.update_search_data(self.changed_activity_ids)
+                self.update_activity_aggregates(self.changed_activity_ids)
+
+                file_grabber.mark_parsed(fetch_result)
+                self.fetch_result = fetch_result
                 gc.collect()
 
                 # Throw away query logs when in debug mode to prevent memory from overflowing
@@ -53,6 +146,9 @@ class Parser(object):
         except Exception as e:
             exception_handler(e, "parse url", "parse_url")
 
+        error_sink.stop()
+        self.profiler.stop(self.activity_count)
+
     # loop through the activities, fast_iter starts at the last activity and walks towards the first
     def fast_iter(self, context, func):
 
@@ -77,14 +173,84 @@ class Parser(object):
 
     # remove previously saved data about the activity and store new info
     def process_element(self, elem):
+        record, content_hash = self.prepare_element(elem)
+        self.process_record(record, content_hash)
+
+    def prepare_element(self, elem):
+        """
+        Returns the data the add_* methods read (an ElementRecord, or the
+        element itself when use_element_records is off) and the content hash,
+        None outside incremental mode. The version of the file is read from
+        the root element on the first call.
+        """
+        if self.iati_standard_version is None and elem.getparent() is not None:
+            self.iati_standard_version = elem.getparent().get('version', '')
+
+        content_hash = None
+        if self.known_hashes is not None:
+            content_hash = self.content_hash(elem)
+        if self.use_element_records:
+            return ElementRecord(elem), content_hash
+        return elem, content_hash
+
+    def process_record(self, elem, content_hash):
 
         if self.activity_has_identifier(elem):
 
+            self.activity_count += 1
+
+            if self.known_hashes is not None:
+                activity_id = to_text(self.get_activity_id(elem))
+                self.seen_activity_ids.add(activity_id)
+                if self.known_hashes.get(activity_id) == content_hash:
+                    return
+                self.changed_activity_ids.add(activity_id)
+
             if self.activity_exists(elem):
                 self.remove_old_values_for_activity(elem)
 
-            self.add_all_activity_data(elem)
-
+            # an activity that was not stored whole is parsed again next time
+            errors_before = handled_error_count()
+            activity = self.add_all_activity_data(elem)
+            if activity and content_hash and handled_error_count() == errors_before:
+                activity.content_hash = content_hash
+
+            if self.writer.is_full():
+                self.flush()
+
+    def copy_for_worker(self):
+        """
+        A parser for another writer thread of the same parse run.
+        """
+        worker = Parser()
+        worker.xml_source_ref = self.xml_source_ref
+        worker.use_element_records = self.use_element_records
+        worker.known_hashes = self.known_hashes
+        worker.organisations = self.organisations
+        worker.profiler = self.profiler
+        self.profiler.instrument(worker)
+        worker.seen_activity_ids = self.seen_activity_ids
+        worker.changed_activity_ids = self.changed_activity_ids
+        return worker
+
+    def content_hash(self, elem):
+        return hashlib.sha1(etree.tostring(elem)).hexdigest()
+
+    def delete_removed_activities(self):
+        removed = [activity_id for activity_id in self.known_hashes if activity_id not in self.seen_activity_ids]
+        if removed:
+            deleter = Deleter()
+            deleter.delete_activities(removed)
+            self.changed_activity_ids.update(removed)
+
+    def flush(self):
+        """
+        Write the organisations and activities collected so far. Total budgets
+        and search data are derived from the stored rows once per file, see
+        parse_url.
+        """
+        self.organisations.flush()
+        self.writer.flush()
 
     def add_all_activity_data(self, elem):
 
@@ -123,9 +289,7 @@ class Parser(object):
                 self.add_policy_markers(elem, activity)
                 self.add_activity_date(elem, activity)
 
-                # Extras
-                self.add_total_budget(activity)
-                self.add_activity_search_data(activity)
+            return activity
 
         except Exception as e:
                 exception_handler(e, iati_identifier, "add_all_activity_data")
@@ -191,6 +355,14 @@ class Parser(object):
         else:
             return False
 
+    def get_activity_id(self, elem):
+        iati_identifier = self.return_first_exist(elem.xpath('iati-identifier/text()'))
+        iati_identifier = iati_identifier.strip(' \t\n\r')
+        activity_id = iati_identifier.replace("/", "-")
+        activity_id = activity_id.replace(":", "-")
+        activity_id = activity_id.replace(" ", "")
+        return activity_id
+
     def activity_has_identifier(self, elem):
         activity_id = self.return_first_exist(elem.xpath( 'iati-identifier/text()' ))
         if activity_id:
@@ -214,19 +386,9 @@ class Parser(object):
             type_ref = self.return_first_exist(elem.xpath('reporting-org/@type'))
             name = self.return_first_exist(elem.xpath('reporting-org/text()'))
 
-            org_type = None
-            if self.isInt(type_ref) and models.OrganisationType.objects.filter(code=type_ref).exists():
-                org_type = models.OrganisationType.objects.get(code=type_ref)
+            org_type = self.codelists.get(models.OrganisationType, type_ref)
 
-            organisation = models.Organisation.objects.get_or_create(
-                code=ref,
-                defaults={
-                    'name': name,
-                    'type': org_type,
-                    'original_ref': ref
-
-                })[0]
-            return organisation
+            return self.organisations.reporting_organisation(ref, name, org_type)
 
         except Exception as e:
             exception_handler(e, ref, "add_organisation")
@@ -236,9 +398,7 @@ class Parser(object):
         try:
             iati_identifier = self.return_first_exist(elem.xpath('iati-identifier/text()'))
             iati_identifier = iati_identifier.strip(' \t\n\r')
-            activity_id = iati_identifier.replace("/", "-")
-            activity_id = activity_id.replace(":", "-")
-            activity_id = activity_id.replace(" ", "")
+            activity_id = self.get_activity_id(elem)
 
             default_currency_ref = self.return_first_exist(elem.xpath('@default-currency'))
             default_currency = None
@@ -270,46 +430,13 @@ class Parser(object):
             activity_scope = None
 
             #get foreign key objects
-            if default_currency_ref:
-                if models.Currency.objects.filter(code=default_currency_ref).exists():
-                    default_currency = models.Currency.objects.get(code=default_currency_ref)
-
-            #activity status
-            if activity_status_code and self.isInt(activity_status_code):
-                if models.ActivityStatus.objects.filter(code=activity_status_code).exists():
-                    activity_status = models.ActivityStatus.objects.get(code=activity_status_code)
-
-            if collaboration_type_ref and self.isInt(collaboration_type_ref):
-                if models.CollaborationType.objects.filter(code=collaboration_type_ref).exists():
-                    collaboration_type = models.CollaborationType.objects.get(code=collaboration_type_ref)
-
-            if default_flow_type_ref and self.isInt(default_flow_type_ref):
-                if models.FlowType.objects.filter(code=default_flow_type_ref).exists():
-                    default_flow_type = models.FlowType.objects.get(code=default_flow_type_ref)
-
-            if default_aid_type_ref:
-                if models.AidType.objects.filter(code=default_aid_type_ref).exists():
-                    default_aid_type = models.AidType.objects.get(code=default_aid_type_ref)
-
-            if default_finance_type_ref and self.isInt(default_finance_type_ref):
-                if models.FinanceType.objects.filter(code=default_finance_type_ref).exists():
-                    default_finance_type = models.FinanceType.objects.get(code=default_finance_type_ref)
-
-            if default_tied_status_ref:
-
-                if not self.isInt(default_tied_status_ref):
-                    default_tied_status_ref = default_tied_status_ref.lower()
-                    if default_tied_status_ref == "partially tied":
-                        default_tied_status_ref = "3"
-                    elif default_tied_status_ref == "tied":
-                        default_tied_status_ref = "4"
-                    elif default_tied_status_ref == "untied":
-                        default_tied_status_ref = "5"
-                    else:
-                        default_tied_status_ref = None
-
-                if models.TiedStatus.objects.filter(code=default_tied_status_ref).exists():
-                    default_tied_status = models.TiedStatus.objects.get(code=default_tied_status_ref)
+            default_currency = self.codelists.get(models.Currency, default_currency_ref)
+            activity_status = self.codelists.get(models.ActivityStatus, activity_status_code)
+            collaboration_type = self.codelists.get(models.CollaborationType, collaboration_type_ref)
+            default_flow_type = self.codelists.get(models.FlowType, default_flow_type_ref)
+            default_aid_type = self.codelists.get(models.AidType, default_aid_type_ref)
+            default_finance_type = self.codelists.get(models.FinanceType, default_finance_type_ref)
+            default_tied_status = self.codelists.tied_status(default_tied_status_ref)
 
             if not self.isInt(hierarchy):
                 hierarchy = None
@@ -324,15 +451,13 @@ class Parser(object):
                 secondary_publisher = False
 
 
-            if activity_scope_ref and self.isInt(activity_scope_ref):
-                if models.ActivityScope.objects.filter(code=activity_scope_ref).exists():
-                    activity_scope = models.ActivityScope.objects.get(code=activity_scope_ref)
+            activity_scope = self.codelists.get(models.ActivityScope, activity_scope_ref)
 
             new_activity = models.Activity(id=activity_id, default_currency=default_currency, hierarchy=hierarchy, last_updated_datetime=last_updated_datetime, linked_data_uri=linked_data_uri, reporting_organisation=reporting_organisation, secondary_publisher=secondary_publisher, activity_status=activity_status, collaboration_type=collaboration_type, default_flow_type=default_flow_type, default_aid_type=default_aid_type, default_finance_type=default_finance_type, default_tied_status=default_tied_status, xml_source_ref=self.xml_source_ref, iati_identifier=iati_identifier, iati_standard_version=iati_standard_version, capital_spend=capital_spend, scope=activity_scope)
 
             self.add_activity_date(elem, new_activity)
 
-            new_activity.save()
+            self.writer.start_activity(new_activity)
             return new_activity
 
         except Exception as e:
@@ -353,13 +478,11 @@ class Parser(object):
                         curdate = self.validate_date(curdate)
 
                     if type_ref:
-                        if models.ActivityDateType.objects.filter(code=type_ref).exists():
-                            type = models.ActivityDateType.objects.get(code=type_ref)
-                        else:
+                        type = self.codelists.get(models.ActivityDateType, type_ref)
+                        if not type:
                             type_ref = type_ref.lower()
                             type_ref = type_ref.replace(' ', '-')
-                            if models.ActivityDateType.objects.filter(code=type_ref).exists():
-                                type = models.ActivityDateType.objects.get(code=type_ref)
+                            type = self.codelists.get(models.ActivityDateType, type_ref)
 
                     if not type:
                         continue
@@ -396,7 +519,7 @@ class Parser(object):
                     if not other_identifier:
                         other_identifier = " "
                     new_other_identifier = models.OtherIdentifier(activity=activity, owner_ref=owner_ref, owner_name=owner_name, identifier=other_identifier)
-                    new_other_identifier.save()
+                    self.writer.add(new_other_identifier)
 
                 except Exception as e:
                     exception_handler(e, activity.id, "add_other_identifier")
@@ -418,13 +541,10 @@ class Parser(object):
                         if title.__len__() > 255:
                             title = title[:255]
 
-                        if language_ref:
-                            if models.Language.objects.filter(code=language_ref).exists():
-                                language = models.Language.objects.get(code=language_ref)
-
+                        language = self.codelists.get(models.Language, language_ref)
 
                         new_title = models.Title(activity=activity, title=title, language=language)
-                        new_title.save()
+                        self.writer.add(new_title)
 
                 except Exception as e:
                     exception_handler(e, activity.id, "add_activity_title")
@@ -448,18 +568,14 @@ class Parser(object):
                     rsr_type = None
 
 
-                    if language_ref:
-                        if models.Language.objects.filter(code=language_ref).exists():
-                            language = models.Language.objects.get(code=language_ref)
+                    language = self.codelists.get(models.Language, language_ref)
 
                     if type_ref:
-                        try:
-                            if models.DescriptionType.objects.filter(code=type_ref).exists():
-                                type = models.DescriptionType.objects.get(code=type_ref)
-                        except ValueError:
+                        if self.isInt(type_ref):
+                            type = self.codelists.get(models.DescriptionType, type_ref)
+                        elif not description:
                             # exception to make wrong use of type ref right
-                            if not description:
-                                description = type_ref
+                            description = type_ref
 
                     if not description:
                         continue
@@ -477,9 +593,9 @@ class Parser(object):
 
                         if rain_type == "d_context":
 
-                            type = models.DescriptionType.objects.get(name=rain_type)
+                            type = self.codelists.get_by_name(models.DescriptionType, rain_type)
                             new_description = models.Description(activity=activity, description=description, type=type, language=language, rsr_description_type_id=rsr_type_ref)
-                            new_description.save()
+                            self.writer.add(new_description)
                             continue
 
                         if rain_type == "services": # rain_services
@@ -496,13 +612,15 @@ class Parser(object):
                             for sec in splitted_sectors:
                                 if sec in lookuplist:
                                     secname = lookuplist[sec]
-                                    sector = models.Sector.objects.get(name=secname)
+                                    sector = self.codelists.get_by_name(models.Sector, secname)
+                                    if not sector:
+                                        continue
                                     new_activity_sector = models.ActivitySector(activity=activity, sector=sector,alt_sector_name="", vocabulary=None, percentage=None)
-                                    new_activity_sector.save()
+                                    self.writer.add(new_activity_sector)
 
 
                     new_description = models.Description(activity=activity, description=description, type=type, language=language, rsr_description_type_id=rsr_type_ref)
-                    new_description.save()
+                    self.writer.add(new_description)
 
 
                 except Exception as e:
@@ -552,12 +670,9 @@ class Parser(object):
                             type_ref = '1'
                         if type_ref == 'revised':
                             type_ref = '2'
-                        if models.BudgetType.objects.filter(code=type_ref).exists():
-                            type = models.BudgetType.objects.get(code=type_ref)
+                        type = self.codelists.get(models.BudgetType, type_ref)
 
-                    if currency_ref:
-                        if models.Currency.objects.filter(code=currency_ref).exists():
-                            currency = models.Currency.objects.get(code=currency_ref)
+                    currency = self.codelists.get(models.Currency, currency_ref)
 
                     if not value:
                         continue
@@ -571,16 +686,15 @@ class Parser(object):
                             value = self.return_first_exist(curvalue.xpath('text()'))
                             rain_type = self.return_first_exist(curvalue.xpath('@rain:type', namespaces={'rain': 'http://data.rainfoundation.org'}))
 
-                            if models.BudgetType.objects.filter(name=rain_type).exists():
-
-                                budget_type = models.BudgetType.objects.get(name=rain_type)
+                            budget_type = self.codelists.get_by_name(models.BudgetType, rain_type)
+                            if budget_type:
                                 new_budget = models.Budget(activity=activity, type=budget_type, period_start=period_start, period_end=period_end, value=value, value_date=value_date, currency=currency)
-                                new_budget.save()
+                                self.writer.add(new_budget)
                         continue
 
 
                     new_budget = models.Budget(activity=activity, type=type, period_start=period_start, period_end=period_end, value=value, value_date=value_date, currency=currency)
-                    new_budget.save()
+                    self.writer.add(new_budget)
 
                 except Exception as e:
                     exception_handler(e, activity.id, "add_budget")
@@ -611,12 +725,10 @@ class Parser(object):
 
                     updated = self.return_first_exist(t.xpath('@updated'))
 
-                    if currency_ref:
-                        if models.Currency.objects.filter(code=currency_ref).exists():
-                            currency = models.Currency.objects.get(code=currency_ref)
+                    currency = self.codelists.get(models.Currency, currency_ref)
 
                     new_planned_disbursement = models.PlannedDisbursement(activity=activity, period_start=period_start, period_end=period_end, value=value, value_date=value_date, currency=currency, updated=updated)
-                    new_planned_disbursement.save()
+                    self.writer.add(new_planned_disbursement)
 
 
                 except Exception as e:
@@ -635,7 +747,7 @@ class Parser(object):
                     url = self.return_first_exist(t.xpath( 'text()'))
                     if url:
                         new_website = models.ActivityWebsite(activity=activity, url=url)
-                        new_website.save()
+                        self.writer.add(new_website)
 
                 except Exception as e:
                     exception_handler(e, activity.id, "add_website")
@@ -660,12 +772,10 @@ class Parser(object):
                     type_ref = self.return_first_exist(t.xpath('@type'))
                     type = None
 
-                    if self.isInt(type_ref):
-                        if models.ContactType.objects.filter(code=type_ref).exists():
-                            type = models.ContactType.objects.get(code=type_ref)
+                    type = self.codelists.get(models.ContactType, type_ref)
 
                     new_contact = models.ContactInfo(activity=activity, person_name=person_name, organisation=organisation, telephone=telephone, email=email, mailing_address=mailing_address, contact_type=type)
-                    new_contact.save()
+                    self.writer.add(new_contact)
 
                 except Exception as e:
                     exception_handler(e, activity.id, "add_contact_info")
@@ -734,31 +844,22 @@ class Parser(object):
 
                     if aid_type_ref:
                         aid_type_ref = aid_type_ref.replace("O", "0")
-                        if models.AidType.objects.filter(code=aid_type_ref).exists():
-                            aid_type = models.AidType.objects.get(code=aid_type_ref)
+                        aid_type = self.codelists.get(models.AidType, aid_type_ref)
                     else:
                         aid_type = activity.default_aid_type
 
-                    if description_type_ref:
-                        if models.DescriptionType.objects.filter(code=description_type_ref).exists():
-                            description_type = models.DescriptionType.objects.get(code=description_type_ref)
-
-                    if disbursement_channel_ref:
-                        if models.DisbursementChannel.objects.filter(code=disbursement_channel_ref).exists():
-                            disbursement_channel = models.DisbursementChannel.objects.get(code=disbursement_channel_ref)
+                    description_type = self.codelists.get(models.DescriptionType, description_type_ref)
+                    disbursement_channel = self.codelists.get(models.DisbursementChannel, disbursement_channel_ref)
 
                     if finance_type_ref:
-                        if models.FinanceType.objects.filter(code=finance_type_ref).exists():
-                            finance_type = models.FinanceType.objects.get(code=finance_type_ref)
+                        finance_type = self.codelists.get(models.FinanceType, finance_type_ref)
                     else:
                         finance_type = activity.default_finance_type
 
                     if self.isInt(flow_type_ref):
-                        if models.FlowType.objects.filter(code=flow_type_ref).exists():
-                            flow_type = models.FlowType.objects.get(code=flow_type_ref)
+                        flow_type = self.codelists.get(models.FlowType, flow_type_ref)
                     elif flow_type_ref:
-                        if models.FlowType.objects.filter(name=flow_type_ref).exists():
-                            flow_type = models.FlowType.objects.get(name=flow_type_ref)
+                        flow_type = self.codelists.get_by_name(models.FlowType, flow_type_ref)
                     else:
                         flow_type = activity.default_flow_type
 
@@ -768,24 +869,20 @@ class Parser(object):
 
 
                     if tied_status_ref:
-                        if models.TiedStatus.objects.filter(code=tied_status_ref).exists():
-                            tied_status = models.TiedStatus.objects.get(code=tied_status_ref)
+                        tied_status = self.codelists.get(models.TiedStatus, tied_status_ref)
                     else:
                         tied_status = activity.default_tied_status
 
-                    if transaction_type_ref:
-                        if models.TransactionType.objects.filter(code=transaction_type_ref).exists():
-                            transaction_type = models.TransactionType.objects.get(code=transaction_type_ref)
+                    transaction_type = self.codelists.get(models.TransactionType, transaction_type_ref)
 
                     if currency_ref:
-                        if models.Currency.objects.filter(code=currency_ref).exists():
-                            currency = models.Currency.objects.get(code=currency_ref)
+                        currency = self.codelists.get(models.Currency, currency_ref)
                     else:
                         currency = activity.default_currency
 
 
                     new_transaction = models.Transaction(activity=activity, aid_type=aid_type, description=description, description_type=description_type, disbursement_channel=disbursement_channel, finance_type=finance_type, flow_type=flow_type, provider_organisation=provider_organisation, provider_organisation_name=provider_organisation_name, provider_activity=provider_activity, receiver_organisation=receiver_organisation, receiver_organisation_name=receiver_organisation_name, tied_status=tied_status, transaction_date=transaction_date, transaction_type=transaction_type, value_date=value_date, value=value, ref=ref, currency=currency)
-                    new_transaction.save()
+                    self.writer.add(new_transaction)
 
 
                 except Exception as e:
@@ -795,9 +892,6 @@ class Parser(object):
         except Exception as e:
             exception_handler(e, activity.id, "add_transaction")
 
-    def org_key_generator(self, size=6, chars=string.ascii_uppercase + string.digits):
-        return ''.join(random.choice(chars) for _ in range(size))
-
     def find_or_create_organisation(self, ref, org_name):
 
         try:
@@ -809,27 +903,7 @@ class Parser(object):
             elif not ref:
                 ref = 'u'
 
-            if models.Organisation.objects.filter(original_ref=ref, name=org_name).exists():
-                found_org = models.Organisation.objects.filter(original_ref=ref, name=org_name)[0]
-
-            else:
-                # create new with random suffix
-                for x in range(0, 10):
-                    random_key = self.org_key_generator()
-                    temp_ref = ref + "-" + random_key
-
-                    if models.Organisation.objects.filter(code=temp_ref).exists():
-                        continue
-                    else:
-                        found_org = models.Organisation(
-                            code=temp_ref,
-                            name=org_name,
-                            type=None,
-                            original_ref=ref)
-                        found_org.save()
-                        break
-
-            return found_org
+            return self.organisations.find_or_create(ref, org_name)
 
         except Exception as e:
             exception_handler(e, ref, "find_or_create_organisation")
@@ -854,12 +928,11 @@ class Parser(object):
                             type_ref = '2'
                         if type_ref == 'impact':
                             type_ref = '3'
-                        if self.isInt(type_ref) and models.ResultType.objects.filter(code=type_ref).exists():
-                            type = models.ResultType.objects.get(code=type_ref)
+                        type = self.codelists.get(models.ResultType, type_ref)
 
 
                     new_result = models.Result(activity=activity, result_type=type, title=title, description=description)
-                    new_result.save()
+                    self.writer.add(new_result)
 
                 except Exception as e:
                     exception_handler(e, activity.id, "add_result")
@@ -888,18 +961,13 @@ class Parser(object):
                         else:
                             sector_code = None
 
-                    if sector_code:
-                        if models.Sector.objects.filter(code=sector_code).exists():
-                            sector = models.Sector.objects.get(code=sector_code)
+                    sector = self.codelists.get(models.Sector, sector_code)
 
                     if not sector:
                         sector_name = self.return_first_exist(t.xpath('text()'))
-                        if models.Sector.objects.filter(name=sector_name).exists():
-                            sector = models.Sector.objects.filter(name=sector_name)[0]
+                        sector = self.codelists.get_by_name(models.Sector, sector_name)
 
-                    if vocabulary_code:
-                        if models.Vocabulary.objects.filter(code=vocabulary_code).exists():
-                            vocabulary = models.Vocabulary.objects.get(code=vocabulary_code)
+                    vocabulary = self.codelists.get(models.Vocabulary, vocabulary_code)
 
                     if not sector:
                         alt_sector_name = sector_code or ""
@@ -907,7 +975,7 @@ class Parser(object):
                         alt_sector_name = ""
 
                     new_activity_sector = models.ActivitySector(activity=activity, sector=sector,alt_sector_name=alt_sector_name, vocabulary=vocabulary, percentage=percentage)
-                    new_activity_sector.save()
+                    self.writer.add(new_activity_sector)
 
 
                 except Exception as e:
@@ -929,21 +997,13 @@ class Parser(object):
                         percentage = percentage.replace("%", "")
 
                     if country_ref:
-                        if models.Country.objects.filter(code=country_ref).exists():
-                            country = models.Country.objects.get(code=country_ref)
-                        elif country_ref == "KOS" or country_ref == "KS":
-                            # Kosovo fix
-                            country = models.Country.objects.get(code="XK")
-                        else:
-                            country_ref = country_ref.lower().capitalize()
-                            if models.Country.objects.filter(name=country_ref).exists():
-                                country = models.Country.objects.filter(name=country_ref)[0]
+                        country = self.codelists.country(country_ref)
                     else:
                         continue
 
                     if country:
                         new_activity_country = models.ActivityRecipientCountry(activity=activity, country=country, percentage = percentage)
-                        new_activity_country.save()
+                        self.writer.add(new_activity_country)
                     # else:
                     #     exception_handler(None, activity.id, "add_countries, country not found: " + country_ref)
 
@@ -967,18 +1027,13 @@ class Parser(object):
                     percentage = percentage.replace("%", "")
 
                 if self.isInt(region_voc_ref):
-                    if models.RegionVocabulary.objects.filter(code=region_voc_ref).exists():
-                        region_voc = models.RegionVocabulary.objects.get(code=region_voc_ref)
+                    region_voc = self.codelists.get(models.RegionVocabulary, region_voc_ref)
                 else:
-                    region_voc = models.RegionVocabulary.objects.get(code=1)
+                    region_voc = self.codelists.get(models.RegionVocabulary, 1)
 
                 if self.isInt(region_ref):
-                    if models.Region.objects.filter(code=region_ref).exists():
-                        region = models.Region.objects.get(code=region_ref)
-                    elif models.Region.objects.filter(name=region_ref).exists():
-                            region = models.Region.objects.filter(name=region_ref)[0]
-                    else:
-                        region = None
+                    region = self.codelists.get(models.Region, region_ref) or \
+                        self.codelists.get_by_name(models.Region, region_ref)
                 else:
                     continue
 
@@ -988,7 +1043,7 @@ class Parser(object):
                         # exception_handler(None, "add_regions", "Unknown region: " + region_ref)
                     else:
                         new_activity_region = models.ActivityRecipientRegion(activity=activity, region=region, percentage = percentage, region_vocabulary=region_voc)
-                        new_activity_region.save()
+                        self.writer.add(new_activity_region)
 
 
                 except Exception as e:
@@ -1012,12 +1067,10 @@ class Parser(object):
                     role_ref = self.return_first_exist(t.xpath('@role'))
                     role = None
 
-                    if role_ref:
-                        if models.OrganisationRole.objects.filter(code=role_ref).exists():
-                            role = models.OrganisationRole.objects.get(code=role_ref)
+                    role = self.codelists.get(models.OrganisationRole, role_ref)
 
                     new_activity_participating_organisation = models.ActivityParticipatingOrganisation(activity=activity, organisation=participating_organisation, role=role, name=name)
-                    new_activity_participating_organisation.save()
+                    self.writer.add(new_activity_participating_organisation)
 
 
                 except Exception as e:
@@ -1049,25 +1102,17 @@ class Parser(object):
 
 
                     if self.isInt(policy_marker_code):
-                        if models.PolicyMarker.objects.filter(code=policy_marker_code).exists():
-                            policy_marker = models.PolicyMarker.objects.get(code=policy_marker_code)
+                        policy_marker = self.codelists.get(models.PolicyMarker, policy_marker_code)
                     else:
                         policy_marker_name = self.return_first_exist(t.xpath( 'text()' ))
-                        if policy_marker_name:
-                            if models.PolicyMarker.objects.filter(name=policy_marker_name).exists():
-                                policy_marker = models.PolicyMarker.objects.get(code=policy_marker_name)
+                        policy_marker = self.codelists.get_by_name(models.PolicyMarker, policy_marker_name)
 
-                    if policy_marker_voc:
-                        if models.Vocabulary.objects.filter(code=policy_marker_voc).exists():
-                            vocabulary = models.Vocabulary.objects.get(code=policy_marker_voc)
-
-                    if self.isInt(policy_marker_significance):
-                        if models.PolicySignificance.objects.filter(code=policy_marker_significance).exists():
-                            significance = models.PolicySignificance.objects.get(code=policy_marker_significance)
+                    vocabulary = self.codelists.get(models.Vocabulary, policy_marker_voc)
+                    significance = self.codelists.get(models.PolicySignificance, policy_marker_significance)
 
 
                     new_activity_policy_marker = models.ActivityPolicyMarker(activity=activity, policy_marker=policy_marker, vocabulary=vocabulary, policy_significance=significance)
-                    new_activity_policy_marker.save()
+                    self.writer.add(new_activity_policy_marker)
 
 
                 except Exception as e:
@@ -1090,15 +1135,11 @@ class Parser(object):
                     text = self.return_first_exist(t.xpath('text()')) or ""
 
                     if type_ref:
-                        if self.isInt(type_ref) and models.RelatedActivityType.objects.filter(code=type_ref).exists():
-                            type = models.RelatedActivityType.objects.get(code=type_ref)
-                        else:
-                            type_ref = type_ref.lower().capitalize()
-                            if models.RelatedActivityType.objects.filter(name=type_ref).exists():
-                                type = models.RelatedActivityType.objects.filter(name=type_ref)[0]
+                        type = self.codelists.get(models.RelatedActivityType, type_ref) or \
+                            self.codelists.get_by_name(models.RelatedActivityType, type_ref)
 
                     new_related_activity = models.RelatedActivity(current_activity=activity, type=type, ref=ref, text=text)
-                    new_related_activity.save()
+                    self.writer.add(new_related_activity)
 
                 except Exception as e:
                     exception_handler(e, activity.id, "add_related_activities")
@@ -1152,54 +1193,20 @@ class Parser(object):
                     point_srs_name = self.return_first_exist(t.xpath('point/@srsName')) or ""
                     point_pos = self.return_first_exist(t.xpath('point/pos/text()')) or ""
 
-                    if type_ref:
-                        if models.LocationType.objects.filter(code=type_ref).exists():
-                            type = models.LocationType.objects.get(code=type_ref)
-
-                    if description_type_ref:
-                        if models.DescriptionType.objects.filter(code=description_type_ref).exists():
-                            description_type = models.DescriptionType.objects.get(code=description_type_ref)
-
-                    if adm_country_iso_ref:
-                        if models.Country.objects.filter(code=adm_country_iso_ref).exists():
-                            adm_country_iso = models.Country.objects.get(code=adm_country_iso_ref)
-
-                    if precision_ref:
-                        if models.GeographicalPrecision.objects.filter(code=precision_ref).exists():
-                            precision = models.GeographicalPrecision.objects.get(code=precision_ref)
-
-                    if gazetteer_ref_ref:
-                        if models.GazetteerAgency.objects.filter(code=gazetteer_ref_ref).exists():
-                            gazetteer_ref = models.GazetteerAgency.objects.get(code=gazetteer_ref_ref)
-
-                    if location_reach_ref:
-                        if models.GeographicLocationReach.objects.filter(code=location_reach_ref).exists():
-                            location_reach = models.GeographicLocationReach.objects.get(code=location_reach_ref)
-
-                    if location_id_vocabulary_ref:
-                        if models.GeographicVocabulary.objects.filter(code=location_id_vocabulary_ref).exists():
-                            location_id_vocabulary = models.GeographicVocabulary.objects.get(code=location_id_vocabulary_ref)
-
-
-
-                    if adm_vocabulary_ref:
-                        if models.GeographicVocabulary.objects.filter(code=adm_vocabulary_ref).exists():
-                            adm_vocabulary = models.GeographicVocabulary.objects.get(code=adm_vocabulary_ref)
-
-                    if exactness_ref:
-                        if models.GeographicExactness.objects.filter(code=exactness_ref).exists():
-                            exactness = models.GeographicExactness.objects.get(code=exactness_ref)
-
-                    if location_class_ref:
-                        if models.GeographicLocationClass.objects.filter(code=location_class_ref).exists():
-                            location_class = models.GeographicLocationClass.objects.get(code=location_class_ref)
-
-                    if feature_designation_ref:
-                        if models.LocationType.objects.filter(code=feature_designation_ref).exists():
-                            feature_designation = models.LocationType.objects.get(code=feature_designation_ref)
+                    type = self.codelists.get(models.LocationType, type_ref)
+                    description_type = self.codelists.get(models.DescriptionType, description_type_ref)
+                    adm_country_iso = self.codelists.get(models.Country, adm_country_iso_ref)
+                    precision = self.codelists.get(models.GeographicalPrecision, precision_ref)
+                    gazetteer_ref = self.codelists.get(models.GazetteerAgency, gazetteer_ref_ref)
+                    location_reach = self.codelists.get(models.GeographicLocationReach, location_reach_ref)
+                    location_id_vocabulary = self.codelists.get(models.GeographicVocabulary, location_id_vocabulary_ref)
+                    adm_vocabulary = self.codelists.get(models.GeographicVocabulary, adm_vocabulary_ref)
+                    exactness = self.codelists.get(models.GeographicExactness, exactness_ref)
+                    location_class = self.codelists.get(models.GeographicLocationClass, location_class_ref)
+                    feature_designation = self.codelists.get(models.LocationType, feature_designation_ref)
 
                     new_location = models.Location(activity=activity, ref=ref, name=name, type=type, type_description=type_description, description=description, description_type=description_type, adm_country_iso=adm_country_iso, adm_country_adm1=adm_country_adm1, adm_country_adm2=adm_country_adm2, adm_country_name=adm_country_name, percentage=percentage, latitude=latitude, longitude=longitude, precision=precision, gazetteer_entry=gazetteer_entry, gazetteer_ref=gazetteer_ref, location_reach=location_reach, location_id_vocabulary=location_id_vocabulary, location_id_code=location_id_code, adm_code=adm_code, adm_vocabulary=adm_vocabulary, adm_level=adm_level, activity_description=activity_description, exactness=exactness, location_class=location_class, feature_designation=feature_designation, point_srs_name=point_srs_name, point_pos=point_pos)
-                    new_location.save()
+                    self.writer.add(new_location)
 
 
 
@@ -1218,12 +1225,10 @@ class Parser(object):
                     condition_type = None
                     condition = self.return_first_exist(t.xpath('text()')) or ""
 
-                    if condition_type_ref:
-                        if models.ConditionType.objects.filter(code=condition_type_ref).exists():
-                            condition_type = models.ConditionType.objects.get(code=condition_type_ref)
+                    condition_type = self.codelists.get(models.ConditionType, condition_type_ref)
 
                     new_condition = models.Condition(activity=activity, text=condition, type=condition_type)
-                    new_condition.save()
+                    self.writer.add(new_condition)
 
 
 
@@ -1251,13 +1256,8 @@ class Parser(object):
 
 
 
-                    if file_format_ref:
-                        if models.FileFormat.objects.filter(code=file_format_ref).exists():
-                            file_format = models.FileFormat.objects.get(code=file_format_ref)
-
-                    if doc_category_ref:
-                        if models.DocumentCategory.objects.filter(code=doc_category_ref).exists():
-                            doc_category = models.DocumentCategory.objects.get(code=doc_category_ref)
+                    file_format = self.codelists.get(models.FileFormat, file_format_ref)
+                    doc_category = self.codelists.get(models.DocumentCategory, doc_category_ref)
 
                     # if language_ref:
                     #     if models.language.objects.filter(code=language_ref).exists():
@@ -1266,7 +1266,7 @@ class Parser(object):
 
 
                     document_link = models.DocumentLink(activity=activity, url=url, file_format=file_format, document_category=doc_category, title=title)
-                    document_link.save()
+                    self.writer.add(document_link)
 
 
 
@@ -1285,9 +1285,7 @@ class Parser(object):
                 try:
                     budget_identifier_vocabulary_ref = self.return_first_exist(t.xpath('@vocabulary'))
                     budget_identifier_vocabulary = None
-                    if budget_identifier_vocabulary_ref and self.isInt(budget_identifier_vocabulary_ref):
-                        if models.BudgetIdentifierVocabulary.objects.filter(code=budget_identifier_vocabulary_ref).exists():
-                            budget_identifier_vocabulary = models.BudgetIdentifierVocabulary.objects.get(code=budget_identifier_vocabulary_ref)
+                    budget_identifier_vocabulary = self.codelists.get(models.BudgetIdentifierVocabulary, budget_identifier_vocabulary_ref)
 
                     for bi in elem.xpath('budget-item'):
 
@@ -1296,12 +1294,10 @@ class Parser(object):
                         percentage = self.return_first_exist(bi.xpath('@percentage'))
                         description = self.return_first_exist(bi.xpath('description/text()'))
 
-                        if code_ref:
-                            if models.BudgetIdentifier.objects.filter(code=code_ref).exists():
-                                code = models.BudgetIdentifier.objects.get(code=code_ref)
+                        code = self.codelists.get(models.BudgetIdentifier, code_ref)
 
                         country_budget_item = models.CountryBudgetItem(activity=activity, vocabulary=budget_identifier_vocabulary, code=code, percentage=percentage, description=description)
-                        country_budget_item.save()
+                        self.writer.add(country_budget_item)
 
 
                 except Exception as e:
@@ -1321,12 +1317,10 @@ class Parser(object):
                     aid_type_flag_significance = self.return_first_exist(t.xpath('aidtype-flag/@significance'))
                     aid_type_flag = None
 
-                    if aid_type_flag_ref:
-                            if models.AidTypeFlag.objects.filter(code=aid_type_flag_ref).exists():
-                                aid_type_flag = models.AidTypeFlag.objects.get(code=aid_type_flag_ref)
+                    aid_type_flag = self.codelists.get(models.AidTypeFlag, aid_type_flag_ref)
 
-                    new_crs_add = models.CrsAdd(aid_type_flag=aid_type_flag, aid_type_flag_significance=aid_type_flag_significance)
-                    new_crs_add.save()
+                    new_crs_add = models.CrsAdd(activity=activity, aid_type_flag=aid_type_flag, aid_type_flag_significance=aid_type_flag_significance)
+                    self.writer.add(new_crs_add)
 
                     for lt in elem.xpath('loan-terms'):
 
@@ -1341,16 +1335,11 @@ class Parser(object):
                         repayment_first_date = self.return_first_exist(lt.xpath('repayment-first-date/@iso-date'))
                         repayment_final_date = self.return_first_exist(lt.xpath('repayment-final-date/@iso-date'))
 
-                        if repayment_type_ref:
-                            if models.LoanRepaymentType.objects.filter(code=repayment_type_ref).exists():
-                                repayment_type = models.LoanRepaymentType.objects.get(code=repayment_type_ref)
-
-                        if repayment_plan_ref:
-                            if models.LoanRepaymentPeriod.objects.filter(code=repayment_plan_ref).exists():
-                                repayment_plan = models.LoanRepaymentPeriod.objects.get(code=repayment_plan_ref)
+                        repayment_type = self.codelists.get(models.LoanRepaymentType, repayment_type_ref)
+                        repayment_plan = self.codelists.get(models.LoanRepaymentPeriod, repayment_plan_ref)
 
                         new_loan_term = models.CrsAddLoanTerms(crs_add=new_crs_add, rate_1=rate_1, rate_2=rate_2, repayment_type=repayment_type, repayment_plan=repayment_plan, repayment_plan_text=repayment_plan_text, commitment_date=commitment_date, repayment_first_date=repayment_first_date, repayment_final_date=repayment_final_date)
-                        new_loan_term.save()
+                        self.writer.add(new_loan_term)
 
                     for ls in elem.xpath('loan-status'):
 
@@ -1363,12 +1352,10 @@ class Parser(object):
                         principal_arrears = self.return_first_exist(ls.xpath(''))
                         interest_arrears = self.return_first_exist(ls.xpath(''))
 
-                        if currency_ref:
-                            if models.Currency.objects.filter(code=currency_ref).exists():
-                                currency = models.Currency.objects.get(code=currency_ref)
+                        currency = self.codelists.get(models.Currency, currency_ref)
 
                         new_loan_status = models.CrsAddLoanStatus(crs_add=new_crs_add, year=year, value_date=value_date, currency=currency, interest_received=interest_received, principal_outstanding=principal_outstanding, principal_arrears=principal_arrears, interest_arrears=interest_arrears)
-                        new_loan_status.save()
+                        self.writer.add(new_loan_status)
 
 
 
@@ -1389,7 +1376,7 @@ class Parser(object):
                     phaseout_year = self.return_first_exist(t.xpath('@phaseout-year'))
 
                     new_ffs = models.Ffs(activity=activity, extraction_date=extraction_date, priority=priority, phaseout_year=phaseout_year)
-                    new_ffs.save()
+                    self.writer.add(new_ffs)
 
                     for fc in elem.xpath('forecast'):
                         year = self.return_first_exist(fc.xpath('@year'))
@@ -1398,12 +1385,10 @@ class Parser(object):
                         value_date = self.return_first_exist(fc.xpath('@value-date'))
                         value = self.return_first_exist(fc.xpath('text()'))
 
-                        if currency_ref:
-                            if models.Currency.objects.filter(code=currency_ref).exists():
-                                currency = models.Currency.objects.get(code=currency_ref)
+                        currency = self.codelists.get(models.Currency, currency_ref)
 
                         new_forecast = models.FfsForecast(ffs=new_ffs, year=year, currency=currency, value_date=value_date, value=value)
-                        new_forecast.save()
+                        self.writer.add(new_forecast)
 
 
                 except Exception as e:
@@ -1412,40 +1397,35 @@ class Parser(object):
             exception_handler(e, activity.id, "add_fss")
 
 
-    def add_total_budget(self, activity):
+    def update_total_budgets(self, activity_ids=None):
 
         try:
             updater = TotalBudgetUpdater()
-            updater.update_single_activity(activity.id)
+            if activity_ids is None:
+                updater.update_source(self.xml_source_ref)
+            else:
+                updater.update_activities(activity_ids)
         except Exception as e:
-            exception_handler(e, activity.id, "add_total_budget")
-
-    def add_activity_search_data(self, activity):
-        search_data = models.ActivitySearchData(activity = activity)
-
-        search_data.search_identifier = activity.iati_identifier
-        for title in activity.title_set.all():
-            search_data.search_title += title.title + ' '
-
-        for description in activity.description_set.all():
-            search_data.search_description += description.description + ' '
-
-        for country in activity.recipient_country.all():
-            search_data.search_country_name +=  country.name + ' '
+            exception_handler(e, self.xml_source_ref, "update_total_budgets")
 
-        for region in activity.recipient_region.all():
-            search_data.search_region_name += region.name + ' '
+    def update_search_data(self, activity_ids=None):
 
-        for sector in activity.sector.all():
-            search_data.search_sector_name += sector.name + ' '
-
-        for organisation in activity.participating_organisations.all():
-            search_data.search_participating_organisation_name += organisation.name + ' '
-
-        if not activity.reporting_organisation is None:
-            search_data.search_reporting_organisation_name += activity.reporting_organisation.name
+        try:
+            updater = SearchDataUpdater()
+            if activity_ids is None:
+                updater.update_source(self.xml_source_ref)
+            else:
+                updater.update_activities(activity_ids)
+        except Exception as e:
+            exception_handler(e, self.xml_source_ref, "update_search_data")
 
-        for document in activity.documentlink_set.all():
-            search_data.search_documentlink_title += document.title + ' '
+    def update_activity_aggregates(self, activity_ids=None):
 
-        search_data.save()
+        try:
+            updater = ActivityAggregateUpdater()
+            if activity_ids is None:
+                updater.update_source(self.xml_source_ref)
+            else:
+                updater.update_activities(activity_ids)
+        except Exception as e:
+            exception_handler(e, self.xml_source_ref, "update_activity_aggregates")
@@ -0,0 +1,105 @@
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range
+from builtins import object
+import copy
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connection
+from lxml import etree
+
+from iati_synchroniser.exception_handler import exception_handler
+
+# put on the queue once per writer when the file has been read
+END_OF_FILE = None
+
+
+class ParsePipeline(object):
+    """
+    Reads and writes a file at the same time.
+
+    A producer thread runs iterparse and turns every activity into plain data
+    (Parser.prepare_element) on a bounded queue, so it waits when the writers
+    fall behind. The producer clears the elements it has read, so a parser
+    without element records gets a copy of the element. The writers take the records from the queue and store them
+    (Parser.process_record). The calling thread is the first writer; extra
+    writers run in their own threads with their own parser and database
+    connection.
+
+    As in Parser.fast_iter, an error in one activity is passed to
+    exception_handler and the next activity is processed.
+    """
+
+    def __init__(self, parser, queue_size=None, writers=None):
+        self.parser = parser
+        self.queue = queue.Queue(queue_size or settings.PARSER_PIPELINE_QUEUE_SIZE)
+        self.writer_count = writers or settings.PARSER_PIPELINE_WRITERS
+
+    def run(self, path):
+        producer = threading.Thread(target=self.produce, args=(path,))
+        producer.daemon = True
+        producer.start()
+
+        writer_threads = []
+        worker_parsers = []
+        for i in range(self.writer_count - 1):
+            worker_parser = self.parser.copy_for_worker()
+            thread = threading.Thread(target=self.write_in_thread, args=(worker_parser,))
+            thread.daemon = True
+            thread.start()
+            writer_threads.append(thread)
+            worker_parsers.append(worker_parser)
+
+        self.write(self.parser)
+
+        for thread in writer_threads:
+            thread.join()
+        producer.join()
+
+        for worker_parser in worker_parsers:
+            self.parser.activity_count += worker_parser.activity_count
+
+    def produce(self, path):
+        try:
+            for event, elem in etree.iterparse(path, tag='iati-activity'):
+                try:
+                    record, content_hash = self.parser.prepare_element(elem)
+                    if record is elem:
+                        record = copy.deepcopy(elem)
+                    self.queue.put((record, content_hash))
+                except Exception as e:
+                    exception_handler(e, "pipeline", "prepare_element")
+                elem.clear()
+
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        except Exception as e:
+            exception_handler(e, "pipeline", "produce")
+        finally:
+            for i in range(self.writer_count):
+                self.queue.put(END_OF_FILE)
+
+    def write(self, parser):
+        while True:
+            item = self.queue.get()
+            if item is END_OF_FILE:
+                break
+
+            try:
+                parser.process_record(*item)
+            except Exception as e:
+                exception_handler(e, "pipeline", "process_record")
+
+        try:
+            parser.flush()
+        except Exception as e:
+            exception_handler(e, "pipeline", "flush")
+
+    def write_in_thread(self, parser):
+        try:
+            self.write(parser)
+        finally:
+            # every thread has its own connection
+            connection.close()
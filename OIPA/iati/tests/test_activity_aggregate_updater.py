@@ -0,0 +1,65 @@
+from django.test import RequestFactory, TestCase
+from api.v3.resources.aggregate_cube import AggregateCube
+from iati import models
+from iati.factory import iati_factory
+from iati.management.commands.activity_aggregate_updater import ActivityAggregateUpdater
+
+
+class ActivityAggregateTestCase(TestCase):
+    """
+    Test building the activity aggregate fact table and answering
+    activity-aggregate-any calls from it
+    """
+    def setUp(self):
+        organisation = models.Organisation.objects.create(code='NL-1', name='Reporting org')
+        for code in ('AD', 'NL'):
+            iati_factory.CountryFactory(code=code, name=code)
+        for code in (200, 300):
+            models.Sector.objects.create(code=code, name=str(code), description='')
+        for code in ('C', 'D'):
+            models.TransactionType.objects.create(code=code, name=code, description='')
+
+        first = models.Activity.objects.create(
+            id='NL-1-0001', iati_identifier='NL-1-0001', xml_source_ref='source-1',
+            reporting_organisation=organisation, total_budget=100)
+        second = models.Activity.objects.create(
+            id='NL-1-0002', iati_identifier='NL-1-0002', xml_source_ref='source-1',
+            reporting_organisation=organisation, total_budget=50)
+
+        models.ActivityRecipientCountry.objects.create(activity=first, country_id='AD')
+        models.ActivityRecipientCountry.objects.create(activity=first, country_id='NL')
+        models.ActivityRecipientCountry.objects.create(activity=second, country_id='AD')
+        models.ActivitySector.objects.create(activity=first, sector_id=200)
+        models.ActivitySector.objects.create(activity=second, sector_id=200)
+        models.ActivitySector.objects.create(activity=second, sector_id=300)
+        models.Transaction.objects.create(activity=first, transaction_type_id='D', value=100)
+        models.Transaction.objects.create(activity=first, transaction_type_id='D', value=50)
+        models.Transaction.objects.create(activity=first, transaction_type_id='C', value=1000)
+
+        ActivityAggregateUpdater().update_source('source-1')
+
+    def aggregate(self, query):
+        request = RequestFactory().get('/api/v3/activity-aggregate-any/?format=json&' + query)
+        return dict(
+            (row['group_field'], row['aggregation_field']) for row in AggregateCube().aggregate(request))
+
+    def test_fact_rows(self):
+        facts = models.ActivityAggregate.objects.filter(activity_id='NL-1-0001')
+        self.assertEqual(4, facts.count())
+        self.assertEqual(150, facts.get(country_id='AD', transaction_type_id='D').value)
+        self.assertEqual(2, models.ActivityAggregate.objects.filter(activity_id='NL-1-0002').count())
+
+    def test_aggregate(self):
+        self.assertEqual({'AD': 2, 'NL': 1},
+                         self.aggregate('group_by=recipient-country&aggregation_key=iati-identifier'))
+        self.assertEqual({200: 2, 300: 1}, self.aggregate('group_by=sector&aggregation_key=iati-identifier'))
+        self.assertEqual({'AD': 150, 'NL': 150},
+                         self.aggregate('group_by=recipient-country&aggregation_key=disbursement'))
+        self.assertEqual({'NL-1': 150}, self.aggregate('group_by=reporting-org&aggregation_key=total-budget'))
+        self.assertEqual({200: 1}, self.aggregate(
+            'group_by=sector&aggregation_key=iati-identifier&countries__in=NL'))
+
+    def test_unsupported_call(self):
+        request = RequestFactory().get(
+            '/api/v3/activity-aggregate-any/?group_by=policy-marker&aggregation_key=iati-identifier')
+        self.assertIsNone(AggregateCube().aggregate(request))
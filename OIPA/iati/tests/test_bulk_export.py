@@ -0,0 +1,142 @@
+from builtins import object
+import datetime
+import decimal
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+
+import pytest
+import ujson
+from django.test import TestCase
+
+from iati import models
+from iati.management.commands.bulk_export import BulkExporter, EXPORT_COLUMNS, file_name
+
+ROWS = [
+    ('NL-1-1', 'NL-1-1', 'NL-1', u'W\xe4ter', '2', datetime.date(2012, 1, 1), None, None, None,
+     decimal.Decimal('10.50'), 'EUR', 'KE,UG', None, '14030', '2014-01-01'),
+    ('NL-1-2', 'NL-1-2', 'NL-1', 'Schools', '2', None, None, None, None,
+     None, None, None, '298', None, ''),
+]
+
+
+CSV = file_name('NL-1') + '.csv.gz'
+NDJSON = file_name('NL-1') + '.ndjson.gz'
+
+
+class TestBulkExport(object):
+
+    @pytest.fixture
+    def export_root(self, request):
+        export_root = tempfile.mkdtemp()
+        request.addfinalizer(lambda: shutil.rmtree(export_root))
+        return export_root
+
+    def exporter(self, export_root):
+        exporter = BulkExporter(export_root=export_root, export_url='/media/exports/')
+        exporter.dump_classes = lambda: [dump_class for dump_class in BulkExporter.dump_classes(exporter)
+                                         if dump_class.format != 'parquet']
+        return exporter
+
+    def read_gzip(self, path):
+        with gzip.open(path, 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def test_file_name(self):
+        assert file_name('NL-KVK-41160054').startswith('activities-NL-KVK-41160054-')
+        assert file_name('../x/y').startswith('activities-.._x_y-')
+        assert file_name('A/B') != file_name('A_B')
+        assert file_name('A/B') == file_name('A/B')
+
+    def test_dumps(self, export_root):
+        entries = self.exporter(export_root).write_dumps('NL-1', iter([ROWS[:1], ROWS[1:]]))
+        assert [entry['file'] for entry in entries] == [CSV, NDJSON]
+        assert sorted(os.listdir(export_root)) == [CSV, NDJSON]
+
+        csv_lines = self.read_gzip(os.path.join(export_root, CSV)).splitlines()
+        assert len(csv_lines) == 3
+        assert csv_lines[0].startswith("'id';'iati_identifier'")
+        assert "'2012-01-01'" in csv_lines[1] and ";10.5;" in csv_lines[1]
+
+        lines = self.read_gzip(os.path.join(export_root, NDJSON)).splitlines()
+        activity = ujson.loads(lines[0])
+        assert len(lines) == 2
+        assert activity['title'] == u'W\xe4ter'
+        assert activity['start_planned'] == '2012-01-01'
+        assert activity['total_budget'] == 10.5
+        assert set(activity) == set(name for name, sql, column_type in EXPORT_COLUMNS)
+
+        for entry in entries:
+            with open(os.path.join(export_root, entry['file']), 'rb') as f:
+                assert entry['sha256'] == hashlib.sha256(f.read()).hexdigest()
+            assert entry['rows'] == 2
+            assert entry['url'] == '/media/exports/' + entry['file']
+
+    def test_failed_export_keeps_previous_dumps(self, export_root):
+        exporter = self.exporter(export_root)
+        exporter.write_dumps('NL-1', iter([ROWS]))
+
+        def broken_chunks():
+            yield ROWS[:1]
+            raise ValueError("connection lost")
+
+        with pytest.raises(ValueError):
+            exporter.write_dumps('NL-1', broken_chunks())
+        assert sorted(os.listdir(export_root)) == [CSV, NDJSON]
+        assert len(self.read_gzip(os.path.join(export_root, CSV)).splitlines()) == 3
+
+    def test_export_updates_index(self, export_root):
+        exporter = self.exporter(export_root)
+        exporter.row_chunks = lambda reporting_organisation: iter([
+            [row for row in ROWS if row[2] == reporting_organisation]])
+        exporter.reporting_organisations = lambda: ['NL-1', 'NL-2']
+        exporter.export()
+
+        exporter.reporting_organisations = lambda: ['NL-1']
+        exporter.export(['NL-1'])
+        assert set(entry['reporting_organisation'] for entry in exporter.read_index()) == set(['NL-1', 'NL-2'])
+
+        exporter.export()
+        assert set(entry['reporting_organisation'] for entry in exporter.read_index()) == set(['NL-1'])
+        assert not os.path.exists(os.path.join(export_root, file_name('NL-2') + '.csv.gz'))
+
+        with open(os.path.join(export_root, 'SHA256SUMS')) as f:
+            sums = f.read().splitlines()
+        assert [line.split('  ')[1] for line in sums] == [CSV, NDJSON]
+
+
+class BulkExportQueryTestCase(TestCase):
+    """
+    Run the export query against the test database, without the
+    GROUP_CONCAT columns that only MySQL has
+    """
+    def setUp(self):
+        organisation = models.Organisation.objects.create(code='NL-1', name='Reporting org')
+        other = models.Organisation.objects.create(code='NL-2', name='Other org')
+        first = models.Activity.objects.create(
+            id='NL-1-0002', iati_identifier='NL-1-0002', reporting_organisation=organisation, total_budget=100)
+        models.Activity.objects.create(
+            id='NL-1-0001', iati_identifier='NL-1-0001', reporting_organisation=organisation)
+        models.Activity.objects.create(
+            id='NL-2-0001', iati_identifier='NL-2-0001', reporting_organisation=other)
+        models.Title.objects.create(activity=first, title='Water')
+
+        self.exporter = BulkExporter(export_root='/nonexistent', export_url='')
+        self.exporter.columns = [column for column in EXPORT_COLUMNS if 'GROUP_CONCAT' not in column[1]]
+        self.exporter.chunk_size = 1
+
+    def test_row_chunks(self):
+        chunks = list(self.exporter.row_chunks('NL-1'))
+        names = [name for name, sql, column_type in self.exporter.columns]
+        rows = [dict(zip(names, row)) for chunk in chunks for row in chunk]
+
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual([row['id'] for row in rows], ['NL-1-0001', 'NL-1-0002'])
+        self.assertEqual([row['reporting_organisation'] for row in rows], ['NL-1', 'NL-1'])
+        self.assertEqual([row['title'] for row in rows], [None, 'Water'])
+        self.assertEqual(float(rows[1]['total_budget']), 100)
+
+    def test_reporting_organisations(self):
+        self.assertEqual(self.exporter.reporting_organisations(), ['NL-1', 'NL-2'])
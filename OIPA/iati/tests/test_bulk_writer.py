@@ -0,0 +1,76 @@
+from django.test import TestCase
+from iati import models
+from iati.bulk_writer import BulkWriter
+
+
+class BulkWriterTestCase(TestCase):
+    """
+    Test BulkWriter inserts
+    """
+    def setUp(self):
+        self.writer = BulkWriter(batch_size=2, activities_per_transaction=2)
+        models.AidTypeFlag.objects.create(code=1, name='Free standing technical cooperation')
+
+    def add_activity(self, activity_id):
+        activity = models.Activity(id=activity_id, iati_identifier=activity_id)
+        self.writer.start_activity(activity)
+        for i in range(3):
+            self.writer.add(models.Title(activity=activity, title='title %d' % i))
+        return activity
+
+    def test_flush(self):
+        """
+        Test if nothing is written before flush and everything after
+        """
+        self.add_activity('IATI-0001')
+        self.add_activity('IATI-0002')
+        self.assertTrue(self.writer.is_full())
+        self.assertEqual(0, models.Activity.objects.count())
+
+        activities = self.writer.flush()
+        self.assertEqual(['IATI-0001', 'IATI-0002'], [a.id for a in activities])
+        self.assertEqual(6, models.Title.objects.count())
+        self.assertFalse(self.writer.is_full())
+
+    def test_parent_child_rows(self):
+        """
+        Test if rows referencing a parent created in the same flush get its id
+        """
+        activity = self.add_activity('IATI-0001')
+        result = models.Result(activity=activity, title='result')
+        indicator = models.ResultIndicator(result=result, baseline_year=2012, baseline_value='1')
+        period = models.ResultIndicatorPeriod(result_indicator=indicator, target='10')
+        crs_add = models.CrsAdd(activity=activity, aid_type_flag_id=1)
+        loan_terms = models.CrsAddLoanTerms(crs_add=crs_add, rate_1=4)
+
+        for instance in (period, loan_terms, indicator, crs_add, result):
+            self.writer.add(instance)
+        self.writer.flush()
+
+        period = models.ResultIndicatorPeriod.objects.get()
+        self.assertEqual('IATI-0001', period.result_indicator.result.activity_id)
+        self.assertEqual('IATI-0001', models.CrsAddLoanTerms.objects.get().crs_add.activity_id)
+
+    def test_duplicate_activity(self):
+        """
+        Test if an activity occurring twice in a file only keeps the last rows
+        """
+        self.add_activity('IATI-0001')
+        activity = models.Activity(id='IATI-0001', iati_identifier='IATI-0001')
+        self.writer.start_activity(activity)
+        self.writer.add(models.Title(activity=activity, title='only title'))
+        self.writer.flush()
+
+        self.assertEqual(['only title'], list(models.Title.objects.values_list('title', flat=True)))
+
+    def test_failed_row(self):
+        """
+        Test if a failing row does not prevent the other rows from being stored
+        """
+        activity = self.add_activity('IATI-0001')
+        # not null violation
+        self.writer.add(models.Title(activity=activity, title=None))
+        self.writer.flush()
+
+        self.assertEqual(1, models.Activity.objects.count())
+        self.assertEqual(3, models.Title.objects.count())
@@ -0,0 +1,73 @@
+from django.test import TestCase
+from iati import models
+from iati.codelist_resolver import CodelistResolver
+from iati.factory import iati_factory
+
+
+class CodelistResolverTestCase(TestCase):
+    """
+    Test CodelistResolver lookups
+    """
+    def setUp(self):
+        models.Currency.objects.create(code='EUR', name='Euro', language='en')
+        models.TiedStatus.objects.create(code=5, name='Untied', description='')
+        category = models.SectorCategory.objects.create(code=111, name='Education', description='')
+        models.Sector.objects.create(code=11110, name='Education policy', description='', category=category)
+        iati_factory.CountryFactory.create(code='XK', name='Kosovo', iso3='xkx')
+        iati_factory.CountryFactory.create(code='AD', name='Andorra', iso3='and')
+
+        self.resolver = CodelistResolver()
+
+    def test_get_by_code(self):
+        """
+        Test if items are found by code, for both char and integer codes
+        """
+        self.assertEqual('EUR', self.resolver.get(models.Currency, 'EUR').code)
+        self.assertEqual('EUR', self.resolver.get(models.Currency, 'eur').code)
+        self.assertEqual(5, self.resolver.get(models.TiedStatus, '5').code)
+        self.assertIsNone(self.resolver.get(models.TiedStatus, 'five'))
+        self.assertIsNone(self.resolver.get(models.Currency, None))
+
+    def test_codelist_loaded_once(self):
+        """
+        Test if a codelist table is only queried on first use
+        """
+        with self.assertNumQueries(1):
+            for i in range(10):
+                self.resolver.get(models.Currency, 'EUR')
+                self.resolver.get(models.Currency, 'USD')
+
+    def test_get_by_name(self):
+        """
+        Test if sectors can be found by name
+        """
+        sector = self.resolver.get_by_name(models.Sector, 'Education policy')
+        self.assertEqual(11110, sector.code)
+
+    def test_country_fallbacks(self):
+        """
+        Test the Kosovo and country name fallbacks
+        """
+        self.assertEqual('XK', self.resolver.country('KOS').code)
+        self.assertEqual('XK', self.resolver.country('KS').code)
+        self.assertEqual('AD', self.resolver.country('ANDORRA').code)
+        self.assertIsNone(self.resolver.country('ZZ'))
+
+    def test_tied_status_text(self):
+        """
+        Test if textual tied statuses are mapped to their code
+        """
+        self.assertEqual(5, self.resolver.tied_status('Untied').code)
+        self.assertEqual(5, self.resolver.tied_status('5').code)
+        self.assertIsNone(self.resolver.tied_status('half tied'))
+
+    def test_invalidate(self):
+        """
+        Test if codelists are reloaded after invalidation
+        """
+        self.assertIsNone(self.resolver.get(models.Currency, 'USD'))
+        models.Currency.objects.create(code='USD', name='US Dollar', language='en')
+        self.assertIsNone(self.resolver.get(models.Currency, 'USD'))
+
+        CodelistResolver.invalidate()
+        self.assertEqual('USD', self.resolver.get(models.Currency, 'USD').code)
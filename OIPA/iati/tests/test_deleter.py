@@ -0,0 +1,76 @@
+from django.test import TestCase
+from iati import models
+from iati.deleter import Deleter
+
+
+class DeleterTestCase(TestCase):
+    """
+    Test the set based Deleter
+    """
+    def setUp(self):
+        models.AidTypeFlag.objects.create(code=1, name='Free standing technical cooperation')
+        self.create_activity('IATI-0001', 'source-1')
+        self.create_activity('IATI-0002', 'source-1')
+        self.create_activity('IATI-0003', 'source-2')
+
+    def create_activity(self, activity_id, xml_source_ref):
+        activity = models.Activity.objects.create(
+            id=activity_id, iati_identifier=activity_id, xml_source_ref=xml_source_ref)
+        models.Title.objects.create(activity=activity, title='title')
+        models.Budget.objects.create(activity=activity, value=10)
+        models.RelatedActivity.objects.create(current_activity=activity)
+
+        result = models.Result.objects.create(activity=activity, title='result')
+        indicator = models.ResultIndicator.objects.create(result=result, baseline_year=2014, baseline_value='1')
+        models.ResultIndicatorPeriod.objects.create(result_indicator=indicator, target='2')
+
+        crs_add = models.CrsAdd.objects.create(activity=activity, aid_type_flag_id=1)
+        models.CrsAddLoanTerms.objects.create(crs_add=crs_add, rate_1=4)
+        models.CrsAddLoanStatus.objects.create(crs_add=crs_add, year=2014)
+
+        models.ActivityAggregate.objects.create(activity=activity, value=10)
+
+    def assert_remaining(self, activity_ids):
+        activity_ids = sorted(activity_ids)
+        self.assertEqual(activity_ids, sorted(models.Activity.objects.values_list('id', flat=True)))
+        self.assertEqual(activity_ids, sorted(models.Title.objects.values_list('activity_id', flat=True)))
+        self.assertEqual(activity_ids, sorted(
+            models.ResultIndicatorPeriod.objects.values_list('result_indicator__result__activity_id', flat=True)))
+        self.assertEqual(activity_ids, sorted(
+            models.CrsAddLoanStatus.objects.values_list('crs_add__activity_id', flat=True)))
+        self.assertEqual(len(activity_ids), models.CrsAddLoanTerms.objects.count())
+        self.assertEqual(activity_ids, sorted(models.ActivityAggregate.objects.values_list('activity_id', flat=True)))
+
+    def test_delete_by_source(self):
+        """
+        Test if all rows of a source are removed, and only those
+        """
+        Deleter().delete_by_source('source-1')
+
+        self.assert_remaining(['IATI-0003'])
+
+    def test_delete_activities(self):
+        """
+        Test deleting a batch of activities by id
+        """
+        Deleter().delete_activities(['IATI-0001', 'IATI-0003'])
+        self.assert_remaining(['IATI-0002'])
+
+    def test_same_result_as_per_activity_delete(self):
+        """
+        Test if the per activity delete leaves the same rows
+        """
+        Deleter().delete_by_source_per_activity('source-1')
+        self.assert_remaining(['IATI-0003'])
+
+    def test_delete_activities_with_aggregates(self):
+        """
+        Test if the activity aggregate rows are removed before their
+        activities, the set based delete does not cascade
+        """
+        activity = models.Activity.objects.get(id='IATI-0001')
+        models.ActivityAggregate.objects.create(activity=activity, value=20)
+
+        Deleter().delete_activities(['IATI-0001'])
+        self.assertFalse(models.ActivityAggregate.objects.filter(activity_id='IATI-0001').exists())
+        self.assert_remaining(['IATI-0002', 'IATI-0003'])
@@ -0,0 +1,64 @@
+from builtins import object
+from lxml import etree
+from iati.element_record import ElementRecord
+import pytest
+
+
+ACTIVITY_XML = b"""
+<iati-activity xmlns:akvo="http://akvo.org/api/v1/iati-activities" default-currency="EUR" xml:lang="en">
+    <iati-identifier>NL-1</iati-identifier>
+    <title xml:lang="en">Title <!-- comment --> continued</title>
+    <title xml:lang="fr">Titre</title>
+    <description type="1" akvo:type="5">Description</description>
+    <transaction>
+        <value currency="USD" value-date="2014-01-01">100</value>
+        <provider-org ref="NL-2">Provider</provider-org>
+    </transaction>
+    <transaction>
+        <value>200</value>
+    </transaction>
+    <conditions><condition type="1">Condition</condition></conditions>
+</iati-activity>
+"""
+
+
+class TestElementRecord(object):
+
+    @pytest.mark.parametrize("path,namespaces", [
+        ('@default-currency', None),
+        ('@hierarchy', None),
+        ('iati-identifier/text()', None),
+        ('title/text()', None),
+        ('title/@xml:lang', None),
+        ('description/@akvo:type', {'akvo': 'http://akvo.org/api/v1/iati-activities'}),
+        ('transaction/value/@currency', None),
+        ('transaction/value/text()', None),
+        ('transaction/provider-org/@ref', None),
+        ('conditions/condition/text()', None),
+        ('activity-date', None),
+    ])
+    def test_same_result_as_lxml(self, path, namespaces):
+        """
+        Test if values are the same as the lxml XPath results
+        """
+        elem = etree.fromstring(ACTIVITY_XML)
+        record = ElementRecord(elem)
+        assert record.xpath(path, namespaces=namespaces) == elem.xpath(path, namespaces=namespaces)
+
+    def test_child_elements(self):
+        """
+        Test if child element results are records, in document order
+        """
+        record = ElementRecord(etree.fromstring(ACTIVITY_XML))
+        transactions = record.xpath('transaction')
+        assert len(transactions) == 2
+        assert transactions[1].xpath('value/text()') == ['200']
+
+    @pytest.mark.parametrize("path", ['', 'ancestor-or-self::*', 'title[1]', '@akvo:type'])
+    def test_unsupported_path(self, path):
+        """
+        Test if paths that are not simple child paths raise an error
+        """
+        record = ElementRecord(etree.fromstring(ACTIVITY_XML))
+        with pytest.raises(ValueError):
+            record.xpath(path)
@@ -0,0 +1,101 @@
+from future import standard_library
+standard_library.install_aliases()
+from builtins import object
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import gzip
+import io
+import shutil
+import tempfile
+import threading
+
+from iati.filegrabber import FileGrabber
+
+
+XML = b'<iati-activities><iati-activity><iati-identifier>NL-1</iati-identifier></iati-activity></iati-activities>'
+
+
+class XmlHandler(BaseHTTPRequestHandler):
+    """
+    Serves XML with an ETag, gzip encoded when the client accepts it.
+    The If-None-Match header of each request is recorded on the server.
+    """
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.path != '/activities.xml':
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        etag = '"%d"' % len(self.server.body)
+
+        if self.server.use_etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = self.server.body
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as gzip_file:
+                gzip_file.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        if self.server.use_etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFileGrabber(object):
+
+    def setup_method(self, method):
+        self.cache_dir = tempfile.mkdtemp()
+        self.server = HTTPServer(('127.0.0.1', 0), XmlHandler)
+        self.server.requests = []
+        self.server.body = XML
+        self.server.use_etag = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/activities.xml' % self.server.server_address[1]
+
+    def teardown_method(self, method):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_download_gzip(self):
+        result = FileGrabber(self.cache_dir).fetch(self.url)
+
+        with open(result.path, 'rb') as xml_file:
+            assert xml_file.read() == XML
+        assert result.size == len(XML)
+        assert not result.unchanged
+
+    def test_not_modified(self):
+        grabber = FileGrabber(self.cache_dir)
+        grabber.mark_parsed(grabber.fetch(self.url))
+
+        result = grabber.fetch(self.url)
+        assert result.unchanged
+        assert self.server.requests[-1] == '"%d"' % len(XML)
+
+    def test_unchanged_checksum_without_etag(self):
+        self.server.use_etag = False
+        grabber = FileGrabber(self.cache_dir)
+        first = grabber.fetch(self.url)
+        assert not grabber.fetch(self.url).unchanged
+
+        grabber.mark_parsed(first)
+        assert grabber.fetch(self.url).unchanged
+
+        self.server.body = XML.replace(b'NL-1', b'NL-2')
+        assert not grabber.fetch(self.url).unchanged
+
+    def test_missing_file(self):
+        assert FileGrabber(self.cache_dir).fetch(self.url.replace('activities', 'missing')) is None
@@ -0,0 +1,53 @@
+import datetime
+from django.test import TestCase
+from iati import models
+from iati.management.commands.filter_facet_updater import FilterFacetUpdater, get_filter_options
+
+
+class FilterFacetUpdaterTestCase(TestCase):
+    """
+    Test the precomputed activity filter option counts
+    """
+    def setUp(self):
+        self.nl = models.Organisation.objects.create(code='NL-1', name='Netherlands')
+        self.gb = models.Organisation.objects.create(code='GB-1', name='United Kingdom')
+        self.sector = models.Sector.objects.create(code=11110, name='Education policy', description='')
+
+        self.create_activity('NL-1-0001', self.nl, datetime.date(2012, 1, 1))
+        self.create_activity('NL-1-0002', self.nl, datetime.date(2013, 1, 1))
+        self.create_activity('GB-1-0001', self.gb, datetime.date(2012, 6, 1))
+
+    def create_activity(self, activity_id, reporting_organisation, start_actual):
+        activity = models.Activity.objects.create(
+            id=activity_id, iati_identifier=activity_id, reporting_organisation=reporting_organisation,
+            start_actual=start_actual)
+        models.ActivitySector.objects.create(activity=activity, sector=self.sector)
+        models.ActivityParticipatingOrganisation.objects.create(activity=activity, organisation=self.gb)
+
+    def test_filter_options(self):
+        FilterFacetUpdater().update()
+        facets = ['sectors', 'donors', 'start_actual', 'reporting_organisations']
+
+        options = get_filter_options(facets)
+        self.assertEqual({'name': 'Education policy', 'total': 3}, options['sectors']['11110'])
+        self.assertEqual({'name': 'United Kingdom', 'total': 3}, options['donors']['GB-1'])
+        self.assertEqual({'name': 2012, 'total': 2}, options['start_actual']['2012'])
+        self.assertEqual({'name': 'Netherlands', 'total': 2}, options['reporting_organisations']['NL-1'])
+
+        options = get_filter_options(facets, ['NL-1'])
+        self.assertEqual(2, options['sectors']['11110']['total'])
+        self.assertEqual(1, options['start_actual']['2012']['total'])
+
+    def test_update_organisations(self):
+        """
+        Test if only the rows of the given organisations are rebuilt
+        """
+        updater = FilterFacetUpdater()
+        updater.update()
+        models.Activity.objects.filter(id='NL-1-0002').delete()
+        models.Activity.objects.filter(id='GB-1-0001').delete()
+        updater.update_organisations(['NL-1'])
+
+        options = get_filter_options(['sectors'])
+        self.assertEqual(2, options['sectors']['11110']['total'])
+        self.assertEqual(1, get_filter_options(['sectors'], ['NL-1'])['sectors']['11110']['total'])
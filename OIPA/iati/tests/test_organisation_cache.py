@@ -0,0 +1,75 @@
+import threading
+from django.test import TestCase
+from iati import models
+from iati.organisation_cache import OrganisationCache
+
+
+class OrganisationCacheTestCase(TestCase):
+    """
+    Test the per run organisation identity map
+    """
+    def setUp(self):
+        self.reporting_org = models.Organisation.objects.create(code='NL-1', name='Reporting', original_ref='NL-1')
+        self.provider = models.Organisation.objects.create(code='NL-2-ABC123', name='Provider', original_ref='NL-2')
+        activity = models.Activity.objects.create(
+            id='IATI-0001', iati_identifier='IATI-0001', xml_source_ref='source',
+            reporting_organisation=self.reporting_org)
+        models.Transaction.objects.create(activity=activity, value=10, provider_organisation=self.provider)
+
+    def test_preloaded(self):
+        """
+        Test if the organisations of the source are found without queries
+        """
+        cache = OrganisationCache()
+        cache.preload('source')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.reporting_org, cache.reporting_organisation('NL-1', 'Reporting', None))
+            self.assertEqual(self.provider, cache.find_or_create('NL-2', 'provider '))
+
+    def test_new_organisations_inserted_at_flush(self):
+        """
+        Test if new organisations are created once and inserted in flush
+        """
+        cache = OrganisationCache()
+        organisation = cache.find_or_create('NL-3', 'Receiver')
+        self.assertIs(organisation, cache.find_or_create('NL-3', 'Receiver'))
+        self.assertTrue(organisation.code.startswith('NL-3-'))
+        self.assertFalse(models.Organisation.objects.filter(original_ref='NL-3').exists())
+
+        reporting_org = cache.reporting_organisation('NL-4', 'New reporting', None)
+
+        cache.flush()
+        self.assertEqual(organisation, models.Organisation.objects.get(original_ref='NL-3', name='Receiver'))
+        self.assertEqual(reporting_org, models.Organisation.objects.get(code='NL-4'))
+
+    def test_flush_waits_for_other_flush(self):
+        """
+        Test if a writer's flush waits until the organisations another
+        writer's flush took are inserted
+        """
+        cache = OrganisationCache()
+        cache.reporting_organisation('NL-5', 'Other writer', None)
+        inserting = threading.Event()
+        release = threading.Event()
+        inserted = []
+
+        def slow_insert(new):
+            inserting.set()
+            release.wait(5)
+            inserted.extend(new)
+
+        cache.insert = slow_insert
+        first = threading.Thread(target=cache.flush)
+        first.start()
+        inserting.wait(5)
+
+        second = threading.Thread(target=cache.flush)
+        second.start()
+        second.join(0.2)
+        self.assertTrue(second.is_alive())
+
+        release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual(['NL-5'], [organisation.code for organisation in inserted])
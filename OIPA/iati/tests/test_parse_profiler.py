@@ -0,0 +1,93 @@
+from collections import deque
+
+from django.db import connection
+from django.test import TestCase
+from iati import models
+from iati.parse_profiler import ParseProfiler
+from iati.parser import Parser
+
+
+class ParseProfilerTestCase(TestCase):
+    """
+    Test the per stage parse timings
+    """
+    def test_stage_queries(self):
+        """
+        Test if the queries of a stage are counted
+        """
+        profiler = ParseProfiler()
+        profiler.start()
+        for i in range(2):
+            with profiler.stage('count'):
+                models.Activity.objects.count()
+                models.Title.objects.count()
+        profiler.stop(10)
+
+        stage = profiler.result()['stages']['count']
+        self.assertEqual(2, stage['calls'])
+        self.assertEqual(4, stage['queries'])
+        self.assertEqual(10, profiler.result()['activity_count'])
+        self.assertTrue(profiler.result()['peak_rss'] > 0)
+
+    def test_nested_stages(self):
+        """
+        Test if the queries of an inner stage are counted once, in the inner
+        stage
+        """
+        profiler = ParseProfiler()
+        profiler.start()
+        with profiler.stage('outer'):
+            models.Activity.objects.count()
+            with profiler.stage('inner'):
+                models.Title.objects.count()
+            models.Activity.objects.count()
+        profiler.stop(0)
+
+        self.assertEqual(2, profiler.stages['outer']['queries'])
+        self.assertEqual(1, profiler.stages['inner']['queries'])
+        self.assertTrue(profiler.stages['outer']['seconds'] >= 0)
+
+    def test_queries_past_log_limit(self):
+        """
+        Test if queries the debug cursor's log no longer keeps are counted
+        """
+        queries_log = connection.queries_log
+        self.addCleanup(setattr, connection, 'queries_log', queries_log)
+        connection.queries_log = deque(maxlen=2)
+
+        profiler = ParseProfiler()
+        profiler.start()
+        with profiler.stage('outer'):
+            for i in range(3):
+                models.Activity.objects.count()
+            with profiler.stage('inner'):
+                for i in range(3):
+                    models.Title.objects.count()
+        profiler.stop(0)
+
+        self.assertEqual(3, profiler.stages['outer']['queries'])
+        self.assertEqual(3, profiler.stages['inner']['queries'])
+        self.assertEqual(2, len(connection.queries_log))
+
+    def test_instrument(self):
+        """
+        Test if the add_* methods and per file updates of a parser are timed
+        """
+        parser = Parser()
+        profiler = ParseProfiler()
+        profiler.instrument(parser)
+        profiler.instrument(parser)
+
+        parser.update_search_data()
+        self.assertEqual(1, profiler.stages['update_search_data']['calls'])
+        self.assertIn('add_activity_title', parser.__dict__)
+        self.assertNotIn('add_all_activity_data', parser.__dict__)
+
+    def test_disabled(self):
+        """
+        Test if a disabled profiler records nothing
+        """
+        profiler = ParseProfiler(enabled=False)
+        with profiler.stage('count'):
+            models.Activity.objects.count()
+        self.assertEqual({}, profiler.stages)
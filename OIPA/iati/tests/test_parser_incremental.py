@@ -0,0 +1,111 @@
+from django.test import TestCase
+from lxml import etree
+from iati import models
+from iati.filegrabber import FetchResult, FileGrabber
+from iati.parser import Parser
+from iati_synchroniser.exception_handler import exception_handler
+from iati_synchroniser.models import ParseError
+
+
+ACTIVITY_XML = """
+<iati-activity last-updated-datetime="2014-01-01">
+    <iati-identifier>{identifier}</iati-identifier>
+    <title>{title}</title>
+</iati-activity>
+"""
+
+
+class IncrementalParseTestCase(TestCase):
+    """
+    Test skipping unchanged activities in incremental mode
+    """
+    def parse(self, activities, incremental, parser=None):
+        parser = parser or Parser()
+        parser.xml_source_ref = 'source'
+        if incremental:
+            parser.known_hashes = dict(models.Activity.objects.filter(
+                xml_source_ref='source').values_list('id', 'content_hash'))
+            parser.seen_activity_ids = set()
+            parser.changed_activity_ids = set()
+
+        for identifier, title in activities:
+            parser.process_element(etree.fromstring(ACTIVITY_XML.format(identifier=identifier, title=title)))
+        parser.flush()
+
+        if incremental:
+            parser.delete_removed_activities()
+        return parser
+
+    def titles(self):
+        return sorted(models.Title.objects.values_list('activity_id', 'title'))
+
+    def test_content_hash_stored(self):
+        """
+        Test if an incremental parse stores a content hash for each activity,
+        and a full parse does not compute them
+        """
+        self.parse([('NL-1', 'first'), ('NL-2', 'second')], incremental=True)
+
+        hashes = models.Activity.objects.values_list('content_hash', flat=True)
+        self.assertEqual(2, len(set(hashes)))
+        self.assertTrue(all(len(h) == 40 for h in hashes))
+
+        self.parse([('NL-3', 'third')], incremental=False)
+        self.assertEqual('', models.Activity.objects.get(id='NL-3').content_hash)
+
+    def test_incremental_parse(self):
+        """
+        Test if unchanged activities are kept, changed ones replaced and
+        removed ones deleted
+        """
+        self.parse([('NL-1', 'first'), ('NL-2', 'second'), ('NL-3', 'third')], incremental=True)
+        unchanged_title_id = models.Title.objects.get(activity_id='NL-1').id
+
+        self.parse([('NL-1', 'first'), ('NL-2', 'second changed')], incremental=True)
+
+        self.assertEqual([('NL-1', 'first'), ('NL-2', 'second changed')], self.titles())
+        self.assertEqual(unchanged_title_id, models.Title.objects.get(activity_id='NL-1').id)
+        self.assertFalse(models.Activity.objects.filter(id='NL-3').exists())
+
+    def test_changed_activity_ids(self):
+        """
+        Test if only the written and removed activities are rebuilt after an
+        incremental parse
+        """
+        self.parse([('NL-1', 'first'), ('NL-2', 'second'), ('NL-3', 'third')], incremental=True)
+        parser = self.parse([('NL-1', 'first'), ('NL-2', 'second changed'), ('NL-4', 'new')], incremental=True)
+
+        self.assertEqual(set(['NL-2', 'NL-3', 'NL-4']), parser.changed_activity_ids)
+
+    def test_failed_stage_parsed_again(self):
+        """
+        Test if an activity that was not stored whole gets no content hash,
+        so the next incremental parse processes it again
+        """
+        def broken_title(elem, activity):
+            exception_handler(ValueError("missing codelist entry"), 'NL-1', 'add_activity_title')
+
+        parser = Parser()
+        parser.add_activity_title = broken_title
+        self.parse([('NL-1', 'first'), ('NL-2', 'second')], incremental=True, parser=parser)
+        self.assertEqual([('NL-2', 'second')], self.titles())
+        self.assertEqual('', models.Activity.objects.get(id='NL-1').content_hash)
+
+        parser = self.parse([('NL-1', 'first'), ('NL-2', 'second')], incremental=True)
+        self.assertEqual([('NL-1', 'first'), ('NL-2', 'second')], self.titles())
+        self.assertEqual(set(['NL-1']), parser.changed_activity_ids)
+
+    def test_unchanged_file_keeps_errors(self):
+        """
+        Test if skipping an unchanged file leaves the errors of its last parse
+        """
+        ParseError.objects.create(source_ref='source', stage='add_budget', exception_type='ValueError')
+
+        original = FileGrabber.fetch
+        FileGrabber.fetch = lambda file_grabber, url: FetchResult(url, '/tmp/source.xml', 10, 'abc', True)
+        try:
+            Parser().parse_url('http://example.org/source.xml', 'source')
+        finally:
+            FileGrabber.fetch = original
+
+        self.assertEqual(1, ParseError.objects.filter(source_ref='source').count())
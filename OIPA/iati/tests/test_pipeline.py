@@ -0,0 +1,115 @@
+from builtins import object
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from iati.element_record import ElementRecord
+from iati.parser import Parser
+from iati.pipeline import ParsePipeline
+
+
+class FakeParser(object):
+    """
+    Records what the pipeline hands to the parser
+    """
+    def __init__(self, processed=None):
+        self.processed = processed if processed is not None else []
+        self.lock = threading.Lock()
+        self.activity_count = 0
+        self.flushed = False
+
+    def copy_for_worker(self):
+        return FakeParser(self.processed)
+
+    def prepare_element(self, elem):
+        if elem.findtext('iati-identifier') == 'broken':
+            raise ValueError("broken activity")
+        return ElementRecord(elem), 'hash'
+
+    def process_record(self, record, content_hash):
+        identifier = record.xpath('iati-identifier/text()')[0]
+        if identifier == 'NL-3':
+            raise ValueError("error while writing")
+        with self.lock:
+            self.processed.append(identifier)
+        self.activity_count += 1
+
+    def flush(self):
+        self.flushed = True
+
+
+class RecordingParser(Parser):
+    """
+    A Parser that records the identifiers the writers read instead of
+    storing the activities
+    """
+    def __init__(self, processed=None):
+        super(RecordingParser, self).__init__()
+        self.processed = processed if processed is not None else []
+        self.lock = threading.Lock()
+
+    def copy_for_worker(self):
+        worker = RecordingParser(self.processed)
+        worker.use_element_records = self.use_element_records
+        return worker
+
+    def process_record(self, record, content_hash):
+        with self.lock:
+            self.processed.extend(record.xpath('iati-identifier/text()'))
+
+    def flush(self):
+        pass
+
+
+class TestParsePipeline(object):
+
+    def setup_method(self, method):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'activities.xml')
+        identifiers = ['NL-%d' % i for i in range(1, 51)] + ['broken']
+        with open(self.path, 'w') as xml_file:
+            xml_file.write('<iati-activities>')
+            for identifier in identifiers:
+                xml_file.write('<iati-activity><iati-identifier>%s</iati-identifier></iati-activity>' % identifier)
+            xml_file.write('</iati-activities>')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.directory)
+
+    def test_all_activities_written(self):
+        """
+        Test if every activity is written once, in file order, and if errors
+        only skip the activity they occur in
+        """
+        parser = FakeParser()
+        ParsePipeline(parser, queue_size=2, writers=1).run(self.path)
+
+        expected = ['NL-%d' % i for i in range(1, 51) if i != 3]
+        assert parser.processed == expected
+        assert parser.activity_count == 49
+        assert parser.flushed
+
+    def test_multiple_writers(self):
+        """
+        Test if the work is divided over the writers without losing activities
+        """
+        parser = FakeParser()
+        ParsePipeline(parser, queue_size=2, writers=3).run(self.path)
+
+        assert sorted(parser.processed) == sorted('NL-%d' % i for i in range(1, 51) if i != 3)
+        assert parser.activity_count == 49
+
+    @pytest.mark.parametrize('use_element_records', [True, False])
+    def test_real_prepare_element(self, use_element_records):
+        """
+        Test if the writers read every activity whole, also when the parser
+        hands on the lxml elements the producer clears
+        """
+        parser = RecordingParser()
+        parser.use_element_records = use_element_records
+        ParsePipeline(parser, queue_size=2, writers=2).run(self.path)
+
+        assert sorted(parser.processed) == sorted(['NL-%d' % i for i in range(1, 51)] + ['broken'])
@@ -0,0 +1,55 @@
+from django.test import TestCase
+from iati import models
+from iati.management.commands.search_data_updater import SearchDataUpdater
+
+
+class SearchDataUpdaterTestCase(TestCase):
+    """
+    Test the batched ActivitySearchData builder
+    """
+    def setUp(self):
+        organisation = models.Organisation.objects.create(code='NL-1', name='Reporting org')
+        self.create_activity('IATI-0001', 'source-1', organisation)
+        self.create_activity('IATI-0002', 'source-1', None)
+        self.create_activity('IATI-0003', 'source-2', None)
+
+    def create_activity(self, activity_id, xml_source_ref, reporting_organisation):
+        activity = models.Activity.objects.create(
+            id=activity_id, iati_identifier=activity_id, xml_source_ref=xml_source_ref,
+            reporting_organisation=reporting_organisation)
+        models.Title.objects.create(activity=activity, title='first ' + activity_id)
+        models.Title.objects.create(activity=activity, title='second')
+        models.Description.objects.create(activity=activity, description='description')
+        models.DocumentLink.objects.create(activity=activity, url='http://example.com', title='document')
+        models.ActivityParticipatingOrganisation.objects.create(activity=activity, name='participant')
+
+    def test_update_source(self):
+        """
+        Test if the search data of a source is built, and only for that source
+        """
+        SearchDataUpdater().update_source('source-1')
+
+        search_data = models.ActivitySearchData.objects.get(activity_id='IATI-0001')
+        self.assertEqual('IATI-0001', search_data.search_identifier)
+        self.assertEqual('first IATI-0001 second ', search_data.search_title)
+        self.assertEqual('description ', search_data.search_description)
+        self.assertEqual('document ', search_data.search_documentlink_title)
+        self.assertEqual('participant ', search_data.search_participating_organisation_name)
+        self.assertEqual('Reporting org', search_data.search_reporting_organisation_name)
+        self.assertEqual('', search_data.search_country_name)
+
+        self.assertEqual('', models.ActivitySearchData.objects.get(
+            activity_id='IATI-0002').search_reporting_organisation_name)
+        self.assertFalse(models.ActivitySearchData.objects.filter(activity_id='IATI-0003').exists())
+
+    def test_rebuild(self):
+        """
+        Test if rebuilding replaces the existing rows
+        """
+        updater = SearchDataUpdater()
+        updater.update()
+        models.Title.objects.filter(activity_id='IATI-0003').delete()
+        updater.update()
+
+        self.assertEqual(3, models.ActivitySearchData.objects.count())
+        self.assertEqual('', models.ActivitySearchData.objects.get(activity_id='IATI-0003').search_title)
@@ -0,0 +1,54 @@
+from decimal import Decimal
+from django.test import TestCase
+from iati import models
+from iati.management.commands.total_budget_updater import TotalBudgetUpdater
+
+
+class TotalBudgetUpdaterTestCase(TestCase):
+    """
+    Test the per source total budget recomputation
+    """
+    def setUp(self):
+        self.eur = models.Currency.objects.create(code='EUR', name='Euro', language='en')
+        self.usd = models.Currency.objects.create(code='USD', name='US Dollar', language='en')
+
+        self.single = self.create_activity('IATI-0001', 'source-1', [(10, self.eur), (15, self.eur)])
+        self.mixed = self.create_activity('IATI-0002', 'source-1', [(10, self.eur), (5, self.usd)])
+        self.other = self.create_activity('IATI-0003', 'source-2', [(20, self.usd)])
+
+    def create_activity(self, activity_id, xml_source_ref, budgets):
+        activity = models.Activity.objects.create(
+            id=activity_id, iati_identifier=activity_id, xml_source_ref=xml_source_ref)
+        for value, currency in budgets:
+            models.Budget.objects.create(activity=activity, value=value, currency=currency)
+        return activity
+
+    def get_activity(self, activity):
+        return models.Activity.objects.get(id=activity.id)
+
+    def test_update_source(self):
+        """
+        Test if the totals of a source are set, and only those
+        """
+        TotalBudgetUpdater().update_source('source-1')
+
+        single = self.get_activity(self.single)
+        self.assertEqual(Decimal('25'), single.total_budget)
+        self.assertEqual('EUR', single.total_budget_currency_id)
+
+        # budgets in more than one currency have no total currency
+        mixed = self.get_activity(self.mixed)
+        self.assertEqual(Decimal('15'), mixed.total_budget)
+        self.assertIsNone(mixed.total_budget_currency_id)
+
+        self.assertIsNone(self.get_activity(self.other).total_budget)
+
+    def test_update_all(self):
+        """
+        Test if update sets the totals of all sources
+        """
+        TotalBudgetUpdater().update()
+
+        other = self.get_activity(self.other)
+        self.assertEqual(Decimal('20'), other.total_budget)
+        self.assertEqual('USD', other.total_budget_currency_id)
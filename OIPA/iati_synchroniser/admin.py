@@ -0,0 +1,86 @@
+from django.conf.urls import patterns
+from django.contrib import admin
+from django.db.models import Count
+from django.http import HttpResponse
+from django.utils.html import format_html, format_html_join
+import django_rq
+import json
+from iati_synchroniser.models import IatiXmlSource, ParseError, ParseRun
+
+
+class IatiXmlSourceAdmin(admin.ModelAdmin):
+    search_fields = ['ref', 'title', 'publisher__org_id']
+    list_display = ['ref', 'publisher', 'date_updated', 'iati_standard_version', 'xml_activity_count',
+                    'oipa_activity_count', 'get_parse_completeness', 'file_size']
+    list_filter = ['iati_standard_version', 'publisher']
+    readonly_fields = ['xml_activity_count', 'oipa_activity_count', 'iati_standard_version', 'file_size',
+                       'file_checksum']
+    actions = ['parse_sources']
+
+    def parse_sources(self, request, queryset):
+        """
+        Parse the selected sources in the parser queue, also when their file
+        did not change (after a parser or codelist fix)
+        """
+        from task_queue.tasks import parse_source_by_url
+        queue = django_rq.get_queue("parser")
+        for source in queryset:
+            queue.enqueue(parse_source_by_url, args=(source.source_url, False, True), timeout=7200)
+        self.message_user(request, "%d sources added to the parser queue" % len(queryset))
+    parse_sources.short_description = "Parse selected sources"
+
+
+class ParseRunAdmin(admin.ModelAdmin):
+    list_display = ['source', 'started', 'duration', 'activity_count', 'activities_per_second', 'peak_rss']
+    list_filter = ['source__publisher']
+    search_fields = ['source__ref']
+    readonly_fields = ['source', 'started', 'duration', 'activity_count', 'activities_per_second', 'peak_rss',
+                       'stage_table']
+    exclude = ['stages']
+    actions = ['export_json']
+
+    def stage_table(self, obj):
+        rows = format_html_join('', "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>", (
+            (name, stage['calls'], '%.2f' % stage['seconds'], stage['queries'], '%.2f' % stage['query_seconds'])
+            for name, stage in obj.get_stages().items()))
+        return format_html(
+            "<table><tr><th>Stage</th><th>Calls</th><th>Seconds</th><th>Queries</th><th>Query seconds</th></tr>"
+            "{}</table>", rows)
+    stage_table.short_description = "Stages"
+
+    def export_json(self, request, queryset):
+        runs = [run.as_dict() for run in queryset.select_related('source__publisher')]
+        response = HttpResponse(json.dumps(runs, indent=2), content_type='application/json')
+        response['Content-Disposition'] = 'attachment; filename="parse_runs.json"'
+        return response
+    export_json.short_description = "Export selected parse runs as JSON"
+
+class ParseErrorAdmin(admin.ModelAdmin):
+    search_fields = ['source_ref', 'ref', 'message']
+    list_display = ['source_ref', 'ref', 'stage', 'exception_type', 'message', 'created']
+    list_filter = ['stage', 'exception_type']
+
+    def get_urls(self):
+        urls = super(ParseErrorAdmin, self).get_urls()
+
+        my_urls = patterns('',
+            (r'^stage-counts/$', self.admin_site.admin_view(self.stage_counts))
+        )
+        return my_urls + urls
+
+    def stage_counts(self, request):
+        """
+        Number of errors per stage and exception type, for one source with
+        ?source_ref=
+        """
+        errors = ParseError.objects.all()
+        if request.GET.get('source_ref'):
+            errors = errors.filter(source_ref=request.GET['source_ref'])
+
+        counts = errors.values('stage', 'exception_type').annotate(count=Count('id')).order_by('-count')
+        return HttpResponse(json.dumps(list(counts), indent=2), content_type='application/json')
+
+
+admin.site.register(IatiXmlSource, IatiXmlSourceAdmin)
+admin.site.register(ParseError, ParseErrorAdmin)
+admin.site.register(ParseRun, ParseRunAdmin)
@@ -2,6 +2,7 @@ from __future__ import print_function
 from future import standard_library
 standard_library.install_aliases()
 from builtins import str
+from builtins import range
 from builtins import object
 __author__ = 'vincentvantwestende'
 from iati.models import *
@@ -9,349 +10,329 @@ import urllib.request, urllib.error, urllib.parse
 from lxml import etree
 from geodata.models import Country, Region
 from iati.models import RegionVocabulary
+from iati.codelist_resolver import CodelistResolver, to_text
+from django.db import transaction
+from django.db.models import Case, Value, When
 import logging
 from iati_synchroniser.models import Codelist
 import datetime
+import hashlib
+import time
 
 logger = logging.getLogger(__name__)
 
-class CodeListImporter(object):
-
-        # class wide functions
-    def return_first_exist(self, xpath_find):
-
-        if not xpath_find:
-             xpath_find = None
-        else:
-            try:
-                xpath_find = str(xpath_find[0], errors='ignore')
-            except:
-                xpath_find = xpath_find[0]
-
-            xpath_find = xpath_find.encode('utf-8', 'ignore')
-        return xpath_find
-
-
-    def synchronise_with_codelists(self):
-
-        def fast_iter(context, func):
-            for event, elem in context:
-                func(elem)
-                elem.clear()
-                while elem.getprevious() is not None:
-                    del elem.getparent()[0]
-            del context
-
-        def return_first_exist(xpath_find):
-
-            if not xpath_find:
-                 xpath_find = None
-            else:
-                # xpath_find = xpath_find[0].encode('utf-8')
-                try:
-                    xpath_find = str(xpath_find[0], errors='ignore')
-                except:
-                    xpath_find = xpath_find[0]
-
-                xpath_find = xpath_find.encode('utf-8')
-            return xpath_find
-
+CODELIST_URL = "http://www.iatistandard.org/105/codelists/downloads/clv1/codelist/%s.xml"
+CODELIST_INDEX_URL = "http://www.iatistandard.org/105/codelists/downloads/clv1/codelist.xml"
+
+# codelist name: (model, fields read from the codelist items)
+CODELISTS = {
+    "ActivityDateType": (ActivityDateType, ('name',)),
+    "ActivityStatus": (ActivityStatus, ('name', 'language')),
+    "Country": (Country, ('name', 'language')),
+    "BudgetType": (BudgetType, ('name', 'language')),
+    "CollaborationType": (CollaborationType, ('name', 'description', 'language')),
+    "ConditionType": (ConditionType, ('name', 'language')),
+    "Currency": (Currency, ('name', 'language')),
+    "DescriptionType": (DescriptionType, ('name', 'description')),
+    "DisbursementChannel": (DisbursementChannel, ('name',)),
+    "DocumentCategory-category": (DocumentCategoryCategory, ('name',)),
+    "DocumentCategory": (DocumentCategory, ('name', 'description', 'category')),
+    "GeographicLocationClass": (GeographicLocationClass, ('name',)),
+    "FileFormat": (FileFormat, ('name',)),
+    "FlowType": (FlowType, ('name', 'description')),
+    "GazetteerAgency": (GazetteerAgency, ('name',)),
+    "GeographicalPrecision": (GeographicalPrecision, ('name', 'description')),
+    "IndicatorMeasure": (ResultIndicatorMeasure, ('name',)),
+    "Language": (Language, ('name',)),
+    "LocationType-category": (LocationTypeCategory, ('name',)),
+    "LocationType": (LocationType, ('name', 'description', 'category')),
+    "OrganisationIdentifier": (OrganisationIdentifier, ('abbreviation', 'name')),
+    "OrganisationRole": (OrganisationRole, ('name', 'description')),
+    "OrganisationType": (OrganisationType, ('name',)),
+    "PolicyMarker": (PolicyMarker, ('name',)),
+    "PolicySignificance": (PolicySignificance, ('name', 'description')),
+    "PublisherType": (PublisherType, ('name',)),
+    "RelatedActivityType": (RelatedActivityType, ('name', 'description')),
+    "ResultType": (ResultType, ('name',)),
+    "SectorCategory": (SectorCategory, ('name', 'description')),
+    "TiedStatus": (TiedStatus, ('name', 'description')),
+    "TransactionType": (TransactionType, ('name', 'description')),
+    "ValueType": (ValueType, ('name', 'description')),
+    "VerificationStatus": (VerificationStatus, ('name',)),
+    "Vocabulary": (Vocabulary, ('name',)),
+    "ActivityScope": (ActivityScope, ('name',)),
+    "AidTypeFlag": (AidTypeFlag, ('name',)),
+    "BudgetIdentifier": (BudgetIdentifier, ('name', 'category', 'sector')),
+    "BudgetIdentifierSector-category": (BudgetIdentifierSectorCategory, ('name',)),
+    "BudgetIdentifierSector": (BudgetIdentifierSector, ('name', 'category')),
+    "BudgetIdentifierVocabulary": (BudgetIdentifierVocabulary, ('name',)),
+    "ContactType": (ContactType, ('name',)),
+    "LoanRepaymentPeriod": (LoanRepaymentPeriod, ('name',)),
+    "LoanRepaymentType": (LoanRepaymentType, ('name',)),
+    "RegionVocabulary": (RegionVocabulary, ('name',)),
+    "FinanceType": (FinanceType, ('name', 'category')),
+    "FinanceType-category": (FinanceTypeCategory, ('name', 'description')),
+    "Region": (Region, ('name',)),
+    "AidType-category": (AidTypeCategory, ('name', 'description')),
+    "AidType": (AidType, ('name', 'description', 'category')),
+    "Sector": (Sector, ('name', 'description', 'category')),
+    # v1.04 added codelists
+    "GeographicLocationReach": (GeographicLocationReach, ('name',)),
+    "OrganisationRegistrationAgency": (OrganisationRegistrationAgency,
+                                       ('name', 'description', 'category', 'category_name', 'url')),
+    "GeographicExactness": (GeographicExactness, ('name', 'description', 'category', 'url')),
+    "GeographicVocabulary": (GeographicVocabulary, ('name', 'description', 'category', 'url')),
+}
+
+# values that are not in the codelist file
+FIXED_VALUES = {
+    "Country": {'data_source': "IATI"},
+    "Region": {'region_vocabulary': 1},
+}
+
+CAPITALIZED_NAMES = ("Country", "SectorCategory")
+
+# the codelists other codelists refer to are imported first
+CATEGORY_CODELISTS = (
+    "SectorCategory",
+    "RegionVocabulary",
+    "BudgetIdentifierSector-category",
+    "LocationType-category",
+    "FinanceType-category",
+    "AidType-category",
+    "DocumentCategory-category",
+)
+
+
+class CodelistTiming(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.unchanged = False
+
+    def report(self):
+        if self.unchanged:
+            return "%s: unchanged (%.2f s)" % (self.name, self.seconds)
+        return "%s: %d inserted, %d updated, %d failed (%.2f s)" % (
+            self.name, self.inserted, self.updated, self.failed, self.seconds)
 
-        def add_code_list_item(elem):
-            tag = elem.tag
 
-            db_row = None
+class CodeListImporter(object):
+    """
+    Imports the IATI codelists.
+
+    Each codelist file is read into memory and compared with the current
+    table contents, which are read with one query. New rows are inserted
+    with bulk_create, changed rows with one UPDATE per chunk. The sha1 of
+    the file is kept on the Codelist row, so a codelist that did not change
+    since the last import is skipped.
+    """
+
+    chunk_size = 500
+
+    def __init__(self, force=False):
+        self.force = force
+        self.codelists = {}
+        self.timings = []
+
+    def item_text(self, elem, field_name):
+        text = elem.findtext(field_name.replace('_', '-'))
+        if text is None:
+            return ""
+        return to_text(text)
+
+    def download(self, url):
+        file_opener = urllib.request.build_opener()
+        return file_opener.open(url).read()
 
-            code = elem.xpath('code/text()')
-            name = elem.xpath('name/text()')
-            description = elem.xpath('description/text()')
-            language_name = elem.xpath('language/text()')
-            category = elem.xpath('category/text()')
-            category_name = elem.xpath('category-name/text()')
-            category_description = elem.xpath('category-description/text()')
-            abbreviation = elem.xpath('abbreviation/text()')
-            sector = elem.xpath('sector/text()')
-            url = elem.xpath('url/text()')
+    def read_items(self, name, root):
+        """
+        The rows of a codelist file, by code, as {field attname: value}.
+        """
+        model, field_names = CODELISTS[name]
+        items = {}
 
+        for elem in root.iter(name):
+            code = self.item_text(elem, 'code')
             if not code:
-                code = ""
-            else:
-                code = return_first_exist(code)
-            if not name:
-                name = ""
-            else:
-                name = return_first_exist(name)
-            if not description:
-                description = ""
-            else:
-                description = return_first_exist(description)
-            if not language_name:
-                language_name = ""
-            else:
-                language_name = return_first_exist(language_name)
-            if not category:
-                category = ""
-            else:
-                category = return_first_exist(category)
-            if not category_name:
-                category_name = ""
-            else:
-                category_name = return_first_exist(category_name)
-            if not category_description:
-                category_description = ""
-            else:
-                category_description = return_first_exist(category_description)
-            if not abbreviation:
-                abbreviation = ""
-            else:
-                abbreviation = return_first_exist(abbreviation)
-            if not sector:
-                sector = ""
-            else:
-                sector = return_first_exist(sector)
+                continue
 
+            values = {}
+            for field_name in field_names:
+                value = self.item_text(elem, field_name)
+                if field_name == 'name' and name in CAPITALIZED_NAMES:
+                    value = value.lower().capitalize()
+                values[field_name] = value
+            values.update(FIXED_VALUES.get(name, {}))
 
             try:
-                if tag == "ActivityDateType":
-                    db_row = ActivityDateType(code=code, name=name)
-
-                elif tag == "ActivityStatus":
-                    db_row = ActivityStatus(code=code, name=name, language=language_name)
-
-                elif tag == "Country":
-                    name = name.lower().capitalize()
-                    db_row = Country(code=code, name=name, language=language_name, data_source="IATI")
-
-                elif tag == "BudgetType":
-                    db_row = BudgetType(code=code, name=name, language=language_name)
-
-                elif tag == "CollaborationType":
-                    db_row = CollaborationType(code=code, name=name, description=description, language=language_name)
-
-                elif tag == "ConditionType":
-                    db_row = ConditionType(code=code, name=name, language=language_name)
-
-                elif tag == "Currency":
-                    db_row = Currency(code=code, name=name, language=language_name)
-
-                elif tag == "DescriptionType":
-                    db_row = DescriptionType(code=code, name=name, description=description)
-
-                elif tag == "DisbursementChannel":
-                    db_row = DisbursementChannel(code=code, name=name)
-
-                elif tag == "DocumentCategory-category":
-                    db_row = DocumentCategoryCategory(code=code, name=name)
-
-                elif tag == "DocumentCategory":
-                    dcc = DocumentCategoryCategory.objects.get(code=category)
-                    db_row = DocumentCategory(code=code, name=name, description=description, category=dcc)
-
-                elif tag == "GeographicLocationClass":
-                    db_row = GeographicLocationClass(code=code, name=name)
-
-                elif tag == "FileFormat":
-                    db_row = FileFormat(code=code, name=name)
-
-                elif tag == "FlowType":
-                    db_row = FlowType(code=code, name=name, description=description)
-
-                elif tag == "GazetteerAgency":
-                    db_row = GazetteerAgency(code=code, name=name)
-
-                elif tag == "GeographicalPrecision":
-                    db_row = GeographicalPrecision(code=code, name=name, description=description)
-
-                elif tag == "IndicatorMeasure":
-                    db_row = ResultIndicatorMeasure(code=code, name=name)
-
-                elif tag == "Language":
-                    db_row = Language(code=code, name=name)
-
-                elif tag == "LocationType-category":
-                    db_row = LocationTypeCategory(code=code, name=name)
-
-                elif tag == "LocationType":
-                    ltc = LocationTypeCategory.objects.get(code=category)
-                    db_row = LocationType(code=code, name=name, description=description, category=ltc)
-
-                elif tag == "OrganisationIdentifier":
-                    db_row = OrganisationIdentifier(code=code,abbreviation=abbreviation, name=name)
-
-                elif tag == "OrganisationRole":
-                    db_row = OrganisationRole(code=code, name=name, description=description)
-
-                elif tag == "OrganisationType":
-                    db_row = OrganisationType(code=code, name=name)
-
-                elif tag == "PolicyMarker":
-                    db_row = PolicyMarker(code=code, name=name)
-
-                elif tag == "PolicySignificance":
-                    db_row = PolicySignificance(code=code, name=name, description=description)
-
-                elif tag == "PublisherType":
-                    db_row = PublisherType(code=code, name=name)
-
-                elif tag == "RelatedActivityType":
-                    db_row = RelatedActivityType(code=code, name=name, description=description)
-
-                elif tag == "ResultType":
-                    db_row = ResultType(code=code, name=name)
-
-                elif tag == "SectorCategory":
-                    name = name.lower().capitalize()
-                    db_row = SectorCategory(code=code, name=name, description=description)
-
-                elif tag == "TiedStatus":
-                    db_row = TiedStatus(code=code, name=name, description=description)
-
-                elif tag == "TransactionType":
-                    db_row = TransactionType(code=code, name=name, description=description)
-
-                elif tag == "ValueType":
-                    db_row = ValueType(code=code, name=name, description=description)
-
-                elif tag == "VerificationStatus":
-                    db_row = VerificationStatus(code=code, name=name)
-
-                elif tag == "Vocabulary":
-                    db_row = Vocabulary(code=code, name=name)
-
-                elif tag == "ActivityScope":
-                    db_row = ActivityScope(code=code, name=name)
-
-                elif tag == "AidTypeFlag":
-                    db_row = AidTypeFlag(code=code, name=name)
-
-                elif tag == "BudgetIdentifier":
-                    db_row = BudgetIdentifier(code=code, name=name, category=category, sector=sector)
-
-                elif tag == "BudgetIdentifierSector-category":
-                    db_row = BudgetIdentifierSectorCategory(code=code, name=name)
-
-                elif tag == "BudgetIdentifierSector":
-                    bisc = BudgetIdentifierSectorCategory.objects.get(code=category)
-                    db_row = BudgetIdentifierSector(code=code, name=name, category=bisc)
-
-                elif tag == "BudgetIdentifierVocabulary":
-                    db_row = BudgetIdentifierVocabulary(code=code, name=name)
-
-                elif tag == "ContactType":
-                    db_row = ContactType(code=code, name=name)
-
-                elif tag == "LoanRepaymentPeriod":
-                    db_row = LoanRepaymentPeriod(code=code, name=name)
-
-                elif tag == "LoanRepaymentType":
-                    db_row = LoanRepaymentType(code=code, name=name)
-
-                elif tag == "RegionVocabulary":
-                    db_row = RegionVocabulary(code=code, name=name)
-
-                elif tag == "FinanceType":
-                    ftc = FinanceTypeCategory.objects.get(code=category)
-                    db_row = FinanceType(code=code, name=name, category=ftc)
-
-                elif tag == "FinanceType-category":
-                    db_row = FinanceTypeCategory(code=code, name=name ,description=description)
-
-                elif tag == "Region":
-                    region_voc = RegionVocabulary.objects.get(code=1)
-                    db_row = Region(code=code, name=name, region_vocabulary=region_voc)
-
-                elif tag == "AidType-category":
-                    db_row = AidTypeCategory(code=code, name=name, description=description)
-
-                elif tag == "AidType":
-                    atc = AidTypeCategory.objects.get(code=category)
-                    db_row = AidType(code=code, name=name, description=description, category=atc)
-
-                elif tag == "Sector":
-                    sector_cat = SectorCategory.objects.get(code=category)
-                    db_row = Sector(code=code, name=name, description=description, category=sector_cat)
-
-                # v1.04 added codelists
+                items[model._meta.pk.to_python(code)] = self.to_python(model, values)
+            except Exception as e:
+                logger.info("error in codelist " + name + ", code " + code)
+                logger.info('%s (%s)' % (e, type(e)))
 
-                elif tag == "GeographicLocationReach":
-                    db_row = GeographicLocationReach(code=code, name=name)
+        return items
 
-                elif tag == "OrganisationRegistrationAgency":
-                    db_row = OrganisationRegistrationAgency(code=code, name=name, description=description, category=category, category_name=category_name, url=url)
+    def to_python(self, model, values):
+        converted = {}
+        for field_name, value in values.items():
+            field = model._meta.get_field(field_name)
+            if field.is_relation:
+                converted[field.attname] = field.target_field.to_python(value)
+            else:
+                converted[field.attname] = field.to_python(value)
+        return converted
+
+    def import_items(self, model, items, timing):
+        attnames = sorted(set(attname for values in items.values() for attname in values))
+        pk_name = model._meta.pk.attname
+
+        existing = dict(
+            (row[0], dict(zip(attnames, row[1:])))
+            for row in model.objects.values_list(pk_name, *attnames))
+
+        new = []
+        changed = []
+        for code, values in items.items():
+            if code not in existing:
+                new.append(model(**dict(values, **{pk_name: code})))
+            elif existing[code] != values:
+                changed.append(model(**dict(values, **{pk_name: code})))
+
+        failed = self.bulk_insert(model, new)
+        self.bulk_update(model, changed, attnames)
+        timing.inserted = len(new) - failed
+        timing.failed = failed
+        timing.updated = len(changed)
+
+    def bulk_insert(self, model, instances):
+        """
+        Insert the instances, one by one when the bulk insert fails. Returns
+        the number of rows that could not be inserted.
+        """
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(instances, batch_size=self.chunk_size)
+            return 0
+        except Exception as e:
+            logger.info("error in codelists, bulk insert of " + model.__name__)
+            logger.info('%s (%s)' % (e, type(e)))
+
+        failed = 0
+        for instance in instances:
+            try:
+                with transaction.atomic():
+                    instance.save(force_insert=True)
+            except Exception as e:
+                failed += 1
+                logger.info("error in codelists")
+                logger.info('%s (%s)' % (e, type(e)))
+        return failed
+
+    def bulk_update(self, model, instances, attnames):
+        pk_name = model._meta.pk.attname
+
+        for i in range(0, len(instances), self.chunk_size):
+            chunk = instances[i:i + self.chunk_size]
+            values = {}
+            for attname in attnames:
+                field = [f for f in model._meta.concrete_fields if f.attname == attname][0]
+                output_field = field.target_field if field.is_relation else field
+                values[field.name] = Case(
+                    *[When(**{pk_name: instance.pk, 'then': Value(getattr(instance, attname))})
+                      for instance in chunk],
+                    output_field=output_field)
+            model.objects.filter(pk__in=[instance.pk for instance in chunk]).update(**values)
+
+    def get_codelist(self, name):
+        if name not in self.codelists:
+            self.codelists[name] = Codelist(name=name)
+        return self.codelists[name]
+
+    def import_codelist(self, name):
+        if name not in CODELISTS:
+            logger.info("type not saved: " + name)
+            return
+
+        timing = CodelistTiming(name)
+        start = time.time()
+
+        try:
+            data = self.download(CODELIST_URL % name)
+            checksum = hashlib.sha1(data).hexdigest()
+            codelist = self.get_codelist(name)
+
+            if codelist.checksum == checksum and not self.force:
+                timing.unchanged = True
+            else:
+                model = CODELISTS[name][0]
+                with transaction.atomic():
+                    self.import_items(model, self.read_items(name, etree.fromstring(data)), timing)
+                # the rows that failed are tried again on the next import
+                if not timing.failed:
+                    codelist.checksum = checksum
+
+        except Exception as e:
+            logger.info("error in codelist " + name)
+            logger.info('%s (%s)' % (e, type(e)))
+
+        finally:
+            timing.seconds = time.time() - start
+            self.timings.append(timing)
+            logger.info(timing.report())
+
+    def update_codelist_meta(self, elem):
+        name = self.item_text(elem, 'name')
+        codelist = self.get_codelist(name)
+        codelist.description = self.item_text(elem, 'description')
+        codelist.count = self.item_text(elem, 'count')
+        codelist.fields = self.item_text(elem, 'fields')
+        codelist.date_updated = datetime.datetime.now()
+        return name
+
+    def add_missing_items(self):
+        Country.objects.get_or_create(
+            code="XK",
+            defaults={
+                'name': 'Kosovo',
+                'language': 'en',
+                'center_longlat': 'POINT(0 0)',
+                'geom': 'MULTIPOLYGON (((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)), ((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)))'})
+        Country.objects.get_or_create(
+            code="YU",
+            defaults={
+                'name': 'Former Yugoslavia',
+                'language': 'en',
+                'center_longlat': 'POINT(0 0)',
+                'geom': 'MULTIPOLYGON (((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)), ((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)))'})
 
-                elif tag == "GeographicExactness":
-                    db_row = GeographicExactness(code=code, name=name, description=description, category=category, url=url)
+    def synchronise_with_codelists(self):
+        """
+        Import all codelists, returns the CodelistTiming of each codelist.
+        """
+        self.codelists = dict((codelist.name, codelist) for codelist in Codelist.objects.all())
+        self.timings = []
 
-                elif tag == "GeographicVocabulary":
-                    db_row = GeographicVocabulary(code=code, name=name, description=description, category=category, url=url)
+        #Do the categories first
+        for name in CATEGORY_CODELISTS:
+            self.import_codelist(name)
+            self.get_codelist(name).save()
 
-                else:
-                    print("type not saved: " + tag)
+        #get the file
+        index = etree.fromstring(self.download(CODELIST_INDEX_URL))
+        for elem in index.iter('codelist'):
+            name = self.update_codelist_meta(elem)
+            if name not in CATEGORY_CODELISTS:
+                self.import_codelist(name)
+            self.get_codelist(name).save()
 
-                if (db_row is not None):
-                    db_row.save()
+        self.add_missing_items()
 
-            except Exception as e:
-                logger.info("error in codelists")
-                logger.info('%s (%s)' % (e.message, type(e)))
-
-        def add_missing_items():
-            Country.objects.get_or_create(
-                code="XK",
-                defaults={
-                    'name': 'Kosovo',
-                    'language': 'en',
-                    'center_longlat': 'POINT(0 0)',
-                    'geom': 'MULTIPOLYGON (((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)), ((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)))'})
-            Country.objects.get_or_create(
-                code="YU",
-                defaults={
-                    'name': 'Former Yugoslavia',
-                    'language': 'en',
-                    'center_longlat': 'POINT(0 0)',
-                    'geom': 'MULTIPOLYGON (((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)), ((0.0000000000000000 0.0000000000000000, 0.0000000000000000 1.0000000000000000, 1.0000000000000000 1.0000000000000000, 0.0000000000000000 0.0000000000000000)))'})
-
-        def get_codelist_data(elem=None, name=None):
-
-            if not name:
-                name = self.return_first_exist(elem.xpath('name/text()'))
-
-                description = self.return_first_exist(elem.xpath('description/text()'))
-                count = self.return_first_exist(elem.xpath('count/text()'))
-                fields = self.return_first_exist(elem.xpath('fields/text()'))
-                date_updated = datetime.datetime.now()
-
-                if (Codelist.objects.filter(name=name).exists()):
-                    current_codelist = Codelist.objects.get(name=name)
-                    current_codelist.date_updated = date_updated
-                    current_codelist.description = description
-                    current_codelist.count = count
-                    current_codelist.fields = fields
-                    current_codelist.save()
-                else:
-                    new_codelist = Codelist(name=name, description=description, count=count, fields=fields, date_updated=date_updated)
-                    new_codelist.save()
-
-            cur_downloaded_xml = "http://www.iatistandard.org/105/codelists/downloads/clv1/codelist/" + name + ".xml"
-            cur_file_opener = urllib.request.build_opener()
-            cur_xml_file = cur_file_opener.open(cur_downloaded_xml)
-
-            context2 = etree.iterparse(cur_xml_file, tag=name)
-            fast_iter(context2, add_code_list_item)
-
-        #Do sector categories first
-        get_codelist_data(name="SectorCategory")
-        get_codelist_data(name="RegionVocabulary")
-        get_codelist_data(name="BudgetIdentifierSector-category")
-        get_codelist_data(name="LocationType-category")
-        get_codelist_data(name="FinanceType-category")
-        get_codelist_data(name="AidType-category")
-        get_codelist_data(name="DocumentCategory-category")
+        # parsers that already loaded codelists should pick up the new rows
+        CodelistResolver.invalidate()
 
-        #get the file
-        downloaded_xml = urllib.request.Request("http://www.iatistandard.org/105/codelists/downloads/clv1/codelist.xml")
-        file_opener = urllib.request.build_opener()
-        xml_file = file_opener.open(downloaded_xml)
-        context = etree.iterparse(xml_file, tag='codelist')
-        fast_iter(context, get_codelist_data)
-        add_missing_items()
+        return self.timings
@@ -9,6 +9,9 @@ from . import models
 import http.client
 import urllib.request, urllib.error, urllib.parse
 import datetime
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from django.db import transaction
 from iati.models import OrganisationIdentifier
 from iati_synchroniser.exception_handler import exception_handler
 
@@ -17,14 +20,31 @@ IATI_URL = 'http://www.iatiregistry.org/api/search/dataset?{options}'
 
 
 class DatasetSyncer(object):
-    # TODO: Clean unnecessary exception catchers.
+    """
+    Adds the datasets in the IATI registry as IatiXmlSources.
+
+    The registry pages are fetched by a pool of threads, a number of pages at
+    a time. The datasets of the fetched pages are written from the calling
+    thread with a few queries per batch, using the publishers and sources
+    that are read in __init__.
+    """
+
+    registry_url = IATI_URL
+    page_size = 200
+    max_offset = 10000
+    # pages fetched at the same time
+    workers = 8
+
     def __init__(self):
         """
         Prefetch data, to minify amount of DB queries
         """
-        self.source_urls = set([xmlsource['source_url'] for xmlsource in models.IatiXmlSource.objects.values('source_url')])
-        self.publisher_ids = set([publisher['org_id'] for publisher in models.Publisher.objects.values('org_id')])
-        self.organisation_identifiers = set([org['code'] for org in OrganisationIdentifier.objects.values('code')])
+        # source url: org id of the publisher
+        self.sources = dict(models.IatiXmlSource.objects.values_list('source_url', 'publisher__org_id'))
+        self.publishers = {}
+        for publisher in models.Publisher.objects.order_by('-id'):
+            self.publishers[publisher.org_id] = publisher
+        self.organisation_identifiers = dict(OrganisationIdentifier.objects.values_list('code', 'abbreviation'))
 
     def synchronize_with_iati_api(self, data_type, extra_options=[]):
         """
@@ -33,73 +53,73 @@ class DatasetSyncer(object):
         url_options = [
             'extras_filetype=activity',
             'all_fields=1',
-            'limit=200',
+            'limit={}'.format(self.page_size),
         ]
         url_options.extend(extra_options)
 
         if data_type == 2:
             url_options[0] = 'extras_filetype=organisation'
 
-        for i in range(0, 10000, 200):
-            options = '&'.join(url_options + ['offset={}'.format(i)])
-            page_url = IATI_URL.format(options=options)
-            if not self.synchronize_with_iati_api_by_page(page_url, data_type):
-                break
+        page_urls = [
+            self.registry_url.format(options='&'.join(url_options + ['offset={}'.format(i)]))
+            for i in range(0, self.max_offset, self.page_size)]
+
+        pool = ThreadPool(self.workers)
+        try:
+            for i in range(0, len(page_urls), self.workers):
+                pages = pool.map(self.fetch_page, page_urls[i:i + self.workers])
+                for results in pages:
+                    if results:
+                        self.parse_json_lines(results, data_type)
+
+                # the pages after the last dataset are empty
+                if not all(pages):
+                    break
+        finally:
+            pool.close()
+            pool.join()
 
-    def synchronize_with_iati_api_by_page(self, url, data_type, try_number=0):
+    def fetch_page(self, url, try_number=0):
         """
-        Loop through the datasets by page
+        The datasets on a registry page, runs in a pool thread
         """
-        # TODO: Clean this function
         try:
             req = urllib.request.Request(url)
             opener = urllib.request.build_opener()
             f = opener.open(req)
-            json_objects = json.load(f)
+            json_objects = json.loads(f.read().decode('utf-8'))
 
             if json_objects is not None:
-                if len(json_objects['results']):
-                    # For each dataset object
-                    for line in json_objects['results']:
-                        try:
-                            self.parse_json_line(line, data_type)
-                        except Exception as e:
-                            exception_handler(
-                                e,
-                                'synchronize_with_iati_api_by_page',
-                                "Unexpected error")
-                    return True
-                else:
-                    return False
+                return json_objects['results']
 
         except (urllib.error.HTTPError, urllib.error.URLError, http.client.HTTPException) as e:
             exception_handler(e, "HTTP error", url)
 
             if try_number < 4:
-                self.synchronize_with_iati_api_by_page(
-                    url,
-                    data_type,
-                    try_number + 1)
-            else:
-                return False
-
-    def update_publisher(self, iati_id, abbreviation, name):
+                return self.fetch_page(url, try_number + 1)
 
-        if iati_id in self.publisher_ids and iati_id != 'Unknown':
-            current_publisher = models.Publisher \
-                .objects.get(org_id=iati_id)
-        else:
-            if iati_id in self.organisation_identifiers:
-                current_publisher_meta = OrganisationIdentifier \
-                    .objects.get(code=iati_id)
-                abbreviation = current_publisher_meta.abbreviation
+        except (ValueError, KeyError) as e:
+            exception_handler(e, "Invalid registry page", url)
 
-            current_publisher = self.add_publisher_to_db(
-                iati_id, abbreviation, name)
+        return []
 
-            self.publisher_ids.add(iati_id)
+    def synchronize_with_iati_api_by_page(self, url, data_type):
+        """
+        Loop through the datasets by page
+        """
+        results = self.fetch_page(url)
+        if results:
+            self.parse_json_lines(results, data_type)
+            return True
+        return False
 
-        return current_publisher
+    def get_publisher(self, iati_id):
+        """
+        The publisher with the given id, None when it has to be created
+        """
+        if iati_id and iati_id != 'Unknown':
+            return self.publishers.get(iati_id)
+        return None
 
     def add_publisher_to_db(self,
                             org_id,
@@ -113,38 +133,42 @@ class DatasetSyncer(object):
         new_publisher.save()
         return new_publisher
 
-    def add_iati_xml_source_to_db(self,
-                                  url,
-                                  title,
-                                  name,
-                                  current_publisher,
-                                  cur_type):
-        new_source = models.IatiXmlSource(
-            ref=name,
-            title=title,
-            publisher=current_publisher,
-            source_url=url,
-            type=cur_type)
-        new_source.save(process=False, added_manually=False)
-        return new_source
+    def add_publishers(self, datasets):
+        """
+        Insert the publishers of the datasets that are not in the database
+        yet, with one bulk insert
+        """
+        new_publishers = OrderedDict()
+        for dataset in datasets:
+            iati_id = dataset['publisher_iati_id']
+            if iati_id and iati_id != 'Unknown' and iati_id not in self.publishers \
+                    and iati_id not in new_publishers:
+                new_publishers[iati_id] = models.Publisher(
+                    org_id=iati_id,
+                    org_abbreviate=self.organisation_identifiers.get(iati_id) or '',
+                    org_name=dataset['publisher_name'],
+                    default_interval='MONTHLY')
+
+        if new_publishers:
+            models.Publisher.objects.bulk_create(list(new_publishers.values()))
+            # bulk_create does not set the ids on MySQL
+            for publisher in models.Publisher.objects.filter(org_id__in=list(new_publishers)).order_by('-id'):
+                self.publishers[publisher.org_id] = publisher
 
-    def parse_json_line(self, line, data_type):
+    def read_json_line(self, line):
         """
-        Parse line from IATI response
+        The source and publisher data of a line from the IATI response
         """
         try:
             publisher_iati_id = line['extras']['publisher_iati_id']
         except KeyError:
             publisher_iati_id = None
 
-        publisher_abbreviation = ''
         publisher_name = 'Unknown'
         try:
             source_url = str(line['res_url'][0]).replace(' ', '%20')
         except IndexError:
             source_url = ''
-        source_name = line.get('name', '')
-        source_title = line.get('title', '')
 
         try:
             data_dict = json.loads(line.get('data_dict', ''))
@@ -156,40 +180,93 @@ class DatasetSyncer(object):
                    "organisation match:")
             exception_handler(e, 'synchronize_with_iati_api_by_page', msg)
 
-        if source_url not in self.source_urls:
-
-            if publisher_iati_id:
-                current_publisher = self.update_publisher(
-                    publisher_iati_id,
-                    publisher_abbreviation,
-                    publisher_name)
-            else:
-                current_publisher = self.add_publisher_to_db(
-                    'Unknown',
-                    publisher_abbreviation,
-                    publisher_name)
-
-            self.add_iati_xml_source_to_db(
-                source_url,
-                source_title,
-                source_name,
-                current_publisher,
-                data_type)
-
-            self.source_urls.add(source_url)
-
-        else:
-            msg = "Updated publisher and last found in registry on: "
-            exception_handler(None, msg, source_url)
-
-            source = models.IatiXmlSource.objects.get(source_url=source_url)
-            source.last_found_in_registry = datetime.datetime.now()
-
-            if source.publisher.org_id != publisher_iati_id:
-                new_publisher = self.update_publisher(
-                    publisher_iati_id,
-                    publisher_abbreviation,
-                    publisher_name)
-                source.publisher = new_publisher
-            source.save(process=False, added_manually=False)
+        return {
+            'publisher_iati_id': publisher_iati_id,
+            'publisher_name': publisher_name,
+            'source_url': source_url,
+            'source_name': line.get('name', ''),
+            'source_title': line.get('title', ''),
+        }
+
+    def parse_json_line(self, line, data_type):
+        """
+        Parse line from IATI response
+        """
+        self.parse_json_lines([line], data_type)
+
+    def parse_json_lines(self, lines, data_type):
+        """
+        Parse a page of lines from the IATI response. New sources and
+        publishers are bulk inserted, sources that are already known are
+        updated with one query per publisher.
+        """
+        datasets = []
+        for line in lines:
+            try:
+                datasets.append(self.read_json_line(line))
+            except Exception as e:
+                exception_handler(e, 'synchronize_with_iati_api_by_page', "Unexpected error")
+
+        now = datetime.datetime.now()
+        new_sources = []
+        found_urls = []
+        # publisher id: (publisher, urls of known sources that moved to it)
+        moved_sources = {}
+
+        with transaction.atomic():
+            self.add_publishers(datasets)
+
+            for dataset in datasets:
+                source_url = dataset['source_url']
+                iati_id = dataset['publisher_iati_id']
+
+                if source_url not in self.sources:
+                    publisher = self.get_publisher(iati_id)
+                    if publisher is None:
+                        publisher = self.add_publisher_to_db(
+                            'Unknown', '', dataset['publisher_name'])
+
+                    new_sources.append(models.IatiXmlSource(
+                        ref=dataset['source_name'],
+                        title=dataset['source_title'],
+                        publisher=publisher,
+                        source_url=source_url,
+                        type=data_type,
+                        added_manually=False))
+                    self.sources[source_url] = publisher.org_id
+
+                else:
+                    found_urls.append(source_url)
+
+                    if self.sources[source_url] != iati_id:
+                        publisher = self.get_publisher(iati_id)
+                        if publisher is None:
+                            publisher = self.add_publisher_to_db(
+                                iati_id or 'Unknown', '', dataset['publisher_name'])
+                        moved_sources.setdefault(publisher.id, (publisher, []))[1].append(source_url)
+                        self.sources[source_url] = iati_id
+
+            self.add_sources(new_sources)
+
+            models.IatiXmlSource.objects.filter(source_url__in=found_urls).update(
+                last_found_in_registry=now, added_manually=False)
+            for publisher, urls in moved_sources.values():
+                models.IatiXmlSource.objects.filter(source_url__in=urls).update(publisher=publisher)
+
+        if found_urls:
+            exception_handler(None, "Updated publisher and last found in registry on", str(len(found_urls)) + " sources")
+
+    def add_sources(self, new_sources):
+        try:
+            with transaction.atomic():
+                models.IatiXmlSource.objects.bulk_create(new_sources)
+            return
+        except Exception as e:
+            exception_handler(e, "bulk insert", "add_sources")
 
+        for source in new_sources:
+            try:
+                with transaction.atomic():
+                    source.save(process=False, added_manually=False)
+            except Exception as e:
+                exception_handler(e, source.source_url, "add_sources")
@@ -1,18 +1,126 @@
+from builtins import str
+from builtins import object
 import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
 
 logger = logging.getLogger('parser')
 
+
+class ParseErrorSink(object):
+    """
+    Collects the exceptions of a parse as ParseError rows.
+
+    record() only appends the exception type and arguments to a buffer; the
+    messages are formatted and the rows inserted with one bulk_create when
+    the buffer is full or the parse ends (flush). Nothing is recorded when
+    no parse is running.
+    """
+
+    def __init__(self, buffer_size=None):
+        # default settings.PARSE_ERROR_BUFFER_SIZE, read on first use
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.dropped = 0
+        self.source_ref = None
+        self.lock = threading.Lock()
+
+    def start(self, source_ref):
+        """
+        Start recording the errors of a parse of source_ref, the errors of
+        its previous parse are removed.
+        """
+        from iati_synchroniser.models import ParseError
+
+        self.flush()
+        try:
+            ParseError.objects.filter(source_ref=source_ref).delete()
+        except Exception as e:
+            logger.error("Could not remove the parse errors of %s: %r", source_ref, e)
+        self.source_ref = source_ref
+
+    def stop(self):
+        self.flush()
+        self.source_ref = None
+
+    def record(self, e, ref, current_def):
+        if self.source_ref is None:
+            return
+
+        if self.buffer_size is None:
+            self.buffer_size = settings.PARSE_ERROR_BUFFER_SIZE
+
+        with self.lock:
+            if len(self.buffer) >= 2 * self.buffer_size:
+                self.dropped += 1
+                return
+            self.buffer.append((self.source_ref, ref, current_def, type(e), e.args))
+            full = len(self.buffer) >= self.buffer_size
+
+        # the rows can not be written inside a transaction that has failed
+        if full and not connection.needs_rollback:
+            self.flush()
+
+    def format_message(self, args):
+        return u", ".join(str(arg) for arg in args)
+
+    def flush(self):
+        from iati_synchroniser.models import ParseError
+
+        with self.lock:
+            buffer = self.buffer
+            dropped = self.dropped
+            self.buffer = []
+            self.dropped = 0
+
+        if dropped:
+            logger.warning("%d parse errors were not stored, the error buffer was full", dropped)
+        if not buffer:
+            return
+
+        try:
+            with transaction.atomic():
+                ParseError.objects.bulk_create([
+                    ParseError(
+                        source_ref=source_ref[:70],
+                        ref=str(ref)[:255],
+                        stage=current_def[:100],
+                        exception_type=exception_type.__name__[:100],
+                        message=self.format_message(args))
+                    for source_ref, ref, current_def, exception_type, args in buffer])
+        except Exception as e:
+            logger.error("Could not store %d parse errors: %r", len(buffer), e)
+
+
+error_sink = ParseErrorSink()
+
+# errors handled per thread, see handled_error_count
+handled_errors = threading.local()
+
+
+def handled_error_count():
+    """
+    The number of errors exception_handler handled in this thread, the
+    parser compares it before and after an activity
+    """
+    return getattr(handled_errors, 'count', 0)
+
+
 def exception_handler(e, ref, current_def):
     try:
         if e:
-            logger.info("error in " + ref + ", def: " + current_def)
+            handled_errors.count = handled_error_count() + 1
+            error_sink.record(e, ref, current_def)
+            logger.info("error in %s, def: %s", ref, current_def)
             if e.args and e.args.__len__() > 0:
                 logger.warning(e.args[0])
             if e.args.__len__() > 1:
                 logger.warning(e.args[1])
             logger.warning(type(e))
         else:
-            logger.info("Message: " + ref + ", message 2: " + current_def)
+            logger.info("Message: %s, message 2: %s", ref, current_def)
 
     except Exception as e2:
         if e2.args and e2.args.__len__() > 0:
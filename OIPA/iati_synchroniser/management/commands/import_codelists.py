@@ -0,0 +1,17 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from iati_synchroniser.codelist_importer import CodeListImporter
+
+
+class Command(BaseCommand):
+    help = 'Import the IATI codelists and report the time spent per codelist'
+    option_list = BaseCommand.option_list + (
+        make_option('--force', dest='force', action='store_true', default=False,
+                    help='Also import codelists that did not change since the last import'),
+    )
+
+    def handle(self, *args, **options):
+        importer = CodeListImporter(force=options['force'])
+        for timing in importer.synchronise_with_codelists():
+            self.stdout.write(timing.report())
@@ -0,0 +1,36 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from iati_synchroniser.models import IatiXmlSource
+from iati_synchroniser.parse_scheduler import ParseScheduler
+
+
+class Command(BaseCommand):
+    help = 'Parse sources in parallel processes. Parses all sources, or the sources with the given refs.'
+    args = '[ref ref ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', dest='processes', type='int', default=None,
+                    help='Number of parser processes (default: settings.PARSE_POOL_PROCESSES)'),
+        make_option('--per-publisher', dest='per_publisher', type='int', default=None,
+                    help='Maximum number of files of one publisher parsed at the same time'),
+        make_option('--incremental', dest='incremental', action='store_true', default=False,
+                    help='Skip activities that did not change since the last parse'),
+        make_option('--force', dest='force', action='store_true', default=False,
+                    help='Parse files that did not change since the last parse'),
+    )
+
+    def handle(self, *args, **options):
+        sources = IatiXmlSource.objects.all()
+        if args:
+            sources = sources.filter(ref__in=args)
+
+        scheduler = ParseScheduler(
+            processes=options['processes'],
+            max_per_publisher=options['per_publisher'],
+            incremental=options['incremental'],
+            force=options['force'])
+
+        for worker in scheduler.run(sources):
+            self.stdout.write(
+                "process %(pid)s: %(sources)d sources (%(errors)d failed), %(activities)d activities "
+                "in %(seconds).0f seconds, %(activities_per_second).1f activities/sec" % worker)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati_synchroniser', '0003_auto_20150211_0707'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseRun',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('started', models.DateTimeField()),
+                ('duration', models.FloatField(default=0)),
+                ('activity_count', models.IntegerField(default=0)),
+                ('activities_per_second', models.FloatField(default=0)),
+                ('peak_rss', models.IntegerField(default=None, null=True)),
+                ('stages', models.TextField(default='')),
+                ('source', models.ForeignKey(related_name='parse_runs', to='iati_synchroniser.IatiXmlSource')),
+            ],
+            options={
+                'ordering': ['-started'],
+            },
+        ),
+    ]
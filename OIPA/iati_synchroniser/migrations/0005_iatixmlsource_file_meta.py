@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati_synchroniser', '0004_parserun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='iatixmlsource',
+            name='file_size',
+            field=models.BigIntegerField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='iatixmlsource',
+            name='file_checksum',
+            field=models.CharField(default='', max_length=40),
+        ),
+    ]
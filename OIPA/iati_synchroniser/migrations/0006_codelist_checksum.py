@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati_synchroniser', '0005_iatixmlsource_file_meta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codelist',
+            name='checksum',
+            field=models.CharField(default='', max_length=40),
+        ),
+    ]
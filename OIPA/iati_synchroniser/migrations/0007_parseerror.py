@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati_synchroniser', '0006_codelist_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseError',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('source_ref', models.CharField(max_length=70, db_index=True)),
+                ('ref', models.CharField(default='', max_length=255)),
+                ('stage', models.CharField(max_length=100, db_index=True)),
+                ('exception_type', models.CharField(max_length=100)),
+                ('message', models.TextField(default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -1,10 +1,17 @@
 from builtins import object
+from django.conf import settings
 from django.db import models
 import datetime
+import json
+from collections import OrderedDict
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
+from iati.models import Activity
 from iati.parser import Parser
+from iati.parse_profiler import ParseProfiler
 from iati.deleter import Deleter
+from iati.management.commands.filter_facet_updater import FilterFacetUpdater
+from cache.data_version import data_versions
 
 
 class Publisher(models.Model):
@@ -56,6 +63,9 @@ class IatiXmlSource(models.Model):
     xml_activity_count = models.IntegerField(null=True, default=None)
     oipa_activity_count = models.IntegerField(null=True, default=None)
     iati_standard_version = models.CharField(max_length=10, default="")
+    # size in bytes and sha1 of the last parsed file
+    file_size = models.BigIntegerField(null=True, default=None)
+    file_checksum = models.CharField(max_length=40, default="")
     is_parsed = models.BooleanField(null=False, default=False)
     added_manually = models.BooleanField(null=False, default=True)
 
@@ -71,28 +81,137 @@ class IatiXmlSource(models.Model):
     get_parse_status.allow_tags = True
     get_parse_status.short_description = _(u"Parse status")
 
-    def process(self):
+    def get_parse_completeness(self):
+        if self.xml_activity_count is None or self.oipa_activity_count is None:
+            return _(u"Not parsed")
+        if self.oipa_activity_count >= self.xml_activity_count:
+            return _(u"Complete")
+        return _(u"Partial")
+    get_parse_completeness.short_description = _(u"Activities parsed")
+
+    def process(self, incremental=False, profile=None, force=False):
+        """
+        Parse the source, returns the number of activities in the file.
+        A file that did not change since the last parse is skipped, unless
+        force is set.
+
+        With profile (default settings.PARSER_PROFILE) the stage timings are
+        stored as a ParseRun.
+        """
+        if profile is None:
+            profile = settings.PARSER_PROFILE
+
         self.is_parsed = True
+        organisations = self.get_reporting_organisations()
         parser = Parser()
-        parser.parse_url(self.source_url, self.ref)
+        if profile:
+            parser.profiler = ParseProfiler()
+        parser.parse_url(self.source_url, self.ref, incremental=incremental, force=force)
+        if profile:
+            ParseRun.objects.create_from_profiler(self, parser.profiler)
         self.date_updated = datetime.datetime.now()
+        if parser.fetch_result:
+            self.set_file_meta(parser)
+        # also when the parse aborted after activities were deleted
+        if parser.data_changed:
+            organisations |= self.get_reporting_organisations()
+            self.invalidate_data(organisations)
         self.save(process=False)
-        from iati_synchroniser.parse_admin import ParseAdmin
-        activity_counter = ParseAdmin()
-        # self.xml_activity_count = activity_counter.get_xml_activity_amount(self.source_url)
-        # self.oipa_activity_count = activity_counter.get_oipa_activity_amount(self.ref)
-        self.save(process=False)
+        return parser.activity_count
+
+    def invalidate_data(self, organisations):
+        FilterFacetUpdater().update_organisations(organisations)
+        # invalidates the cached API responses on the data of this source
+        data_versions.bump(organisations)
+
+    def get_reporting_organisations(self):
+        return set(Activity.objects.filter(xml_source_ref=self.ref).exclude(
+            reporting_organisation=None).values_list('reporting_organisation_id', flat=True).distinct())
+
+    def set_file_meta(self, parser):
+        """
+        Counts and file properties of the parse that just ran, collected while
+        the file was downloaded and read.
+        """
+        self.xml_activity_count = parser.activity_count
+        self.oipa_activity_count = Activity.objects.filter(xml_source_ref=self.ref).count()
+        self.iati_standard_version = (parser.iati_standard_version or "")[:10]
+        self.file_size = parser.fetch_result.size
+        self.file_checksum = parser.fetch_result.checksum
 
     def save(self, process=False , added_manually=True, *args, **kwargs):
         self.added_manually = added_manually
         super(IatiXmlSource, self).save()
         if process:
-            self.process()
+            self.process(force=True)
 
     def delete(self, process=True, *args, **kwargs):
+        organisations = self.get_reporting_organisations()
         deleter = Deleter()
-        deleter.delete_by_source(self.source_url)
+        deleter.delete_by_source(self.ref)
         super(IatiXmlSource, self).delete()
+        self.invalidate_data(organisations)
+
+
+class ParseRunManager(models.Manager):
+
+    def create_from_profiler(self, source, profiler):
+        result = profiler.result()
+        result['stages'] = json.dumps(result['stages'])
+        return self.create(source=source, **result)
+
+
+class ParseRun(models.Model):
+    source = models.ForeignKey(IatiXmlSource, related_name="parse_runs")
+    started = models.DateTimeField()
+    duration = models.FloatField(default=0)
+    activity_count = models.IntegerField(default=0)
+    activities_per_second = models.FloatField(default=0)
+    # kilobytes, peak of the parsing process since it started (not per run)
+    peak_rss = models.IntegerField(null=True, default=None)
+    # json, per stage: calls, seconds, queries, query_seconds
+    stages = models.TextField(default="")
+
+    objects = ParseRunManager()
+
+    class Meta:
+        ordering = ["-started"]
+
+    def __unicode__(self):
+        return "%s %s" % (self.source.ref, self.started)
+
+    def get_stages(self):
+        if not self.stages:
+            return {}
+        return json.loads(self.stages, object_pairs_hook=OrderedDict)
+
+    def as_dict(self):
+        return OrderedDict((
+            ('source', self.source.ref),
+            ('publisher', self.source.publisher.org_id),
+            ('started', self.started.isoformat()),
+            ('duration', self.duration),
+            ('activity_count', self.activity_count),
+            ('activities_per_second', self.activities_per_second),
+            ('peak_rss', self.peak_rss),
+            ('stages', self.get_stages()),
+        ))
+
+
+class ParseError(models.Model):
+    source_ref = models.CharField(max_length=70, db_index=True)
+    # the activity id, or the part of the parser the error occurred in
+    ref = models.CharField(max_length=255, default="")
+    stage = models.CharField(max_length=100, db_index=True)
+    exception_type = models.CharField(max_length=100)
+    message = models.TextField(default="")
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        ordering = ["-created"]
+
+    def __unicode__(self):
+        return "%s %s: %s" % (self.source_ref, self.ref, self.exception_type)
 
 
 class Codelist(models.Model):
@@ -101,6 +220,8 @@ class Codelist(models.Model):
     count = models.CharField(max_length=10, blank=True, null=True)
     fields = models.CharField(max_length=255, blank=True, null=True)
     date_updated = models.DateTimeField(auto_now=True, editable=False)
+    # sha1 of the last imported codelist file
+    checksum = models.CharField(max_length=40, default="")
 
     def __unicode__(self,):
         return "%s" % self.name
@@ -0,0 +1,186 @@
+from __future__ import division
+from future import standard_library
+standard_library.install_aliases()
+from builtins import str
+from builtins import object
+from collections import deque
+import logging
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from iati.filegrabber import FileGrabber
+from iati_synchroniser.exception_handler import exception_handler
+from iati_synchroniser.models import IatiXmlSource
+
+logger = logging.getLogger(__name__)
+
+
+def init_worker():
+    # every process needs its own database connection, they are opened on
+    # first use
+    connections.close_all()
+
+
+def parse_source(source_id, incremental, force=False):
+    """
+    Runs in a pool process. Exceptions are returned instead of raised,
+    Pool.apply_async has no error callback on python 2.
+    """
+    start = time.time()
+    try:
+        source = IatiXmlSource.objects.get(id=source_id)
+        activity_count = source.process(incremental=incremental, force=force)
+        error = None
+    except Exception as e:
+        exception_handler(e, str(source_id), "parse_source")
+        activity_count = 0
+        error = repr(e)
+
+    return {
+        'source_id': source_id,
+        'pid': os.getpid(),
+        'activities': activity_count or 0,
+        'seconds': time.time() - start,
+        'error': error,
+    }
+
+
+class ParseScheduler(object):
+    """
+    Parses sources in a pool of processes.
+
+    The biggest files are started first so a large file does not end up
+    running alone at the end, and no more than max_per_publisher files of
+    one publisher are parsed at the same time (to spare the publisher's
+    server and the rows they share in the database).
+
+    A worker that is killed (out of memory, a signal) never returns its
+    result; its source is reported as failed after task_timeout seconds.
+    """
+
+    # seconds between checks for finished sources
+    poll_interval = 1
+
+    def __init__(self, processes=None, max_per_publisher=None, incremental=False, force=False, task_timeout=None):
+        self.processes = processes or settings.PARSE_POOL_PROCESSES
+        self.max_per_publisher = max_per_publisher or settings.PARSE_POOL_MAX_PER_PUBLISHER
+        self.task_timeout = task_timeout or settings.PARSE_POOL_TASK_TIMEOUT
+        self.incremental = incremental
+        self.force = force
+
+    def order_sources(self, sources):
+        """
+        Largest first, by the size of the last parsed file or else the last
+        download. Sources that were never downloaded go last.
+        """
+        file_grabber = FileGrabber()
+        sizes = dict((source.id, source.file_size or file_grabber.cached_size(source.source_url) or 0)
+                     for source in sources)
+        return sorted(sources, key=lambda source: sizes[source.id], reverse=True)
+
+    def next_source(self, pending, running_per_publisher):
+        for source in pending:
+            if running_per_publisher.get(source.publisher_id, 0) < self.max_per_publisher:
+                pending.remove(source)
+                return source
+        return None
+
+    def run(self, sources=None):
+        """
+        Parse the given sources (all sources by default), returns the
+        throughput per worker process.
+        """
+        if sources is None:
+            sources = IatiXmlSource.objects.all()
+        pending = deque(self.order_sources(list(sources)))
+        publisher_ids = dict((source.id, source.publisher_id) for source in pending)
+
+        running_per_publisher = {}
+        # source id -> (AsyncResult, start time)
+        running = {}
+        results = []
+        lost = False
+
+        # forked processes must not share the connections of this process
+        connections.close_all()
+        pool = multiprocessing.Pool(self.processes, initializer=init_worker)
+
+        try:
+            while pending or running:
+                while len(running) < self.processes:
+                    source = self.next_source(pending, running_per_publisher)
+                    if source is None:
+                        break
+                    running_per_publisher[source.publisher_id] = running_per_publisher.get(source.publisher_id, 0) + 1
+                    running[source.id] = (
+                        pool.apply_async(parse_source, (source.id, self.incremental, self.force)), time.time())
+
+                for result in self.collect(running):
+                    running_per_publisher[publisher_ids[result['source_id']]] -= 1
+                    results.append(result)
+                    if result['pid'] is None:
+                        lost = True
+                        logger.error("Lost source %(source_id)s: %(error)s" % result)
+                    else:
+                        logger.info("Parsed source %(source_id)s in process %(pid)s: %(activities)s activities in %(seconds).1f seconds" % result)
+        finally:
+            # the pool waits for the results of lost sources when it is closed
+            if lost or running:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+        return self.throughput(results)
+
+    def collect(self, running):
+        """
+        Wait until sources are done, removes them from running and returns
+        their results. A source without a result after task_timeout seconds
+        gets a failed result without pid.
+        """
+        while True:
+            results = []
+            for source_id, (async_result, started) in list(running.items()):
+                if async_result.ready():
+                    results.append(async_result.get())
+                elif time.time() - started > self.task_timeout:
+                    results.append({
+                        'source_id': source_id,
+                        'pid': None,
+                        'activities': 0,
+                        'seconds': time.time() - started,
+                        'error': "no result after %d seconds, the worker process was lost" % self.task_timeout,
+                    })
+                else:
+                    continue
+                del running[source_id]
+
+            if results:
+                return results
+            time.sleep(self.poll_interval)
+
+    def throughput(self, results):
+        workers = {}
+        for result in results:
+            worker = workers.setdefault(result['pid'], {
+                'pid': result['pid'],
+                'sources': 0,
+                'errors': 0,
+                'activities': 0,
+                'seconds': 0.0,
+            })
+            worker['sources'] += 1
+            worker['activities'] += result['activities']
+            worker['seconds'] += result['seconds']
+            if result['error']:
+                worker['errors'] += 1
+
+        for worker in workers.values():
+            worker['activities_per_second'] = worker['activities'] / worker['seconds'] if worker['seconds'] else 0
+
+        return sorted(workers.values(), key=lambda worker: worker['pid'] or 0)
@@ -0,0 +1,96 @@
+from django.test import TestCase
+from iati import models
+from iati_synchroniser.codelist_importer import CodeListImporter
+from iati_synchroniser.models import Codelist
+
+
+LANGUAGE_XML = b"""
+<codelist>
+    <Language><code>en</code><name>English</name></Language>
+    <Language><code>fr</code><name>%s</name></Language>
+    <Language><code>nl</code><name>Dutch</name></Language>
+</codelist>
+"""
+
+
+class FileCodeListImporter(CodeListImporter):
+    """
+    Reads the codelist from a string instead of the IATI website
+    """
+    data = LANGUAGE_XML % b'French'
+
+    def download(self, url):
+        return self.data
+
+
+class CodeListImporterTestCase(TestCase):
+    """
+    Test the bulk codelist import
+    """
+    def setUp(self):
+        models.Language.objects.create(code='en', name='English')
+        models.Language.objects.create(code='fr', name='Francais')
+
+    def import_languages(self, importer):
+        importer.import_codelist('Language')
+        importer.get_codelist('Language').save()
+        return importer.timings[-1]
+
+    def test_insert_and_update(self):
+        """
+        Test if new rows are inserted, changed rows updated and others left alone
+        """
+        timing = self.import_languages(FileCodeListImporter())
+
+        self.assertEqual(1, timing.inserted)
+        self.assertEqual(1, timing.updated)
+        self.assertEqual(
+            [('en', 'English'), ('fr', 'French'), ('nl', 'Dutch')],
+            list(models.Language.objects.order_by('code').values_list('code', 'name')))
+
+    def test_unchanged_codelist_skipped(self):
+        """
+        Test if a codelist with the same checksum as the last import is skipped
+        """
+        self.import_languages(FileCodeListImporter())
+        models.Language.objects.filter(code='nl').delete()
+
+        importer = FileCodeListImporter()
+        importer.codelists = {'Language': Codelist.objects.get(name='Language')}
+        timing = self.import_languages(importer)
+
+        self.assertTrue(timing.unchanged)
+        self.assertFalse(models.Language.objects.filter(code='nl').exists())
+
+        importer = FileCodeListImporter(force=True)
+        timing = self.import_languages(importer)
+        self.assertEqual(1, timing.inserted)
+
+    def test_failed_rows_retried(self):
+        """
+        Test if the checksum is not stored when rows could not be inserted,
+        so the next import tries them again
+        """
+        def broken_bulk_create(*args, **kwargs):
+            raise ValueError("bulk insert failed")
+
+        def broken_save(language, *args, **kwargs):
+            raise ValueError("insert failed")
+
+        models.Language.objects.bulk_create = broken_bulk_create
+        original_save = models.Language.save
+        models.Language.save = broken_save
+        try:
+            timing = self.import_languages(FileCodeListImporter())
+        finally:
+            del models.Language.objects.bulk_create
+            models.Language.save = original_save
+
+        self.assertEqual(1, timing.failed)
+        self.assertEqual('', Codelist.objects.get(name='Language').checksum)
+
+        importer = FileCodeListImporter()
+        importer.codelists = {'Language': Codelist.objects.get(name='Language')}
+        timing = self.import_languages(importer)
+        self.assertEqual(1, timing.inserted)
+        self.assertTrue(models.Language.objects.filter(code='nl').exists())
@@ -1,4 +1,11 @@
+from future import standard_library
+standard_library.install_aliases()
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+import copy
 import json
+import threading
+import urllib.parse
 from django.test import TestCase
 from iati_synchroniser.dataset_syncer import DatasetSyncer
 from iati_synchroniser.models import IatiXmlSource
@@ -78,3 +85,87 @@ class DatasetSyncerTestCase(TestCase):
         publisher = Publisher.objects.get(org_id="GB-CHC-1020488")
         self.assertEqual(publisher, source.publisher,
             "IatiXmlSource should have correct publisher")
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """
+    Serves the datasets of the server in pages, like the registry search API
+    """
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        offset = int(query['offset'][0])
+        limit = int(query['limit'][0])
+        self.server.offsets.append(offset)
+
+        body = json.dumps({
+            'count': len(self.server.datasets),
+            'results': self.server.datasets[offset:offset + limit],
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RegistryServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RegistrySyncTestCase(TestCase):
+    """
+    Test synchronising with a local registry
+    """
+    def setUp(self):
+        with open('iati_synchroniser/fixtures/test_activity.json') as fixture:
+            line = json.load(fixture)['results'][0]
+
+        datasets = []
+        for i in range(45):
+            dataset = copy.deepcopy(line)
+            dataset['name'] = 'source-%d' % i
+            dataset['res_url'] = ['http://example.org/source-%d.xml' % i]
+            datasets.append(dataset)
+
+        self.server = RegistryServer(('127.0.0.1', 0), RegistryHandler)
+        self.server.datasets = datasets
+        self.server.offsets = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_syncer(self):
+        syncer = DatasetSyncer()
+        syncer.registry_url = 'http://127.0.0.1:%d/search?{options}' % self.server.server_address[1]
+        syncer.page_size = 10
+        syncer.max_offset = 100
+        syncer.workers = 3
+        return syncer
+
+    def test_all_pages_synchronised(self):
+        """
+        Test if the datasets of all pages are added, and fetching stops after
+        the last page
+        """
+        self.get_syncer().synchronize_with_iati_api(1)
+
+        self.assertEqual(45, IatiXmlSource.objects.count())
+        self.assertEqual(1, Publisher.objects.count())
+        self.assertEqual([0, 10, 20, 30, 40, 50], sorted(self.server.offsets))
+
+    def test_known_sources_updated(self):
+        """
+        Test if a second synchronisation marks the sources as found without
+        adding them again
+        """
+        self.get_syncer().synchronize_with_iati_api(1)
+        self.get_syncer().synchronize_with_iati_api(1)
+
+        self.assertEqual(45, IatiXmlSource.objects.count())
+        self.assertEqual(45, IatiXmlSource.objects.filter(last_found_in_registry__isnull=False).count())
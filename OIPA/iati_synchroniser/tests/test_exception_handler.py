@@ -0,0 +1,44 @@
+from django.test import TestCase
+from iati_synchroniser.exception_handler import ParseErrorSink
+from iati_synchroniser.models import ParseError
+
+
+class ParseErrorSinkTestCase(TestCase):
+    """
+    Test storing parse errors in batches
+    """
+    def test_errors_stored_in_batches(self):
+        """
+        Test if errors are only written when the buffer is full or the parse ends
+        """
+        sink = ParseErrorSink(buffer_size=3)
+        sink.start('source')
+
+        for i in range(4):
+            sink.record(ValueError('invalid value', i), 'IATI-000%d' % i, 'add_budget')
+            self.assertEqual(3 if i >= 2 else 0, ParseError.objects.count())
+
+        sink.stop()
+
+        self.assertEqual(4, ParseError.objects.count())
+        error = ParseError.objects.get(ref='IATI-0001')
+        self.assertEqual('source', error.source_ref)
+        self.assertEqual('add_budget', error.stage)
+        self.assertEqual('ValueError', error.exception_type)
+        self.assertEqual('invalid value, 1', error.message)
+
+    def test_previous_errors_removed(self):
+        """
+        Test if a new parse of a source replaces its errors, and if nothing
+        is recorded outside a parse
+        """
+        ParseError.objects.create(source_ref='source', stage='add_budget', exception_type='ValueError')
+        ParseError.objects.create(source_ref='other', stage='add_budget', exception_type='ValueError')
+
+        sink = ParseErrorSink()
+        sink.start('source')
+        sink.stop()
+        sink.record(ValueError('after the parse'), 'IATI-0001', 'add_budget')
+        sink.flush()
+
+        self.assertEqual(['other'], list(ParseError.objects.values_list('source_ref', flat=True)))
@@ -0,0 +1,95 @@
+from django.test import TestCase
+from lxml import etree
+from iati import models
+from iati.filegrabber import FetchResult
+from iati.parser import Parser
+from iati_synchroniser.models import IatiXmlSource
+from iati_synchroniser.models import Publisher
+from cache.data_version import GLOBAL
+from cache.models import DataVersion
+
+
+class IatiXmlSourceMetaTestCase(TestCase):
+    """
+    Test the file properties stored after a parse
+    """
+    def setUp(self):
+        publisher = Publisher.objects.create(org_id='NL-1', org_name='Publisher 1')
+        self.source = IatiXmlSource.objects.create(
+            ref='source', source_url='http://example.org/source.xml', publisher=publisher)
+        models.Activity.objects.create(id='IATI-0001', iati_identifier='IATI-0001', xml_source_ref='source')
+
+    def test_version_read_from_root(self):
+        """
+        Test if the parser keeps the version of the iati-activities element
+        """
+        root = etree.fromstring(b'<iati-activities version="2.01"><iati-activity/></iati-activities>')
+        parser = Parser()
+        parser.prepare_element(root[0])
+        self.assertEqual('2.01', parser.iati_standard_version)
+
+    def test_set_file_meta(self):
+        """
+        Test if counts, version and file properties are copied from the parser
+        """
+        parser = Parser()
+        parser.activity_count = 2
+        parser.iati_standard_version = '2.01'
+        parser.fetch_result = FetchResult(self.source.source_url, '/tmp/source.xml', 1234, 'abc', False)
+
+        self.source.set_file_meta(parser)
+
+        self.assertEqual(2, self.source.xml_activity_count)
+        self.assertEqual(1, self.source.oipa_activity_count)
+        self.assertEqual('2.01', self.source.iati_standard_version)
+        self.assertEqual(1234, self.source.file_size)
+        self.assertEqual('abc', self.source.file_checksum)
+        self.assertEqual('Partial', self.source.get_parse_completeness())
+
+    def test_process_passes_force(self):
+        """
+        Test if process hands force to the parser, so unchanged files can be
+        parsed again
+        """
+        calls = []
+        original = Parser.parse_url
+        Parser.parse_url = lambda parser, url, ref, **kwargs: calls.append(kwargs)
+        try:
+            self.source.process(profile=False, force=True)
+            self.source.process(profile=False)
+        finally:
+            Parser.parse_url = original
+
+        self.assertEqual([True, False], [kwargs['force'] for kwargs in calls])
+
+    def global_version(self):
+        return DataVersion.objects.filter(key=GLOBAL).values_list('version', flat=True).first() or 0
+
+    def test_delete_invalidates_cache(self):
+        """
+        Test if deleting a source bumps the data versions
+        """
+        version = self.global_version()
+        self.source.delete()
+
+        self.assertFalse(models.Activity.objects.filter(xml_source_ref='source').exists())
+        self.assertEqual(version + 1, self.global_version())
+
+    def test_aborted_parse_invalidates_cache(self):
+        """
+        Test if a parse that changed activities but did not finish bumps the
+        data versions
+        """
+        def aborted_parse(parser, url, ref, **kwargs):
+            parser.data_changed = True
+            parser.fetch_result = None
+
+        version = self.global_version()
+        original = Parser.parse_url
+        Parser.parse_url = aborted_parse
+        try:
+            self.source.process(profile=False)
+        finally:
+            Parser.parse_url = original
+
+        self.assertEqual(version + 1, self.global_version())
@@ -0,0 +1,101 @@
+from collections import deque
+import time
+from django.test import TestCase
+from iati.filegrabber import FileGrabber
+from iati_synchroniser.models import IatiXmlSource
+from iati_synchroniser.models import Publisher
+from iati_synchroniser.parse_scheduler import ParseScheduler
+
+
+class FakeAsyncResult(object):
+    def __init__(self, result=None):
+        self.result = result
+
+    def ready(self):
+        return self.result is not None
+
+    def get(self):
+        return self.result
+
+
+class ParseSchedulerTestCase(TestCase):
+    """
+    Test ParseScheduler job ordering
+    """
+    def setUp(self):
+        self.scheduler = ParseScheduler(processes=2, max_per_publisher=1)
+        publisher_1 = Publisher.objects.create(org_id='NL-1', org_name='Publisher 1')
+        publisher_2 = Publisher.objects.create(org_id='NL-2', org_name='Publisher 2')
+
+        self.sizes = {}
+        for ref, publisher, size in (
+                ('small', publisher_1, 10),
+                ('large', publisher_1, 1000),
+                ('medium', publisher_2, 100),
+                ('new', publisher_2, None)):
+            url = 'http://example.org/%s.xml' % ref
+            IatiXmlSource.objects.create(ref=ref, source_url=url, publisher=publisher)
+            self.sizes[url] = size
+
+    def cached_size(self, url):
+        return self.sizes[url]
+
+    def test_order_sources(self):
+        """
+        Test if the largest files come first, never downloaded ones last
+        """
+        original = FileGrabber.cached_size
+        FileGrabber.cached_size = lambda file_grabber, url: self.cached_size(url)
+        try:
+            sources = self.scheduler.order_sources(list(IatiXmlSource.objects.all()))
+        finally:
+            FileGrabber.cached_size = original
+
+        self.assertEqual(['large', 'medium', 'small', 'new'], [source.ref for source in sources])
+
+    def test_max_per_publisher(self):
+        """
+        Test if a source is skipped while its publisher is at the maximum
+        """
+        sources = IatiXmlSource.objects.order_by('ref')
+        pending = deque(sources)
+        publisher_1 = sources.get(ref='large').publisher_id
+
+        source = self.scheduler.next_source(pending, {publisher_1: 1})
+        self.assertEqual('medium', source.ref)
+        self.assertEqual(3, len(pending))
+
+    def test_throughput(self):
+        """
+        Test if results are summed per worker process
+        """
+        results = [
+            {'source_id': 1, 'pid': 10, 'activities': 100, 'seconds': 2.0, 'error': None},
+            {'source_id': 2, 'pid': 10, 'activities': 50, 'seconds': 1.0, 'error': 'IOError()'},
+            {'source_id': 3, 'pid': 11, 'activities': 0, 'seconds': 0.0, 'error': None},
+        ]
+        workers = self.scheduler.throughput(results)
+
+        self.assertEqual(50, workers[0]['activities_per_second'])
+        self.assertEqual(1, workers[0]['errors'])
+        self.assertEqual(0, workers[1]['activities_per_second'])
+
+    def test_collect_lost_source(self):
+        """
+        Test if a source without result is reported as failed after the
+        timeout instead of waited for forever
+        """
+        scheduler = ParseScheduler(processes=2, max_per_publisher=1, task_timeout=60)
+        result = {'source_id': 1, 'pid': 10, 'activities': 5, 'seconds': 1.0, 'error': None}
+        running = {
+            1: (FakeAsyncResult(result), time.time()),
+            2: (FakeAsyncResult(), time.time() - 120),
+            3: (FakeAsyncResult(), time.time()),
+        }
+
+        results = sorted(scheduler.collect(running), key=lambda result: result['source_id'])
+
+        self.assertEqual([1, 2], [result['source_id'] for result in results])
+        self.assertEqual(None, results[1]['pid'])
+        self.assertTrue(results[1]['error'])
+        self.assertEqual([3], list(running))
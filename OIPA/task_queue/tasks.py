@@ -57,7 +57,14 @@ def remove_duplicates_from_parser_queue():
 def parse_all_existing_sources():
     for e in IatiXmlSource.objects.all():
         queue = django_rq.get_queue("parser")
-        queue.enqueue(parse_source_by_url, args=(e.source_url,), timeout=7200)
+        queue.enqueue(parse_source_by_url, args=(e.source_url, False, True), timeout=7200)
+
+
+@job('parser', timeout=60 * 60 * 24)
+def parse_all_sources_in_pool(incremental=False, force=False):
+    from iati_synchroniser.parse_scheduler import ParseScheduler
+    scheduler = ParseScheduler(incremental=incremental, force=force)
+    return scheduler.run()
 
 
 @job
@@ -67,10 +74,10 @@ def get_new_sources_from_iati_api():
     ds.synchronize_with_iati_api(1)
 
 @job
-def parse_source_by_url(url):
+def parse_source_by_url(url, incremental=False, force=False):
     if IatiXmlSource.objects.filter(source_url=url).exists():
         xml_source = IatiXmlSource.objects.get(source_url=url)
-        xml_source.process()
+        xml_source.process(incremental=incremental, force=force)
 
 
 
@@ -103,7 +110,9 @@ def parse_all_over_parse_interval():
             update_interval_time = 24 * 60 * 60 * 365
 
         if ((curdate - update_interval_time) > last_updated):
-            source.save()
+            # most activities in these files did not change since the last parse
+            queue = django_rq.get_queue("parser")
+            queue.enqueue(parse_source_by_url, args=(source.source_url, True), timeout=7200)
 
 
 @job
@@ -198,6 +207,24 @@ def cache_long_api_calls():
 
 
 
+###############################
+######## EXPORT TASKS  ########
+###############################
+
+@job('default', timeout=60 * 60 * 12)
+def export_all_activities():
+    from iati.management.commands.bulk_export import BulkExporter
+    exporter = BulkExporter()
+    return exporter.export()
+
+@job('default', timeout=60 * 60 * 12)
+def export_activities_of_organisation(reporting_organisation):
+    from iati.management.commands.bulk_export import BulkExporter
+    exporter = BulkExporter()
+    return exporter.export([reporting_organisation])
+
+
+
 def delete_task_from_queue(job_id):
     from rq import cancel_job
     from rq import Connection